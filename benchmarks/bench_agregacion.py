@@ -0,0 +1,106 @@
+"""
+**Benchmark de la agregación FedAvg: todo al final vs incremental (comun/agregacion.py)**
+
+Simula miles de actualizaciones que llegan al servidor una tras otra, como FitRes con sus bytes recién recibidos:
+
+- "al final":     se guardan todos los resultados y al llegar el último se agregan con el FedAvg de Flower
+                  (aggregate), deserializando sin copias. Es lo que hace estrategia.py sin STREAMING_AGG.
+- "incremental":  cada resultado se suma a AcumuladorFedAvg en cuanto llega y se libera (STREAMING_AGG=True).
+
+Para cada número de actualizaciones: tiempo total, tiempo desde que llega la última hasta tener el modelo agregado
+(lo que espera la ronda), pico de memoria (tracemalloc) en MB y en "modelos" (pico / bytes del modelo), y la
+diferencia máxima entre ambos resultados.
+
+Las actualizaciones se generan a partir de --distintas plantillas (pesos aleatorios) con muestras aleatorias.
+
+Uso:
+    python benchmarks/bench_agregacion.py --actualizaciones 100 1000 5000 --parametros 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+from flwr.common import Parameters  # noqa: E402
+from flwr.server.strategy.aggregate import aggregate  # noqa: E402
+from comun.parametros import ndarrays_a_parameters, parameters_a_ndarrays  # noqa: E402
+from comun.agregacion import AcumuladorFedAvg  # noqa: E402
+
+
+def formas_modelo(parametros):
+    """Capas de un modelo denso de unos `parametros` pesos (como modelo_denso de bench_parametros.py)."""
+    ocultas = max(1, parametros // 800)
+    return [(784, ocultas), (ocultas,), (ocultas, 10), (10,)]
+
+
+def recibir(plantilla):
+    """Unos Parameters con bytes nuevos, como los que entrega gRPC por cada respuesta."""
+    return Parameters(tensors=[bytearray(tensor) for tensor in plantilla.tensors], tensor_type=plantilla.tensor_type)
+
+
+def al_final(plantillas, muestras):
+    recibidos = []
+    for i, n in enumerate(muestras):
+        recibidos.append((recibir(plantillas[i % len(plantillas)]), n))
+    ultimo = time.perf_counter()
+    resultado = aggregate([(parameters_a_ndarrays(p), n) for p, n in recibidos])
+    return resultado, time.perf_counter() - ultimo
+
+
+def incremental(plantillas, muestras):
+    acumulador = AcumuladorFedAvg()
+    for i, n in enumerate(muestras):
+        ultimo = time.perf_counter()
+        acumulador.sumar(parameters_a_ndarrays(recibir(plantillas[i % len(plantillas)])), n)
+    return acumulador.resultado(), time.perf_counter() - ultimo
+
+
+def medir(funcion, *args):
+    """
+    (resultado, segundos, segundos tras la última llegada, pico de memoria en bytes). Los tiempos se miden sin
+    tracemalloc (ralentiza cada reserva de memoria) y el pico en una segunda ejecución.
+    """
+    inicio = time.perf_counter()
+    resultado, t_final = funcion(*args)
+    t = time.perf_counter() - inicio
+    del resultado
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    resultado, _ = funcion(*args)
+    pico = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return resultado, t, t_final, pico
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actualizaciones", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--parametros", type=int, default=100_000, help="Tamaño aproximado del modelo.")
+    parser.add_argument("--distintas", type=int, default=16, help="Actualizaciones distintas que se repiten.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    formas = formas_modelo(args.parametros)
+    plantillas = [ndarrays_a_parameters([rng.normal(0, 0.1, forma).astype(np.float32) for forma in formas])
+                  for _ in range(args.distintas)]
+    bytes_modelo = sum(int(np.prod(forma)) for forma in formas) * 4
+    print(f"Modelo: {bytes_modelo // 4} parámetros ({bytes_modelo / 1e6:.2f} MB)")
+    print(f"{'actualizaciones':>15} | {'variante':>11} | {'total':>9} | {'tras la última':>14} | "
+          f"{'pico memoria':>22} | {'dif. máx':>8}")
+
+    for num in args.actualizaciones:
+        muestras = rng.integers(50, 2000, size=num).tolist()
+        referencia = None
+        for nombre, funcion in (("al final", al_final), ("incremental", incremental)):
+            resultado, t, t_final, pico = medir(funcion, plantillas, muestras)
+            if referencia is None:
+                referencia = resultado
+            diferencia = max(float(np.max(np.abs(a - b))) for a, b in zip(resultado, referencia))
+            print(f"{num:>15} | {nombre:>11} | {t * 1000:>7.1f}ms | {t_final * 1000:>12.2f}ms | "
+                  f"{pico / 1e6:>9.1f} MB {pico / bytes_modelo:>6.1f} mod. | {diferencia:>8.1e}")
+            del resultado
+        del referencia
@@ -0,0 +1,128 @@
+"""
+**Benchmark del almacén columnar de resultados (experimentos/almacen.py) frente a releer los JSON**
+
+Genera --experimentos carpetas con global_results.json (una línea por ronda, con el detalle por cliente como el
+servidor) y client_<id>_metrics.json (una línea por ronda y cliente), de --rondas rondas y --clientes clientes,
+escritas con RegistroJSONL. Después mide lo que cuesta tener la tabla resumen y la accuracy media de los clientes
+por ronda de todos los experimentos:
+
+- "json":                leer_json_lineas de todos los ficheros y calcularlo en Python (como barrido.resumir).
+- "almacen, primera":    la primera compactación de todo (Almacen.actualizar_todo) y la consulta.
+- "almacen, sin cambios": otra ejecución de analisis.py sin datos nuevos.
+- "almacen, +N rondas":  tras escribir --nuevas rondas más en cada experimento: sólo se leen las líneas nuevas.
+
+Para cada una: tiempo y filas leídas de los JSON. Al final se comprueba que las dos lecturas dan lo mismo.
+
+Uso:
+    python benchmarks/bench_almacen.py --experimentos 10 --rondas 1000 --clientes 100
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+from comun.registro import RegistroJSONL  # noqa: E402
+from experimentos.local import leer_json_lineas  # noqa: E402
+from experimentos.almacen import Almacen  # noqa: E402
+
+
+def escribir_rondas(carpeta, primera, ultima, clientes, rng):
+    """Rondas [primera, ultima] de un experimento sintético, con el formato de server.py y client.py."""
+    globales = RegistroJSONL(os.path.join(carpeta, "global_results.json"), lineas=100)
+    registros = [RegistroJSONL(os.path.join(carpeta, f"client_{c}_metrics.json"), lineas=100)
+                 for c in range(1, clientes + 1)]
+    for ronda in range(primera, ultima + 1):
+        base = 1 - 0.9 * np.exp(-ronda / 50)
+        accuracy = np.clip(base + rng.normal(0, 0.03, clientes), 0, 1)
+        for c, registro in enumerate(registros, start=1):
+            registro.escribir({"ronda": ronda, "tiempo": "2026-01-01 00:00:00", "client_id": c, "loss": 1 - accuracy[c - 1],
+                               "accuracy": accuracy[c - 1], "precision": accuracy[c - 1], "recall": accuracy[c - 1],
+                               "f1_score": accuracy[c - 1], "data_size": 500, "rss_mb": 300.0})
+        globales.escribir({"ronda": ronda, "num_clientes_activos": clientes,
+                           "clientes_participantes": list(range(1, clientes + 1)),
+                           "metricas_globales": {"accuracy": float(accuracy.mean()), "precision": float(accuracy.mean()),
+                                                 "recall": float(accuracy.mean()), "f1_score": float(accuracy.mean())},
+                           "detalle_clientes": [{"client_id": c, "accuracy": float(a)} for c, a in
+                                                enumerate(accuracy, start=1)],
+                           "t_ronda": float(rng.uniform(1, 2))})
+    for registro in registros + [globales]:
+        registro.vaciar()
+
+
+def analisis_json(raiz):
+    """Resumen y accuracy media de los clientes por ronda releyendo todos los JSON. Devuelve (resultado, filas)."""
+    resultado, filas = {}, 0
+    for experimento in sorted(os.listdir(raiz)):
+        carpeta = os.path.join(raiz, experimento)
+        if not os.path.isdir(carpeta) or experimento.startswith("."):
+            continue
+        lineas = leer_json_lineas(os.path.join(carpeta, "global_results.json"))
+        rondas = [r for r in lineas if "metricas_globales" in r]
+        por_ronda = {}
+        for nombre in os.listdir(carpeta):
+            if nombre.startswith("client_"):
+                for linea in leer_json_lineas(os.path.join(carpeta, nombre)):
+                    por_ronda.setdefault(linea["ronda"], []).append(linea["accuracy"])
+                    filas += 1
+        filas += len(lineas)
+        resultado[experimento] = (rondas[-1]["metricas_globales"]["accuracy"],
+                                  np.array([np.mean(por_ronda[r]) for r in sorted(por_ronda)]))
+    return resultado, filas
+
+
+def analisis_almacen(raiz, directorio):
+    almacen = Almacen(directorio)
+    cambios = almacen.actualizar_todo(raiz)
+    resultado = {e: (almacen.experimentos[e]["resumen"]["accuracy_final"],
+                     almacen.por_ronda(e, "clientes", "accuracy")[1]) for e in almacen.experimentos}
+    return resultado, sum(sum(n.values()) for n in cambios.values())
+
+
+def medir(funcion, *argumentos):
+    inicio = time.perf_counter()
+    resultado, filas = funcion(*argumentos)
+    return time.perf_counter() - inicio, filas, resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--experimentos", type=int, default=5)
+    parser.add_argument("--rondas", type=int, default=500)
+    parser.add_argument("--clientes", type=int, default=100)
+    parser.add_argument("--nuevas", type=int, default=1, help="Rondas que se añaden antes de la medida incremental.")
+    args = parser.parse_args()
+
+    raiz = tempfile.mkdtemp(prefix="bench_almacen_")
+    almacen = os.path.join(raiz, ".almacen")
+    rng = np.random.default_rng(0)
+    try:
+        for e in range(args.experimentos):
+            escribir_rondas(os.path.join(raiz, f"exp_{e:03d}"), 1, args.rondas, args.clientes, rng)
+        tamano = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(raiz) for f in fs)
+        print(f"{args.experimentos} experimentos x {args.rondas} rondas x {args.clientes} clientes | "
+              f"JSON: {tamano / 2**20:.0f} MB")
+        print(f"{'lectura':>24} | {'tiempo':>8} | {'filas leídas':>12}")
+
+        medidas = [("json", *medir(analisis_json, raiz)),
+                   ("almacen, primera", *medir(analisis_almacen, raiz, almacen)),
+                   ("almacen, sin cambios", *medir(analisis_almacen, raiz, almacen))]
+        for e in range(args.experimentos):
+            escribir_rondas(os.path.join(raiz, f"exp_{e:03d}"), args.rondas + 1, args.rondas + args.nuevas,
+                            args.clientes, rng)
+        medidas += [(f"json, +{args.nuevas} rondas", *medir(analisis_json, raiz)),
+                    (f"almacen, +{args.nuevas} rondas", *medir(analisis_almacen, raiz, almacen))]
+        for nombre, t, filas, _ in medidas:
+            print(f"{nombre:>24} | {t:>7.3f}s | {filas:>12}")
+
+        json_final, almacen_final = medidas[-2][3], medidas[-1][3]
+        for experimento, (final, por_ronda) in json_final.items():
+            assert np.isclose(final, almacen_final[experimento][0])
+            assert np.allclose(por_ronda, almacen_final[experimento][1])
+        print("Mismos resultados con los JSON y con el almacén.")
+    finally:
+        shutil.rmtree(raiz)
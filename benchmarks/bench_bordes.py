@@ -0,0 +1,129 @@
+"""
+**Benchmark del nivel de agregadores de borde (edge/edge.py)**
+
+Ejecuta en local (experimentos/local.py) el mismo experimento dos veces:
+
+- "directo": los N clientes conectados al servidor.
+- "bordes":  los clientes repartidos entre --bordes agregadores de borde y el servidor sólo ve a los bordes.
+
+Para cada variante: participantes que ve el servidor, tiempo de CPU y pico de memoria (VmHWM) del proceso del
+servidor y de los bordes (leídos de /proc mientras se ejecuta), tiempo de ronda y de agregación del servidor (mediana,
+de global_results.json) y accuracy final.
+
+Datos sintéticos con la forma de MNIST (como bench_e2e.py), todos los clientes en todas las rondas.
+
+Uso:
+    python benchmarks/bench_bordes.py --clientes 8 --bordes 2 --rondas 3
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from experimentos.local import crear_mnist_sintetico, ejecutar_procesos, leer_json_lineas  # noqa: E402
+
+TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def uso_proceso(pid):
+    """(segundos de CPU, pico de RSS en MB) de un proceso vivo, o None si ya ha terminado."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            pico = next(int(linea.split()[1]) for linea in f if linea.startswith("VmHWM"))
+    except (OSError, StopIteration):
+        return None
+    return (int(campos[11]) + int(campos[12])) / TICKS, pico / 1024 # utime + stime, kB -> MB
+
+
+class Muestreador(threading.Thread):
+    """Lee cada `intervalo` segundos el uso de los procesos de la lista (se van añadiendo según arrancan)."""
+
+    def __init__(self, procesos, intervalo=0.2):
+        super().__init__(daemon=True)
+        self.procesos = procesos
+        self.intervalo = intervalo
+        self.uso = {} # pid -> último (cpu, rss_pico) leído
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.is_set():
+            for proceso in list(self.procesos):
+                uso = uso_proceso(proceso.pid)
+                if uso is not None:
+                    self.uso[proceso.pid] = uso
+            time.sleep(self.intervalo)
+
+
+def ejecutar(variante, args, npz, dataset_dir, puerto):
+    directorio = tempfile.mkdtemp(prefix=f"bench_bordes_{variante}_")
+    grupos = np.array_split(np.arange(1, args.clientes + 1), args.bordes) if variante == "bordes" else []
+    participantes = len(grupos) if grupos else args.clientes
+    entorno_servidor = {"TOTAL_CLIENTS": str(participantes), "NUM_ROUNDS": str(args.rondas),
+                        "MIN_CLIENTS_FRACTION": "1.0"}
+    entorno_cliente = {"TOTAL_CLIENTS": str(args.clientes), "DISTRIBUTION_METHOD": "iid", "MNIST_NPZ": npz,
+                       "DATASET_DIR": dataset_dir, "PARTITION_DIR": os.path.join(directorio, "particiones")}
+    borde_de = {int(c): f"borde-{g}" for g, grupo in enumerate(grupos, start=1) for c in grupo}
+    entornos_clientes = [dict(entorno_cliente, CLIENT_ID=str(i),
+                              **({"SERVER_ADDRESS": f"{borde_de[i]}:8080"} if i in borde_de else {}))
+                         for i in range(1, args.clientes + 1)]
+    entornos_bordes = [{"EDGE_ID": f"borde-{g}", "EDGE_CLIENTS": str(len(grupo)), "MIN_CLIENTS_FRACTION": "1.0"}
+                       for g, grupo in enumerate(grupos, start=1)]
+
+    procesos = []
+    muestreador = Muestreador(procesos)
+    muestreador.start()
+    ejecucion = ejecutar_procesos(entorno_servidor, entornos_clientes, directorio, puerto, timeout=args.timeout,
+                                  entornos_bordes=entornos_bordes, procesos=procesos)
+    muestreador.parar.set()
+    muestreador.join()
+
+    rondas = [r for r in leer_json_lineas(os.path.join(directorio, "global_results.json")) if "t_ronda" in r]
+    if not rondas:
+        raise RuntimeError(f"No se completó ninguna ronda (ver logs en {directorio})")
+    servidor = muestreador.uso.get(procesos[0].pid, (float("nan"), float("nan")))
+    bordes = [muestreador.uso[p.pid] for p in procesos[1:] if p.pid in muestreador.uso]
+    return {
+        "variante": variante,
+        "estado": ejecucion["estado"],
+        "participantes": participantes,
+        "cpu_servidor": servidor[0],
+        "rss_servidor_mb": servidor[1],
+        "cpu_bordes": sum(b[0] for b in bordes),
+        "rss_borde_max_mb": max((b[1] for b in bordes), default=0.0),
+        "t_ronda_mediana": float(np.median([r["t_ronda"] for r in rondas])),
+        "t_agregacion_mediana": float(np.median([r.get("t_agregacion", 0.0) for r in rondas])),
+        "accuracy_final": rondas[-1]["metricas_globales"]["accuracy"],
+        "resultados_dir": directorio,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--bordes", type=int, default=2, help="Agregadores de borde entre los que se reparten.")
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--muestras", type=int, default=14000, help="Tamaño del MNIST sintético (train + test).")
+    parser.add_argument("--puerto", type=int, default=18180)
+    parser.add_argument("--timeout", type=float, default=1800, help="Segundos máximos por variante.")
+    args = parser.parse_args()
+
+    trabajo = tempfile.mkdtemp(prefix="bench_bordes_datos_")
+    npz = os.path.join(trabajo, "mnist_sintetico.npz")
+    crear_mnist_sintetico(npz, args.muestras)
+    dataset_dir = os.path.join(trabajo, "dataset")
+
+    print(f"{args.clientes} clientes, {args.rondas} rondas")
+    print(f"{'variante':>9} | {'particip.':>9} | {'CPU servidor':>12} | {'RSS servidor':>12} | {'CPU bordes':>10} | "
+          f"{'t_ronda':>8} | {'t_agreg':>9} | {'acc':>6}")
+    for i, variante in enumerate(("directo", "bordes")):
+        r = ejecutar(variante, args, npz, dataset_dir, args.puerto + i * 10)
+        print(f"{variante:>9} | {r['participantes']:>9} | {r['cpu_servidor']:>11.2f}s | {r['rss_servidor_mb']:>9.0f} MB | "
+              f"{r['cpu_bordes']:>9.2f}s | {r['t_ronda_mediana']:>7.2f}s | {r['t_agregacion_mediana'] * 1000:>7.1f}ms | "
+              f"{r['accuracy_final']:>6.3f}")
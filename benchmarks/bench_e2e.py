@@ -0,0 +1,162 @@
+"""
+**Benchmark de extremo a extremo en localhost (sin Docker)**
+
+Para medir rondas completas hacía falta `docker compose up` con tc y Pumba, que no se puede usar en CI ni en
+máquinas sin privilegios. Este script lanza server/server.py y N clientes client/client.py como procesos locales
+conectados por loopback:
+
+- Datos sintéticos con la forma de MNIST (no descarga nada): cada clase es una plantilla fija más ruido.
+- Sin emulación de red (NET_EMULATION=False) y con el perfilado de los clientes activado (PROFILE=True).
+- Todos los clientes participan en todas las rondas (MIN_CLIENTS_FRACTION=1.0).
+
+Para cada combinación de número de clientes y método de particionado se guarda:
+tiempo de ronda (mediana y por ronda), actualizaciones/s, latencia de agregación del servidor, tiempo de
+entrenamiento y de empaquetado de los clientes, memoria (pico de RSS) por cliente y el coste de serializar y
+deserializar el modelo (ndarrays <-> Parameters de Flower) medido aparte en este proceso.
+
+El resultado es un JSON en results/benchmarks/ (una entrada por combinación). Con --referencia se compara con
+otro JSON anterior y el script termina con código 1 si algún tiempo de ronda empeora más de --tolerancia.
+
+Uso:
+    python benchmarks/bench_e2e.py --clientes 2 4 8 --metodos iid dirichlet pathological --rondas 3
+    python benchmarks/bench_e2e.py --referencia results/benchmarks/e2e_20260101_120000.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from experimentos.local import crear_mnist_sintetico, ejecutar_procesos, leer_json_lineas  # noqa: E402
+
+
+def coste_serializacion(repeticiones=20):
+    """Segundos de ndarrays_to_parameters y parameters_to_ndarrays con los pesos del modelo real."""
+    from flwr.common import ndarrays_to_parameters, parameters_to_ndarrays
+    from comun.modelo import build_model
+
+    pesos = build_model().get_weights()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        parametros = ndarrays_to_parameters(pesos)
+    t_serializar = (time.perf_counter() - inicio) / repeticiones
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        parameters_to_ndarrays(parametros)
+    t_deserializar = (time.perf_counter() - inicio) / repeticiones
+    return {
+        "bytes_modelo": int(sum(w.nbytes for w in pesos)),
+        "t_serializar": t_serializar,
+        "t_deserializar": t_deserializar,
+    }
+
+
+def ejecutar(num_clientes, metodo, args, dataset_dir, npz, puerto):
+    """Lanza servidor + clientes, espera a que terminen las rondas y resume global_results.json."""
+    resultados_dir = tempfile.mkdtemp(prefix=f"bench_e2e_{num_clientes}_{metodo}_")
+    entorno_servidor = {"TOTAL_CLIENTS": str(num_clientes), "NUM_ROUNDS": str(args.rondas), "MIN_CLIENTS_FRACTION": "1.0"}
+    entorno_cliente = {"TOTAL_CLIENTS": str(num_clientes), "PROFILE": "True", "DISTRIBUTION_METHOD": metodo,
+                       "DIRICHLET_ALPHA": str(args.alpha), "MNIST_NPZ": npz, "DATASET_DIR": dataset_dir,
+                       "PARTITION_DIR": os.path.join(resultados_dir, "particiones")}
+    ejecucion = ejecutar_procesos(entorno_servidor,
+                                  [dict(entorno_cliente, CLIENT_ID=str(i)) for i in range(1, num_clientes + 1)],
+                                  resultados_dir, puerto, timeout=args.timeout)
+    t_total = ejecucion["t_total"]
+
+    rondas = [r for r in leer_json_lineas(os.path.join(resultados_dir, "global_results.json")) if "t_ronda" in r]
+    if not rondas:
+        raise RuntimeError(f"No se completó ninguna ronda (ver logs en {resultados_dir})")
+    t_rondas = [r["t_ronda"] for r in rondas]
+    perfiles = [c for r in rondas for c in r.get("perfilado_fit", {}).get("clientes", [])]
+    actualizaciones = sum(len(r.get("perfilado_fit", {}).get("clientes", [])) or r.get("num_clientes_activos", 0) for r in rondas)
+
+    return {
+        "clientes": num_clientes,
+        "metodo": metodo,
+        "rondas": len(rondas),
+        "t_total": t_total,
+        "t_ronda": t_rondas,
+        "t_ronda_mediana": float(np.median(t_rondas)),
+        "actualizaciones_por_s": actualizaciones / sum(t_rondas),
+        "t_agregacion_mediana": float(np.median([r.get("t_agregacion", 0.0) for r in rondas])),
+        "t_entrenar_mediana": float(np.median([c.get("t_entrenar", 0.0) for c in perfiles])) if perfiles else None,
+        "t_empaquetar_mediana": float(np.median([c.get("t_empaquetar", 0.0) for c in perfiles])) if perfiles else None,
+        "rss_pico_mb_medio": float(np.mean([c["rss_pico_mb"] for c in perfiles])) if perfiles else None,
+        "rss_pico_mb_max": float(np.max([c["rss_pico_mb"] for c in perfiles])) if perfiles else None,
+        "accuracy_final": rondas[-1]["metricas_globales"]["accuracy"],
+        "resultados_dir": resultados_dir,
+    }
+
+
+def comparar(actual, referencia, tolerancia):
+    """Imprime la variación del tiempo de ronda frente a la referencia. Devuelve True si hay regresiones."""
+    previos = {(r["clientes"], r["metodo"]): r for r in referencia["resultados"]}
+    regresion = False
+    for r in actual["resultados"]:
+        previo = previos.get((r["clientes"], r["metodo"]))
+        if previo is None:
+            continue
+        cambio = r["t_ronda_mediana"] / previo["t_ronda_mediana"] - 1.0
+        marca = "REGRESIÓN" if cambio > tolerancia else ""
+        regresion |= cambio > tolerancia
+        print(f"{r['clientes']:>8} | {r['metodo']:>12} | {previo['t_ronda_mediana']:>8.2f}s -> "
+              f"{r['t_ronda_mediana']:>8.2f}s ({cambio:+.1%}) {marca}")
+    return regresion
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--metodos", nargs="+", default=["iid", "dirichlet"])
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    parser.add_argument("--muestras", type=int, default=14000, help="Tamaño del MNIST sintético (train + test).")
+    parser.add_argument("--puerto", type=int, default=18080)
+    parser.add_argument("--timeout", type=float, default=1800, help="Segundos máximos por combinación.")
+    parser.add_argument("--salida", default=os.path.join(RAIZ, "results", "benchmarks"))
+    parser.add_argument("--referencia", help="JSON de una ejecución anterior con el que comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento relativo admitido.")
+    args = parser.parse_args()
+
+    trabajo = tempfile.mkdtemp(prefix="bench_e2e_datos_")
+    npz = os.path.join(trabajo, "mnist_sintetico.npz")
+    crear_mnist_sintetico(npz, args.muestras)
+    dataset_dir = os.path.join(trabajo, "dataset") # Un único almacén memmap para todas las ejecuciones
+
+    commit = subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    informe = {
+        "fecha": str(datetime.datetime.now()),
+        "commit": commit.stdout.strip(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "rondas": args.rondas,
+        "muestras": args.muestras,
+        "serializacion": coste_serializacion(),
+        "resultados": [],
+    }
+
+    print(f"{'clientes':>8} | {'método':>12} | {'t_ronda':>9} | {'upd/s':>7} | {'t_agreg':>9} | {'RSS max':>9} | {'acc':>6}")
+    for i, (n, metodo) in enumerate((n, m) for n in args.clientes for m in args.metodos):
+        r = ejecutar(n, metodo, args, dataset_dir, npz, args.puerto + i)
+        informe["resultados"].append(r)
+        rss = f"{r['rss_pico_mb_max']:>7.0f}MB" if r["rss_pico_mb_max"] else f"{'-':>9}"
+        print(f"{n:>8} | {metodo:>12} | {r['t_ronda_mediana']:>8.2f}s | {r['actualizaciones_por_s']:>7.2f} | "
+              f"{r['t_agregacion_mediana'] * 1000:>7.1f}ms | {rss} | {r['accuracy_final']:>6.3f}")
+
+    os.makedirs(args.salida, exist_ok=True)
+    fichero = os.path.join(args.salida, f"e2e_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(fichero, "w") as f:
+        json.dump(informe, f, indent=1)
+    print(f"Resultados en {fichero}")
+
+    if args.referencia:
+        with open(args.referencia) as f:
+            referencia = json.load(f)
+        sys.exit(1 if comparar(informe, referencia, args.tolerancia) else 0)
@@ -0,0 +1,67 @@
+"""
+**Benchmark del entrenamiento local: model.fit vs MotorEntrenamiento**
+
+Latencia de fit por ronda con el CNN de build_model y datos sintéticos con forma de MNIST.
+En cada ronda se hace set_weights (como al recibir el modelo global) y una época de entrenamiento.
+
+- "model.fit (numpy)": lo que hacía el cliente antes, sobre arrays float ya normalizados.
+- "model.fit (LotesMNIST)": normalizando por lote con la Sequence de Keras.
+- "motor tf.data": MotorEntrenamiento (pipeline cacheado + paso compilado reutilizado).
+- "motor tf.data + XLA": lo mismo con jit_compile.
+
+La primera ronda incluye la traza/compilación, por eso se muestra aparte de la mediana del resto.
+
+Uso:
+    python benchmarks/bench_entrenamiento.py --muestras 5000 --rondas 5
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "client"))
+from comun.modelo import build_model  # noqa: E402
+from entrenamiento import MotorEntrenamiento, LotesMNIST  # noqa: E402
+
+
+def medir(nombre, entrenar_ronda, pesos_iniciales, model, rondas):
+    tiempos = []
+    for _ in range(rondas):
+        model.set_weights(pesos_iniciales)
+        inicio = time.perf_counter()
+        entrenar_ronda()
+        tiempos.append(time.perf_counter() - inicio)
+    print(f"{nombre:>24} | {tiempos[0]:>10.3f}s | {np.median(tiempos[1:]):>10.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--muestras", type=int, default=5000)
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x_u8 = rng.integers(0, 256, size=(args.muestras, 28, 28), dtype=np.uint8)
+    y = rng.integers(0, 10, size=args.muestras).astype(np.uint8)
+    x_float = x_u8.reshape(-1, 28, 28, 1) / 255.0
+
+    print(f"{'método':>24} | {'1ª ronda':>11} | {'mediana resto':>11}")
+
+    model = build_model()
+    pesos = model.get_weights()
+    medir("model.fit (numpy)",
+          lambda: model.fit(x_float, y, epochs=1, batch_size=args.batch, verbose=0), pesos, model, args.rondas)
+
+    model = build_model()
+    medir("model.fit (LotesMNIST)",
+          lambda: model.fit(LotesMNIST(x_u8, y, args.batch, shuffle=True), epochs=1, verbose=0), pesos, model, args.rondas)
+
+    for xla in (False, True):
+        model = build_model()
+        motor = MotorEntrenamiento(model, x_u8, y, xla=xla)
+        medir("motor tf.data" + (" + XLA" if xla else ""),
+              lambda: motor.entrenar(epocas=1, batch_size=args.batch), pesos, model, args.rondas)
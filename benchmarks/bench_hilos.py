@@ -0,0 +1,145 @@
+"""
+**Benchmark de los hilos ajustados a la cuota de CPU (client/recursos.py)**
+
+Para cada perfil de PERFILES (experimentos/escenario.py) lanza un proceso "cliente" dentro de un cgroup con la cuota
+de CPU del perfil (cpu.max en v2, cpu.cfs_quota_us en v1; hace falta poder crear cgroups, p. ej. como root) y mide
+una época de fit (MotorEntrenamiento, lotes de 32) y un evaluate (predict del test local) con:
+
+- "antes":   lo que hacen TensorFlow y la BLAS sin ajustar: hilos intra-op, inter-op, de tf.data y de OpenBLAS =
+             núcleos del host (--nucleos, por defecto los de esta máquina).
+- "despues": CPU_TUNING=True: los hilos que calcula recursos.py a partir de la cuota.
+
+Para cada combinación: mediana de --repeticiones medidas de fit y de evaluate, y el throttling del cgroup durante
+las medidas (fracción de periodos con la cuota agotada y segundos congelado). Con --nucleos mayor que los núcleos
+reales se reproduce el caso de un host grande (más hilos que CPU) en una máquina pequeña.
+Sin permisos para crear cgroups los procesos se lanzan sin cuota (sólo CPU_LIMIT) y se avisa.
+
+Uso (como root):
+    python benchmarks/bench_hilos.py --nucleos 16 --repeticiones 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "client"))
+import recursos  # noqa: E402
+
+PERIODO_US = 100_000
+
+
+def crear_cgroup(nombre, cpus):
+    """Directorio de un cgroup hijo del de este proceso con una cuota de `cpus`, o None si no se puede crear."""
+    version, base = recursos.directorio_cgroup()
+    if version is None:
+        return None
+    ruta = os.path.join(base, nombre)
+    try:
+        os.makedirs(ruta, exist_ok=True)
+        if version == 2:
+            with open(os.path.join(ruta, "cpu.max"), "w") as f:
+                f.write(f"{int(cpus * PERIODO_US)} {PERIODO_US}")
+        else:
+            with open(os.path.join(ruta, "cpu.cfs_period_us"), "w") as f:
+                f.write(str(PERIODO_US))
+            with open(os.path.join(ruta, "cpu.cfs_quota_us"), "w") as f:
+                f.write(str(int(cpus * PERIODO_US)))
+    except OSError:
+        return None
+    return ruta
+
+
+def trabajador(args):
+    """Proceso medido: entra en su cgroup antes de importar NumPy y TensorFlow, configura los hilos y mide."""
+    if args.cgroup:
+        with open(os.path.join(args.cgroup, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    if args.variante == "despues":
+        cpus, origen = recursos.cpus_disponibles(os.environ.get("CPU_LIMIT"))
+        hilos = recursos.hilos_para(cpus)
+        recursos.configurar_entorno(hilos)
+        inter_op = recursos.hilos_inter_op(hilos)
+    else:
+        cpus, origen = float(args.nucleos), "host"
+        hilos, inter_op = args.nucleos, args.nucleos
+        for variable in recursos.VARIABLES_BLAS:
+            os.environ[variable] = str(hilos)
+
+    import numpy as np
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(hilos)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    from comun.modelo import build_model
+    from entrenamiento import MotorEntrenamiento, LotesMNIST
+
+    datos = np.load(args.npz)
+    x, y = datos["x_train"][:args.muestras], datos["y_train"][:args.muestras]
+    x_test, y_test = datos["x_test"][:args.test], datos["y_test"][:args.test]
+    model = build_model()
+    motor = MotorEntrenamiento(model, x, y, hilos=hilos)
+    motor.calentar()
+    model.predict(LotesMNIST(x_test[:256], y_test[:256], batch_size=256), verbose=0)
+
+    monitor = recursos.MonitorCPU()
+    monitor.medir()
+    t_fit, t_evaluate = [], []
+    for _ in range(args.repeticiones):
+        t_fit.append(motor.entrenar(epocas=1, batch_size=32)["t_fit"])
+        inicio = time.perf_counter()
+        model.predict(LotesMNIST(x_test, y_test, batch_size=256), verbose=0)
+        t_evaluate.append(time.perf_counter() - inicio)
+    print(json.dumps({"cpus": cpus, "origen": origen, "hilos": hilos, "inter_op": inter_op,
+                      "t_fit": float(np.median(t_fit)), "t_evaluate": float(np.median(t_evaluate)),
+                      **monitor.medir()}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nucleos", type=int, default=os.cpu_count(), help="Núcleos del host que se simulan en \"antes\".")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--muestras", type=int, default=6000, help="Muestras de entrenamiento por época.")
+    parser.add_argument("--test", type=int, default=2000, help="Muestras del test local.")
+    parser.add_argument("--trabajador", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--variante", default="despues", help=argparse.SUPPRESS)
+    parser.add_argument("--cgroup", help=argparse.SUPPRESS)
+    parser.add_argument("--npz", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trabajador:
+        trabajador(args)
+        sys.exit(0)
+
+    from experimentos.escenario import PERFILES
+    from experimentos.local import crear_mnist_sintetico
+    npz = os.path.join(tempfile.mkdtemp(prefix="bench_hilos_"), "mnist_sintetico.npz")
+    crear_mnist_sintetico(npz, args.muestras + args.test)
+
+    print(f"Host simulado en \"antes\": {args.nucleos} núcleos | núcleos reales: {len(os.sched_getaffinity(0))}")
+    print(f"{'perfil':>9} | {'cpus':>4} | {'variante':>8} | {'hilos':>5} | {'fit':>8} | {'evaluate':>8} | "
+          f"{'periodos lim.':>13} | {'congelado':>9}")
+    sin_cuota = False
+    for nombre, perfil in PERFILES.items():
+        for variante in ("antes", "despues"):
+            cgroup = crear_cgroup(f"bench_hilos_{os.getpid()}_{nombre}_{variante}", float(perfil["cpu"]))
+            sin_cuota |= cgroup is None
+            orden = [sys.executable, os.path.abspath(__file__), "--trabajador", "--variante", variante, "--npz", npz,
+                     "--nucleos", str(args.nucleos), "--repeticiones", str(args.repeticiones),
+                     "--muestras", str(args.muestras), "--test", str(args.test)] + (["--cgroup", cgroup] if cgroup else [])
+            entorno = dict(os.environ, PYTHONPATH=RAIZ, TF_CPP_MIN_LOG_LEVEL="3", CPU_LIMIT=perfil["cpu"])
+            salida = subprocess.run(orden, env=entorno, capture_output=True, text=True)
+            if cgroup:
+                os.rmdir(cgroup)
+            if salida.returncode != 0:
+                sys.exit(f"Falló {nombre} ({variante}):\n{salida.stderr[-2000:]}")
+            r = json.loads(salida.stdout.strip().splitlines()[-1])
+            limitados = f"{r['fraccion_cpu_limitada']:.1%}" if "fraccion_cpu_limitada" in r else "-"
+            congelado = f"{r['t_cpu_limitado']:.2f}s" if "t_cpu_limitado" in r else "-"
+            print(f"{nombre:>9} | {perfil['cpu']:>4} | {variante:>8} | {r['hilos']:>5} | "
+                  f"{r['t_fit']:>7.2f}s | {r['t_evaluate']:>7.3f}s | {limitados:>13} | {congelado:>9}")
+    if sin_cuota:
+        print("Aviso: no se han podido crear cgroups (¿sin permisos?): medidas sin cuota de CPU.")
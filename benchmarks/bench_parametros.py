@@ -0,0 +1,112 @@
+"""
+**Benchmark del paso de parámetros: listas de Flower vs buffer plano (comun/parametros.py)**
+
+Una ronda de un cliente y la agregación del servidor, sin red ni entrenamiento:
+
+    servidor serializa el global -> cliente deserializa y set_weights -> get_weights y serializa
+    -> servidor deserializa las respuestas de --clientes clientes y agrega (media ponderada de Flower)
+
+- "flower":        get_weights/set_weights de Keras y ndarrays_to_parameters/parameters_to_ndarrays de Flower.
+- "buffer capas":  BufferModelo y la serialización sin copias, enviando la lista de capas (vistas de un vector).
+- "buffer plano":  lo mismo con FLAT_PARAMS=True: un único tensor en el cable y en la agregación.
+
+Para cada paso: tiempo (mediana de --repeticiones) y pico de memoria NumPy/Python (tracemalloc) en "modelos":
+pico / bytes del modelo, es decir, cuántas copias del modelo vivas crea ese paso. La columna total suma los pasos:
+copias del modelo por ronda. Las copias dentro de TensorFlow (variables -> tensor) no las ve tracemalloc, así que
+en set/get_weights el tiempo es la medida que cuenta.
+
+Con --parametros se añade un modelo denso más grande que el CNN de build_model (p. ej. 5000000).
+
+Uso:
+    python benchmarks/bench_parametros.py --clientes 10 --parametros 5000000
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+import tensorflow as tf  # noqa: E402
+from flwr.common import ndarrays_to_parameters, parameters_to_ndarrays  # noqa: E402
+from flwr.server.strategy.aggregate import aggregate  # noqa: E402
+from comun.modelo import build_model  # noqa: E402
+from comun.parametros import BufferModelo, ndarrays_a_parameters, parameters_a_ndarrays  # noqa: E402
+
+PASOS = ["serializar global", "deserializar (cliente)", "set_weights", "get_weights", "serializar (cliente)",
+         "deserializar (servidor)", "agregar"]
+
+
+def modelo_denso(parametros):
+    """Modelo de dos capas densas con unos `parametros` pesos (para ver cómo escala con el tamaño)."""
+    ocultas = max(1, parametros // 800)
+    return tf.keras.Sequential([tf.keras.layers.Dense(ocultas, input_shape=(784,)), tf.keras.layers.Dense(10)])
+
+
+def medir(funcion, bytes_modelo):
+    """(segundos, copias del modelo vivas en el pico) de una llamada. Devuelve también su resultado."""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    resultado = funcion()
+    t = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1] - base
+    return t, pico / bytes_modelo, resultado
+
+
+def ronda(variante, model, buffer, pesos_globales, clientes, bytes_modelo):
+    """{paso: (segundos, copias)} de una ronda."""
+    if variante == "flower":
+        serializar, deserializar = ndarrays_to_parameters, parameters_to_ndarrays
+        escribir, leer = model.set_weights, model.get_weights
+    else:
+        serializar, deserializar = ndarrays_a_parameters, parameters_a_ndarrays
+        escribir = buffer.escribir
+        leer = (lambda: [buffer.leer()]) if variante == "buffer plano" else buffer.leer_capas
+    medidas = {}
+    medidas["serializar global"] = medir(lambda: serializar(pesos_globales), bytes_modelo)
+    medidas["deserializar (cliente)"] = medir(lambda: deserializar(medidas["serializar global"][2]), bytes_modelo)
+    medidas["set_weights"] = medir(lambda: escribir(medidas["deserializar (cliente)"][2]), bytes_modelo)
+    medidas["get_weights"] = medir(leer, bytes_modelo)
+    medidas["serializar (cliente)"] = medir(lambda: serializar(medidas["get_weights"][2]), bytes_modelo)
+    respuestas = [medidas["serializar (cliente)"][2]] * clientes # Los mismos bytes, como si llegaran de N clientes
+    medidas["deserializar (servidor)"] = medir(lambda: [deserializar(r) for r in respuestas], bytes_modelo)
+    resultados = [(pesos, 100) for pesos in medidas["deserializar (servidor)"][2]]
+    medidas["agregar"] = medir(lambda: aggregate(resultados), bytes_modelo)
+    return {paso: valores[:2] for paso, valores in medidas.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=10, help="Respuestas que deserializa y agrega el servidor.")
+    parser.add_argument("--parametros", type=int, nargs="*", default=[], help="Tamaños de un modelo denso extra.")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    modelos = [("CNN build_model", build_model())] + [(f"denso {p}", modelo_denso(p)) for p in args.parametros]
+    tracemalloc.start()
+    for nombre, model in modelos:
+        buffer = BufferModelo(model)
+        bytes_modelo = buffer.disposicion.tamano * 4
+        print(f"\n{nombre}: {buffer.disposicion.tamano} parámetros ({bytes_modelo / 1e6:.2f} MB), "
+              f"{args.clientes} clientes en la agregación")
+        print(f"{'paso':>24} | " + " | ".join(f"{v:>22}" for v in ("flower", "buffer capas", "buffer plano")))
+        totales = {}
+        filas = {paso: [] for paso in PASOS}
+        for variante in ("flower", "buffer capas", "buffer plano"):
+            pesos = buffer.leer()
+            pesos_globales = [pesos] if variante == "buffer plano" else [c.copy() for c in buffer.disposicion.vistas(pesos)]
+            repeticiones = [ronda(variante, model, buffer, pesos_globales, args.clientes, bytes_modelo)
+                            for _ in range(args.repeticiones)]
+            for paso in PASOS:
+                t = float(np.median([r[paso][0] for r in repeticiones]))
+                copias = float(np.median([r[paso][1] for r in repeticiones]))
+                filas[paso].append(f"{t * 1000:>8.2f}ms {copias:>5.1f} copias")
+            totales[variante] = (sum(float(np.median([r[p][0] for r in repeticiones])) for p in PASOS),
+                                 sum(float(np.median([r[p][1] for r in repeticiones])) for p in PASOS))
+        for paso in PASOS:
+            print(f"{paso:>24} | " + " | ".join(f"{celda:>22}" for celda in filas[paso]))
+        print(f"{'total ronda':>24} | " + " | ".join(f"{t * 1000:>8.2f}ms {c:>5.1f} copias" for t, c in totales.values()))
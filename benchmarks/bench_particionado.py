@@ -0,0 +1,80 @@
+"""
+**Benchmark del particionado: versión original vs vectorizada**
+
+Mide el tiempo de particionar 70.000 etiquetas tipo MNIST en función del número de clientes.
+
+- "original (por cliente)": el bucle Dirichlet de antes, que cada cliente ejecutaba para quedarse con su trozo.
+  El coste de la flota completa es N ejecuciones, así que también se muestra el total estimado (x N).
+- "vectorizado (flota)": partition_indices calcula TODAS las particiones en una sola pasada.
+- "carga manifiesto": lo que paga cada cliente cuando el manifiesto ya existe.
+
+Uso:
+    python benchmarks/bench_particionado.py --clientes 2 10 100 1000
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client"))
+from particionado import partition_indices, obtener_particion  # noqa: E402
+
+
+def particion_original(y, client_id, num_clients, alpha, balance_quantity=True):
+    """Copia del bucle Dirichlet original de client.py, sólo para comparar."""
+    np.random.seed(42)
+    n_classes = len(np.unique(y))
+    min_size = 0
+    N = len(y)
+    idxs = np.arange(N)
+    while min_size < 10:
+        idx_batch = [[] for _ in range(num_clients)]
+        for k in range(n_classes):
+            idx_k = idxs[y == k]
+            np.random.shuffle(idx_k)
+            proportions = np.random.dirichlet(np.repeat(alpha, num_clients))
+            if balance_quantity:
+                proportions = np.array([p * (len(idx_j) < N / num_clients) for p, idx_j in zip(proportions, idx_batch)])
+            proportions = proportions / proportions.sum()
+            proportions = (np.cumsum(proportions) * len(idx_k)).astype(int)[:-1]
+            idx_batch_split = np.split(idx_k, proportions)
+            for i in range(num_clients):
+                idx_batch[i] += idx_batch_split[i].tolist()
+        min_size = min([len(idx_j) for idx_j in idx_batch])
+    partition_idxs = np.array(idx_batch[client_id - 1])
+    np.random.shuffle(partition_idxs)
+    return partition_idxs
+
+
+def cronometrar(funcion, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, nargs="+", default=[2, 10, 100, 1000])
+    # Con alpha=0.1 y cientos de clientes el bucle original no termina nunca (no alcanza 10 muestras por cliente).
+    parser.add_argument("--alpha", type=float, default=0.5)
+    parser.add_argument("--muestras", type=int, default=70000)
+    args = parser.parse_args()
+
+    # Etiquetas sintéticas con el mismo tamaño y número de clases que MNIST (no hace falta descargarlo).
+    y = np.random.RandomState(0).randint(0, 10, args.muestras)
+
+    print(f"{'clientes':>9} | {'original/cliente':>16} | {'original flota':>14} | {'vectorizado':>11} | {'carga manifiesto':>16}")
+    for n in args.clientes:
+        t_original = cronometrar(lambda: particion_original(y, 1, n, args.alpha), repeticiones=1)
+        t_vector = cronometrar(lambda: partition_indices(y, n, "dirichlet", args.alpha))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            obtener_particion(y, 1, n, "dirichlet", args.alpha, directorio_base=tmp)
+            t_carga = cronometrar(lambda: obtener_particion(y, n, n, "dirichlet", args.alpha, directorio_base=tmp))
+
+        print(f"{n:>9} | {t_original:>15.3f}s | {t_original * n:>13.1f}s | {t_vector:>10.3f}s | {t_carga * 1000:>14.2f}ms")
@@ -0,0 +1,64 @@
+"""
+**Benchmark de la agregación robusta**
+
+Tiempo de agregación de cada método en función del número de clientes y del tamaño del modelo, con deltas sintéticos.
+El último cliente es un atacante como el de generate_compose.py (ruido N(0, 10)), así que también se comprueba
+que el método lo deja fuera.
+
+Como referencia se incluye Krum "ingenuo" (doble bucle de Python sobre pares de clientes) para tamaños pequeños.
+
+Uso:
+    python benchmarks/bench_robusta.py --clientes 10 50 200 --parametros 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+from robusta import agregar_robusto, METODOS  # noqa: E402
+
+
+def krum_ingenuo(X, f):
+    """Krum con un bucle por cada par de clientes."""
+    n = len(X)
+    puntuaciones = []
+    for i in range(n):
+        distancias = sorted(float(np.sum((X[i] - X[j]) ** 2)) for j in range(n) if j != i)
+        puntuaciones.append(sum(distancias[:max(1, n - f - 2)]))
+    return int(np.argmin(puntuaciones))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--parametros", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-gb", type=float, default=2.0, help="Salta combinaciones cuya matriz supere este tamaño.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'clientes':>8} | {'parámetros':>10} | {'método':>12} | {'tiempo':>9} | {'atacante fuera':>14}")
+    for n in args.clientes:
+        for d in args.parametros:
+            if n * d * 4 / 1e9 > args.max_gb:
+                continue
+            deltas = rng.normal(0.0, 0.01, size=(n, d)).astype(np.float32)
+            deltas[-1] = rng.normal(0.0, 10.0, size=d) # Atacante
+            muestras = rng.integers(1000, 5000, size=n)
+
+            for metodo in METODOS[1:]:
+                agregado, informe = agregar_robusto(deltas, muestras, metodo, f=1, factor_norma=0.0)
+                fuera = (n - 1) not in informe["seleccionados"] if metodo in ("krum", "multikrum") \
+                    else informe["distancia_al_agregado"][-1] > 10 * np.median(informe["distancia_al_agregado"])
+                print(f"{n:>8} | {d:>10} | {metodo:>12} | {informe['t_agregacion'] * 1000:>7.1f}ms | {str(fuera):>14}")
+
+            _, informe = agregar_robusto(deltas, muestras, "fedavg", factor_norma=3.0)
+            print(f"{n:>8} | {d:>10} | {'filtro norma':>12} | {informe['t_agregacion'] * 1000:>7.1f}ms | "
+                  f"{str(informe['descartados_norma'] == [n - 1]):>14}")
+
+            if n <= 50 and d <= 100_000:
+                inicio = time.perf_counter()
+                elegido = krum_ingenuo(deltas, 1)
+                print(f"{n:>8} | {d:>10} | {'krum ingenuo':>12} | {(time.perf_counter() - inicio) * 1000:>7.1f}ms | "
+                      f"{str(elegido != n - 1):>14}")
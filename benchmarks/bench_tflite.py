@@ -0,0 +1,97 @@
+"""
+**Benchmark de la evaluación con TFLite (client/inferencia.py) frente a Keras float32**
+
+Simula las rondas de evaluación de un cliente: en cada ronda el modelo "global" cambia (una época de entrenamiento
+sobre los datos de entrenamiento) y se evalúa el test local con:
+
+- "keras float32": set_weights + model.predict(LotesMNIST), lo que hace evaluate sin EVAL_TFLITE.
+- MotorTFLite con "float32", "dynamic" e "int8": actualizar (conversión la primera vez, pesos escritos en el
+  modelo convertido después; "int8" se convierte en todas las rondas) + predecir.
+
+Para cada motor: tiempo de la primera ronda (con la conversión), mediana del resto, aceleración frente a Keras
+(mediana del resto de rondas), pérdida de accuracy media y máxima frente a Keras y tamaño del modelo.
+
+Con --hilos 1 TensorFlow y TFLite usan un solo hilo, lo más parecido a los perfiles IoT (0.5 CPU) y Movil (1.0 CPU).
+Datos: MNIST_NPZ si existe o un MNIST sintético (como bench_e2e.py).
+
+Uso:
+    python benchmarks/bench_tflite.py --muestras 12000 --rondas 10 --hilos 1
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "client"))
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+import tensorflow as tf  # noqa: E402
+from comun.modelo import build_model  # noqa: E402
+from entrenamiento import LotesMNIST  # noqa: E402
+from inferencia import MotorTFLite, CUANTIZACIONES  # noqa: E402
+from experimentos.local import crear_mnist_sintetico  # noqa: E402
+
+
+def cargar_datos(muestras):
+    ruta = os.environ.get("MNIST_NPZ")
+    if not ruta or not os.path.exists(ruta):
+        ruta = os.path.join(tempfile.mkdtemp(), "mnist_sintetico.npz")
+        crear_mnist_sintetico(ruta, muestras)
+    datos = np.load(ruta)
+    return datos["x_train"][:muestras], datos["y_train"][:muestras], datos["x_test"], datos["y_test"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--muestras", type=int, default=12000, help="Muestras de entrenamiento.")
+    parser.add_argument("--test", type=int, default=2000, help="Muestras del test local que se evalúan.")
+    parser.add_argument("--rondas", type=int, default=10)
+    parser.add_argument("--hilos", type=int, default=0, help="Hilos de TensorFlow y TFLite (0 = los de por defecto).")
+    args = parser.parse_args()
+
+    if args.hilos:
+        tf.config.threading.set_intra_op_parallelism_threads(args.hilos)
+        tf.config.threading.set_inter_op_parallelism_threads(args.hilos)
+    x, y, x_test, y_test = cargar_datos(args.muestras)
+    x_test, y_test = x_test[:args.test], y_test[:args.test]
+
+    model = build_model()
+    evaluador = build_model() # El del cliente: recibe los pesos globales y evalúa
+    motores = {q: MotorTFLite(q, x_calibracion=x, hilos=args.hilos or None)
+               for q in CUANTIZACIONES}
+    tiempos = {"keras float32": [], **{q: [] for q in motores}}
+    conversiones = {q: [] for q in motores}
+    brechas = {q: [] for q in motores}
+    for ronda in range(args.rondas):
+        model.fit(LotesMNIST(x, y, batch_size=32, shuffle=True), epochs=1, verbose=0)
+        pesos = model.get_weights()
+
+        inicio = time.perf_counter()
+        evaluador.set_weights(pesos)
+        referencia = evaluador.predict(LotesMNIST(x_test, y_test, batch_size=256), verbose=0)
+        tiempos["keras float32"].append(time.perf_counter() - inicio)
+        acc_referencia = float(np.mean(np.argmax(referencia, axis=1) == y_test))
+
+        for q, motor in motores.items():
+            inicio = time.perf_counter()
+            conversiones[q].append(motor.actualizar(pesos)["conversion"])
+            probabilidades = motor.predecir(x_test)
+            tiempos[q].append(time.perf_counter() - inicio)
+            brechas[q].append(acc_referencia - float(np.mean(np.argmax(probabilidades, axis=1) == y_test)))
+        print(f"Ronda {ronda + 1}: accuracy Keras {acc_referencia:.4f} | " +
+              " | ".join(f"{q} {acc_referencia - brechas[q][-1]:.4f}" for q in motores))
+
+    keras = float(np.median(tiempos["keras float32"][1:]))
+    print(f"\n{len(x_test)} muestras de test, {args.rondas} rondas, hilos: {args.hilos or 'por defecto'}")
+    print(f"{'motor':>14} | {'1ª ronda':>9} | {'mediana':>9} | {'aceleración':>11} | {'conversiones':>12} | "
+          f"{'brecha media':>12} | {'brecha máx':>10} | {'tamaño':>9}")
+    print(f"{'keras float32':>14} | {tiempos['keras float32'][0]:>8.3f}s | {keras:>8.4f}s | {'x1.00':>11} | "
+          f"{'-':>12} | {'-':>12} | {'-':>10} | {'-':>9}")
+    for q, motor in motores.items():
+        mediana = float(np.median(tiempos[q][1:])) if args.rondas > 1 else float("nan")
+        print(f"{q:>14} | {tiempos[q][0]:>8.3f}s | {mediana:>8.4f}s | {'x' + format(keras / mediana, '.2f'):>11} | "
+              f"{sum(conversiones[q]):>12} | {np.mean(brechas[q]):>+12.4f} | {np.max(brechas[q]):>+10.4f} | "
+              f"{motor.bytes_modelo / 1024:>6.1f} KB")
@@ -0,0 +1,326 @@
+"""
+**Benchmark de los parámetros en trozos (comun/trozos.py, server/transferencia.py)**
+
+Una ronda de fit de un cliente con un modelo sintético de --mb MB (capas float32, varios tamaños de cientos de MB),
+sin entrenar (el cliente devuelve los pesos que recibe). El servidor y el cliente son dos procesos (spawn) unidos por
+un Pipe: ProxyProceso serializa cada mensaje con protobuf, lo envía como bytes y el cliente lo parsea, como en gRPC.
+
+- "completo":         el modelo entero en FitIns y en FitRes (Flower de siempre, PARAM_CHUNK_KB=0).
+- "trozos":           GestorClientesTrozos con trozos de --kb KB; la subida se reconstruye en un buffer.
+- "trozos + stream":  además la subida se suma trozo a trozo a un AcumuladorFedAvg al llegar el último (STREAMING_AGG).
+
+Para cada variante: tiempo, mensajes, bytes en el cable y el pico de memoria residente (VmHWM) de CADA proceso
+durante la ronda, en "modelos": (pico - residente antes de la ronda) / bytes del modelo. En el servidor no cuenta el
+modelo global, que ya estaba en memoria antes de la ronda.
+
+Con --mb 200 500 (1 MB por trozo) el servidor llega a 2.0 modelos con "completo" (el mensaje serializado y el
+FitRes parseado), 1.0 con "trozos" y 2.0 con "trozos + stream"; el cliente a 2.0-2.1 con "completo" y 1.0 con trozos.
+En "trozos + stream" son la suma del acumulador (float32, y el resultado se divide sobre ella) y los trozos del
+cliente, que se guardan hasta que llega el último para no sumar una subida a medias. Ese pico no crece con el número
+de clientes que ya han respondido; el de "completo" (y el de "trozos", que reconstruye el modelo de cada cliente) sí,
+un modelo por cliente. En el cliente los trozos evitan las copias del mensaje entero (serializado y parseado)
+en los dos sentidos.
+
+Después, en un solo proceso (ProxyCable) y con trozos:
+- "pérdidas": cada trozo de la bajada llega corrupto con probabilidad --perdida; sólo se repiten esos trozos.
+- "corte":    la conexión se corta a mitad de la bajada; el cliente se reinicia (un ClienteBuffer nuevo con el mismo
+              directorio) y vuelve a conectarse: sólo se le envían los trozos que faltaban.
+
+Uso:
+    python benchmarks/bench_trozos.py --mb 200 500 --kb 1024
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "server"))
+import flwr as fl  # noqa: E402
+from flwr.common import serde, FitIns  # noqa: E402
+from flwr.server.client_proxy import ClientProxy  # noqa: E402
+from flwr.proto.transport_pb2 import ClientMessage  # noqa: E402
+from comun.parametros import ClienteBuffer, ndarrays_a_parameters, parameters_a_ndarrays  # noqa: E402
+from comun.agregacion import AcumuladorFedAvg  # noqa: E402
+from comun.datos import memoria_residente_mb  # noqa: E402
+from transferencia import GestorClientesTrozos  # noqa: E402
+
+
+class ClienteEco(fl.client.NumPyClient):
+    """Devuelve los pesos que recibe: sólo se mide el transporte."""
+
+    def get_parameters(self, config):
+        return []
+
+    def fit(self, parameters, config):
+        return parameters, 100, {}
+
+    def evaluate(self, parameters, config):
+        return 0.0, 100, {}
+
+
+class ProxyCable(ClientProxy):
+    """
+    ClientProxy en el mismo proceso que pasa cada mensaje por protobuf (serializar + parsear, en los dos sentidos).
+    Con `perdida` corrompe un byte de algunos trozos de la bajada; con `corte` falla al llegar a ese mensaje.
+    """
+
+    def __init__(self, cid, cliente, perdida=0.0, corte=None, semilla=0):
+        super().__init__(cid)
+        self.cliente = cliente
+        self.perdida = perdida
+        self.corte = corte
+        self.azar = np.random.default_rng(semilla)
+        self.mensajes = 0
+        self.bytes = 0
+
+    def _cable(self, mensaje, a_proto, de_proto):
+        self.mensajes += 1
+        if self.corte is not None and self.mensajes >= self.corte:
+            raise ConnectionError(f"Conexión cortada en el mensaje {self.mensajes}")
+        proto = a_proto(mensaje)
+        datos = proto.SerializeToString()
+        self.bytes += len(datos)
+        recibido = type(proto)()
+        del proto
+        recibido.ParseFromString(datos)
+        return de_proto(recibido)
+
+    def get_properties(self, ins, timeout):
+        if ins.config.get("trozos") == "bajada" and self.perdida > 0 and self.azar.random() < self.perdida:
+            datos = bytearray(ins.config["datos"])
+            datos[0] ^= 0xFF
+            ins.config["datos"] = bytes(datos)
+        ins = self._cable(ins, serde.get_properties_ins_to_proto, serde.get_properties_ins_from_proto)
+        res = self.cliente.get_properties(ins)
+        return self._cable(res, serde.get_properties_res_to_proto, serde.get_properties_res_from_proto)
+
+    def get_parameters(self, ins, timeout):
+        return self.cliente.get_parameters(ins)
+
+    def fit(self, ins, timeout):
+        ins = self._cable(ins, serde.fit_ins_to_proto, serde.fit_ins_from_proto)
+        res = self.cliente.fit(ins)
+        return self._cable(res, serde.fit_res_to_proto, serde.fit_res_from_proto)
+
+    def evaluate(self, ins, timeout):
+        return self.cliente.evaluate(ins)
+
+    def reconnect(self, ins, timeout):
+        return None
+
+
+class ProxyProceso(ClientProxy):
+    """ClientProxy hacia un cliente en otro proceso (_proceso_cliente): cada mensaje va serializado por un Pipe."""
+
+    def __init__(self, cid, conexion):
+        super().__init__(cid)
+        self.conexion = conexion
+        self.mensajes = 0
+        self.bytes = 0
+
+    def _llamar(self, tipo, ins, a_proto, tipo_respuesta, de_proto):
+        datos = a_proto(ins).SerializeToString()
+        self.conexion.send(tipo)
+        self.conexion.send_bytes(datos)
+        self.mensajes += 2
+        self.bytes += len(datos)
+        del datos
+        datos = self.conexion.recv_bytes()
+        self.bytes += len(datos)
+        respuesta = tipo_respuesta()
+        respuesta.ParseFromString(datos)
+        del datos
+        return de_proto(respuesta)
+
+    def get_properties(self, ins, timeout):
+        return self._llamar("get_properties", ins, serde.get_properties_ins_to_proto, ClientMessage.GetPropertiesRes,
+                            serde.get_properties_res_from_proto)
+
+    def get_parameters(self, ins, timeout):
+        return self._llamar("get_parameters", ins, serde.get_parameters_ins_to_proto, ClientMessage.GetParametersRes,
+                            serde.get_parameters_res_from_proto)
+
+    def fit(self, ins, timeout):
+        return self._llamar("fit", ins, serde.fit_ins_to_proto, ClientMessage.FitRes, serde.fit_res_from_proto)
+
+    def evaluate(self, ins, timeout):
+        return self._llamar("evaluate", ins, serde.evaluate_ins_to_proto, ClientMessage.EvaluateRes,
+                            serde.evaluate_res_from_proto)
+
+    def reconnect(self, ins, timeout):
+        return None
+
+
+def _reiniciar_pico():
+    """Pone VmHWM a la memoria residente actual (Linux). Sin /proc el pico incluye la preparación."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _proceso_cliente(conexion):
+    """Cliente: parsea cada petición, la atiende con ClienteBuffer(ClienteEco) y devuelve la respuesta serializada."""
+    from flwr.proto.transport_pb2 import ServerMessage
+    cliente = ClienteBuffer(ClienteEco())
+    mensajes = {
+        "get_properties": (ServerMessage.GetPropertiesIns, serde.get_properties_ins_from_proto, cliente.get_properties,
+                           serde.get_properties_res_to_proto),
+        "get_parameters": (ServerMessage.GetParametersIns, serde.get_parameters_ins_from_proto,
+                           cliente.get_parameters, serde.get_parameters_res_to_proto),
+        "fit": (ServerMessage.FitIns, serde.fit_ins_from_proto, cliente.fit, serde.fit_res_to_proto),
+        "evaluate": (ServerMessage.EvaluateIns, serde.evaluate_ins_from_proto, cliente.evaluate,
+                     serde.evaluate_res_to_proto),
+    }
+    _reiniciar_pico()
+    base = memoria_residente_mb()[0]
+    while True:
+        tipo = conexion.recv()
+        if tipo is None:
+            break
+        tipo_ins, de_proto, atender, a_proto = mensajes[tipo]
+        datos = conexion.recv_bytes()
+        peticion = tipo_ins()
+        peticion.ParseFromString(datos)
+        del datos
+        respuesta = a_proto(atender(de_proto(peticion)))
+        del peticion
+        datos = respuesta.SerializeToString()
+        del respuesta
+        conexion.send_bytes(datos)
+        del datos
+    conexion.send((base, memoria_residente_mb()[1]))
+
+
+def _proceso_servidor(conexion, resultado, variante, mb, kb):
+    """Servidor: una ronda de fit con la variante y (tiempo, mensajes, bytes, MB antes, pico MB, pesos correctos)."""
+    pesos = modelo_sintetico(mb)
+    parameters = ndarrays_a_parameters(pesos)
+    proxy = ProxyProceso("0", conexion)
+    acumulador = AcumuladorFedAvg()
+
+    def consumidor(server_round, res, manifiesto, trozos):
+        acumulador.sumar_trozos(manifiesto, list(trozos), res.num_examples)
+        return True
+
+    cliente = proxy
+    if variante != "completo":
+        gestor = GestorClientesTrozos(kb * 1024, consumidor=consumidor if variante == "trozos + stream" else None)
+        gestor.register(proxy)
+        cliente = gestor.clients[proxy.cid]
+
+    _reiniciar_pico()
+    base = memoria_residente_mb()[0]
+    inicio = time.perf_counter()
+    res = cliente.fit(FitIns(parameters=parameters, config={"server_round": 1}), timeout=None)
+    recibidos = acumulador.resultado() if acumulador.actualizaciones else parameters_a_ndarrays(res.parameters)
+    t = time.perf_counter() - inicio
+    pico = memoria_residente_mb()[1]
+    del res
+    correctos = all(np.allclose(a, b) for a, b in zip(recibidos, pesos))
+    conexion.send(None)
+    resultado.send((t, proxy.mensajes, proxy.bytes, base, pico, correctos))
+
+
+def medir_procesos(variante, mb, kb):
+    """Una ronda con servidor y cliente en procesos separados: (tiempo, mensajes, bytes, servidor, cliente) en MB."""
+    contexto = multiprocessing.get_context("spawn") # Procesos nuevos: ni la memoria ni el pico del padre
+    lado_servidor, lado_cliente = contexto.Pipe()
+    resultado_rx, resultado_tx = contexto.Pipe(duplex=False)
+    procesos = [contexto.Process(target=_proceso_cliente, args=(lado_cliente,)),
+                contexto.Process(target=_proceso_servidor, args=(lado_servidor, resultado_tx, variante, mb, kb))]
+    for proceso in procesos:
+        proceso.start()
+    t, mensajes, bytes_cable, base_servidor, pico_servidor, correctos = resultado_rx.recv()
+    base_cliente, pico_cliente = lado_servidor.recv()
+    for proceso in procesos:
+        proceso.join()
+    assert correctos, variante
+    return t, mensajes, bytes_cable, pico_servidor - base_servidor, pico_cliente - base_cliente
+
+
+def modelo_sintetico(mb, capas=8, semilla=0):
+    """Capas float32 que suman `mb` MB."""
+    azar = np.random.default_rng(semilla)
+    return [azar.standard_normal(elementos_capa(mb, capas), dtype=np.float32) for _ in range(capas)]
+
+
+def elementos_capa(mb, capas=8):
+    return int(mb * 2**20 // 4 // capas)
+
+
+def ronda(variante, pesos, kb, directorio=None, perdida=0.0, corte=None):
+    """En un solo proceso: (segundos, proxy del cable, estadísticas de los trozos, pesos que llegan al servidor)."""
+    parameters = ndarrays_a_parameters(pesos)
+    proxy = ProxyCable("0", ClienteBuffer(ClienteEco(), directorio=directorio), perdida=perdida, corte=corte)
+    estadisticas, acumulador = {}, AcumuladorFedAvg()
+
+    def registrar(server_round, clave, valores):
+        estadisticas[clave] = valores
+
+    def consumidor(server_round, res, manifiesto, trozos):
+        acumulador.sumar_trozos(manifiesto, list(trozos), res.num_examples)
+        return True
+
+    cliente = proxy
+    if variante != "completo":
+        gestor = GestorClientesTrozos(kb * 1024, registrar=registrar,
+                                      consumidor=consumidor if variante == "trozos + stream" else None)
+        gestor.register(proxy)
+        cliente = gestor.clients[proxy.cid]
+
+    inicio = time.perf_counter()
+    res = cliente.fit(FitIns(parameters=parameters, config={"server_round": 1}), timeout=None)
+    recibidos = acumulador.resultado() if acumulador.actualizaciones else parameters_a_ndarrays(res.parameters)
+    return time.perf_counter() - inicio, proxy, estadisticas, recibidos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, nargs="+", default=[200, 500], help="Tamaños del modelo en MB.")
+    parser.add_argument("--kb", type=int, default=1024, help="Tamaño de trozo en KB (PARAM_CHUNK_KB).")
+    parser.add_argument("--perdida", type=float, default=0.05, help="Probabilidad de que un trozo llegue corrupto.")
+    args = parser.parse_args()
+
+    print(f"Trozos de {args.kb} KB | Pico de memoria residente de cada proceso durante la ronda, en modelos (MB)")
+    print(f"{'modelo':>8} | {'variante':>16} | {'tiempo':>8} | {'mensajes':>8} | {'cable':>9} | {'servidor':>17} | "
+          f"{'cliente':>17}")
+    for mb in args.mb:
+        bytes_modelo = elementos_capa(mb) * 4 * 8 / 2**20 # MB del modelo de los procesos
+        for variante in ("completo", "trozos", "trozos + stream"):
+            t, mensajes, bytes_cable, servidor, cliente = medir_procesos(variante, mb, args.kb)
+            print(f"{bytes_modelo:>5.0f} MB | {variante:>16} | {t:>7.2f}s | {mensajes:>8} | "
+                  f"{bytes_cable / 2**20:>6.0f} MB | {servidor / bytes_modelo:>5.2f} ({servidor:>6.0f} MB) | "
+                  f"{cliente / bytes_modelo:>5.2f} ({cliente:>6.0f} MB)")
+
+    pesos = modelo_sintetico(min(args.mb))
+    bytes_modelo = sum(p.nbytes for p in pesos)
+    t, proxy, estadisticas, recibidos = ronda("trozos", pesos, args.kb, perdida=args.perdida)
+    assert all(np.array_equal(a, b) for a, b in zip(recibidos, pesos))
+    bajada = estadisticas["bajada_fit"]
+    print(f"\nPérdidas ({args.perdida:.0%} de los trozos corruptos): {bajada['trozos']} trozos, "
+          f"{bajada['reintentos']} repetidos | {t:.2f}s")
+
+    directorio = tempfile.mkdtemp(prefix="bench_trozos_")
+    try:
+        num_trozos = -(-bytes_modelo // (args.kb * 1024))
+        corte = 4 + num_trozos # Ida y vuelta de "capacidad", "manifiesto" y la mitad de los trozos
+        try:
+            ronda("trozos", pesos, args.kb, directorio=directorio, corte=corte)
+        except ConnectionError as error:
+            print(f"Corte: {error}")
+        del recibidos
+        t, proxy, estadisticas, recibidos = ronda("trozos", pesos, args.kb, directorio=directorio)
+        assert all(np.array_equal(a, b) for a, b in zip(recibidos, pesos))
+        bajada = estadisticas["bajada_fit"]
+        print(f"Tras reiniciar el cliente: {bajada['reanudados']} trozos ya en disco, {bajada['trozos']} enviados "
+              f"de {bajada['trozos'] + bajada['reanudados']} | {bajada['bytes'] / 2**20:.0f} MB | {t:.2f}s")
+    finally:
+        shutil.rmtree(directorio)
@@ -1,12 +1,30 @@
+import time
+T_INICIO = time.time() # Arranque del proceso, para medir cuánto tarda el cliente en atender al servidor
 import os # Para manejar variables de entorno. Aquí se usa para obtener el ID del cliente desde una variable de entorno.
+import recursos
+#Hilos de TensorFlow y de la BLAS según la cuota de CPU del contenedor (o CPU_LIMIT), no según los núcleos del host.
+#Va antes de importar NumPy (Flower lo importa): OpenBLAS dimensiona su pool al cargarse. Ver recursos.py.
+#CPU_TUNING=False deja los valores por defecto de cada librería.
+CPU_TUNING = os.environ.get("CPU_TUNING", "True") == "True"
+CPUS, ORIGEN_CPUS = recursos.cpus_disponibles(os.environ.get("CPU_LIMIT"))
+HILOS = recursos.hilos_para(CPUS) if CPU_TUNING else None
+if CPU_TUNING:
+    recursos.configurar_entorno(HILOS)
 import flwr as fl
-import tensorflow as tf
 import numpy as np
-import json
 import datetime
 import subprocess # Para ejecutar comandos de linux
-import time
-from sklearn.metrics import precision_score, recall_score, f1_score
+import threading
+from particionado import obtener_particion, clave_manifiesto
+from comun.datos import cargar_o_crear_almacen, memoria_residente_mb
+from comun.metricas import metricas_desde_probabilidades
+from estado import CacheCliente
+from comun.compresion import CodificadorActualizaciones
+from comun.perfilado import Perfilador
+from comun.descarga import ReceptorModelo
+from comun.parametros import BufferModelo, ClienteBuffer
+from comun.registro import RegistroJSONL
+#TensorFlow (modelo y entrenamiento) se importa en segundo plano al arrancar. Ver RuntimeCliente.
 #import flex.data
 #from flex.data import Dataset, FedDatasetConfig, FedDataDistribution
 
@@ -44,8 +62,17 @@ def configurar_red_adversa():
     except Exception as e:
         print(f" Excepción configurando red: {e}")
 
-#Llamada incial.
-configurar_red_adversa()
+#Llamada incial. NET_EMULATION=False la salta (benchmarks en localhost: no queremos tocar la interfaz del host).
+if os.environ.get("NET_EMULATION", "True") == "True":
+    configurar_red_adversa()
+
+#Carpeta de resultados (volumen compartido en Docker).
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "/app/results")
+#Escritura de client_<id>_metrics.json: líneas enteras en una sola escritura, de RESULTS_BUFFER_LINES en
+#RESULTS_BUFFER_LINES (1 = al momento) o cada RESULTS_BUFFER_S segundos, y al salir. Ver comun/registro.py.
+RESULTS_BUFFER_LINES = int(os.environ.get("RESULTS_BUFFER_LINES", "1"))
+RESULTS_BUFFER_S = float(os.environ.get("RESULTS_BUFFER_S", "0"))
+RESULTS_FSYNC = os.environ.get("RESULTS_FSYNC", "False") == "True"
 
 
 
@@ -74,11 +101,10 @@ Es por eso que al cargar el dataset con tf.keras.datasets.mnist.load_data(), obt
 Más información del dataset MNIST en:
 https://interactivechaos.com/es/manual/tutorial-de-deep-learning/el-dataset-mnist
 """
-(x_train, y_train), (x_test, y_test) = tf.keras.datasets.mnist.load_data()
-
-#Para no acabar con el error de lógica que se iba a cometer, unimos el conjunto de entrenamiento y de test:
-x_all = np.concatenate([x_train, x_test])
-y_all = np.concatenate([y_train, y_test])
+#Para no acabar con el error de lógica que se iba a cometer, el almacén ya tiene unidos el conjunto de entrenamiento y de test.
+#Las imágenes se quedan en uint8 y en un memmap compartido por todos los clientes del host. Ver comun/datos.py.
+DATASET_DIR = os.environ.get("DATASET_DIR", os.path.join(RESULTS_DIR, "dataset"))
+#La carga se hace en preparar_datos(), y sólo si la partición no está ya en la caché local del cliente.
 
 
 
@@ -100,11 +126,8 @@ Hay muchos trabajos de preprocesamiento que realiza esto.
 https://www.kaggle.com/code/merfarukyce/mnist-cnn-classification
 https://www.kaggle.com/code/sani84/mnist-cnn
 """
-#Normalización
-x_all = x_all / 255.0
-
-#Redimensionar, añadimos canal del color.
-x_all = x_all.reshape(-1, 28, 28, 1)
+#La normalización y el redimensionado NO se hacen aquí sobre las 70.000 imágenes (era una copia float64 de ~440 MB).
+#Se aplican lote a lote con normalizar_lote() justo antes de pasar los datos al modelo. Ver LotesMNIST y MotorEntrenamiento en entrenamiento.py.
 
 """ 
 **Ralizamos la distribución no-IDD de los datos entre los clientes.**
@@ -135,7 +158,7 @@ num_clients = int(os.environ.get("TOTAL_CLIENTS", "2"))
 #Para identficarlo en los logs.
 print(f" Cliente ID: {client_id} de {num_clients}")
 
-def partition_data(x, y, client_id, num_clients, method="dirichlet", alpha=0.5, balance_quantity=True):
+def partition_data(x, y, client_id, num_clients, method="dirichlet", alpha=0.5, balance_quantity=True, seed=42):
     """
     Divide los datos según los métodos descritos en el paper FLEX y el TFM.
     
@@ -146,57 +169,20 @@ def partition_data(x, y, client_id, num_clients, method="dirichlet", alpha=0.5,
                    probabilidad de cada clase en cada cliente.
                    alpha pequeño (0.1) = Muy Non-IID (desbalanceado).
                    alpha grande (100) = Casi IID (balanceado).
-    """
-    # IMPORTANTE: Fijar la semilla para que todos los clientes en Docker
-    # calculen exactamente la misma matriz de distribución.
-    np.random.seed(42) 
-    
-    if method == "iid":
-        # Reparto aleatorio simple
-        idxs = np.random.permutation(len(x))
-        partition_idxs = np.array_split(idxs, num_clients)[client_id - 1]
-        
-    elif method == "pathological":
-        # Ordenar por etiquetas y dividir en trozos. Es el método anterior que tenía.
-        # Esto simula "Label Quantity Skew" donde cada cliente tiene pocas etiquetas
-        idxs_sorted = np.argsort(y)
-        partition_idxs = np.array_split(idxs_sorted, num_clients)[client_id - 1]
-        
-    elif method == "dirichlet":
-        n_classes = len(np.unique(y))
-        min_size = 0
-        min_require_size = 10 
-        N = len(x)
-        idxs = np.arange(N)
-        
-        while min_size < min_require_size:
-            idx_batch = [[] for _ in range(num_clients)]
-            for k in range(n_classes):
-                idx_k = idxs[y == k]
-                np.random.shuffle(idx_k)
-                
-                proportions = np.random.dirichlet(np.repeat(alpha, num_clients))
-                
-                # --- CAMBIO CLAVE AQUÍ ---
-                if balance_quantity:
-                    # El "freno" original: evita que uno se llene demasiado
-                    proportions = np.array([p * (len(idx_j) < N / num_clients) for p, idx_j in zip(proportions, idx_batch)])
-                
-                # Normalizamos siempre para que sume 1
-                proportions = proportions / proportions.sum()
-                proportions = (np.cumsum(proportions) * len(idx_k)).astype(int)[:-1]
-                
-                idx_batch_split = np.split(idx_k, proportions)
-                for i in range(num_clients):
-                    idx_batch[i] += idx_batch_split[i].tolist()
-            
-            min_size = min([len(idx_j) for idx_j in idx_batch])
 
-        partition_idxs = np.array(idx_batch[client_id - 1])
-        np.random.shuffle(partition_idxs)
-        
-    else:
-        raise ValueError(f"Método '{method}' no reconocido.")
+    El reparto completo se calcula UNA sola vez (vectorizado) y se guarda en un manifiesto
+    en el volumen compartido. El resto de clientes sólo lee sus propios índices. Ver particionado.py.
+    """
+    # IMPORTANTE: la semilla fija hace que todos los clientes en Docker
+    # obtengan exactamente la misma matriz de distribución.
+    partition_idxs = obtener_particion(
+        y, client_id, num_clients,
+        method=method,
+        alpha=alpha,
+        balance_quantity=balance_quantity,
+        seed=seed,
+        directorio_base=PARTITION_DIR if HOLDOUT_SIZE == 0 else os.path.join(PARTITION_DIR, f"holdout{HOLDOUT_SIZE}")
+    )
 
     return x[partition_idxs], y[partition_idxs]
 
@@ -205,88 +191,156 @@ def partition_data(x, y, client_id, num_clients, method="dirichlet", alpha=0.5,
 # "dirichlet"    -> Realista (desbalanceado suave o fuerte según alpha)
 # "iid"          -> Perfecto (irreal)
 
-DISTRIBUTION_METHOD = "dirichlet" 
-DIRICHLET_ALPHA = 0.1 # Cuanto más pequeño, más desbalanceado. 0.1 es muy desbalanceado, 1 es casi balanceado (IID).
+DISTRIBUTION_METHOD = os.environ.get("DISTRIBUTION_METHOD", "dirichlet")
+DIRICHLET_ALPHA = float(os.environ.get("DIRICHLET_ALPHA", "0.1")) # Cuanto más pequeño, más desbalanceado. 0.1 es muy desbalanceado, 1 es casi balanceado (IID).
 DIRICHLET_BALANCE_QUANTITY = True # Si True, se asegura que ningún cliente tenga demasiados datos (freno para clientes con mucho más datos que otros).
+PARTITION_SEED = int(os.environ.get("PARTITION_SEED", "42")) # Semilla común a todos los clientes.
+PARTITION_DIR = os.environ.get("PARTITION_DIR", os.path.join(RESULTS_DIR, "particiones")) # Dónde se guarda el manifiesto compartido.
+
+#Las últimas HOLDOUT_SIZE muestras del almacén son el holdout de la evaluación en el servidor: no se reparten.
+#Tiene que valer lo mismo que en el servidor. Ver server/evaluacion.py.
+HOLDOUT_SIZE = int(os.environ.get("HOLDOUT_SIZE", "0"))
+
+TEST_SIZE = 0.2 # Fracción de la partición local que se reserva para evaluar.
+SPLIT_SEED = 42
+
+def preparar_datos(cid=client_id):
+    """Carga el almacén, aplica la partición del cliente `cid` y hace el split local. Devuelve (x_train, x_test, y_train, y_test)."""
+    x_all, y_all = cargar_o_crear_almacen(DATASET_DIR)
+    if HOLDOUT_SIZE > 0:
+        x_all, y_all = x_all[:-HOLDOUT_SIZE], y_all[:-HOLDOUT_SIZE] # Vistas: el memmap no se copia
+
+    # Aplicar partición en total
+    x_client, y_client = partition_data(
+        x_all, y_all,
+        cid,
+        num_clients,
+        method=DISTRIBUTION_METHOD,
+        alpha=DIRICHLET_ALPHA,
+        balance_quantity=DIRICHLET_BALANCE_QUANTITY,
+        seed=PARTITION_SEED
+    )
 
-# Aplicar partición en total
-x_client, y_client = partition_data(
-    x_all, y_all,
-    client_id,
-    num_clients,
-    method=DISTRIBUTION_METHOD,
-    alpha=DIRICHLET_ALPHA,
-    balance_quantity=DIRICHLET_BALANCE_QUANTITY
-)
-
-#Una vez obtenidos tanto las particiones de cada cliente. hacemos su split local.
-
-from sklearn.model_selection import train_test_split
-
-x_train_c, x_test_c, y_train_c, y_test_c = train_test_split(
-    x_client,
-    y_client,
-    test_size=0.2,
-    random_state=42,
-    shuffle=True
-)
-
-print(f"DATOS ASIGNADOS ({DISTRIBUTION_METHOD}):")
-print(f"   -> Train: {len(x_train_c)} imgs. Etiquetas únicas: {np.unique(y_train_c)}")
-print(f"   -> Test:  {len(x_test_c)} imgs. Etiquetas únicas: {np.unique(y_test_c)}")
+    #Una vez obtenidos tanto las particiones de cada cliente. hacemos su split local.
 
-"""
+    from sklearn.model_selection import train_test_split
 
-**Construimos el modelo de red neuronal convolucional (CNN)**
-Las redes neuronales convolucionales (CNN) es un tipo de red neuronal especializado en procesar datos con una estructura cuadrática, como imágenes.
-Referencia: https://www.tensorflow.org/tutorials/images/cnn
-Su funcionamiento es el siguiente:
-1. Capas convulacionales. A estas capas se le aplican kernels, pequeñas matrices que recorren la imagen, para extraer la características más importantes como bordes, tecturas, etc...
-2. Capas de pooling, que reducen la dimensionalidad de las características extraídas, manteniendo la información más relevante.
-3. Maxpooling, selecciona el valor máximo dentro cada región cubierta por el kernel.
-4. Flatten, convierte la matriz, en un vector para conectarlo con las neuronas.
-5. Se genera una red neuronal normal para razonar sobre las características y decidir.
-"""
-def build_model(): #Construir un modelo de red neuronal convolucional simple para clasificar las imágenes de MNIST
-    model = tf.keras.Sequential([ #Modelo secuencial apilando capas linealmente. signifca que la salida de una capa es la entrada de la siguiente
-        #Un filtro son las característica/objetivo que la red quiere aprender.
-        #Kenel es la matricula de la que se va a deslizar, en este caso es 3x3.
-        #La funcion de activación ReLU.
-        #La entrada de datos.
-        tf.keras.layers.Conv2D(8, 3, activation="relu", input_shape=(28, 28, 1)),
-        tf.keras.layers.MaxPooling2D(), #Reduce dimensaionalidad a 2x2.
-        tf.keras.layers.Flatten(), #Pasar de matriz a vector.
-        tf.keras.layers.Dense(16, activation="relu"), #Capa donde se razonan
-        tf.keras.layers.Dense(10, activation="softmax"), #Capa final para clasificación multiclase.
-    ])
-
-    model.compile( #Compilar el modelo con el optimizador Adam, la función de pérdida de entropía cruzada categórica y la métrica de precisión
-        optimizer="adam", 
-        loss="sparse_categorical_crossentropy", 
-        metrics=["accuracy"], 
+    #Al salir de la función se suelta la referencia al memmap completo: la partición ya está copiada en memoria.
+    return train_test_split(
+        x_client,
+        y_client,
+        test_size=TEST_SIZE,
+        random_state=SPLIT_SEED,
+        shuffle=True
     )
 
-    return model
-"""
-**Compilación del modelo**
-Es la configuración del modelo para el entranamiento del modelo.
-1. Optimizador:
-El optimizador ADAM (Adaptive Moment Estimation). Es un algoritmo de optimización.
-Aquí se aplica el descenso de la gradiente estocástico, para minimizar el error del modelo. Explicado en clase.
-El objetivo es encontrar un mínimo local de la función de pérdida
-
-2. Función de pérdida:
-La función de pérdida de entropía cruzada categórica. Mide cuanto mal lo hizo el modelo. Para ello calcula la pérdida (loss)
-Sparse significa que las etiquetas son enteros (0-9) en lugar de vectores one-hot.
-
-3. Métrica:
-La métrica de precisión para saber cuanto acertó de x imágnes.
 
 """
-    
-
-
-model = build_model()
+**Arranque perezoso y caché local (reincorporación rápida)**
+Pumba mata un cliente cada 2 minutos. Antes, al reiniciar, el cliente cargaba el dataset, particionaba, hacía el split
+y construía el modelo ANTES de conectarse, y volvía con un modelo sin entrenar.
+
+Ahora:
+1. El cliente se conecta al servidor en cuanto arranca (sólo necesita Flower).
+2. En paralelo, un hilo prepara lo pesado: TensorFlow, los datos y el modelo. La primera petición del servidor espera
+   a que termine.
+3. La partición ya repartida, los últimos pesos globales y el estado del optimizador se guardan en una caché local
+   (CLIENT_CACHE_DIR, ver estado.py). Al reiniciar se restauran en lugar de recalcularse.
+
+Los tiempos de arranque se guardan en client_[ID]_arranque.json.
+"""
+CLIENT_CACHE = os.environ.get("CLIENT_CACHE", "True") == "True"
+CLIENT_CACHE_DIR = os.environ.get("CLIENT_CACHE_DIR", os.path.join(RESULTS_DIR, "cache", f"cliente_{client_id}"))
+
+#Pipeline tf.data y paso de entrenamiento compilado, construidos una vez y reutilizados en todas las rondas (ver entrenamiento.py).
+#TRAIN_XLA=True compila el paso con XLA.
+TRAIN_XLA = os.environ.get("TRAIN_XLA", "False") == "True"
+
+class RuntimeCliente:
+    """Datos, modelo y motor de entrenamiento del cliente, inicializados en segundo plano."""
+
+    def __init__(self):
+        self.cache = CacheCliente(CLIENT_CACHE_DIR) if CLIENT_CACHE else None
+        self.listo = threading.Event()
+        self.error = None
+        self.arranque = {"client_id": client_id, "tiempo": str(datetime.datetime.now()), # Tiempos desde T_INICIO
+                         "cpus": CPUS, "origen_cpus": ORIGEN_CPUS, "hilos": HILOS}
+        self.hilo = threading.Thread(target=self._inicializar, daemon=True)
+
+    def iniciar(self):
+        self.hilo.start()
+
+    def _inicializar(self):
+        try:
+            #La clave identifica el reparto y el split: con otra configuración no se reutiliza la caché.
+            clave = (f"{clave_manifiesto(DISTRIBUTION_METHOD, DIRICHLET_ALPHA, num_clients, PARTITION_SEED, DIRICHLET_BALANCE_QUANTITY)}"
+                     f"_c{client_id}_t{TEST_SIZE}_r{SPLIT_SEED}_h{HOLDOUT_SIZE}")
+            datos = self.cache.cargar_particion(clave) if self.cache else None
+            self.arranque["cache_datos"] = datos is not None
+            if datos is None:
+                datos = preparar_datos()
+                if self.cache:
+                    self.cache.guardar_particion(clave, *datos)
+            self.x_train_c, self.x_test_c, self.y_train_c, self.y_test_c = datos
+            self.arranque["t_datos"] = time.time() - T_INICIO
+
+            print(f"DATOS ASIGNADOS ({DISTRIBUTION_METHOD}):")
+            print(f"   -> Train: {len(self.x_train_c)} imgs. Etiquetas únicas: {np.unique(self.y_train_c)}")
+            print(f"   -> Test:  {len(self.x_test_c)} imgs. Etiquetas únicas: {np.unique(self.y_test_c)}")
+
+            if CPU_TUNING:
+                import tensorflow as tf
+                self.arranque["hilos_tensorflow"] = recursos.configurar_tensorflow(tf, HILOS)
+
+            #El modelo CNN (build_model) está en comun/modelo.py, porque el servidor y los benchmarks también lo construyen.
+            from comun.modelo import build_model
+            from entrenamiento import MotorEntrenamiento
+            self.model = build_model()
+            self.buffer = BufferModelo(self.model) # Pesos como un vector contiguo (ver comun/parametros.py)
+            self.motor = MotorEntrenamiento(self.model, self.x_train_c, self.y_train_c, xla=TRAIN_XLA, hilos=HILOS)
+
+            #Modelo "caliente": últimos pesos globales y estado de Adam de antes de la caída.
+            estado = self.cache.cargar_modelo(self.buffer.disposicion.formas) if self.cache else None
+            if estado is not None:
+                pesos, optimizador, ronda = estado
+                self.model.set_weights(pesos)
+                self.arranque["optimizador_restaurado"] = self.motor.restaurar_optimizador(optimizador)
+                self.arranque["ronda_restaurada"] = ronda
+            self.motor.calentar()
+            self.arranque["t_listo"] = time.time() - T_INICIO
+
+            rss_mb, rss_pico_mb = memoria_residente_mb()
+            print(f"   -> Memoria residente: {rss_mb:.1f} MB (pico {rss_pico_mb:.1f} MB)")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.listo.set()
+
+    def esperar(self):
+        """Bloquea hasta que la inicialización termine. Relanza su error si lo hubo."""
+        self.listo.wait()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def guardar_estado(self, pesos_globales, ronda):
+        """Últimos pesos globales + estado del optimizador tras el fit, para volver con el modelo caliente."""
+        if self.cache is not None:
+            self.cache.guardar_modelo(self.buffer.disposicion.capas(pesos_globales), self.motor.estado_optimizador(), ronda)
+
+    def registrar_primera_peticion(self):
+        """Anota cuándo llega la primera petición del servidor y guarda los tiempos de arranque (una sola vez)."""
+        if "t_primera_peticion" in self.arranque:
+            return
+        self.arranque["t_primera_peticion"] = time.time() - T_INICIO
+        self.esperar()
+        self.arranque["t_atendida"] = time.time() - T_INICIO
+        RegistroJSONL(os.path.join(RESULTS_DIR, f"client_{client_id}_arranque.json")).escribir(self.arranque)
+        print(f"Cliente {client_id}: conectado a los {self.arranque.get('t_conexion', 0):.2f}s, listo a los "
+              f"{self.arranque['t_listo']:.2f}s (caché de datos: {self.arranque['cache_datos']}, "
+              f"ronda restaurada: {self.arranque.get('ronda_restaurada')})")
+
+runtime = RuntimeCliente()
 
 """
 **Cliente Flower**
@@ -319,77 +373,250 @@ ya que los clientes podrían estar actualizando sus modelos en direcciones diver
 
 """
 
+# Compresión del uplink (opcional). "none" envía los pesos completos como siempre.
+# Opciones: "int8", "uint4", "topk", "topk+int8", "topk+uint4". Ver comun/compresion.py.
+UPDATE_CODEC = os.environ.get("UPDATE_CODEC", "none")
+UPDATE_TOPK = float(os.environ.get("UPDATE_TOPK", "0.01")) # Fracción de valores que se envían con topk.
+# Con UPDATE_CODEC, muestras del test local con las que se mide la accuracy del modelo entrenado sin comprimir y la del
+# que reconstruye el servidor (el impacto de la compresión en la accuracy). 0 = no se mide.
+COMPRESSION_EVAL_SAMPLES = int(os.environ.get("COMPRESSION_EVAL_SAMPLES", "500"))
+
+# Modelo como un único tensor (el vector plano de comun/parametros.py) en lugar de una lista de capas: el servidor
+# deserializa y agrega un solo array. Todos los clientes con el mismo valor.
+FLAT_PARAMS = os.environ.get("FLAT_PARAMS", "False") == "True"
+
+# Perfilado por fases (tiempos, bytes, CPU, pico de memoria) enviado al servidor en las métricas. Ver comun/perfilado.py.
+PROFILE = os.environ.get("PROFILE", "False") == "True"
+
+# Evaluación con TFLite para los perfiles con poca CPU: "float32", "dynamic" (pesos int8) o "int8" (pesos y activaciones).
+# "off" = predict de Keras en float32 como siempre. El modelo se convierte una vez y en cada ronda se escriben los pesos
+# nuevos en él; "int8" se convierte y calibra en cada ronda (las escalas de las activaciones dependen de los pesos).
+# Cada TFLITE_COMPARE_EVERY evaluaciones (0 = nunca) se evalúa también con Keras para medir la pérdida de accuracy y la
+# aceleración. Ver inferencia.py.
+EVAL_TFLITE = os.environ.get("EVAL_TFLITE", "off")
+TFLITE_COMPARE_EVERY = int(os.environ.get("TFLITE_COMPARE_EVERY", "5"))
+
 class FlowerClient(fl.client.NumPyClient): #Definir un cliente Flower que implementa los métodos necesarios para el entrenamiento y evaluación federados
 
+    def __init__(self, rt=None, entorno=None):
+        #Sin argumentos es el cliente de este proceso: el runtime global y las variables de entorno.
+        #El simulador (experimentos/simulacion.py) crea muchos en un mismo proceso, cada uno con su runtime y su entorno.
+        entorno = os.environ if entorno is None else entorno
+        self.rt = rt if rt is not None else runtime
+        self.client_id = int(entorno.get("CLIENT_ID", client_id))
+        self.perfil = entorno.get("PERFIL", "Desconocido")
+        self.cpu_limit = float(entorno.get("CPU_LIMIT", "1.0"))
+        self.atacante = entorno.get("IS_ATTACKER", "False") == "True"
+        self.eval_tflite = entorno.get("EVAL_TFLITE", EVAL_TFLITE) # Se puede elegir por perfil (ver experimentos/escenario.py)
+        self.tflite = None # MotorTFLite, se crea en la primera evaluación
+        self.evaluaciones = 0
+        #El codificador guarda el error de compresión entre rondas (error feedback), por eso vive en el cliente.
+        self.codificador = CodificadorActualizaciones(UPDATE_CODEC, UPDATE_TOPK) if UPDATE_CODEC != "none" else None
+        self.perfilador = Perfilador(PROFILE)
+        self.monitor_cpu = recursos.MonitorCPU() # Throttling del cgroup en cada ronda (nada sin cuota de CPU)
+        #Última versión del modelo global recibida: el servidor puede mandar sólo el delta desde ella (ver comun/descarga.py).
+        self.receptor = ReceptorModelo()
+        self.registro = RegistroJSONL(os.path.join(RESULTS_DIR, f"client_{self.client_id}_metrics.json"),
+                                      lineas=RESULTS_BUFFER_LINES, segundos=RESULTS_BUFFER_S, fsync=RESULTS_FSYNC)
+
+    def _empaquetar(self, pesos, parameters):
+        """Devuelve los pesos tal cual o, si hay codec, el delta comprimido con sus métricas."""
+        if self.codificador is None:
+            return pesos, self._metricas_base()
+        pesos, metricas = self.codificador.codificar(pesos, parameters)
+        metricas.update(self._metricas_base())
+        return pesos, metricas
+
+    def _impacto_compresion(self, rt, parameters):
+        """
+        Accuracy sobre COMPRESSION_EVAL_SAMPLES muestras del test del modelo recién entrenado (el que tiene rt.model) y
+        del que reconstruirá el servidor con el paquete comprimido. Deja en el modelo los pesos reconstruidos: el
+        siguiente fit o evaluate escribe los del servidor.
+        """
+        from entrenamiento import LotesMNIST
+        x, y = rt.x_test_c[:COMPRESSION_EVAL_SAMPLES], rt.y_test_c[:COMPRESSION_EVAL_SAMPLES]
+        if len(x) == 0:
+            return {}
+        sin_comprimir = rt.model.predict(LotesMNIST(x, y, batch_size=256), verbose=0)
+        rt.buffer.escribir(self.codificador.pesos_servidor(parameters))
+        comprimido = rt.model.predict(LotesMNIST(x, y, batch_size=256), verbose=0)
+        return {"accuracy_sin_comprimir": float(np.mean(np.argmax(sin_comprimir, axis=1) == y)),
+                "accuracy_comprimido": float(np.mean(np.argmax(comprimido, axis=1) == y))}
+
+    def _metricas_base(self):
+        metricas = {"client_id": self.client_id}
+        if self.receptor.version is not None:
+            metricas["version_modelo"] = self.receptor.version
+        return metricas
+
+    def _sincronizar(self):
+        """Métricas de respuesta cuando no se tiene la versión base del delta: el servidor enviará el modelo completo."""
+        print(f"Cliente {self.client_id}: no tengo la versión base del modelo, se pide el modelo completo.")
+        return {"client_id": self.client_id, "sincronizar": True}
+
+    def _pesos(self, rt):
+        """Pesos del modelo local para enviar: el vector plano o sus capas (vistas del mismo vector)."""
+        return [rt.buffer.leer()] if FLAT_PARAMS else rt.buffer.leer_capas()
+
+    def _predecir_tflite(self, rt, parameters):
+        """Probabilidades con el intérprete TFLite y métricas del motor; cada TFLITE_COMPARE_EVERY, también con Keras."""
+        if self.tflite is None:
+            from inferencia import MotorTFLite
+            self.tflite = MotorTFLite(self.eval_tflite, x_calibracion=rt.x_train_c, hilos=HILOS)
+        actualizacion = self.tflite.actualizar(rt.buffer.disposicion.capas(parameters))
+        inicio = time.perf_counter()
+        probabilidades = self.tflite.predecir(rt.x_test_c)
+        motor = {
+            "motor_evaluacion": f"tflite-{self.eval_tflite}",
+            "perfil": self.perfil,
+            "conversion_tflite": actualizacion["conversion"],
+            "t_actualizar_tflite": actualizacion["t_actualizar"],
+            "t_inferencia": time.perf_counter() - inicio,
+            "bytes_modelo_tflite": self.tflite.bytes_modelo,
+        }
+        if TFLITE_COMPARE_EVERY > 0 and self.evaluaciones % TFLITE_COMPARE_EVERY == 0:
+            from entrenamiento import LotesMNIST
+            inicio = time.perf_counter()
+            rt.buffer.escribir(parameters)
+            referencia = rt.model.predict(LotesMNIST(rt.x_test_c, rt.y_test_c, batch_size=256), verbose=0)
+            motor["t_inferencia_float32"] = time.perf_counter() - inicio
+            motor["accuracy_float32"] = float(np.mean(np.argmax(referencia, axis=1) == rt.y_test_c))
+            motor["accuracy_tflite"] = float(np.mean(np.argmax(probabilidades, axis=1) == rt.y_test_c))
+            motor["brecha_accuracy"] = motor["accuracy_float32"] - motor["accuracy_tflite"]
+            #Aceleración de la ronda: Keras frente a escribir los pesos (o convertir) + inferencia con TFLite.
+            motor["aceleracion"] = motor["t_inferencia_float32"] / (motor["t_actualizar_tflite"] + motor["t_inferencia"])
+        self.evaluaciones += 1
+        return probabilidades, motor
+
+    def _runtime(self):
+        """Espera a que el hilo de arranque tenga listos los datos y el modelo (sólo bloquea la primera vez)."""
+        self.rt.registrar_primera_peticion()
+        return self.rt.esperar()
+
     def get_parameters(self, config=None):
-        return model.get_weights()
+        rt = self._runtime()
+        return self._pesos(rt)
+
+    def get_properties(self, config=None):
+        rt = self._runtime()
+        #Perfil del dispositivo para la selección de clientes del servidor (ver server/seleccion.py).
+        #etiquetas: máscara de bits con los dígitos que tiene este cliente (bit i = dígito i).
+        return {
+            "client_id": self.client_id,
+            "perfil": self.perfil,
+            "cpu_limit": self.cpu_limit,
+            "muestras": len(rt.x_train_c),
+            "etiquetas": int(sum(1 << int(e) for e in np.unique(rt.y_train_c))),
+        }
 
     def fit(self, parameters, config=None):
+        rt = self._runtime()
+        self.perfilador.iniciar(config)
+        recibidos = parameters
+        parameters = self.receptor.reconstruir(recibidos, config) #Pesos completos aunque llegue un delta o nada.
+        if parameters is None:
+            return [], 0, self._sincronizar()
         
         #Ataque bizantino (Envenenamiento del modelo)
-        is_attacker = os.environ.get("IS_ATTACKER", "False") == "True"
-
-        if is_attacker:
-            print(f"[ATACANTE] Cliente {client_id}: Generando pesos aleatorios destructivos.")
-            pesos_actuales = model.get_weights()
+        if self.atacante:
+            print(f"[ATACANTE] Cliente {self.client_id}: Generando pesos aleatorios destructivos.")
+            pesos_actuales = self._pesos(rt)
             # Generamos ruido gaussiano con la misma forma exacta que la red neuronal
             pesos_maliciosos = [np.random.normal(loc=0.0, scale=10.0, size=w.shape) for w in pesos_actuales]
             
             # Engañaos al modelo con nuestros datos locales
-            return pesos_maliciosos, len(x_train_c), {}
+            pesos_maliciosos, metricas = self._empaquetar(pesos_maliciosos, parameters)
+            self.perfilador.registrar_bytes(recibidos, pesos_maliciosos)
+            metricas.update(self.perfilador.metricas())
+            return pesos_maliciosos, len(rt.x_train_c), metricas
 
         #Cliente normal
-        model.set_weights(parameters) #Establecer los pesos del modelo recibido del servidor.
-        model.fit(x_train_c, y_train_c, epochs=1, batch_size=32, verbose=0) #Una época es un ciclo completo a través del conjunto de datos. batch_size es el número de muestras que se procesan antes de actualizar los pesos del modelo. Verbose=0 significa que no se muestra salida durante el entrenamiento.
-        return model.get_weights(), len(x_train_c), {} #Devolvemos los pesos y el número de muestras usadas.
+        with self.perfilador.fase("set_weights"):
+            rt.buffer.escribir(parameters) #Establecer los pesos del modelo recibido del servidor (planos o por capas).
+        #Una época es un ciclo completo a través del conjunto de datos. batch_size es el número de muestras que se procesan antes de actualizar los pesos del modelo.
+        #Ambos llegan en el config del servidor (por defecto 1 época y lotes de 32).
+        #Con "t_limite" (segundos) se entrena sólo lo que cabe en ese tiempo; las épocas pasan a ser un máximo.
+        epocas = int(config.get("local_epochs", 1)) if config else 1
+        batch_size = int(config.get("batch_size", 32)) if config else 32
+        limite = float(config.get("t_limite", 0)) if config else 0.0
+        with self.perfilador.fase("entrenar"):
+            entrenamiento = rt.motor.entrenar(epocas=epocas, batch_size=batch_size, limite=limite or None)
+        with self.perfilador.fase("get_weights"):
+            pesos = self._pesos(rt)
+        with self.perfilador.fase("empaquetar"):
+            pesos, metricas = self._empaquetar(pesos, parameters) #Con codec, el delta comprimido en vez de los pesos.
+        if self.codificador is not None and COMPRESSION_EVAL_SAMPLES > 0:
+            with self.perfilador.fase("impacto_compresion"):
+                metricas.update(self._impacto_compresion(rt, parameters))
+        with self.perfilador.fase("guardar_estado"):
+            rt.guardar_estado(parameters, int(config.get("server_round", 0)) if config else 0) #Caché para volver rápido tras una caída.
+        metricas["t_fit"] = entrenamiento["t_fit"] #Latencia observada, para la selección de clientes del servidor.
+        metricas["pasos"] = entrenamiento["pasos"]
+        metricas["muestras_procesadas"] = entrenamiento["muestras"]
+        metricas["recortado"] = entrenamiento["recortado"] #True si el límite de tiempo ha cortado el entrenamiento
+        metricas.update(self.monitor_cpu.medir()) #Periodos con la cuota de CPU agotada y tiempo congelado
+        self.perfilador.registrar_bytes(recibidos, pesos)
+        metricas.update(self.perfilador.metricas())
+        #Con límite de tiempo, FedAvg pondera por las muestras realmente procesadas (un cliente recortado pesa menos).
+        num_muestras = entrenamiento["muestras"] if limite else len(rt.x_train_c)
+        return pesos, num_muestras, metricas #Devolvemos los pesos y el número de muestras usadas.
 
     
     def evaluate(self, parameters, config=None):
-        model.set_weights(parameters)
+        inicio_evaluacion = time.perf_counter()
+        rt = self._runtime()
+        self.perfilador.iniciar(config)
+        recibidos = parameters
+        parameters = self.receptor.reconstruir(recibidos, config)
+        if parameters is None:
+            return 0.0, 0, self._sincronizar()
+        motor = {}
+        if self.eval_tflite == "off":
+            with self.perfilador.fase("set_weights"):
+                rt.buffer.escribir(parameters)
         
         #Leer la ronda.
         server_round = config.get("server_round", 0) if config else 0
 
-        #Evaluación básica.
-        loss, acc = model.evaluate(x_test_c, y_test_c, verbose=2)
-       
-       #METRICAS
-        #Métricas relacionales sobre el conjunto local
-        y_pred_probs = model.predict(x_test_c, verbose=0)
-        y_pred = np.argmax(y_pred_probs, axis=1) # Obtenemos la clase (0-9) con más probabilidad
+        #Una única pasada de inferencia. De las probabilidades salen la pérdida y todas las métricas (ver comun/metricas.py).
+        with self.perfilador.fase("predict"):
+            if self.eval_tflite == "off":
+                from entrenamiento import LotesMNIST # Ya importado por el hilo de arranque
+                y_pred_probs = rt.model.predict(LotesMNIST(rt.x_test_c, rt.y_test_c, batch_size=256), verbose=0)
+            else:
+                y_pred_probs, motor = self._predecir_tflite(rt, parameters)
 
+       #METRICAS
         # average='weighted' es vital en entornos Non-IID porque tienes datos desbalanceados
-        precision = precision_score(y_test_c, y_pred, average='weighted', zero_division=0)
-        recall = recall_score(y_test_c, y_pred, average='weighted', zero_division=0)
-        f1 = f1_score(y_test_c, y_pred, average='weighted', zero_division=0)
+        with self.perfilador.fase("metricas"):
+            metricas, por_clase = metricas_desde_probabilidades(rt.y_test_c, y_pred_probs)
+        loss, acc = metricas["loss"], metricas["accuracy"]
+        precision, recall, f1 = metricas["precision"], metricas["recall"], metricas["f1_score"]
 
 
         #GLOBAL Current Round: El número de ronda actual, que se recibe del servidor a través del diccionario config. Si no se encuentra, se asigna "desconocida".
         mi_resultado = {
             "ronda": server_round,          # <-- NUEVO
             "tiempo": str(datetime.datetime.now()),
-            "client_id": client_id,         # Para trazar quién es quién
+            "client_id": self.client_id,    # Para trazar quién es quién
             "loss": loss,
             "accuracy": acc,
             "precision": float(precision),  # Convertimos a float nativo para JSON
             "recall": float(recall),
             "f1_score": float(f1),
-            "data_size": len(x_test_c),
-            "labels": str(np.unique(y_test_c).tolist())
+            "data_size": len(rt.x_test_c),
+            "labels": str(np.unique(rt.y_test_c).tolist()),
+            "rss_mb": memoria_residente_mb()[0], # Memoria residente del cliente en esta ronda
+            "por_clase": por_clase, # Precision/recall/F1 de cada dígito, sin pasadas extra
+            **motor # Con EVAL_TFLITE: motor, tiempos y, en las rondas de comparación, la brecha frente a Keras
         }
 
-        # Crear carpeta results si no existe (por seguridad)
-        if not os.path.exists("/app/results"):
-            os.makedirs("/app/results", exist_ok=True)
-        
-        # Guardamos en mi propio fichero usando mi ID
-        archivo_propio = f"/app/results/client_{client_id}_metrics.json"
-        
-        with open(archivo_propio, "a") as f:
-            f.write(json.dumps(mi_resultado) + "\n")
+        # Guardamos en mi propio fichero usando mi ID (el registro crea la carpeta si no existe)
+        with self.perfilador.fase("escribir_json"):
+            self.registro.escribir(mi_resultado)
         
 
-        print(f"Cliente {client_id}: Resultado guardado (Acc: {acc:.4f})")
+        print(f"Cliente {self.client_id}: Resultado guardado (Acc: {acc:.4f})")
 
         #Métricas para devolverselo al servidor:
         metricas_para_servidor = {
@@ -398,14 +625,20 @@ class FlowerClient(fl.client.NumPyClient): #Definir un cliente Flower que implem
             "precision": float(precision), 
             "recall": float(recall), 
             "f1_score": float(f1), 
-            "client_id": client_id
+            **self._metricas_base(), #client_id y versión del modelo recibida
+            **motor,
+            "t_evaluate": time.perf_counter() - inicio_evaluacion #Latencia observada, para la selección de clientes.
         }
+        self.perfilador.registrar_bytes(recibidos, [])
+        metricas_para_servidor.update(self.monitor_cpu.medir())
+        metricas_para_servidor.update(self.perfilador.metricas())
         
-        return float(loss), len(x_test_c), metricas_para_servidor
+        return float(loss), len(rt.x_test_c), metricas_para_servidor
         
 """
 **Iniciar el cliente Flower**
 Iniciamos el cliente Flower, conectándonos al servidor en la dirección "server:8080
+(SERVER_ADDRESS permite cambiarla, p. ej. 127.0.0.1:8080 al lanzar todo en local con benchmarks/bench_e2e.py).
 
 Referencia: https://flower.dev/docs/
 """
@@ -418,5 +651,12 @@ if __name__ == "__main__":
         time.sleep(delay_inicio)
         print(f"Cliente {client_id}: Entrando al servidor")
 
-    # Iniciar el cliente Flower original
-    fl.client.start_numpy_client(server_address="server:8080", client=FlowerClient())
+    # Datos, TensorFlow y modelo se preparan en segundo plano mientras el cliente se conecta.
+    runtime.iniciar()
+    runtime.arranque["t_conexion"] = time.time() - T_INICIO
+
+    # Iniciar el cliente Flower (ClienteBuffer: el envoltorio NumPyClient de Flower con la serialización sin copias)
+    # Con CLIENT_CACHE las bajadas en trozos a medias se guardan en disco y se reanudan si el contenedor se reinicia.
+    directorio_trozos = os.path.join(CLIENT_CACHE_DIR, "trozos") if CLIENT_CACHE else None
+    fl.client.start_client(server_address=os.environ.get("SERVER_ADDRESS", "server:8080"),
+                           client=ClienteBuffer(FlowerClient(), directorio=directorio_trozos))
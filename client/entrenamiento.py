@@ -0,0 +1,177 @@
+"""
+**Motor de entrenamiento local (tf.data + paso de entrenamiento compilado)**
+
+Antes cada ronda llamaba a model.fit(x_train_c, y_train_c, epochs=1, batch_size=32) con arrays de NumPy:
+Keras volvía a envolver los datos y a trazar sus funciones en cada ronda, y no había prefetch que solapara
+la preparación del siguiente lote con el cálculo del actual.
+
+Aquí, por cliente y UNA sola vez:
+1. Un pipeline tf.data con las imágenes en uint8: cache -> shuffle (cada época) -> batch -> normalizar -> prefetch.
+   La normalización a float32 se hace por lote, como en LotesMNIST.
+2. Un paso de entrenamiento con tf.function (opcionalmente compilado con XLA) que se traza la primera vez y se
+   reutiliza en todas las rondas. Usa el optimizador del modelo compilado, así que su estado (Adam) se conserva
+   entre rondas igual que con model.fit.
+
+El tamaño de lote y las épocas locales llegan en el config de fit del servidor ("batch_size", "local_epochs").
+Con "t_limite" (TRAIN_DEADLINE en el servidor) se entrena como mucho ese tiempo: las épocas locales pasan a ser un
+máximo y el cliente lento hace sólo los pasos que le caben.
+
+Para la reincorporación rápida (ver estado.py) el motor puede exportar/restaurar el estado del optimizador y
+trazar el paso por adelantado (calentar), sin entrenar nada. Con cambiar_datos el mismo motor (y su traza) sirve a
+varios clientes, como en el simulador (experimentos/simulacion.py).
+
+LotesMNIST (la Sequence de Keras que normaliza lote a lote) también vive aquí: la usa evaluate para predict.
+"""
+import time
+import numpy as np
+import tensorflow as tf
+
+from comun.datos import normalizar_lote
+
+
+def construir_optimizador(optimizador, variables):
+    """
+    Crea las variables del optimizador (iteraciones y slots) sin aplicar ningún paso. El optimizador nuevo de Keras
+    (TF >= 2.11, el de los Dockerfiles) tiene build(); OptimizerV2 (TF 2.10, requirements.txt) no, y las crea con
+    _create_all_weights.
+    """
+    if hasattr(optimizador, "build"):
+        optimizador.build(variables)
+    else:
+        optimizador._create_all_weights(variables)
+
+
+def variables_optimizador(optimizador):
+    """Las variables del optimizador: variables() es un método en OptimizerV2 y una propiedad en Keras más nuevos."""
+    variables = optimizador.variables
+    return list(variables() if callable(variables) else variables)
+
+
+class LotesMNIST(tf.keras.utils.Sequence):
+    """
+    Entrega los datos al modelo lote a lote, normalizando a float32 sólo el lote que se está usando.
+    Con shuffle=True se baraja el orden de las muestras en cada época (igual que model.fit con arrays).
+    """
+    def __init__(self, x_u8, y, batch_size=32, shuffle=False):
+        self.x_u8 = x_u8
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.orden = np.random.permutation(len(y)) if shuffle else np.arange(len(y))
+
+    def __len__(self):
+        return int(np.ceil(len(self.y) / self.batch_size))
+
+    def __getitem__(self, i):
+        idx = self.orden[i * self.batch_size:(i + 1) * self.batch_size]
+        return normalizar_lote(self.x_u8[idx]), self.y[idx]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.orden)
+
+
+def _normalizar(x, y):
+    return tf.reshape(tf.cast(x, tf.float32) / 255.0, (-1, 28, 28, 1)), y
+
+
+class MotorEntrenamiento:
+
+    def __init__(self, model, x_u8, y, xla=False, semilla=42, hilos=None):
+        self.model = model
+        self.hilos = hilos # Pool de tf.data; None = el de por defecto (núcleos del host). Ver recursos.py.
+        self.x_u8 = x_u8
+        self.y = y.astype(np.int32)
+        self.semilla = semilla
+        self.datasets = {} # batch_size -> tf.data.Dataset (se construye una vez por tamaño de lote)
+        self.loss_fn = tf.keras.losses.SparseCategoricalCrossentropy()
+
+        # Firma con el lote de tamaño variable: una sola traza para los lotes completos y el último incompleto.
+        firma = [tf.TensorSpec([None, 28, 28, 1], tf.float32), tf.TensorSpec([None], tf.int32)]
+        self._paso = tf.function(self._paso_entrenamiento, input_signature=firma, jit_compile=xla)
+
+    def _paso_entrenamiento(self, x, y):
+        with tf.GradientTape() as tape:
+            predicciones = self.model(x, training=True)
+            loss = self.loss_fn(y, predicciones)
+        gradientes = tape.gradient(loss, self.model.trainable_variables)
+        self.model.optimizer.apply_gradients(zip(gradientes, self.model.trainable_variables))
+        return loss
+
+    def cambiar_datos(self, x_u8, y, datasets=None):
+        """
+        Cambia los datos locales sin volver a trazar el paso (el simulador comparte un motor entre muchos clientes).
+        `datasets` son los pipelines ya construidos para esos datos, si se tienen. Devuelve los del motor.
+        """
+        self.x_u8 = x_u8
+        self.y = y.astype(np.int32)
+        self.datasets = {} if datasets is None else datasets
+        return self.datasets
+
+    def calentar(self):
+        """Crea las variables del optimizador y traza el paso de entrenamiento sin ejecutarlo."""
+        construir_optimizador(self.model.optimizer, self.model.trainable_variables)
+        self._paso.get_concrete_function()
+
+    def estado_optimizador(self):
+        """Valores de las variables del optimizador (iteraciones y momentos de Adam)."""
+        return [v.numpy() for v in variables_optimizador(self.model.optimizer)]
+
+    def restaurar_optimizador(self, valores):
+        """Devuelve True si el estado encaja con las variables del optimizador y se ha restaurado."""
+        construir_optimizador(self.model.optimizer, self.model.trainable_variables)
+        variables = variables_optimizador(self.model.optimizer)
+        if len(variables) != len(valores) or any(v.shape != w.shape for v, w in zip(variables, valores)):
+            return False
+        for variable, valor in zip(variables, valores):
+            variable.assign(valor)
+        return True
+
+    def dataset(self, batch_size):
+        if batch_size not in self.datasets:
+            self.datasets[batch_size] = (
+                tf.data.Dataset.from_tensor_slices((self.x_u8, self.y))
+                .cache()
+                .shuffle(len(self.y), seed=self.semilla, reshuffle_each_iteration=True)
+                .batch(batch_size)
+                .map(_normalizar, num_parallel_calls=tf.data.AUTOTUNE)
+                .prefetch(tf.data.AUTOTUNE)
+            )
+            if self.hilos:
+                opciones = tf.data.Options()
+                opciones.threading.private_threadpool_size = self.hilos
+                opciones.threading.max_intra_op_parallelism = 1
+                self.datasets[batch_size] = self.datasets[batch_size].with_options(opciones)
+        return self.datasets[batch_size]
+
+    def entrenar(self, epocas=1, batch_size=32, limite=None):
+        """
+        Entrena sobre los datos locales. Devuelve pasos, muestras procesadas, pérdida media, tiempo y si se ha
+        cortado por el límite.
+        Con `limite` (segundos) no empieza un paso que, según lo que tardan los anteriores (media móvil, con la
+        lectura del lote incluida), terminaría después del límite. Siempre se da al menos un paso.
+        """
+        inicio = time.perf_counter()
+        pasos, muestras, suma_loss = 0, 0, tf.constant(0.0)
+        t_paso, ultimo = None, inicio
+        recortado = False
+        for _ in range(epocas):
+            for x, y in self.dataset(batch_size):
+                if limite is not None and t_paso is not None and time.perf_counter() - inicio + t_paso > limite:
+                    recortado = True
+                    break
+                suma_loss += self._paso(x, y) # Sin float() aquí: no forzamos una sincronización en cada paso
+                pasos += 1
+                muestras += int(y.shape[0])
+                ahora = time.perf_counter()
+                t_paso = ahora - ultimo if t_paso is None else 0.8 * t_paso + 0.2 * (ahora - ultimo)
+                ultimo = ahora
+            if recortado:
+                break
+        return {
+            "pasos": pasos,
+            "muestras": muestras,
+            "loss_entrenamiento": float(suma_loss) / max(pasos, 1),
+            "t_fit": time.perf_counter() - inicio,
+            "recortado": recortado,
+        }
@@ -0,0 +1,83 @@
+"""
+**Estado local persistente del cliente (reincorporación rápida tras una caída)**
+
+Pumba mata un cliente cada 2 minutos. Al volver, el cliente repetía todo antes de conectarse: cargar MNIST,
+particionar, el train_test_split y construir/compilar el modelo. Además empezaba con un modelo sin entrenar
+y con el optimizador (Adam) a cero.
+
+CacheCliente guarda en un directorio propio de cada cliente (dentro del volumen de resultados):
+
+    particion_<clave>.npz   x_train, y_train, x_test, y_test ya repartidos (uint8). La clave incluye la
+                            configuración del reparto, así que cambiar de experimento no reutiliza datos viejos.
+    modelo.npz              Últimos pesos globales recibidos, estado del optimizador tras el último fit y, en el
+                            array "meta" (JSON), ronda, número de arrays y formas (para no restaurar un modelo con
+                            otra arquitectura). Pesos y ronda van en el mismo fichero para que se sustituyan juntos.
+
+Todas las escrituras son atómicas (fichero temporal + os.replace): si el contenedor muere a mitad de una
+escritura, la versión anterior sigue siendo válida.
+"""
+import os
+import json
+import numpy as np
+
+
+def _guardar_npz_atomico(ruta, **arrays):
+    temporal = ruta + ".tmp.npz" # np.savez añade .npz si no lo lleva
+    np.savez(temporal, **arrays)
+    os.replace(temporal, ruta)
+
+
+class CacheCliente:
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    # ---------- Partición local ----------
+
+    def _ruta_particion(self, clave):
+        return os.path.join(self.directorio, f"particion_{clave}.npz")
+
+    def cargar_particion(self, clave):
+        """(x_train, x_test, y_train, y_test) guardados para esta clave, o None."""
+        ruta = self._ruta_particion(clave)
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with np.load(ruta) as datos:
+                return datos["x_train"], datos["x_test"], datos["y_train"], datos["y_test"]
+        except Exception as e:
+            print(f"Caché de partición ilegible ({e}), se regenera.")
+            return None
+
+    def guardar_particion(self, clave, x_train, x_test, y_train, y_test):
+        _guardar_npz_atomico(self._ruta_particion(clave), x_train=x_train, x_test=x_test, y_train=y_train, y_test=y_test)
+
+    # ---------- Modelo y optimizador ----------
+
+    def cargar_modelo(self, formas_esperadas):
+        """(pesos, estado del optimizador, ronda) si el modelo guardado tiene las mismas formas, o None."""
+        ruta = os.path.join(self.directorio, "modelo.npz")
+        if not os.path.exists(ruta):
+            return None
+        try:
+            with np.load(ruta) as datos:
+                if "meta" not in datos.files: # Caché de una versión anterior (ronda en modelo.json aparte)
+                    return None
+                meta = json.loads(str(datos["meta"]))
+                if [tuple(forma) for forma in meta["formas"]] != [tuple(forma) for forma in formas_esperadas]:
+                    return None
+                pesos = [datos[f"p{i}"] for i in range(meta["num_pesos"])]
+                optimizador = [datos[f"o{i}"] for i in range(meta["num_optimizador"])]
+            return pesos, optimizador, meta["ronda"]
+        except Exception as e:
+            print(f"Caché del modelo ilegible ({e}), se empieza desde cero.")
+            return None
+
+    def guardar_modelo(self, pesos, optimizador, ronda):
+        meta = {"ronda": ronda, "num_pesos": len(pesos), "num_optimizador": len(optimizador),
+                "formas": [list(w.shape) for w in pesos]}
+        arrays = {f"p{i}": w for i, w in enumerate(pesos)}
+        arrays.update({f"o{i}": v for i, v in enumerate(optimizador)})
+        # Un solo os.replace: una caída deja los pesos y la ronda de antes o los de ahora, nunca mezclados.
+        _guardar_npz_atomico(os.path.join(self.directorio, "modelo.npz"), meta=np.array(json.dumps(meta)), **arrays)
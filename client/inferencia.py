@@ -0,0 +1,172 @@
+"""
+**Evaluación con TFLite cuantizado (perfiles con poca CPU)**
+
+evaluate hace en cada ronda una inferencia completa en float32 con Keras (model.predict) sobre el test local.
+En los perfiles IoT (0.5 CPU) y Movil (1.0 CPU) el intérprete de TFLite es bastante más rápido, y con los pesos
+cuantizados a int8 la red ocupa 4 veces menos.
+
+Con "float32" y "dynamic" MotorTFLite convierte el modelo UNA vez y en las rondas siguientes reutiliza el modelo
+convertido:
+
+1. Conversión (TFLiteConverter, ~2s): "float32" (sin cuantizar), "dynamic" (pesos int8, activaciones en float: rango
+   dinámico) o "int8" (pesos y activaciones int8, con las escalas de las activaciones calibradas con muestras de
+   entrenamiento del cliente). La entrada y la salida siguen siendo float32.
+2. Mapa de constantes: cada tensor constante del modelo TFLite se empareja con su variable de Keras comparando
+   valores (TFLite guarda los kernels traspuestos: Dense como [salida, entrada], Conv2D como [salida, h, w, entrada]).
+3. En cada ronda los pesos recibidos se escriben directamente en los buffers del flatbuffer convertido: tal cual en
+   float32, o re-cuantizados (int8 simétrico con escala max|w| / 127 por tensor o por canal) actualizando también sus
+   escalas. Después se crea el intérprete sobre esos bytes (~1ms); el intérprete anterior no se reutiliza porque
+   XNNPACK empaqueta los pesos al crearlo.
+
+Se vuelve a convertir sólo si no se pudo emparejar alguna variable (p. ej. el conversor elimina los bias que valen
+0, como los del modelo recién creado).
+
+"int8" se convierte (y calibra) en TODAS las rondas: las escalas de las activaciones dependen de los pesos y, escritas
+sobre un modelo calibrado con los de otra ronda, se quedan desfasadas. Con bench_tflite.py --rondas 4 y una
+recalibración cada 5 rondas la accuracy en int8 se alejaba de la de Keras hasta 0.69 en la tercera ronda; la
+conversión cuesta ~2s por ronda, pero las métricas son las del modelo recibido.
+
+predecir devuelve las probabilidades, así que las métricas salen de metricas_desde_probabilidades como siempre.
+"""
+import time
+import itertools
+import numpy as np
+import tensorflow as tf
+from tensorflow.lite.python import schema_py_generated as schema_fb
+
+from comun.datos import normalizar_lote
+
+CUANTIZACIONES = ("float32", "dynamic", "int8")
+_FLOAT32, _INT8 = schema_fb.TensorType.FLOAT32, schema_fb.TensorType.INT8
+
+
+def _escalas_por_eje(escalas, forma, eje):
+    """Escalas (una por tensor o una por canal en `eje`) con forma para multiplicar a un tensor de `forma`."""
+    if escalas.size == 1:
+        return escalas.reshape([1] * len(forma))
+    return escalas.reshape([-1 if i == eje else 1 for i in range(len(forma))])
+
+
+class MotorTFLite:
+
+    def __init__(self, cuantizacion="dynamic", x_calibracion=None, batch_size=256, hilos=None):
+        if cuantizacion not in CUANTIZACIONES:
+            raise ValueError(f"Cuantización desconocida: {cuantizacion}. Opciones: {CUANTIZACIONES}")
+        if cuantizacion == "int8" and x_calibracion is None:
+            raise ValueError("La cuantización int8 necesita muestras de calibración")
+        self.cuantizacion = cuantizacion
+        self.x_calibracion = None if x_calibracion is None else x_calibracion[:100] # uint8, como el almacén
+        self.batch_size = batch_size
+        self.hilos = hilos
+        self.model = None # Modelo Keras propio, sólo para convertir
+        self.flatbuffer = None # bytearray con el modelo convertido; los pesos se escriben aquí
+        self.constantes = None # [(índice de la variable, permutación, tipo, datos, escalas, eje)]
+        self.interprete = None
+        self.conversiones = 0
+
+    @property
+    def bytes_modelo(self):
+        return 0 if self.flatbuffer is None else len(self.flatbuffer)
+
+    def _datos_calibracion(self):
+        for i in range(len(self.x_calibracion)):
+            yield [normalizar_lote(self.x_calibracion[i:i + 1])]
+
+    def _convertir(self, pesos):
+        if self.model is None:
+            from comun.modelo import build_model
+            self.model = build_model()
+        self.model.set_weights(pesos)
+        conversor = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        if self.cuantizacion != "float32":
+            conversor.optimizations = [tf.lite.Optimize.DEFAULT]
+        if self.cuantizacion == "int8":
+            conversor.representative_dataset = self._datos_calibracion
+        self.flatbuffer = bytearray(conversor.convert())
+        # En "int8" los pesos no se escriben sobre el modelo convertido (se convierte cada ronda): no hace falta el mapa.
+        self.constantes = self._mapear(pesos) if self.cuantizacion != "int8" else None
+        self.conversiones += 1
+
+    def _mapear(self, pesos):
+        """Empareja cada variable de Keras con su tensor constante en el flatbuffer. None si falta alguna."""
+        modelo = schema_fb.Model.GetRootAsModel(self.flatbuffer, 0)
+        subgrafo = modelo.Subgraphs(0)
+        constantes = []
+        libres = set(range(len(pesos)))
+        for t in range(subgrafo.TensorsLength()):
+            tensor = subgrafo.Tensors(t)
+            datos = modelo.Buffers(tensor.Buffer()).DataAsNumpy()
+            if isinstance(datos, int) or datos.size == 0: # Activaciones y entradas: sin datos
+                continue
+            cuantizacion = tensor.Quantization()
+            escalas = cuantizacion.ScaleAsNumpy() if cuantizacion is not None and cuantizacion.ScaleLength() else None
+            tipo, forma = tensor.Type(), tuple(tensor.ShapeAsNumpy())
+            if tipo == _FLOAT32 and escalas is None:
+                valores, tolerancia = datos.view(np.float32).reshape(forma), 1e-6
+            elif tipo == _INT8 and escalas is not None:
+                eje = cuantizacion.QuantizedDimension()
+                escala = _escalas_por_eje(escalas, forma, eje)
+                valores = datos.view(np.int8).reshape(forma) * escala
+                tolerancia = 0.501 * escala + 1e-7
+            else:
+                continue # Constantes propias de TFLite (p. ej. la forma de Flatten)
+            for v in sorted(libres):
+                permutacion = next((p for p in itertools.permutations(range(pesos[v].ndim))
+                                    if tuple(pesos[v].shape[i] for i in p) == forma
+                                    and np.all(np.abs(np.transpose(pesos[v], p) - valores) <= tolerancia)), None)
+                if permutacion is not None:
+                    libres.discard(v)
+                    constantes.append((v, permutacion, tipo, datos, escalas,
+                                       None if escalas is None else cuantizacion.QuantizedDimension()))
+                    break
+        return None if libres else constantes
+
+    def _escribir(self, pesos):
+        """Escribe los pesos en los buffers del modelo convertido, re-cuantizando los que van en int8."""
+        for v, permutacion, tipo, datos, escalas, eje in self.constantes:
+            w = np.transpose(pesos[v], permutacion)
+            if tipo == _FLOAT32:
+                datos.view(np.float32)[:] = w.reshape(-1)
+                continue
+            if escalas.size == 1:
+                nuevas = np.array([np.max(np.abs(w))], dtype=np.float32) / 127
+            else:
+                otros = tuple(i for i in range(w.ndim) if i != eje)
+                nuevas = (np.max(np.abs(w), axis=otros) / 127).astype(np.float32)
+            escalas[:] = np.maximum(nuevas, np.float32(1e-12))
+            q = np.clip(np.round(w / _escalas_por_eje(escalas, w.shape, eje)), -127, 127).astype(np.int8)
+            datos.view(np.int8)[:] = q.reshape(-1)
+
+    def actualizar(self, pesos):
+        """
+        Prepara el intérprete con estos pesos (lista de capas como get_weights). Devuelve
+        {"conversion": si ha hecho falta convertir, "t_actualizar": segundos}.
+        """
+        inicio = time.perf_counter()
+        pesos = [np.asarray(capa, dtype=np.float32) for capa in pesos]
+        conversion = self.constantes is None # Siempre en "int8" (ver _convertir)
+        if conversion:
+            self._convertir(pesos)
+        else:
+            self._escribir(pesos)
+        # El intérprete copia los bytes: las escrituras de la ronda siguiente no le afectan.
+        self.interprete = tf.lite.Interpreter(model_content=bytes(self.flatbuffer), num_threads=self.hilos)
+        entrada = self.interprete.get_input_details()[0]["index"]
+        self.interprete.resize_tensor_input(entrada, [self.batch_size, 28, 28, 1])
+        self.interprete.allocate_tensors()
+        return {"conversion": conversion, "t_actualizar": time.perf_counter() - inicio}
+
+    def predecir(self, x_u8):
+        """Probabilidades (n, 10) para las imágenes uint8, por lotes de batch_size (el último se rellena con ceros)."""
+        entrada = self.interprete.get_input_details()[0]["index"]
+        salida = self.interprete.get_output_details()[0]["index"]
+        probabilidades = []
+        for i in range(0, len(x_u8), self.batch_size):
+            lote = normalizar_lote(x_u8[i:i + self.batch_size])
+            n = len(lote)
+            if n < self.batch_size:
+                lote = np.concatenate([lote, np.zeros((self.batch_size - n, 28, 28, 1), dtype=np.float32)])
+            self.interprete.set_tensor(entrada, lote)
+            self.interprete.invoke()
+            probabilidades.append(self.interprete.get_tensor(salida)[:n])
+        return np.concatenate(probabilidades)
@@ -0,0 +1,224 @@
+"""
+**Particionado vectorizado de datos y manifiesto compartido**
+
+Antes cada contenedor ejecutaba `partition_data` sobre las 70.000 muestras al importar client.py,
+calculando el reparto de TODA la federación sólo para quedarse con su trozo.
+Con 1.000 clientes eso son 1.000 pasadas completas sobre el dataset.
+
+Ahora el reparto se calcula una única vez con NumPy y se guarda en un manifiesto en el volumen compartido:
+
+    /app/results/particiones/<clave>/
+        indices.npy   -> índices de todas las particiones concatenados (int32)
+        offsets.npy   -> offsets[c-1]:offsets[c] es el trozo del cliente c (int64, num_clients + 1)
+        meta.json     -> versión del formato, parámetros y tamaño del dataset
+
+La clave depende de (método, alpha, num_clients, semilla, balance_quantity), así que cada configuración
+de experimento tiene su propio manifiesto. Cada cliente abre indices.npy con mmap y lee únicamente su rango.
+
+El algoritmo consume el generador aleatorio EXACTAMENTE en el mismo orden que la versión original
+(semilla 42, shuffle por clase, dirichlet por clase...), por lo que cada cliente recibe las mismas
+muestras y en el mismo orden que antes. Los resultados de experimentos anteriores siguen siendo comparables.
+
+Uso desde la terminal (precalcular antes de lanzar los contenedores):
+    python client/particionado.py --clientes 1000 --metodo dirichlet --alpha 0.1 --salida results/particiones
+"""
+import os
+import json
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+
+FORMATO_MANIFIESTO = 1 # Subir si cambia el algoritmo o el formato en disco. Invalida los manifiestos anteriores.
+MIN_MUESTRAS_DIRICHLET = 10 # Igual que min_require_size en la versión original.
+MAX_INTENTOS_DIRICHLET = 200 # Con muchos clientes y alpha pequeño puede ser imposible llegar al mínimo (antes se quedaba colgado).
+
+
+def clave_manifiesto(method, alpha, num_clients, seed, balance_quantity):
+    """Nombre del directorio del manifiesto para una configuración concreta."""
+    return f"v{FORMATO_MANIFIESTO}_{method}_a{alpha}_n{num_clients}_s{seed}_b{int(bool(balance_quantity))}"
+
+
+def _dirichlet(y, num_clients, alpha, balance_quantity, rng):
+    """
+    Versión vectorizada del bucle Dirichlet original.
+    En lugar de listas de Python con `+=` y `.tolist()`, llevamos un vector con el tamaño de cada cliente
+    y una etiqueta de cliente por muestra. Sólo se itera sobre las clases (10), nunca sobre los clientes.
+    """
+    N = len(y)
+    n_classes = len(np.unique(y))
+
+    # Índices de cada clase en orden creciente (igual que idxs[y == k]) con un único argsort estable.
+    orden_clases = np.argsort(y, kind="stable")
+    cortes_clases = np.searchsorted(y[orden_clases], np.arange(n_classes + 1))
+    clientes = np.arange(num_clients)
+
+    mejor = None
+    for _ in range(MAX_INTENTOS_DIRICHLET):
+        tamanos = np.zeros(num_clients, dtype=np.int64)
+        trozos_idx = []
+        trozos_cliente = []
+        for k in range(n_classes):
+            idx_k = orden_clases[cortes_clases[k]:cortes_clases[k + 1]].copy()
+            rng.shuffle(idx_k)
+
+            proportions = rng.dirichlet(np.repeat(alpha, num_clients))
+
+            if balance_quantity:
+                # El "freno" original: evita que uno se llene demasiado
+                proportions = proportions * (tamanos < N / num_clients)
+
+            proportions = proportions / proportions.sum()
+            proportions = (np.cumsum(proportions) * len(idx_k)).astype(int)[:-1]
+
+            # np.split(idx_k, proportions) equivale a asignar a cada cliente el tramo entre dos cortes.
+            limites = np.concatenate(([0], proportions, [len(idx_k)]))
+            por_cliente = np.diff(limites)
+            trozos_idx.append(idx_k)
+            trozos_cliente.append(np.repeat(clientes, por_cliente))
+            tamanos += por_cliente
+
+        if mejor is None or tamanos.min() > mejor[0].min():
+            mejor = (tamanos, trozos_idx, trozos_cliente)
+        if tamanos.min() >= MIN_MUESTRAS_DIRICHLET:
+            break
+    else:
+        # Nos quedamos con el intento más equilibrado en lugar de reintentar indefinidamente.
+        print(f"Dirichlet: ningún reparto con >= {MIN_MUESTRAS_DIRICHLET} muestras por cliente "
+              f"en {MAX_INTENTOS_DIRICHLET} intentos. Mínimo conseguido: {mejor[0].min()}")
+
+    tamanos, trozos_idx, trozos_cliente = mejor
+    todos_idx = np.concatenate(trozos_idx)
+    todos_cliente = np.concatenate(trozos_cliente)
+
+    # Agrupamos por cliente conservando el orden por clase (como hacía idx_batch[i] += ...).
+    agrupado = todos_idx[np.argsort(todos_cliente, kind="stable")]
+    offsets = np.concatenate(([0], np.cumsum(tamanos)))
+
+    # La versión original barajaba la partición de cada cliente con el estado del generador
+    # tras el bucle. Cada cliente partía del MISMO estado, así que lo reproducimos copiándolo.
+    estado = rng.get_state()
+    for c in range(num_clients):
+        rng.set_state(estado)
+        rng.shuffle(agrupado[offsets[c]:offsets[c + 1]])
+
+    return agrupado, offsets
+
+
+def partition_indices(y, num_clients, method="dirichlet", alpha=0.5, balance_quantity=True, seed=42):
+    """
+    Calcula el reparto de TODOS los clientes en una sola pasada.
+
+    Devuelve (indices, offsets): los índices del cliente c (empezando en 1) son
+    indices[offsets[c - 1]:offsets[c]].
+    """
+    y = np.asarray(y)
+    # IMPORTANTE: RandomState con la misma semilla reproduce la secuencia de np.random.seed(42).
+    rng = np.random.RandomState(seed)
+
+    if method == "iid":
+        idxs = rng.permutation(len(y))
+        tamanos = [len(p) for p in np.array_split(idxs, num_clients)]
+        return idxs, np.concatenate(([0], np.cumsum(tamanos)))
+
+    elif method == "pathological":
+        idxs_sorted = np.argsort(y)
+        tamanos = [len(p) for p in np.array_split(idxs_sorted, num_clients)]
+        return idxs_sorted, np.concatenate(([0], np.cumsum(tamanos)))
+
+    elif method == "dirichlet":
+        return _dirichlet(y, num_clients, alpha, balance_quantity, rng)
+
+    else:
+        raise ValueError(f"Método '{method}' no reconocido.")
+
+
+def guardar_manifiesto(directorio, indices, offsets, meta):
+    """
+    Escribe el manifiesto de forma atómica: primero en un directorio temporal y luego os.rename.
+    Si otro cliente lo ha escrito antes, nos quedamos con el suyo (el contenido es idéntico).
+    El temporal tiene nombre único (mkdtemp): en Docker el proceso de todos los clientes es el PID 1.
+    """
+    temporal = tempfile.mkdtemp(prefix=os.path.basename(directorio) + ".tmp-", dir=os.path.dirname(directorio))
+    os.chmod(temporal, 0o755) # mkdtemp lo crea sólo para su dueño
+    np.save(os.path.join(temporal, "indices.npy"), indices.astype(np.int32))
+    np.save(os.path.join(temporal, "offsets.npy"), offsets.astype(np.int64))
+    with open(os.path.join(temporal, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(temporal, directorio)
+    except OSError:
+        # Ya existe: otro proceso ganó la carrera.
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+def cargar_particion(directorio, client_id):
+    """Lee del manifiesto únicamente los índices del cliente indicado (mmap, sin cargar el resto)."""
+    offsets = np.load(os.path.join(directorio, "offsets.npy"))
+    indices = np.load(os.path.join(directorio, "indices.npy"), mmap_mode="r")
+    return np.array(indices[offsets[client_id - 1]:offsets[client_id]], dtype=np.int64)
+
+
+def obtener_particion(y, client_id, num_clients, method="dirichlet", alpha=0.5,
+                      balance_quantity=True, seed=42, directorio_base="/app/results/particiones"):
+    """
+    Devuelve los índices del cliente usando el manifiesto compartido.
+    El primer cliente que llega lo calcula y lo guarda; el resto sólo lee su trozo.
+    """
+    clave = clave_manifiesto(method, alpha, num_clients, seed, balance_quantity)
+    directorio = os.path.join(directorio_base, clave)
+    meta_path = os.path.join(directorio, "meta.json")
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("formato") == FORMATO_MANIFIESTO and meta.get("num_muestras") == len(y):
+            return cargar_particion(directorio, client_id)
+        print(f"Manifiesto {clave} incompatible con el dataset actual, se recalcula en memoria.")
+        indices, offsets = partition_indices(y, num_clients, method, alpha, balance_quantity, seed)
+        return indices[offsets[client_id - 1]:offsets[client_id]]
+
+    indices, offsets = partition_indices(y, num_clients, method, alpha, balance_quantity, seed)
+    meta = {
+        "formato": FORMATO_MANIFIESTO,
+        "method": method,
+        "alpha": alpha,
+        "num_clients": num_clients,
+        "seed": seed,
+        "balance_quantity": bool(balance_quantity),
+        "num_muestras": int(len(y)),
+    }
+    try:
+        os.makedirs(directorio_base, exist_ok=True)
+        guardar_manifiesto(directorio, indices, offsets, meta)
+    except OSError as e:
+        # Sin volumen compartido (o de sólo lectura) seguimos funcionando, sólo perdemos la caché.
+        print(f"No se pudo guardar el manifiesto de particiones: {e}")
+
+    return indices[offsets[client_id - 1]:offsets[client_id]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula el manifiesto de particiones de MNIST.")
+    parser.add_argument("--clientes", type=int, required=True)
+    parser.add_argument("--metodo", default="dirichlet", choices=["dirichlet", "pathological", "iid"])
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--sin-balance", action="store_true", help="Desactiva balance_quantity.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--npz", default=os.path.expanduser("~/.keras/datasets/mnist.npz"),
+                        help="Fichero mnist.npz (el que descarga Keras).")
+    parser.add_argument("--salida", default="results/particiones")
+    args = parser.parse_args()
+
+    with np.load(args.npz) as mnist:
+        y_all = np.concatenate([mnist["y_train"], mnist["y_test"]])
+
+    balance = not args.sin_balance
+    clave = clave_manifiesto(args.metodo, args.alpha, args.clientes, args.semilla, balance)
+    if os.path.exists(os.path.join(args.salida, clave)):
+        print(f"El manifiesto {clave} ya existe.")
+    else:
+        obtener_particion(y_all, 1, args.clientes, args.metodo, args.alpha, balance, args.semilla, args.salida)
+        print(f"Manifiesto guardado en {os.path.join(args.salida, clave)}")
@@ -0,0 +1,162 @@
+"""
+**Hilos de TensorFlow y BLAS ajustados a la cuota de CPU del contenedor**
+
+Los clientes corren con `deploy.resources.limits.cpus` entre 0.5 y 4.0, pero TensorFlow (intra-op e inter-op) y la
+BLAS de NumPy (OpenBLAS / OpenMP) dimensionan sus hilos con los núcleos del HOST. En un host de 64 núcleos un cliente
+IoT de 0.5 CPU lanza decenas de hilos que se reparten 50 ms de CPU cada 100 ms: el cgroup los congela en cuanto
+agotan la cuota (throttling) y cada paso espera al hilo más retrasado.
+
+Al arrancar el cliente:
+
+1. cpus_disponibles: la cuota CFS del cgroup del proceso (v2: cpu.max, v1: cpu.cfs_quota_us / cpu.cfs_period_us,
+   en el directorio que indica /proc/self/cgroup), CPU_LIMIT si está definida (sin Docker es la única pista del
+   perfil) y los núcleos visibles (sched_getaffinity); la menor.
+2. configurar_entorno: hilos = parte entera de las CPUs (mínimo 1) en las variables de OpenMP/BLAS y de TensorFlow.
+   Tiene que hacerse ANTES de importar NumPy: OpenBLAS crea su pool al cargarse. Las variables que ya vengan
+   definidas se respetan. Si NumPy ya estaba cargado (simulador, benchmarks) se limita con threadpoolctl si está.
+3. configurar_tensorflow: intra-op = hilos e inter-op = 1 (2 con 4 o más hilos) antes de crear el primer tensor.
+   El pool propio de tf.data (que también sale de los núcleos del host) lo limita MotorEntrenamiento (hilos=...).
+
+El tamaño de lote no se toca: el de entrenamiento lo fija el servidor (cambia la convergencia) y el de predict no
+cambia el tiempo con un solo hilo (medido entre 128 y 1024 con 0.5 y 1 CPU).
+
+MonitorCPU lee cpu.stat del cgroup y devuelve, por ronda, los periodos en los que se ha agotado la cuota y el tiempo
+congelado. Sin cgroup con cuota (procesos locales) no devuelve nada.
+"""
+import os
+import math
+
+RAIZ_CGROUP = "/sys/fs/cgroup"
+#Variables que leen OpenMP y las BLAS habituales (OpenBLAS, MKL, BLIS, Accelerate) y numexpr al cargarse.
+VARIABLES_BLAS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+                  "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def _leer(ruta):
+    try:
+        with open(ruta) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def directorio_cgroup(raiz=RAIZ_CGROUP):
+    """
+    (versión, directorio) del cgroup de CPU de este proceso según /proc/self/cgroup, o (None, None).
+    Dentro de un contenedor con su propio espacio de cgroups la ruta es "/" y el directorio es la raíz.
+    """
+    v1, v2 = None, None
+    for linea in (_leer("/proc/self/cgroup") or "").splitlines():
+        _, controladores, ruta = linea.split(":", 2)
+        if "cpu" in controladores.split(","):
+            v1 = ruta.lstrip("/")
+        elif controladores == "":
+            v2 = ruta.lstrip("/")
+    candidatos = []
+    if v1 is not None:
+        candidatos += [(1, os.path.join(raiz, "cpu", v1), "cpu.cfs_quota_us"),
+                       (1, os.path.join(raiz, "cpu"), "cpu.cfs_quota_us")]
+    if v2 is not None:
+        candidatos += [(2, os.path.join(raiz, v2), "cpu.max"), (2, raiz, "cpu.max")]
+    for version, directorio, fichero in candidatos:
+        if os.path.exists(os.path.join(directorio, fichero)):
+            return version, directorio
+    return None, None
+
+
+def cuota_cgroup(raiz=RAIZ_CGROUP):
+    """CPUs que permite la cuota CFS del cgroup del proceso, o None si no hay límite (o no hay cgroup)."""
+    version, directorio = directorio_cgroup(raiz)
+    if version == 2: # "<cuota> <periodo>" o "max <periodo>"
+        cuota, periodo = _leer(os.path.join(directorio, "cpu.max")).split()
+        return None if cuota == "max" else int(cuota) / int(periodo)
+    if version == 1: # -1 = sin límite
+        cuota = int(_leer(os.path.join(directorio, "cpu.cfs_quota_us")))
+        periodo = int(_leer(os.path.join(directorio, "cpu.cfs_period_us")))
+        return None if cuota <= 0 else cuota / periodo
+    return None
+
+
+def cpus_disponibles(cpu_limit=None, raiz=RAIZ_CGROUP):
+    """(cpus, origen): la menor entre la cuota del cgroup, CPU_LIMIT y los núcleos visibles."""
+    candidatas = [(float(len(os.sched_getaffinity(0))), "nucleos")]
+    cuota = cuota_cgroup(raiz)
+    if cuota is not None:
+        candidatas.append((cuota, "cgroup"))
+    if cpu_limit:
+        candidatas.append((float(cpu_limit), "CPU_LIMIT"))
+    return min(candidatas)
+
+
+def hilos_para(cpus):
+    """Hilos de cálculo para una cuota de `cpus`: la parte entera, como mínimo 1 (0.5 CPU -> 1, 2.0 -> 2)."""
+    return max(1, int(math.floor(cpus)))
+
+
+def hilos_inter_op(hilos):
+    """Operaciones independientes en paralelo: con pocos hilos compiten con los intra-op por la misma cuota."""
+    return 1 if hilos < 4 else 2
+
+
+def configurar_entorno(hilos):
+    """Variables de OpenMP/BLAS y de TensorFlow. Llamar antes de importar NumPy y TensorFlow."""
+    for variable in VARIABLES_BLAS:
+        os.environ.setdefault(variable, str(hilos))
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(hilos))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(hilos_inter_op(hilos)))
+    try:
+        #Las BLAS ya cargadas no vuelven a leer las variables: se limitan en caliente.
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=hilos)
+    except ImportError:
+        pass
+
+
+def configurar_tensorflow(tf, hilos):
+    """Pools de TensorFlow. Devuelve False si TensorFlow ya estaba inicializado (se quedan los que tenga)."""
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(hilos)
+        tf.config.threading.set_inter_op_parallelism_threads(hilos_inter_op(hilos))
+        return True
+    except RuntimeError:
+        return False
+
+
+def _leer_cpu_stat(raiz=RAIZ_CGROUP):
+    """{nr_periods, nr_throttled, throttled_s} del cgroup del proceso, o None si no hay cpu.stat."""
+    version, directorio = directorio_cgroup(raiz)
+    contenido = _leer(os.path.join(directorio, "cpu.stat")) if version is not None else None
+    if contenido is None:
+        return None
+    campos = dict(linea.split() for linea in contenido.splitlines() if len(linea.split()) == 2)
+    if "nr_periods" not in campos:
+        return None
+    #v2 da el tiempo congelado en microsegundos y v1 en nanosegundos.
+    throttled_s = int(campos["throttled_usec"]) * 1e-6 if version == 2 else int(campos.get("throttled_time", 0)) * 1e-9
+    return {"nr_periods": int(campos["nr_periods"]), "nr_throttled": int(campos["nr_throttled"]),
+            "throttled_s": throttled_s}
+
+
+class MonitorCPU:
+    """Throttling del cgroup entre dos llamadas a medir() (una ronda de fit o de evaluate)."""
+
+    def __init__(self, raiz=RAIZ_CGROUP):
+        self.raiz = raiz
+        self.activo = cuota_cgroup(raiz) is not None # Sin cuota no hay periodos que contar
+        self.anterior = _leer_cpu_stat(raiz) if self.activo else None
+
+    def medir(self):
+        """Métricas planas para Flower desde la medida anterior: {} sin cgroup con cuota."""
+        actual = _leer_cpu_stat(self.raiz) if self.activo else None
+        if actual is None or self.anterior is None:
+            return {}
+        periodos = actual["nr_periods"] - self.anterior["nr_periods"]
+        limitados = actual["nr_throttled"] - self.anterior["nr_throttled"]
+        metricas = {
+            "cpu_periodos": periodos,
+            "cpu_periodos_limitados": limitados,
+            "fraccion_cpu_limitada": limitados / periodos if periodos > 0 else 0.0,
+            "t_cpu_limitado": actual["throttled_s"] - self.anterior["throttled_s"],
+        }
+        self.anterior = actual
+        return metricas
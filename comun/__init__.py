@@ -0,0 +1,4 @@
+"""
+Código compartido entre el cliente y el servidor (se copia en ambas imágenes Docker).
+Aquí va todo lo que tiene que coincidir en los dos extremos, como el formato de las actualizaciones comprimidas.
+"""
@@ -0,0 +1,100 @@
+"""
+**Media ponderada de FedAvg acumulada en streaming**
+
+AcumuladorFedAvg suma cada actualización a sum(n_i * w_i) en cuanto llega, sin guardar las anteriores. La suma es
+del dtype de cada capa si es de coma flotante de al menos 32 bits (float32 para los modelos de Keras) y el resultado
+se divide sobre ella misma: la agregación ocupa un modelo, no uno en float64 más otro en float32 para el resultado.
+Lo usan el servidor (server/incremental.py, STREAMING_AGG) y los agregadores de borde (edge/edge.py).
+
+Las actualizaciones que llegan en trozos (comun/trozos.py) se suman trozo a trozo (sumar_trozos), sin reconstruirlas,
+pero sólo cuando han llegado todos sus trozos con el CRC bien: si la subida se corta o falla, no se suma nada de ella
+y la ronda sigue siendo el FedAvg de los clientes que han respondido.
+"""
+import time
+import numpy as np
+
+from comun.trozos import tramos
+
+
+def _dtype_suma(dtype):
+    """El dtype en que se acumula una capa de `dtype`: el suyo si es float32/float64, float64 si no."""
+    return np.promote_types(dtype, np.float32) if np.dtype(dtype).kind == "f" else np.dtype(np.float64)
+
+
+class AcumuladorFedAvg:
+    """Suma ponderada de las actualizaciones de una ronda."""
+
+    def __init__(self):
+        self.suma = None # Lista de arrays con la forma de cada capa (dtype de _dtype_suma)
+        self.temporal = None # Buffer para muestras * capa, sin reservar memoria en cada suma
+        self.dtypes = None
+        self.muestras = 0
+        self.actualizaciones = 0
+        self.manifiesto = None # Disposición de los trozos (la de la primera actualización en trozos)
+        self.t_acumular = 0.0 # Tiempo total dentro de sumar() y sumar_trozos()
+
+    def _reservar(self, formas, dtypes):
+        if self.suma is None:
+            self.dtypes = [np.dtype(dtype) for dtype in dtypes]
+            self.suma = [np.zeros(forma, dtype=_dtype_suma(dtype)) for forma, dtype in zip(formas, self.dtypes)]
+        if [list(s.shape) for s in self.suma] != [list(forma) for forma in formas]:
+            raise ValueError("Todas las actualizaciones de una ronda tienen que tener las mismas capas")
+
+    def _producto(self, valores, num_muestras, dtype):
+        """muestras * valores en el buffer temporal (que crece si hace falta)."""
+        if self.temporal is None or self.temporal.size < valores.size or self.temporal.dtype != dtype:
+            self.temporal = np.empty(max(valores.size, 0 if self.temporal is None else self.temporal.size), dtype=dtype)
+        producto = self.temporal[:valores.size].reshape(valores.shape)
+        np.multiply(valores, num_muestras, out=producto, dtype=dtype)
+        return producto
+
+    def sumar(self, pesos, num_muestras):
+        inicio = time.perf_counter()
+        self._reservar([capa.shape for capa in pesos], [capa.dtype for capa in pesos])
+        for suma, capa in zip(self.suma, pesos):
+            suma += self._producto(np.asarray(capa), num_muestras, suma.dtype)
+        self.muestras += num_muestras
+        self.actualizaciones += 1
+        self.t_acumular += time.perf_counter() - inicio
+
+    def sumar_trozos(self, manifiesto, trozos, num_muestras):
+        """
+        Suma una actualización enviada en trozos (Transferencia.desde_ndarrays). `trozos` es la lista de (indice,
+        datos) de la subida completa, con los CRC ya comprobados; se vacía según se suma para liberar cada trozo.
+        """
+        inicio = time.perf_counter()
+        if sorted(indice for indice, _ in trozos) != list(range(manifiesto["num_trozos"])):
+            raise ValueError(f"La subida {manifiesto['id']} no está completa")
+        disposicion = {clave: manifiesto[clave] for clave in ("tamano_trozo", "total", "longitudes", "cabeceras", "dtypes")}
+        self._reservar(manifiesto["formas"], manifiesto["dtypes"])
+        if self.manifiesto is None:
+            self.manifiesto = disposicion
+        elif disposicion != self.manifiesto:
+            raise ValueError("Todas las actualizaciones en trozos de una ronda tienen que trocearse igual")
+        trozos.reverse()
+        while trozos:
+            indice, datos = trozos.pop()
+            for capa, primero, final, desplazamiento in tramos(manifiesto, indice):
+                valores = np.frombuffer(datos, dtype=self.dtypes[capa], count=final - primero, offset=desplazamiento)
+                suma = self.suma[capa].reshape(-1)[primero:final]
+                suma += self._producto(valores, num_muestras, suma.dtype)
+            del datos
+        self.muestras += num_muestras
+        self.actualizaciones += 1
+        self.t_acumular += time.perf_counter() - inicio
+
+    def resultado(self):
+        """
+        Los pesos agregados (media ponderada por muestras), en el dtype original de cada capa. Las capas que se han
+        acumulado en su propio dtype se dividen sobre la suma, sin copiarlas: después el acumulador ya no sirve.
+        """
+        if not self.muestras:
+            raise ValueError("No se ha sumado ninguna actualización")
+        resultado = []
+        for suma, dtype in zip(self.suma, self.dtypes):
+            if suma.dtype == dtype:
+                resultado.append(np.divide(suma, self.muestras, out=suma))
+            else:
+                resultado.append((suma / self.muestras).astype(dtype))
+        self.suma = None
+        return resultado
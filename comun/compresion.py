@@ -0,0 +1,174 @@
+"""
+**Compresión de las actualizaciones del cliente (uplink)**
+
+En el perfil IoT (1mbit, 5% de pérdida) lo que más tarda en cada ronda es subir los pesos.
+En lugar de enviar la lista completa de pesos float32, el cliente puede enviar el DELTA respecto al
+modelo global que recibió, comprimido con:
+
+- "int8":  cuantización simétrica a 8 bits (x4 menos bytes).
+- "uint4": cuantización a 4 bits, dos valores por byte (x8 menos bytes).
+- "topk":  sólo los k valores de mayor magnitud + sus índices (esparsificación).
+- "topk+int8" / "topk+uint4": las dos cosas a la vez.
+
+El error que se pierde al comprimir no se tira: el cliente lo guarda (error feedback) y lo suma al delta
+de la siguiente ronda, así el modelo acaba recibiendo toda la información aunque sea con retraso.
+
+Impacto en la accuracy: el codificador guarda el delta que verá el servidor (reconstruido), así que el cliente puede
+evaluar su modelo entrenado sin comprimir y el que reconstruye el servidor (global + reconstruido) sobre unas muestras
+de su test (COMPRESSION_EVAL_SAMPLES). El servidor anota la media de ambas y de la diferencia en global_results.json.
+
+Formato en el cable (una lista de ndarrays, que es lo que Flower sabe transportar):
+    [cabecera float64, indices uint32, valores]
+    cabecera = [FORMATO, modo, n, k, escala, minimo]
+
+Este módulo lo usan el cliente (codificar) y el servidor (decodificar), por eso vive en comun/.
+"""
+import time
+import numpy as np
+
+
+FORMATO = 1
+MODOS = ["none", "int8", "uint4", "topk", "topk+int8", "topk+uint4"]
+
+
+def aplanar(pesos):
+    """Lista de tensores -> vector float32 1D (y las formas para deshacerlo). Un vector float32 solo no se copia."""
+    formas = [w.shape for w in pesos]
+    if len(pesos) == 1 and pesos[0].ndim == 1 and pesos[0].dtype == np.float32:
+        return pesos[0], formas # Modelo ya plano (FLAT_PARAMS, ver comun/parametros.py)
+    return np.concatenate([np.asarray(w, dtype=np.float32).ravel() for w in pesos]), formas
+
+
+def desaplanar(vector, formas):
+    """Vector 1D -> lista de tensores con las formas originales."""
+    pesos = []
+    inicio = 0
+    for forma in formas:
+        tamano = int(np.prod(forma))
+        pesos.append(vector[inicio:inicio + tamano].reshape(forma))
+        inicio += tamano
+    return pesos
+
+
+def _cuantizar(valores, bits):
+    """Devuelve (payload, escala, minimo). 8 bits: simétrica con signo. 4 bits: afín sin signo, empaquetada."""
+    if bits == 8:
+        escala = float(np.max(np.abs(valores))) / 127.0 if len(valores) else 0.0
+        if escala == 0.0:
+            return np.zeros(len(valores), dtype=np.int8), 0.0, 0.0
+        return np.round(valores / escala).astype(np.int8), escala, 0.0
+
+    minimo = float(np.min(valores)) if len(valores) else 0.0
+    escala = (float(np.max(valores)) - minimo) / 15.0 if len(valores) else 0.0
+    if escala == 0.0:
+        q = np.zeros(len(valores), dtype=np.uint8)
+    else:
+        q = np.clip(np.round((valores - minimo) / escala), 0, 15).astype(np.uint8)
+    if len(q) % 2:
+        q = np.append(q, np.uint8(0))
+    return (q[0::2] | (q[1::2] << 4)).astype(np.uint8), escala, minimo
+
+
+def _descuantizar(payload, bits, escala, minimo, k):
+    if bits == 8:
+        return payload.astype(np.float32) * np.float32(escala)
+    q = np.empty(len(payload) * 2, dtype=np.uint8)
+    q[0::2] = payload & 0x0F
+    q[1::2] = payload >> 4
+    return q[:k].astype(np.float32) * np.float32(escala) + np.float32(minimo)
+
+
+def codificar(delta, modo, fraccion_topk=0.01):
+    """Comprime un vector 1D float32. Devuelve la lista de ndarrays que se envía al servidor."""
+    if modo not in MODOS:
+        raise ValueError(f"Codec '{modo}' no reconocido. Opciones: {MODOS}")
+    n = len(delta)
+
+    if modo.startswith("topk"):
+        k = max(1, min(n, int(n * fraccion_topk)))
+        indices = np.sort(np.argpartition(np.abs(delta), n - k)[n - k:]).astype(np.uint32)
+        valores = delta[indices]
+    else:
+        k = n
+        indices = np.zeros(0, dtype=np.uint32)
+        valores = delta
+
+    escala, minimo = 0.0, 0.0
+    if modo.endswith("int8"):
+        valores, escala, minimo = _cuantizar(valores, 8)
+    elif modo.endswith("uint4"):
+        valores, escala, minimo = _cuantizar(valores, 4)
+    else:
+        valores = np.asarray(valores, dtype=np.float32)
+
+    cabecera = np.array([FORMATO, MODOS.index(modo), n, k, escala, minimo], dtype=np.float64)
+    return [cabecera, indices, valores]
+
+
+def decodificar(paquete):
+    """Reconstruye el vector 1D float32 a partir de [cabecera, indices, valores]."""
+    cabecera, indices, valores = paquete
+    formato, modo_id, n, k, escala, minimo = cabecera.tolist()
+    if int(formato) != FORMATO:
+        raise ValueError(f"Formato de compresión {int(formato)} no soportado (se esperaba {FORMATO}).")
+    modo = MODOS[int(modo_id)]
+    n, k = int(n), int(k)
+
+    if modo.endswith("int8"):
+        valores = _descuantizar(valores, 8, escala, minimo, k)
+    elif modo.endswith("uint4"):
+        valores = _descuantizar(valores, 4, escala, minimo, k)
+    else:
+        valores = np.asarray(valores, dtype=np.float32)
+
+    if modo.startswith("topk"):
+        delta = np.zeros(n, dtype=np.float32)
+        delta[indices] = valores
+        return delta
+    return valores
+
+
+def tamano_bytes(arrays):
+    """Bytes que ocupan los datos de una lista de ndarrays (sin contar la cabecera de serialización)."""
+    return int(sum(a.nbytes for a in arrays))
+
+
+class CodificadorActualizaciones:
+    """
+    Lado cliente: calcula el delta, lo comprime y guarda el error para la ronda siguiente (error feedback).
+    Un objeto por cliente, que vive lo mismo que el proceso.
+    """
+    def __init__(self, modo, fraccion_topk=0.01):
+        self.modo = modo
+        self.fraccion_topk = fraccion_topk
+        self.residuo = None
+        self.reconstruido = None # Delta (vector 1D) que reconstruirá el servidor a partir del último paquete
+
+    def codificar(self, pesos_locales, pesos_globales):
+        inicio = time.perf_counter()
+        local, _ = aplanar(pesos_locales)
+        global_, _ = aplanar(pesos_globales)
+        delta = local - global_
+        if self.residuo is not None and len(self.residuo) == len(delta):
+            delta += self.residuo
+
+        paquete = codificar(delta, self.modo, self.fraccion_topk)
+        reconstruido = decodificar(paquete)
+        self.residuo = delta - reconstruido
+        self.reconstruido = reconstruido
+        t_codificar = time.perf_counter() - inicio
+
+        norma = float(np.linalg.norm(delta))
+        metricas = {
+            "codec": self.modo,
+            "bytes_originales": int(local.nbytes),
+            "bytes_codificados": tamano_bytes(paquete),
+            "t_codificar": t_codificar,
+            "error_relativo": float(np.linalg.norm(self.residuo)) / norma if norma > 0 else 0.0,
+        }
+        return paquete, metricas
+
+    def pesos_servidor(self, pesos_globales):
+        """Los pesos que el servidor obtiene al decodificar el último paquete: global + delta reconstruido."""
+        global_, formas = aplanar(pesos_globales)
+        return desaplanar(global_ + self.reconstruido, formas)
@@ -0,0 +1,125 @@
+"""
+**Almacén compartido del dataset MNIST (uint8 + memmap)**
+
+Antes cada cliente cargaba MNIST, unía train y test y dividía entre 255.0.
+Eso crea una copia float64 de 70.000x28x28 (~440 MB) en CADA contenedor, aunque luego sólo use unos pocos miles de filas.
+Con decenas de clientes en el mismo host es lo que provocaba los OOM.
+
+Ahora las imágenes se guardan UNA vez en el volumen compartido como uint8 (~55 MB):
+
+    /app/results/dataset/
+        mnist_x_u8.npy  -> (70000, 28, 28) uint8
+        mnist_y.npy     -> (70000,) uint8
+
+Cada cliente abre el fichero en modo memmap de sólo lectura (las páginas las comparte el sistema operativo entre
+todos los contenedores), copia únicamente las filas de su partición, y normaliza a float32 lote a lote.
+
+No hace falta red en tiempo de ejecución: el almacén se crea a partir de un mnist.npz local
+(el que deja Keras en ~/.keras/datasets o el indicado en MNIST_NPZ). Las imágenes de Docker lo descargan al construirse;
+si no hay ninguno se falla con un error en lugar de descargarlo.
+
+Preparar el almacén desde la terminal (no necesita TensorFlow):
+    python comun/datos.py --npz ~/.keras/datasets/mnist.npz --salida results/dataset
+"""
+import os
+import argparse
+import tempfile
+import numpy as np
+
+
+FICHERO_X = "mnist_x_u8.npy"
+FICHERO_Y = "mnist_y.npy"
+
+
+def preparar_almacen(directorio, x, y):
+    """
+    Escribe imágenes (uint8) y etiquetas de forma atómica. Si otro cliente ya lo hizo, no se toca.
+    Cada proceso escribe en su propio temporal (mkstemp): en Docker el proceso de todos los clientes es el PID 1.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    for nombre, datos in ((FICHERO_X, x), (FICHERO_Y, y)):
+        destino = os.path.join(directorio, nombre)
+        if os.path.exists(destino):
+            continue
+        descriptor, temporal = tempfile.mkstemp(prefix=nombre + ".tmp-", dir=directorio)
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                np.save(f, np.ascontiguousarray(datos, dtype=np.uint8))
+            os.chmod(temporal, 0o644) # mkstemp lo crea sólo para su dueño
+            os.replace(temporal, destino)
+        except BaseException:
+            os.remove(temporal)
+            raise
+
+
+def abrir_almacen(directorio):
+    """Abre el almacén: imágenes como memmap de sólo lectura, etiquetas en memoria (70 KB)."""
+    x = np.load(os.path.join(directorio, FICHERO_X), mmap_mode="r")
+    y = np.load(os.path.join(directorio, FICHERO_Y))
+    return x, y
+
+
+def _cargar_mnist_original(npz=None):
+    """MNIST completo (train + test) en uint8 desde un mnist.npz local. Sin ninguno, FileNotFoundError (no se descarga)."""
+    candidatos = [npz, os.environ.get("MNIST_NPZ"), os.path.expanduser("~/.keras/datasets/mnist.npz")]
+    for ruta in candidatos:
+        if ruta and os.path.exists(ruta):
+            with np.load(ruta) as mnist:
+                x = np.concatenate([mnist["x_train"], mnist["x_test"]])
+                y = np.concatenate([mnist["y_train"], mnist["y_test"]])
+            return x, y
+
+    raise FileNotFoundError(
+        "No hay mnist.npz local (buscado en: " + ", ".join(r for r in candidatos if r) + "). Indica uno con MNIST_NPZ, "
+        "crea antes el almacén con 'python comun/datos.py --npz <mnist.npz>' o descárgalo una vez con "
+        "tf.keras.datasets.mnist.load_data().")
+
+
+def cargar_o_crear_almacen(directorio, npz=None):
+    """Abre el almacén compartido y, si todavía no existe, lo crea."""
+    if not (os.path.exists(os.path.join(directorio, FICHERO_X)) and os.path.exists(os.path.join(directorio, FICHERO_Y))):
+        x, y = _cargar_mnist_original(npz)
+        try:
+            preparar_almacen(directorio, x, y)
+        except OSError as e:
+            # Sin volumen compartido seguimos con los datos en memoria (en uint8, no en float64).
+            print(f"No se pudo crear el almacén en {directorio}: {e}")
+            return x, y
+        del x, y
+    return abrir_almacen(directorio)
+
+
+def normalizar_lote(x_u8):
+    """Normaliza un lote a [0, 1] en float32 y añade el canal de color: (n, 28, 28, 1)."""
+    return (np.asarray(x_u8, dtype=np.float32) / np.float32(255.0)).reshape(-1, 28, 28, 1)
+
+
+def memoria_residente_mb():
+    """
+    Memoria residente del proceso (VmRSS) y su pico (VmHWM) en MB, leídos de /proc/self/status.
+    Las páginas del memmap compartido cuentan aquí, pero el sistema operativo sólo las guarda una vez para todos.
+    """
+    rss, pico = 0.0, 0.0
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    rss = int(linea.split()[1]) / 1024
+                elif linea.startswith("VmHWM:"):
+                    pico = int(linea.split()[1]) / 1024
+    except OSError:
+        # Fuera de Linux no hay /proc. Usamos el pico que da resource (KB en Linux, bytes en macOS).
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return rss, pico
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea el almacén compartido uint8 de MNIST.")
+    parser.add_argument("--npz", default=os.path.expanduser("~/.keras/datasets/mnist.npz"))
+    parser.add_argument("--salida", default="results/dataset")
+    args = parser.parse_args()
+
+    x_all, y_all = _cargar_mnist_original(args.npz)
+    preparar_almacen(args.salida, x_all, y_all)
+    print(f"Almacén creado en {args.salida}: {x_all.shape} {x_all.dtype} ({x_all.nbytes / 1e6:.1f} MB)")
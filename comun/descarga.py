@@ -0,0 +1,98 @@
+"""
+**Bajada del modelo global por versiones (downlink)**
+
+Cada fit y cada evaluate enviaban la lista completa de pesos a todos los clientes, aunque la mayoría ya tiene un
+modelo casi igual: el que recibió en la evaluación de la ronda anterior es exactamente el que se le vuelve a mandar
+en el fit de la siguiente. En los perfiles de 1mbit y 10mbit eso es la mitad del tráfico de bajada.
+
+El servidor (CacheVersiones) numera cada modelo global que publica y recuerda qué versión tiene cada cliente:
+
+- "actual":   el cliente ya tiene la versión que toca -> no se envía nada.
+- "delta":    tiene una versión reciente -> se envía la cadena de deltas comprimidos (comun/compresion.py) desde ella.
+- "completo": no se sabe qué tiene, su versión ya no está en la caché o la cadena ocupa más que el modelo
+              -> se envía el modelo completo, como antes.
+
+Para que el error de compresión no se acumule, el modelo publicado no es el agregado tal cual sino el RECONSTRUIDO:
+versión v = versión v-1 + decodificar(delta comprimido). Cliente y servidor hacen exactamente las mismas operaciones
+en float32, así que tienen el mismo modelo bit a bit, y frente al agregado sólo hay el error del último delta.
+
+El cliente (ReceptorModelo) reconstruye los pesos completos antes de model.set_weights. Si le llega un delta o un
+"actual" sobre una versión que no tiene (p. ej. se ha reiniciado), devuelve None: el cliente responde con
+"sincronizar" y el servidor le manda el modelo completo la próxima vez.
+
+Los campos del config: descarga (tipo), version_modelo y version_base (sólo en delta y actual).
+Sin el campo descarga (modo asíncrono, servidores antiguos) los parámetros son el modelo completo.
+"""
+from comun.compresion import aplanar, desaplanar, codificar, decodificar, tamano_bytes
+
+
+class CacheVersiones:
+    """Lado servidor: últimas versiones del modelo global (como deltas) y versión que tiene cada cliente."""
+
+    def __init__(self, codec="int8", conservar=3, fraccion_topk=0.01):
+        self.codec = codec # Codec de los deltas (ver comun/compresion.py). "none" = delta en float32
+        self.conservar = conservar # Nº de deltas que se guardan (un cliente más atrasado recibe el modelo completo)
+        self.fraccion_topk = fraccion_topk
+        self.version = 0 # Versión publicada (0 = ninguna todavía)
+        self.vector = None # Modelo publicado (reconstruido), aplanado
+        self.formas = None
+        self.deltas = {} # v -> paquete comprimido que lleva de la versión v-1 a la v
+        self.clientes = {} # cid -> versión que tiene el cliente
+
+    def publicar(self, pesos):
+        """Publica una versión nueva a partir de los pesos agregados. Devuelve los pesos que reconstruyen los clientes."""
+        vector, formas = aplanar(pesos)
+        if self.vector is None or formas != self.formas:
+            self.vector, self.deltas = vector, {}
+        else:
+            paquete = codificar(vector - self.vector, self.codec, self.fraccion_topk)
+            self.vector = self.vector + decodificar(paquete)
+            self.deltas[self.version + 1] = paquete
+            self.deltas.pop(self.version + 1 - self.conservar, None)
+        self.version += 1
+        self.formas = formas
+        return desaplanar(self.vector, formas)
+
+    def preparar(self, cid):
+        """(tipo, arrays a enviar, versión base) para que el cliente `cid` tenga la versión actual."""
+        base = self.clientes.get(cid)
+        if base == self.version:
+            return "actual", [], base
+        if base is not None and all(v in self.deltas for v in range(base + 1, self.version + 1)):
+            cadena = [a for v in range(base + 1, self.version + 1) for a in self.deltas[v]]
+            if tamano_bytes(cadena) < self.vector.nbytes:
+                return "delta", cadena, base
+        return "completo", desaplanar(self.vector, self.formas), None
+
+    def confirmar(self, cid, version):
+        self.clientes[cid] = version
+
+    def olvidar(self, cid):
+        """No se sabe qué tiene el cliente (ha fallado o ha pedido sincronizar): la próxima vez, modelo completo."""
+        self.clientes.pop(cid, None)
+
+
+class ReceptorModelo:
+    """Lado cliente: la última versión recibida, para aplicar sobre ella los deltas del servidor."""
+
+    def __init__(self):
+        self.version = None
+        self.vector = None
+        self.formas = None
+
+    def reconstruir(self, parameters, config):
+        """Pesos completos a partir de lo recibido, o None si no se tiene la versión base (hay que sincronizar)."""
+        config = config or {}
+        tipo = config.get("descarga", "completo")
+        if tipo == "completo":
+            self.vector, self.formas = aplanar(parameters)
+        else:
+            if self.vector is None or self.version != config.get("version_base"):
+                return None
+            if tipo == "delta":
+                vector = self.vector
+                for i in range(0, len(parameters), 3): # Cada delta son 3 arrays: [cabecera, indices, valores]
+                    vector = vector + decodificar(parameters[i:i + 3])
+                self.vector = vector
+        self.version = config.get("version_modelo")
+        return desaplanar(self.vector, self.formas)
@@ -0,0 +1,75 @@
+"""
+**Métricas de evaluación a partir de una única pasada de inferencia**
+
+Antes `FlowerClient.evaluate` hacía dos pasadas completas sobre el test local (model.evaluate + model.predict)
+y luego llamaba por separado a precision_score, recall_score y f1_score de sklearn, que repetían el conteo de etiquetas cada una.
+
+Aquí, a partir de las probabilidades de UN solo model.predict:
+1. Construimos la matriz de confusión con np.bincount.
+2. De ella salen accuracy, precision, recall y F1 (ponderados por soporte, igual que average='weighted' con zero_division=0).
+3. La pérdida es la entropía cruzada categórica dispersa, con el mismo recorte (epsilon 1e-7) que usa Keras.
+
+Como subproducto tenemos las métricas por clase sin coste adicional.
+"""
+import numpy as np
+
+
+EPSILON = 1e-7 # Mismo valor que tf.keras.backend.epsilon()
+
+
+def _dividir(numerador, denominador):
+    """División elemento a elemento que devuelve 0 donde el denominador es 0 (zero_division=0 en sklearn)."""
+    resultado = np.zeros(len(numerador), dtype=np.float64)
+    np.divide(numerador, denominador, out=resultado, where=denominador > 0)
+    return resultado
+
+
+def matriz_confusion(y_true, y_pred, num_clases):
+    """Filas: clase real. Columnas: clase predicha."""
+    return np.bincount(y_true * num_clases + y_pred, minlength=num_clases * num_clases).reshape(num_clases, num_clases)
+
+
+def metricas_desde_probabilidades(y_true, probabilidades):
+    """
+    Devuelve (metricas, por_clase):
+    - metricas: loss, accuracy, precision, recall y f1_score ponderados.
+    - por_clase: {etiqueta: {precision, recall, f1_score, soporte}} para las clases que aparecen (reales o predichas).
+    """
+    y_true = np.asarray(y_true, dtype=np.int64)
+    num_clases = probabilidades.shape[1]
+    y_pred = np.argmax(probabilidades, axis=1)
+
+    # Pérdida: -log(p de la clase correcta), recortada como en Keras para evitar log(0).
+    p_correcta = np.clip(probabilidades[np.arange(len(y_true)), y_true], EPSILON, 1.0 - EPSILON)
+    loss = float(-np.mean(np.log(p_correcta)))
+
+    cm = matriz_confusion(y_true, y_pred, num_clases)
+    tp = np.diag(cm).astype(np.float64)
+    soporte = cm.sum(axis=1)
+    predichos = cm.sum(axis=0)
+
+    precision_c = _dividir(tp, predichos)
+    recall_c = _dividir(tp, soporte)
+    f1_c = _dividir(2 * tp, soporte + predichos) # 2TP / (2TP + FP + FN)
+
+    # average='weighted': media ponderada por el número de muestras reales de cada clase.
+    pesos = soporte / soporte.sum()
+    metricas = {
+        "loss": loss,
+        "accuracy": float(tp.sum() / len(y_true)),
+        "precision": float(np.dot(pesos, precision_c)),
+        "recall": float(np.dot(pesos, recall_c)),
+        "f1_score": float(np.dot(pesos, f1_c)),
+    }
+
+    por_clase = {
+        int(k): {
+            "precision": float(precision_c[k]),
+            "recall": float(recall_c[k]),
+            "f1_score": float(f1_c[k]),
+            "soporte": int(soporte[k]),
+        }
+        for k in np.flatnonzero((soporte + predichos) > 0)
+    }
+
+    return metricas, por_clase
@@ -0,0 +1,56 @@
+"""
+**Modelo compartido**
+
+Lo usa el cliente para entrenar y, además, el servidor y los benchmarks para construir exactamente la misma red.
+"""
+import tensorflow as tf
+
+
+"""
+
+**Construimos el modelo de red neuronal convolucional (CNN)**
+Las redes neuronales convolucionales (CNN) es un tipo de red neuronal especializado en procesar datos con una estructura cuadrática, como imágenes.
+Referencia: https://www.tensorflow.org/tutorials/images/cnn
+Su funcionamiento es el siguiente:
+1. Capas convulacionales. A estas capas se le aplican kernels, pequeñas matrices que recorren la imagen, para extraer la características más importantes como bordes, tecturas, etc...
+2. Capas de pooling, que reducen la dimensionalidad de las características extraídas, manteniendo la información más relevante.
+3. Maxpooling, selecciona el valor máximo dentro cada región cubierta por el kernel.
+4. Flatten, convierte la matriz, en un vector para conectarlo con las neuronas.
+5. Se genera una red neuronal normal para razonar sobre las características y decidir.
+"""
+def build_model(): #Construir un modelo de red neuronal convolucional simple para clasificar las imágenes de MNIST
+    model = tf.keras.Sequential([ #Modelo secuencial apilando capas linealmente. signifca que la salida de una capa es la entrada de la siguiente
+        #Un filtro son las característica/objetivo que la red quiere aprender.
+        #Kenel es la matricula de la que se va a deslizar, en este caso es 3x3.
+        #La funcion de activación ReLU.
+        #La entrada de datos.
+        tf.keras.layers.Conv2D(8, 3, activation="relu", input_shape=(28, 28, 1)),
+        tf.keras.layers.MaxPooling2D(), #Reduce dimensaionalidad a 2x2.
+        tf.keras.layers.Flatten(), #Pasar de matriz a vector.
+        tf.keras.layers.Dense(16, activation="relu"), #Capa donde se razonan
+        tf.keras.layers.Dense(10, activation="softmax"), #Capa final para clasificación multiclase.
+    ])
+
+    model.compile( #Compilar el modelo con el optimizador Adam, la función de pérdida de entropía cruzada categórica y la métrica de precisión
+        optimizer="adam", 
+        loss="sparse_categorical_crossentropy", 
+        metrics=["accuracy"], 
+    )
+
+    return model
+"""
+**Compilación del modelo**
+Es la configuración del modelo para el entranamiento del modelo.
+1. Optimizador:
+El optimizador ADAM (Adaptive Moment Estimation). Es un algoritmo de optimización.
+Aquí se aplica el descenso de la gradiente estocástico, para minimizar el error del modelo. Explicado en clase.
+El objetivo es encontrar un mínimo local de la función de pérdida
+
+2. Función de pérdida:
+La función de pérdida de entropía cruzada categórica. Mide cuanto mal lo hizo el modelo. Para ello calcula la pérdida (loss)
+Sparse significa que las etiquetas son enteros (0-9) en lugar de vectores one-hot.
+
+3. Métrica:
+La métrica de precisión para saber cuanto acertó de x imágnes.
+
+"""
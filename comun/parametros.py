@@ -0,0 +1,204 @@
+"""
+**Parámetros en un único buffer plano, sin copias intermedias**
+
+Por cada cliente y ronda los pesos se copiaban varias veces enteros:
+model.get_weights() (una copia por capa), ndarrays_to_parameters de Flower (np.save a un BytesIO y getvalue(): dos
+copias más), parameters_to_ndarrays en el otro extremo (np.load: otra) y model.set_weights.
+
+Aquí:
+
+1. Serialización compatible con Flower (mismo formato .npy, tensor_type "numpy.ndarray") pero con UNA copia al
+   serializar (cabecera + memoryview del array unidos con b"".join) y NINGUNA al deserializar: np.frombuffer devuelve
+   una vista de sólo lectura sobre los bytes recibidos. Lo usan el servidor (estrategia.py, asincrono.py) y el
+   cliente (ClienteBuffer, que sustituye al envoltorio NumPyClient de Flower).
+
+2. Disposicion: formas y desplazamientos de cada capa dentro de un vector float32 contiguo. Cada capa es una vista
+   (reshape de un slice) del vector, sin copiar.
+
+3. BufferModelo: los pesos del modelo Keras como ese vector. leer() hace una sola copia (tf.concat de las variables,
+   cuyo .numpy() comparte memoria con el tensor), escribir() asigna cada variable desde su vista.
+
+4. ClienteBuffer también recibe y envía el modelo en trozos cuando el servidor lo pide (ver trozos.py).
+
+Con FLAT_PARAMS=True (ver client.py) los clientes envían el modelo como un único tensor (el vector) en lugar de una
+lista de capas: el servidor deserializa, agrega, comprime y guarda checkpoints sobre un solo array. Todos los
+clientes tienen que usar el mismo valor (FedAvg no puede agregar listas con distinto número de arrays).
+"""
+import io
+import os
+import json
+import numpy as np
+from flwr.common import Parameters, Code, Status, GetPropertiesRes, GetParametersRes, FitRes, EvaluateRes
+from flwr.client import Client
+
+from comun.trozos import MARCA, Transferencia, Recepcion, manifiesto_a_parameters, parameters_a_manifiesto
+
+_LEER_CABECERA = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+
+def ndarray_a_piezas(array):
+    """Array -> (cabecera .npy, memoryview de sus datos): los bytes de ndarray_a_bytes sin unirlos (sin copia)."""
+    array = np.asarray(array)
+    if not array.flags.c_contiguous:
+        array = np.ascontiguousarray(array)
+    cabecera = io.BytesIO()
+    np.lib.format.write_array_header_1_0(cabecera, np.lib.format.header_data_from_array_1_0(array))
+    return cabecera.getvalue(), memoryview(array.reshape(-1)).cast("B")
+
+
+def ndarray_a_bytes(array):
+    """Array -> bytes en formato .npy (como np.save), con una sola copia de los datos."""
+    return b"".join(ndarray_a_piezas(array))
+
+
+def bytes_a_ndarray(datos):
+    """
+    Bytes .npy -> array de sólo lectura que comparte memoria con `datos` (sin copia). No admite objetos (pickle).
+    `datos` puede ser cualquier objeto con el protocolo buffer (bytes, bytearray, una vista de un np.memmap...).
+    """
+    vista = memoryview(datos).cast("B")
+    # Sólo la cabecera pasa por BytesIO (que copia todo lo que no sea bytes): magic (6) + versión (2) + longitud.
+    ancho = 2 if (vista[6], vista[7]) == (1, 0) else 4
+    flujo = io.BytesIO(vista[:8 + ancho + int.from_bytes(vista[8:8 + ancho], "little")])
+    version = np.lib.format.read_magic(flujo)
+    if version not in _LEER_CABECERA:
+        raise ValueError(f"Versión de .npy no soportada: {version}")
+    forma, fortran, dtype = _LEER_CABECERA[version](flujo)
+    if dtype.hasobject:
+        raise ValueError("Los parámetros no pueden contener objetos de Python")
+    array = np.frombuffer(datos, dtype=dtype, count=int(np.prod(forma)), offset=flujo.tell())
+    return array.reshape(forma, order="F" if fortran else "C")
+
+
+def ndarrays_a_parameters(arrays):
+    """Equivalente a flwr.common.ndarrays_to_parameters con una copia por array en lugar de dos."""
+    return Parameters(tensors=[ndarray_a_bytes(array) for array in arrays], tensor_type="numpy.ndarray")
+
+
+def parameters_a_ndarrays(parameters):
+    """Equivalente a flwr.common.parameters_to_ndarrays, sin copias (vistas de sólo lectura)."""
+    return [bytes_a_ndarray(tensor) for tensor in parameters.tensors]
+
+
+class Disposicion:
+    """Dónde está cada capa dentro del vector plano (float32)."""
+
+    def __init__(self, formas):
+        self.formas = [tuple(forma) for forma in formas]
+        self.tamanos = [int(np.prod(forma)) for forma in self.formas]
+        self.desplazamientos = np.concatenate([[0], np.cumsum(self.tamanos)]).astype(int).tolist()
+        self.tamano = self.desplazamientos[-1]
+
+    def es_plano(self, pesos):
+        """True si `pesos` es el modelo como un único vector (formato FLAT_PARAMS)."""
+        return len(pesos) == 1 and pesos[0].ndim == 1 and pesos[0].size == self.tamano and len(self.formas) > 1
+
+    def vistas(self, vector):
+        """Lista de capas que son vistas del vector (sin copiar)."""
+        return [vector[inicio:inicio + tamano].reshape(forma)
+                for inicio, tamano, forma in zip(self.desplazamientos, self.tamanos, self.formas)]
+
+    def capas(self, pesos):
+        """Los pesos como lista de capas, vengan planos o no."""
+        return self.vistas(pesos[0]) if self.es_plano(pesos) else list(pesos)
+
+
+class BufferModelo:
+    """Los pesos de un modelo Keras como un vector float32 contiguo."""
+
+    def __init__(self, model):
+        self.variables = model.weights # Mismo orden que get_weights/set_weights
+        self.disposicion = Disposicion([v.shape for v in self.variables])
+
+    def leer(self):
+        """Vector con todos los pesos (una copia: la de tf.concat)."""
+        import tensorflow as tf
+        return tf.concat([tf.reshape(v, [-1]) for v in self.variables], axis=0).numpy()
+
+    def leer_capas(self):
+        """Los pesos como lista de capas, vistas de un único vector."""
+        return self.disposicion.vistas(self.leer())
+
+    def escribir(self, pesos):
+        """Asigna los pesos (vector plano o lista de capas) sin copias intermedias."""
+        capas = self.disposicion.capas(pesos)
+        if len(capas) != len(self.variables):
+            raise ValueError(f"Se esperaban {len(self.variables)} arrays y han llegado {len(capas)}")
+        for variable, capa in zip(self.variables, capas):
+            variable.assign(capa)
+
+
+class ClienteBuffer(Client):
+    """
+    El envoltorio de Flower para un NumPyClient (flwr.client.app._wrap_numpy_client) con la serialización
+    de este módulo: el cliente recibe vistas de sólo lectura y sus pesos se serializan con una sola copia.
+
+    También es el lado cliente de las transferencias en trozos (comun/trozos.py, server/transferencia.py): el servidor
+    envía y pide cada trozo con get_properties({"trozos": ...}) y en fit/evaluate llega sólo el manifiesto. Con
+    `directorio` la bajada en curso se guarda en disco y se reanuda si el proceso se reinicia a mitad. La subida no se
+    reanuda: si se corta, el servidor descarta ese fit.
+    """
+
+    def __init__(self, numpy_client, directorio=None):
+        self.numpy_client = numpy_client
+        self.directorio = directorio
+        self.recepcion = None # Recepcion de la última bajada en trozos
+        self.subida = None # Transferencia de la última subida en trozos, hasta que el servidor pida la siguiente
+        self.subidas = 0
+
+    def _trozos(self, config):
+        orden = config["trozos"]
+        if orden == "capacidad":
+            return {"trozos": True}
+        if orden == "manifiesto": # Empieza (o se reanuda) una bajada: se responde con los trozos que ya están
+            manifiesto = json.loads(config["manifiesto"])
+            if self.recepcion is None or self.recepcion.id != manifiesto["id"]:
+                if self.recepcion is not None:
+                    self.recepcion.borrar()
+                self.recepcion = Recepcion(manifiesto, self.directorio)
+            return {"recibidos": np.packbits(self.recepcion.recibidos.astype(bool)).tobytes()}
+        if orden == "bajada":
+            return {"ok": self.recepcion.recibir(int(config["indice"]), config["datos"], int(config["crc"]))}
+        if orden == "subida":
+            datos, crc = self.subida.trozo(int(config["indice"]))
+            return {"datos": datos, "crc": crc}
+        raise ValueError(f"Orden de transferencia desconocida: {orden}")
+
+    def _recibir(self, parameters):
+        """Los pesos recibidos: los del mensaje o, si sólo llega el manifiesto, los de la bajada en trozos."""
+        if parameters.tensor_type != MARCA:
+            return parameters_a_ndarrays(parameters)
+        manifiesto = parameters_a_manifiesto(parameters)
+        if self.recepcion is None or self.recepcion.id != manifiesto["id"] or not self.recepcion.completa():
+            raise RuntimeError(f"La transferencia {manifiesto['id']} no se ha recibido entera")
+        return parameters_a_ndarrays(self.recepcion.parameters())
+
+    def _enviar(self, pesos, config):
+        """Los pesos como Parameters o, si el servidor admite la subida en trozos y no caben en uno, su manifiesto."""
+        tamano = int(config.get("trozos_subida", 0))
+        if tamano <= 0 or sum(np.asarray(p).nbytes for p in pesos) <= tamano:
+            self.subida = None
+            return ndarrays_a_parameters(pesos)
+        self.subidas += 1
+        self.subida = Transferencia.desde_ndarrays(f"{os.getpid()}-{self.subidas}", pesos, tamano)
+        return manifiesto_a_parameters(self.subida.manifiesto)
+
+    def get_properties(self, ins):
+        config = ins.config or {}
+        propiedades = self._trozos(config) if "trozos" in config else self.numpy_client.get_properties(config=config)
+        return GetPropertiesRes(status=Status(code=Code.OK, message="Success"), properties=propiedades)
+
+    def get_parameters(self, ins):
+        pesos = self.numpy_client.get_parameters(config=ins.config)
+        return GetParametersRes(status=Status(code=Code.OK, message="Success"), parameters=self._enviar(pesos, ins.config))
+
+    def fit(self, ins):
+        pesos, num_ejemplos, metricas = self.numpy_client.fit(self._recibir(ins.parameters), ins.config)
+        return FitRes(status=Status(code=Code.OK, message="Success"), parameters=self._enviar(pesos, ins.config),
+                      num_examples=num_ejemplos, metrics=metricas)
+
+    def evaluate(self, ins):
+        loss, num_ejemplos, metricas = self.numpy_client.evaluate(self._recibir(ins.parameters), ins.config)
+        return EvaluateRes(status=Status(code=Code.OK, message="Success"), loss=loss, num_examples=num_ejemplos,
+                           metrics=metricas)
+
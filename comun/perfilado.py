@@ -0,0 +1,115 @@
+"""
+**Perfilado por fases de cada ronda**
+
+En global_results.json sólo vemos accuracy y F1: cuando una ronda es lenta no sabemos si el tiempo se fue en la red,
+en set_weights, en el entrenamiento, en la evaluación o en escribir el JSON.
+
+Lado cliente (Perfilador): mide cada fase de fit/evaluate, los bytes recibidos y enviados, el pico de memoria residente
+y los segundos de CPU, y lo devuelve dentro del diccionario de métricas de Flower con el prefijo "perf_"
+(Flower sólo admite escalares, así que van planos: perf_t_entrenar, perf_bytes_enviados, ...).
+Si el servidor manda "t_envio" en el config, también calcula t_bajada: desde que el servidor preparó la petición hasta
+que el cliente la empieza a procesar (red + deserialización). Supone relojes sincronizados (contenedores del mismo host).
+
+Lado servidor (resumen_perfilado): junta las métricas "perf_" de todos los clientes de una ronda y ordena a los
+rezagados de más lento a más rápido.
+
+Desactivado (por defecto) el Perfilador no mide nada: fase() devuelve siempre el mismo contexto vacío y metricas() {}.
+"""
+import time
+import resource
+import contextlib
+import numpy as np
+
+
+PREFIJO = "perf_"
+_SIN_PERFILADO = contextlib.nullcontext()
+
+
+def tamano_parametros(arrays):
+    """Bytes de una lista de ndarrays (lo que viaja por la red, sin la cabecera de protobuf)."""
+    return int(sum(a.nbytes for a in arrays))
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso en MB (ru_maxrss viene en KB en Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Perfilador:
+
+    def __init__(self, activo=False):
+        self.activo = activo
+        self.tiempos = {} # fase -> segundos
+        self.valores = {} # bytes, t_bajada, ...
+        self._inicio = 0.0
+        self._cpu_inicio = 0.0
+
+    def iniciar(self, config=None):
+        """Llamar al entrar en fit/evaluate. Reinicia las medidas de la llamada anterior."""
+        if not self.activo:
+            return
+        self.tiempos, self.valores = {}, {}
+        self._inicio = time.perf_counter()
+        self._cpu_inicio = time.process_time()
+        if config and "t_envio" in config:
+            self.valores["t_bajada"] = max(0.0, time.time() - float(config["t_envio"]))
+
+    def fase(self, nombre):
+        """Context manager que acumula el tiempo de la fase `nombre`."""
+        if not self.activo:
+            return _SIN_PERFILADO
+        return self._medir(nombre)
+
+    @contextlib.contextmanager
+    def _medir(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def registrar_bytes(self, recibidos, enviados):
+        if self.activo:
+            self.valores["bytes_recibidos"] = tamano_parametros(recibidos)
+            self.valores["bytes_enviados"] = tamano_parametros(enviados)
+
+    def metricas(self):
+        """Métricas planas con prefijo "perf_" para añadir a las que se devuelven a Flower."""
+        if not self.activo:
+            return {}
+        metricas = {f"{PREFIJO}t_{fase}": t for fase, t in self.tiempos.items()}
+        metricas.update({PREFIJO + clave: valor for clave, valor in self.valores.items()})
+        metricas[PREFIJO + "t_total"] = time.perf_counter() - self._inicio
+        metricas[PREFIJO + "cpu_s"] = time.process_time() - self._cpu_inicio
+        metricas[PREFIJO + "rss_pico_mb"] = rss_pico_mb()
+        return metricas
+
+
+def extraer_perfilado(metricas):
+    """Las métricas "perf_" de un cliente, sin el prefijo."""
+    return {clave[len(PREFIJO):]: valor for clave, valor in metricas.items() if clave.startswith(PREFIJO)}
+
+
+def resumen_perfilado(resultados):
+    """
+    resultados: lista de (num_examples, métricas) como la que reciben las funciones de agregación de métricas.
+    Devuelve el detalle por cliente y el ranking de rezagados, o None si ningún cliente envió perfilado.
+    """
+    detalle = []
+    for _, metricas in resultados:
+        perfilado = extraer_perfilado(metricas)
+        if perfilado:
+            # Tiempo de respuesta visto por el servidor: bajada + todo lo que hace el cliente.
+            perfilado["t_respuesta"] = perfilado.get("t_bajada", 0.0) + perfilado["t_total"]
+            detalle.append({"client_id": metricas.get("client_id", "Desconocido"), **perfilado})
+    if not detalle:
+        return None
+
+    detalle.sort(key=lambda d: d["t_respuesta"], reverse=True)
+    respuestas = [d["t_respuesta"] for d in detalle]
+    return {
+        "rezagados": [d["client_id"] for d in detalle],
+        "t_respuesta_max": max(respuestas),
+        "t_respuesta_mediana": float(np.median(respuestas)),
+        "clientes": detalle,
+    }
@@ -0,0 +1,151 @@
+"""
+**Escritura y lectura de los JSON por líneas de resultados (global_results.json, client_<id>_metrics.json)**
+
+Con muchos clientes escribiendo a la vez en el volumen compartido y caídas con SIGTERM (Pumba, ver local.py), un
+open(..., "a") + f.write puede dejar una línea a medias: el buffer de Python la parte en varias escrituras si es
+larga y el proceso puede morir entre ellas. La siguiente línea se pega a la rota y json.loads falla al leer todo el
+fichero.
+
+RegistroJSONL escribe así:
+- Cada vaciado es un único os.write sobre un descriptor con O_APPEND: las líneas llegan enteras y, con varios
+  procesos en el mismo fichero, no se mezclan.
+- Si el fichero acaba sin salto de línea (una línea rota de un proceso anterior) se añade uno antes de escribir, para
+  que la rota quede sola en su línea y la siguiente se lea bien.
+- Con lineas > 1 (RESULTS_BUFFER_LINES) las líneas se acumulan y se vacían juntas cada `lineas` líneas o cuando la
+  más antigua lleva `segundos` (RESULTS_BUFFER_S) esperando (un temporizador, aunque no llegue ninguna línea más).
+  También se vacían al salir (atexit) y al recibir SIGTERM (docker stop, Pumba con --signal SIGTERM, terminate()):
+  el manejador vacía todos los registros y después deja que la señal termine el proceso como lo habría hecho.
+  Con SIGKILL (docker kill, Pumba por defecto) no se ejecuta nada: se pierden las líneas acumuladas, como mucho
+  `lineas` - 1 o las de los últimos `segundos`. El búfer no es a prueba de caídas; con lineas=1 (por defecto) cada
+  línea se escribe al momento y sí lo es. Con fsync=True (RESULTS_FSYNC) cada vaciado llega al disco antes de seguir.
+
+leer_nuevas lee desde un desplazamiento hasta el último salto de línea, así que una línea que se está escribiendo
+se lee la próxima vez, y se salta las líneas rotas. Es la base de la lectura incremental del almacén de resultados
+(ver experimentos/almacen.py).
+"""
+import os
+import json
+import time
+import atexit
+import signal
+import threading
+import weakref
+
+_REGISTROS = weakref.WeakSet() # Registros con búfer, para vaciarlos al recibir SIGTERM
+_SIGTERM_ANTERIOR = None # Manejador de SIGTERM que había antes del nuestro (None = todavía no se ha instalado)
+
+
+def _al_recibir_sigterm(signum, frame):
+    for registro in list(_REGISTROS):
+        try:
+            registro.vaciar()
+        except OSError:
+            pass
+    if callable(_SIGTERM_ANTERIOR):
+        _SIGTERM_ANTERIOR(signum, frame)
+    elif _SIGTERM_ANTERIOR != signal.SIG_IGN:
+        # Comportamiento por defecto: restaurarlo y volver a enviarse la señal para terminar igual que sin manejador.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _instalar_sigterm():
+    """Instala _al_recibir_sigterm una vez por proceso. Sólo se puede desde el hilo principal; si no, sin manejador."""
+    global _SIGTERM_ANTERIOR
+    if _SIGTERM_ANTERIOR is not None:
+        return
+    try:
+        _SIGTERM_ANTERIOR = signal.signal(signal.SIGTERM, _al_recibir_sigterm)
+    except ValueError:
+        return
+    if _SIGTERM_ANTERIOR is None: # Manejador instalado fuera de Python: lo tratamos como el de por defecto
+        _SIGTERM_ANTERIOR = signal.SIG_DFL
+
+
+class RegistroJSONL:
+
+    def __init__(self, ruta, lineas=1, segundos=0.0, fsync=False):
+        self.ruta = ruta
+        self.lineas = max(1, lineas)
+        self.segundos = segundos # 0 = sin vaciado por tiempo
+        self.fsync = fsync
+        self.pendientes = []
+        self.inicio_pendientes = None # Instante de la línea más antigua sin vaciar
+        self.revisado = False # ¿Se ha comprobado ya el final del fichero en este proceso?
+        self.cerrojo = threading.RLock() # Reentrante: SIGTERM puede llegar mientras este hilo vacía
+        self.temporizador = None # Vacía las pendientes a los `segundos` aunque no llegue otra línea
+        atexit.register(self.vaciar)
+        if self.lineas > 1:
+            _REGISTROS.add(self)
+            _instalar_sigterm()
+
+    def escribir(self, registro):
+        linea = json.dumps(registro) + "\n"
+        with self.cerrojo:
+            self.pendientes.append(linea)
+            if self.inicio_pendientes is None:
+                self.inicio_pendientes = time.monotonic()
+            vaciar = len(self.pendientes) >= self.lineas or \
+                (self.segundos > 0 and time.monotonic() - self.inicio_pendientes >= self.segundos)
+            if not vaciar and self.segundos > 0 and self.temporizador is None:
+                self.temporizador = threading.Timer(self.segundos, self.vaciar)
+                self.temporizador.daemon = True
+                self.temporizador.start()
+        if vaciar:
+            self.vaciar()
+
+    def vaciar(self):
+        with self.cerrojo:
+            if self.temporizador is not None:
+                self.temporizador.cancel()
+                self.temporizador = None
+            if not self.pendientes:
+                return
+            # Se sacan antes de escribir: si SIGTERM llega a mitad, el vaciado del manejador no las repite.
+            datos = "".join(self.pendientes).encode()
+            self.pendientes = []
+            self.inicio_pendientes = None
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            fd = os.open(self.ruta, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if not self.revisado:
+                    self.revisado = True
+                    if _acaba_sin_salto(fd):
+                        datos = b"\n" + datos
+                escrito = 0
+                while escrito < len(datos): # os.write puede escribir menos de lo pedido (señales, disco lleno)
+                    escrito += os.write(fd, datos[escrito:])
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def _acaba_sin_salto(fd):
+    tamano = os.fstat(fd).st_size
+    return tamano > 0 and os.pread(fd, 1, tamano - 1) != b"\n"
+
+
+def leer_nuevas(ruta, desde=0):
+    """
+    (registros, desplazamiento hasta el que se ha leído, líneas rotas saltadas) de las líneas completas de `ruta`
+    a partir del byte `desde`. Sin fichero: ([], desde, 0).
+    """
+    try:
+        with open(ruta, "rb") as f:
+            f.seek(desde)
+            datos = f.read()
+    except FileNotFoundError:
+        return [], desde, 0
+    fin = datos.rfind(b"\n") + 1 # Lo que va detrás del último salto todavía se está escribiendo
+    registros, rotas = [], 0
+    for linea in datos[:fin].split(b"\n"):
+        if not linea.strip():
+            continue
+        try:
+            registros.append(json.loads(linea))
+        except ValueError:
+            rotas += 1
+    return registros, desde + fin, rotas
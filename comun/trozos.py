@@ -0,0 +1,171 @@
+"""
+**Parámetros en trozos de tamaño fijo con CRC y reanudación**
+
+Con Flower cada modelo viaja en un único mensaje gRPC por sentido: el emisor lo serializa entero, el receptor lo
+recibe entero (y gRPC lo copia otra vez al decodificar el protobuf) y un mensaje mayor que grpc_max_message_length no
+pasa. Si la conexión se corta a mitad (enlaces IoT a 1mbit con pérdidas) se vuelve a enviar todo.
+
+Aquí los tensores serializados (formato .npy, ver parametros.py) se ven como un único flujo de bytes que se parte en
+trozos de `tamano_trozo` bytes:
+
+- Transferencia (emisor): el flujo sin copiarlo. Cada tensor son sus piezas (bytes ya serializados, o cabecera .npy
+  + memoryview del array), y trozo(i) une sólo los bytes del trozo i. El manifiesto (id, tamaño de trozo, longitud
+  de cada tensor y, si se sabe, su forma, dtype y cabecera) es lo único que viaja en el mensaje de Flower.
+- Recepcion (receptor): reserva el flujo entero una vez (o un fichero con np.memmap si se le da un directorio),
+  comprueba el CRC32 de cada trozo y marca los recibidos. Con directorio los trozos sobreviven a un reinicio del
+  proceso: al volver a recibir el mismo manifiesto sólo faltan los que no llegaron.
+- tramos(): qué elementos de cada tensor caen en un trozo, para sumar un trozo a la agregación sin reconstruir el
+  tensor (ver AcumuladorFedAvg.sumar_trozos). Las cabeceras .npy miden un múltiplo de 64 bytes, así que con float32 y
+  un tamaño de trozo múltiplo de 4 ningún elemento queda partido entre dos trozos.
+
+El transporte (cada trozo en un get_properties de Flower) está en server/transferencia.py y en ClienteBuffer.
+"""
+import os
+import json
+import zlib
+import glob
+import bisect
+import numpy as np
+from flwr.common import Parameters
+
+MARCA = "trozos" # tensor_type de unos Parameters que sólo llevan el manifiesto de una transferencia
+
+
+def manifiesto_a_parameters(manifiesto):
+    """Los Parameters que sustituyen al modelo en FitIns/FitRes/...: un único tensor con el manifiesto en JSON."""
+    return Parameters(tensors=[json.dumps(manifiesto).encode()], tensor_type=MARCA)
+
+
+def parameters_a_manifiesto(parameters):
+    return json.loads(bytes(parameters.tensors[0]))
+
+
+class Transferencia:
+    """Lado que envía: tensores (listas de piezas bytes-like) vistos como un flujo troceado, sin copiarlos."""
+
+    def __init__(self, id_transferencia, tensores, tamano_trozo, tensor_type="numpy.ndarray", **extra):
+        self.piezas = [] # (desplazamiento en el flujo, memoryview de bytes)
+        longitudes = []
+        desplazamiento = 0
+        for piezas in tensores:
+            inicio = desplazamiento
+            for pieza in piezas:
+                vista = memoryview(pieza).cast("B")
+                self.piezas.append((desplazamiento, vista))
+                desplazamiento += vista.nbytes
+            longitudes.append(desplazamiento - inicio)
+        self.inicios = [inicio for inicio, _ in self.piezas]
+        self.total = desplazamiento
+        self.tamano_trozo = tamano_trozo
+        self.num_trozos = max(1, -(-self.total // tamano_trozo))
+        self.manifiesto = {"id": id_transferencia, "tamano_trozo": tamano_trozo, "num_trozos": self.num_trozos,
+                           "total": self.total, "longitudes": longitudes, "tensor_type": tensor_type, **extra}
+
+    @classmethod
+    def desde_ndarrays(cls, id_transferencia, arrays, tamano_trozo):
+        """Arrays -> flujo .npy (cabecera + datos de cada uno) sin serializarlos. El manifiesto lleva formas y dtypes."""
+        from comun.parametros import ndarray_a_piezas
+        piezas = [ndarray_a_piezas(array) for array in arrays]
+        return cls(id_transferencia, piezas, tamano_trozo,
+                   formas=[list(np.shape(array)) for array in arrays],
+                   dtypes=[np.asarray(array).dtype.str for array in arrays],
+                   cabeceras=[len(cabecera) for cabecera, _ in piezas])
+
+    def trozo(self, indice):
+        """(bytes del trozo, CRC32). Una copia: la del trozo."""
+        inicio = indice * self.tamano_trozo
+        fin = min(inicio + self.tamano_trozo, self.total)
+        partes = []
+        p = bisect.bisect_right(self.inicios, inicio) - 1
+        while inicio < fin:
+            desplazamiento, vista = self.piezas[p]
+            final = min(fin, desplazamiento + vista.nbytes)
+            partes.append(vista[inicio - desplazamiento:final - desplazamiento])
+            inicio = final
+            p += 1
+        datos = b"".join(partes)
+        return datos, zlib.crc32(datos)
+
+
+class Recepcion:
+    """
+    Lado que recibe: el flujo reservado de una vez (en memoria o en `directorio`/trozos_<id>.bin) y un byte por trozo
+    que dice si ya ha llegado (trozos_<id>.estado). El dato se escribe antes que su marca.
+    """
+
+    def __init__(self, manifiesto, directorio=None):
+        self.manifiesto = manifiesto
+        self.id = manifiesto["id"]
+        self.tamano_trozo = manifiesto["tamano_trozo"]
+        self.total = manifiesto["total"]
+        num_trozos = manifiesto["num_trozos"]
+        if directorio is None:
+            self.datos = np.empty(self.total, dtype=np.uint8)
+            self.recibidos = np.zeros(num_trozos, dtype=np.uint8)
+            self.rutas = []
+            return
+
+        os.makedirs(directorio, exist_ok=True)
+        base = os.path.join(directorio, f"trozos_{self.id}")
+        self.rutas = [base + ".bin", base + ".estado"]
+        for ruta in glob.glob(os.path.join(directorio, "trozos_*")): # Sólo se conserva la transferencia en curso
+            if ruta not in self.rutas:
+                os.remove(ruta)
+        modo = "r+" if all(os.path.exists(r) for r in self.rutas) and os.path.getsize(self.rutas[0]) == self.total \
+            and os.path.getsize(self.rutas[1]) == num_trozos else "w+"
+        self.datos = np.memmap(self.rutas[0], dtype=np.uint8, mode=modo, shape=(self.total,))
+        self.recibidos = np.memmap(self.rutas[1], dtype=np.uint8, mode=modo, shape=(num_trozos,))
+
+    def completa(self):
+        return bool(self.recibidos.all())
+
+    def recibir(self, indice, datos, crc):
+        """Guarda el trozo si su CRC y su longitud son correctos. Devuelve si se ha aceptado."""
+        if not trozo_valido(self.manifiesto, indice, datos, crc):
+            return False
+        self.colocar(indice, datos)
+        return True
+
+    def colocar(self, indice, datos):
+        """Guarda un trozo ya comprobado."""
+        inicio = indice * self.tamano_trozo
+        self.datos[inicio:inicio + len(datos)] = np.frombuffer(datos, dtype=np.uint8)
+        self.recibidos[indice] = 1
+
+    def parameters(self):
+        """Los Parameters originales, con cada tensor como vista del flujo recibido (sin copiar)."""
+        tensores, inicio = [], 0
+        for longitud in self.manifiesto["longitudes"]:
+            tensores.append(self.datos[inicio:inicio + longitud])
+            inicio += longitud
+        return Parameters(tensors=tensores, tensor_type=self.manifiesto["tensor_type"])
+
+    def borrar(self):
+        for ruta in self.rutas:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+
+def trozo_valido(manifiesto, indice, datos, crc):
+    """True si el trozo `indice` tiene la longitud que le toca y su CRC32 es `crc`."""
+    inicio = indice * manifiesto["tamano_trozo"]
+    return len(datos) == min(manifiesto["tamano_trozo"], manifiesto["total"] - inicio) and zlib.crc32(datos) == crc
+
+
+def tramos(manifiesto, indice):
+    """
+    Por cada tensor con datos en el trozo `indice`: (tensor, primer elemento, elemento final, inicio en el trozo).
+    Necesita las cabeceras y dtypes del manifiesto (Transferencia.desde_ndarrays).
+    """
+    tamano = manifiesto["tamano_trozo"]
+    inicio = indice * tamano
+    fin = min(inicio + tamano, manifiesto["total"])
+    tensor = 0
+    for j, (longitud, cabecera, dtype) in enumerate(zip(manifiesto["longitudes"], manifiesto["cabeceras"],
+                                                        manifiesto["dtypes"])):
+        datos, final = tensor + cabecera, tensor + longitud
+        a, b = max(inicio, datos), min(fin, final)
+        if a < b:
+            ancho = np.dtype(dtype).itemsize
+            yield j, (a - datos) // ancho, (b - datos) // ancho, a - inicio
+        tensor = final
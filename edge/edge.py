@@ -0,0 +1,238 @@
+"""
+**Agregador de borde (nivel jerárquico opcional)**
+
+Con todos los clientes conectados a server:8080 el servidor atiende una conexión por cliente y envía el modelo a cada
+uno por la red compartida: la carga del servidor y el tráfico de bajada crecen con NUM_CLIENTS.
+
+Un borde agrupa a varios clientes (p. ej. todos los IoT) detrás de un solo participante:
+
+- Hacia el servidor es un cliente de Flower más (AgregadorBorde). Recibe el modelo una sola vez, admite la bajada por
+  versiones (comun/descarga.py) y responde con UNA actualización: la media FedAvg de sus clientes con
+  num_examples = la suma de sus muestras. Así FedAvg en el servidor da el mismo resultado que con todos los clientes
+  conectados directamente (media ponderada de medias ponderadas).
+- Hacia sus clientes es un servidor de Flower (el mismo servidor gRPC, start_grpc_server): les reenvía cada fit y
+  evaluate con el modelo completo (serializado una sola vez para todos) y suma cada respuesta en cuanto llega
+  (AcumuladorFedAvg, comun/agregacion.py). Las actualizaciones comprimidas de los clientes (UPDATE_CODEC) se
+  decodifican aquí; con UPDATE_CODEC en el borde la actualización agregada sube comprimida.
+- Las métricas de sus clientes se combinan en unas del borde (combinar_metricas): medias ponderadas por muestras,
+  máximos para los tiempos (el más lento marca la ronda), sumas para bytes y muestras. client_id es EDGE_ID y
+  clientes_borde lista los clientes que han respondido.
+
+Si no responde ningún cliente, el borde devuelve 0 muestras y el servidor no lo tiene en cuenta en esa ronda.
+Cada fase se anota en edge_<EDGE_ID>_results.json (clientes, fallos, tiempos de difusión y agregación).
+"""
+import os
+import time
+import concurrent.futures
+import numpy as np
+import flwr as fl
+from flwr.common import (Code, Status, FitIns, FitRes, EvaluateIns, EvaluateRes, GetPropertiesIns, GetPropertiesRes,
+                         Parameters)
+from flwr.server.grpc_server.grpc_server import start_grpc_server
+
+from comun.agregacion import AcumuladorFedAvg
+from comun.compresion import CodificadorActualizaciones, aplanar, desaplanar, decodificar
+from comun.descarga import ReceptorModelo
+from comun.parametros import ndarrays_a_parameters, parameters_a_ndarrays
+from comun.registro import RegistroJSONL
+
+OK = Status(code=Code.OK, message="Success")
+CAMPOS_DESCARGA = ("descarga", "version_modelo", "version_base") # Los pone el servidor para el borde, no para sus clientes
+#Métricas de la actualización de cada cliente que no tienen sentido para la del borde (ver comun/compresion.py).
+CAMPOS_CLIENTE = ("codec", "bytes_originales", "bytes_codificados", "t_codificar", "error_relativo", "version_modelo",
+                  "sincronizar", "accuracy_sin_comprimir", "accuracy_comprimido")
+
+
+def combinar_metricas(resultados):
+    """
+    Métricas del borde a partir de las de sus clientes (lista de (num_examples, métricas)). Por cada clave:
+    tiempos (t_*) y picos de memoria (rss_*) -> máximo; bytes_* y muestras_* -> suma; booleanos -> alguno;
+    texto -> el valor si todos coinciden (p. ej. motor_evaluacion); el resto -> media ponderada por muestras.
+    Vale también con el prefijo "perf_". Las de la compresión y la versión de cada cliente no suben: son del borde.
+    """
+    total = sum(n for n, _ in resultados)
+    claves = set().union(*(m.keys() for _, m in resultados)) if resultados else set()
+    combinadas = {}
+    for clave in sorted(claves - set(CAMPOS_CLIENTE)):
+        valores = [(n, m[clave]) for n, m in resultados if clave in m]
+        if any(isinstance(v, (str, bytes)) for _, v in valores):
+            if len({v for _, v in valores}) == 1:
+                combinadas[clave] = valores[0][1]
+            continue
+        nombre = clave[len("perf_"):] if clave.startswith("perf_") else clave
+        if all(isinstance(v, bool) for _, v in valores):
+            combinadas[clave] = any(v for _, v in valores)
+        elif nombre.startswith(("t_", "rss_")):
+            combinadas[clave] = max(v for _, v in valores)
+        elif nombre.startswith(("bytes_", "muestras_")) or nombre == "pasos":
+            combinadas[clave] = sum(v for _, v in valores)
+        else:
+            combinadas[clave] = sum(n * v for n, v in valores) / max(total, 1)
+    return combinadas
+
+
+class AgregadorBorde(fl.client.Client):
+
+    def __init__(self, client_manager, id_borde, perfil="Desconocido", min_clientes=1, codificador=None,
+                 fichero_log="/app/results/edge_results.json"):
+        self.client_manager = client_manager # Clientes conectados a este borde (start_grpc_server)
+        self.id_borde = id_borde
+        self.perfil = perfil
+        self.min_clientes = min_clientes
+        self.codificador = codificador # CodificadorActualizaciones o None (sube la media completa)
+        self.registro = RegistroJSONL(fichero_log) # Una línea por fase, entera (ver comun/registro.py)
+        self.receptor = ReceptorModelo() # Última versión recibida del servidor (bajada por versiones)
+
+    def _clientes(self):
+        """Espera a que haya al menos min_clientes conectados y los devuelve todos."""
+        self.client_manager.wait_for(self.min_clientes)
+        return list(self.client_manager.all().values())
+
+    def _difundir(self, fase, ins, al_llegar):
+        """Envía `ins` a todos los clientes a la vez y llama a al_llegar(proxy, res) con cada respuesta según llega."""
+        clientes = self._clientes()
+        fallos = 0
+
+        def enviar(proxy):
+            return proxy, (proxy.fit(ins, None) if fase == "fit" else proxy.evaluate(ins, None))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(clientes)) as executor:
+            futuros = [executor.submit(enviar, proxy) for proxy in clientes]
+            for futuro in concurrent.futures.as_completed(futuros):
+                if futuro.exception() is not None or futuro.result()[1].status.code != Code.OK:
+                    fallos += 1
+                    continue
+                al_llegar(*futuro.result())
+        return len(clientes), fallos
+
+    def _modelo_completo(self, ins):
+        """(pesos, Parameters para los clientes, config para los clientes) o None si hay que sincronizar."""
+        recibidos = parameters_a_ndarrays(ins.parameters)
+        pesos = self.receptor.reconstruir(recibidos, ins.config)
+        if pesos is None:
+            return None
+        completo = ins.config.get("descarga", "completo") == "completo"
+        parameters = ins.parameters if completo else ndarrays_a_parameters(pesos) # Serializado una vez para todos
+        config = {clave: valor for clave, valor in ins.config.items() if clave not in CAMPOS_DESCARGA}
+        return pesos, parameters, config
+
+    def _metricas_base(self, clientes):
+        metricas = {"client_id": self.id_borde, "perfil": self.perfil,
+                    "clientes_borde": ",".join(str(c) for c in clientes), "num_clientes_borde": len(clientes)}
+        if self.receptor.version is not None:
+            metricas["version_modelo"] = self.receptor.version
+        return metricas
+
+    def _registrar(self, fase, config, entrada):
+        entrada = {"borde": self.id_borde, "fase": fase, "ronda": config.get("server_round"),
+                   "tiempo": time.time(), **entrada}
+        self.registro.escribir(entrada)
+        print(f"[BORDE] {self.id_borde} | Ronda {entrada['ronda']} ({fase}) | {entrada['respuestas']}/"
+              f"{entrada['clientes']} clientes | {entrada['t_fase']:.2f}s")
+
+    def get_properties(self, ins):
+        # Perfil del grupo para la selección de clientes del servidor: muestras y etiquetas de todos, la CPU del más lento.
+        propiedades = [proxy.get_properties(GetPropertiesIns(config=ins.config), None).properties
+                       for proxy in self._clientes()]
+        return GetPropertiesRes(status=OK, properties={
+            "client_id": self.id_borde,
+            "perfil": self.perfil,
+            "cpu_limit": min(float(p.get("cpu_limit", 1.0)) for p in propiedades),
+            "muestras": sum(int(p.get("muestras", 0)) for p in propiedades),
+            "etiquetas": int(np.bitwise_or.reduce([int(p.get("etiquetas", 0)) for p in propiedades])),
+        })
+
+    def get_parameters(self, ins):
+        # Los pesos iniciales de uno de sus clientes, tal cual (como hace el servidor de Flower).
+        return self._clientes()[0].get_parameters(ins, None)
+
+    def fit(self, ins):
+        inicio = time.perf_counter()
+        modelo = self._modelo_completo(ins)
+        if modelo is None:
+            return FitRes(status=OK, parameters=Parameters(tensors=[], tensor_type="numpy.ndarray"), num_examples=0,
+                          metrics={"client_id": self.id_borde, "sincronizar": True})
+        pesos, parameters, config = modelo
+        base = None
+        acumulador = AcumuladorFedAvg()
+        respuestas = []
+
+        def al_llegar(proxy, res):
+            nonlocal base
+            recibidos = parameters_a_ndarrays(res.parameters)
+            if res.metrics.get("codec", "none") != "none": # Delta comprimido sobre el modelo que se les ha enviado
+                if base is None:
+                    base = aplanar(pesos)
+                recibidos = desaplanar(base[0] + decodificar(recibidos), base[1])
+            acumulador.sumar(recibidos, res.num_examples)
+            respuestas.append((res.num_examples, res.metrics))
+
+        clientes, fallos = self._difundir("fit", FitIns(parameters, config), al_llegar)
+        t_difusion = time.perf_counter() - inicio
+        if not respuestas:
+            agregados, metricas = pesos, {}
+        else:
+            agregados, metricas = acumulador.resultado(), combinar_metricas(respuestas)
+        metricas.update(self._metricas_base([m.get("client_id", "?") for _, m in respuestas]))
+        if self.codificador is not None and respuestas:
+            agregados, codec = self.codificador.codificar(agregados, pesos)
+            metricas.update(codec)
+        metricas["t_fit"] = time.perf_counter() - inicio # Latencia del grupo, para la selección de clientes
+        self._registrar("fit", config, {"clientes": clientes, "respuestas": len(respuestas), "fallos": fallos,
+                                        "muestras": acumulador.muestras, "t_difusion": t_difusion,
+                                        "t_acumular": acumulador.t_acumular, "t_fase": metricas["t_fit"]})
+        return FitRes(status=OK, parameters=ndarrays_a_parameters(agregados), num_examples=acumulador.muestras,
+                      metrics=metricas)
+
+    def evaluate(self, ins):
+        inicio = time.perf_counter()
+        modelo = self._modelo_completo(ins)
+        if modelo is None:
+            return EvaluateRes(status=OK, loss=0.0, num_examples=0, metrics={"client_id": self.id_borde, "sincronizar": True})
+        _, parameters, config = modelo
+        respuestas = []
+        clientes, fallos = self._difundir("evaluate", EvaluateIns(parameters, config),
+                                          lambda proxy, res: respuestas.append((res.num_examples, res.loss, res.metrics)))
+        total = sum(n for n, _, _ in respuestas)
+        loss = sum(n * l for n, l, _ in respuestas) / max(total, 1)
+        metricas = combinar_metricas([(n, m) for n, _, m in respuestas])
+        metricas.update(self._metricas_base([m.get("client_id", "?") for _, _, m in respuestas]))
+        metricas["t_evaluate"] = time.perf_counter() - inicio
+        self._registrar("evaluate", config, {"clientes": clientes, "respuestas": len(respuestas), "fallos": fallos,
+                                             "muestras": total, "t_fase": metricas["t_evaluate"]})
+        return EvaluateRes(status=OK, loss=float(loss), num_examples=total, metrics=metricas)
+
+
+"""
+**Arranque del borde**
+Primero el servidor gRPC para sus clientes (EDGE_ADDRESS) y después la conexión al servidor central como un cliente
+más (SERVER_ADDRESS). Cuando el servidor central termina, se cierra también el de los clientes.
+"""
+EDGE_ID = os.environ.get("EDGE_ID", "borde")
+PERFIL = os.environ.get("PERFIL", "Desconocido") # Perfil de los clientes del grupo
+EDGE_ADDRESS = os.environ.get("EDGE_ADDRESS", "0.0.0.0:8080")
+SERVER_ADDRESS = os.environ.get("SERVER_ADDRESS", "server:8080")
+EDGE_CLIENTS = int(os.environ.get("EDGE_CLIENTS", "1")) # Clientes del grupo
+#Como en el servidor: fracción de los clientes del grupo que tiene que estar conectada para empezar cada fase.
+MIN_CLIENTS_FRACTION = float(os.environ.get("MIN_CLIENTS_FRACTION", "0.6"))
+#Compresión de la actualización agregada que sube al servidor ("none" = completa). Ver comun/compresion.py.
+UPDATE_CODEC = os.environ.get("UPDATE_CODEC", "none")
+UPDATE_TOPK = float(os.environ.get("UPDATE_TOPK", "0.01"))
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "/app/results")
+
+if __name__ == "__main__":
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    client_manager = fl.server.SimpleClientManager()
+    servidor_grpc = start_grpc_server(client_manager=client_manager, server_address=EDGE_ADDRESS)
+    print(f"Borde {EDGE_ID} ({PERFIL}) escuchando en {EDGE_ADDRESS} para {EDGE_CLIENTS} clientes. "
+          f"Servidor central: {SERVER_ADDRESS}")
+    borde = AgregadorBorde(
+        client_manager, EDGE_ID, perfil=PERFIL,
+        min_clientes=max(1, int(EDGE_CLIENTS * MIN_CLIENTS_FRACTION)),
+        codificador=CodificadorActualizaciones(UPDATE_CODEC, UPDATE_TOPK) if UPDATE_CODEC != "none" else None,
+        fichero_log=os.path.join(RESULTS_DIR, f"edge_{EDGE_ID}_results.json"),
+    )
+    try:
+        fl.client.start_client(server_address=SERVER_ADDRESS, client=borde)
+    finally:
+        servidor_grpc.stop(grace=1)
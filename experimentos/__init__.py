@@ -0,0 +1,3 @@
+"""
+Escenarios de experimento (escenario.py), ejecución local sin Docker (local.py) y barridos en paralelo (barrido.py).
+"""
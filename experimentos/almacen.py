@@ -0,0 +1,321 @@
+"""
+**Almacén columnar e indexado de los resultados de muchos experimentos**
+
+Cada experimento (una carpeta con global_results.json y/o client_<id>_metrics.json: los de Docker en results/, los
+de cada combinación de un barrido, las simulaciones...) deja sus resultados en JSON por líneas. Analizarlos con
+leer_json_lineas vuelve a parsear todo cada vez: con miles de rondas y de clientes, y decenas de experimentos, casi
+todo el tiempo se va en json.loads de líneas que ya se habían leído.
+
+Almacen compacta esos ficheros en columnas NumPy en disco:
+
+    <almacen>/indice.json                                  experimentos, fuentes leídas, segmentos y resúmenes
+    <almacen>/<experimento>/<tabla>/<segmento>/<columna>.npy
+
+- Tablas: "global" (global_results.json, una fila por línea, clave ronda) y "clientes" (client_*_metrics.json, clave
+  ronda + client_id). Los diccionarios se aplanan ("metricas_globales.accuracy", "trozos.bajada_fit.bytes", ...) y las
+  listas se dejan fuera (el detalle por cliente ya está en "clientes"). Columnas numéricas en float64 (NaN = no está
+  en esa fila), ronda y client_id en int64 (-1) y el resto como texto.
+- Incremental: el índice guarda, por fichero fuente, su inodo y hasta qué byte se ha leído (comun/registro.py). Al
+  actualizar sólo se leen las líneas nuevas y se escriben como un segmento más. Si un fichero ha cambiado de inodo o
+  es más corto que lo leído (una ejecución nueva en la misma carpeta) se reconstruye ese experimento.
+- Índice: cada segmento está ordenado por (ronda, client_id) y el índice guarda su rango de rondas y de clientes,
+  así que una consulta por rondas no abre los segmentos que no las tienen y dentro de cada uno usa searchsorted. Las
+  columnas se abren con mmap: sólo se leen las que se piden. Con más de MAX_SEGMENTOS segmentos una tabla se funde
+  en uno solo.
+- A prueba de caídas: cada segmento se escribe en una carpeta temporal que se renombra al terminar, y el índice se
+  reescribe de forma atómica (os.replace) después. Un segmento que no está en el índice se borra en la siguiente
+  actualización; lo que no llegó al índice se vuelve a leer de los JSON.
+- El resumen de cada experimento (rondas, métricas finales y mejores, tiempos, clientes, motivo del final) se
+  calcula al actualizarlo y se guarda en el índice: listar miles de experimentos no abre ninguna columna.
+
+La línea de comandos está en analisis.py.
+"""
+import os
+import re
+import sys
+import json
+import glob
+import shutil
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from comun.registro import leer_nuevas  # noqa: E402
+
+VERSION = 1
+MAX_SEGMENTOS = 8
+#Tabla -> patrón de sus ficheros dentro de la carpeta del experimento.
+TABLAS = {"global": "global_results.json", "clientes": "client_*_metrics.json"}
+CLAVES = ("ronda", "client_id") # Claves de todas las tablas (client_id = -1 en "global")
+NUMERICAS = (bool, int, float)
+
+
+def aplanar(registro, prefijo="", destino=None):
+    """{"a": {"b": 1}, "c": [..]} -> {"a.b": 1}: escalares y textos, sin listas."""
+    destino = {} if destino is None else destino
+    for clave, valor in registro.items():
+        nombre = prefijo + str(clave)
+        if isinstance(valor, dict):
+            aplanar(valor, nombre + ".", destino)
+        elif valor is None or isinstance(valor, (str,) + NUMERICAS):
+            destino[nombre] = valor
+    return destino
+
+
+def columnas_de(filas):
+    """Filas aplanadas -> {columna: array}, ordenadas por (ronda, client_id)."""
+    nombres = sorted({nombre for fila in filas for nombre in fila} | set(CLAVES))
+    columnas = {}
+    for nombre in nombres:
+        valores = [fila.get(nombre) for fila in filas]
+        if nombre in CLAVES:
+            columnas[nombre] = np.array([v if isinstance(v, NUMERICAS) else -1 for v in valores], dtype=np.int64)
+        elif all(v is None or isinstance(v, NUMERICAS) for v in valores):
+            columnas[nombre] = np.array([np.nan if v is None else v for v in valores], dtype=np.float64)
+        else:
+            columnas[nombre] = np.array(["" if v is None else str(v) for v in valores], dtype=np.str_)
+    orden = np.lexsort((columnas["client_id"], columnas["ronda"]))
+    return {nombre: columna[orden] for nombre, columna in columnas.items()}
+
+
+def unir(partes):
+    """Concatena varias {columna: array}; lo que falta en una parte se rellena (NaN, -1 o "")."""
+    nombres = sorted({nombre for parte in partes for nombre in parte})
+    unidas = {}
+    for nombre in nombres:
+        presentes = [parte[nombre] for parte in partes if nombre in parte]
+        texto = any(columna.dtype.kind == "U" for columna in presentes)
+        trozos = []
+        for parte in partes:
+            filas = len(next(iter(parte.values()))) if parte else 0
+            if nombre in parte:
+                columna = parte[nombre]
+                trozos.append(columna.astype(np.str_) if texto and columna.dtype.kind != "U" else columna)
+            elif texto:
+                trozos.append(np.full(filas, "", dtype=np.str_))
+            else:
+                trozos.append(np.full(filas, -1 if nombre in CLAVES else np.nan,
+                                      dtype=np.int64 if nombre in CLAVES else np.float64))
+        unidas[nombre] = np.concatenate(trozos)
+    return unidas
+
+
+def _nombre_carpeta(experimento):
+    return re.sub(r"[^\w.-]", "_", experimento.replace(os.sep, "__"))
+
+
+def _fichero(columna):
+    return columna.replace(os.sep, "%2F") + ".npy"
+
+
+class Almacen:
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta_indice = os.path.join(directorio, "indice.json")
+        self.indice = {"version": VERSION, "experimentos": {}}
+        if os.path.exists(self.ruta_indice):
+            with open(self.ruta_indice) as f:
+                indice = json.load(f)
+            if indice.get("version") == VERSION:
+                self.indice = indice
+
+    @property
+    def experimentos(self):
+        return self.indice["experimentos"]
+
+    # ---------- Escritura ----------
+
+    def _guardar_indice(self):
+        temporal = self.ruta_indice + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump(self.indice, f)
+        os.replace(temporal, self.ruta_indice)
+
+    def _carpeta(self, experimento, tabla, segmento=None):
+        partes = [self.directorio, self.experimentos[experimento]["carpeta"], tabla]
+        return os.path.join(*partes, segmento) if segmento is not None else os.path.join(*partes)
+
+    def _escribir_segmento(self, experimento, tabla, columnas):
+        """Escribe un segmento (carpeta temporal + rename) y devuelve su entrada del índice (sin añadirla)."""
+        carpeta = self._carpeta(experimento, tabla)
+        os.makedirs(carpeta, exist_ok=True)
+        #Un nombre que no usa ningún segmento, tampoco los reemplazados que el índice en disco aún puede nombrar.
+        usados = [s["nombre"] for s in self.experimentos[experimento]["tablas"].get(tabla, [])] + \
+            [n.split(".")[0] for n in os.listdir(carpeta)]
+        nombre = f"{max((int(n) for n in usados if n.isdigit()), default=-1) + 1:06d}"
+        destino = os.path.join(carpeta, nombre)
+        temporal = destino + ".tmp"
+        os.makedirs(temporal)
+        for columna, valores in columnas.items():
+            np.save(os.path.join(temporal, _fichero(columna)), valores)
+        os.rename(temporal, destino)
+        rondas, clientes = columnas["ronda"], columnas["client_id"]
+        return {"nombre": nombre, "filas": int(len(rondas)),
+                "rondas": [int(rondas.min()), int(rondas.max())],
+                "clientes": [int(clientes.min()), int(clientes.max())],
+                "columnas": {columna: valores.dtype.str for columna, valores in columnas.items()}}
+
+    def _limpiar(self, experimento, tabla):
+        """
+        Borra los segmentos de la tabla que no están en el índice: restos de una actualización interrumpida o
+        segmentos reemplazados. Sólo cuando el índice en memoria es el guardado en disco.
+        """
+        carpeta = self._carpeta(experimento, tabla)
+        if not os.path.isdir(carpeta):
+            return
+        validos = {s["nombre"] for s in self.experimentos[experimento]["tablas"].get(tabla, [])}
+        for nombre in os.listdir(carpeta):
+            if nombre not in validos:
+                shutil.rmtree(os.path.join(carpeta, nombre), ignore_errors=True)
+
+    def _fundir(self, experimento, tabla):
+        """Sustituye los segmentos de una tabla por uno solo (los antiguos se borran tras guardar el índice)."""
+        columnas = self.leer(experimento, tabla)
+        orden = np.lexsort((columnas["client_id"], columnas["ronda"]))
+        nuevo = self._escribir_segmento(experimento, tabla, {n: c[orden] for n, c in columnas.items()})
+        self.experimentos[experimento]["tablas"][tabla] = [nuevo]
+
+    def actualizar(self, raiz, experimento, carpeta_resultados):
+        """Lee lo nuevo de los JSON de un experimento. Devuelve las filas añadidas por tabla."""
+        entrada = self.experimentos.setdefault(experimento, {
+            "carpeta": _nombre_carpeta(experimento), "ruta": os.path.relpath(carpeta_resultados, raiz),
+            "fuentes": {}, "tablas": {}, "resumen": None})
+        nuevas = {}
+        for tabla, patron in TABLAS.items():
+            rutas = sorted(glob.glob(os.path.join(carpeta_resultados, patron)))
+            fuentes = {os.path.basename(r): r for r in rutas}
+            #¿Alguna fuente ya leída ha cambiado de fichero o se ha acortado? Entonces se rehace la tabla entera.
+            rehacer = False
+            for nombre, estado in entrada["fuentes"].items():
+                if estado["tabla"] != tabla:
+                    continue
+                ruta = fuentes.get(nombre)
+                if ruta is None or os.stat(ruta).st_ino != estado["inodo"] or os.path.getsize(ruta) < estado["leido"]:
+                    rehacer = True
+            self._limpiar(experimento, tabla)
+            if rehacer:
+                entrada["tablas"][tabla] = []
+                entrada["fuentes"] = {n: e for n, e in entrada["fuentes"].items() if e["tabla"] != tabla}
+
+            filas = []
+            for nombre, ruta in fuentes.items():
+                estado = entrada["fuentes"].get(nombre, {"tabla": tabla, "inodo": os.stat(ruta).st_ino, "leido": 0,
+                                                         "rotas": 0})
+                if os.path.getsize(ruta) == estado["leido"]:
+                    continue
+                registros, leido, rotas = leer_nuevas(ruta, estado["leido"])
+                filas += [aplanar(r) for r in registros if isinstance(r, dict)]
+                entrada["fuentes"][nombre] = dict(estado, leido=leido, rotas=estado["rotas"] + rotas)
+            if filas:
+                segmento = self._escribir_segmento(experimento, tabla, columnas_de(filas))
+                entrada["tablas"].setdefault(tabla, []).append(segmento)
+                if len(entrada["tablas"][tabla]) > MAX_SEGMENTOS:
+                    self._fundir(experimento, tabla)
+            nuevas[tabla] = len(filas)
+        if any(nuevas.values()) or entrada["resumen"] is None:
+            entrada["resumen"] = self.resumir(experimento)
+        self._guardar_indice()
+        for tabla in TABLAS:
+            self._limpiar(experimento, tabla)
+        return nuevas
+
+    def actualizar_todo(self, raiz, filtro=None):
+        """
+        Busca experimentos bajo `raiz` (carpetas con global_results.json o client_*_metrics.json) y actualiza los que
+        han cambiado. Devuelve {experimento: filas nuevas por tabla} de los que tenían algo nuevo.
+        """
+        cambios = {}
+        almacen = os.path.abspath(self.directorio)
+        for carpeta, subcarpetas, ficheros in os.walk(raiz):
+            subcarpetas[:] = sorted(s for s in subcarpetas if os.path.abspath(os.path.join(carpeta, s)) != almacen)
+            if "global_results.json" not in ficheros and not any(re.fullmatch(r"client_\d+_metrics\.json", f)
+                                                                 for f in ficheros):
+                continue
+            experimento = os.path.relpath(carpeta, raiz)
+            if filtro is not None and filtro not in experimento:
+                continue
+            nuevas = self.actualizar(raiz, experimento, carpeta)
+            if any(nuevas.values()):
+                cambios[experimento] = nuevas
+        return cambios
+
+    # ---------- Lectura ----------
+
+    def leer(self, experimento, tabla, columnas=None, rondas=None):
+        """
+        {columna: array} de una tabla de un experimento. `columnas` (None = todas) y `rondas` = (primera, última)
+        limitan lo que se lee: los segmentos fuera del rango de rondas no se abren.
+        """
+        segmentos = self.experimentos.get(experimento, {}).get("tablas", {}).get(tabla, [])
+        partes = []
+        for segmento in segmentos:
+            if rondas is not None and (segmento["rondas"][1] < rondas[0] or segmento["rondas"][0] > rondas[1]):
+                continue
+            carpeta = self._carpeta(experimento, tabla, segmento["nombre"])
+            nombres = [c for c in (segmento["columnas"] if columnas is None else columnas) if c in segmento["columnas"]]
+            ronda = np.load(os.path.join(carpeta, _fichero("ronda")), mmap_mode="r")
+            a, b = (0, len(ronda)) if rondas is None else (np.searchsorted(ronda, rondas[0], side="left"),
+                                                           np.searchsorted(ronda, rondas[1], side="right"))
+            partes.append({c: np.asarray(np.load(os.path.join(carpeta, _fichero(c)), mmap_mode="r")[a:b])
+                           for c in set(nombres) | {"ronda"}})
+        if not partes:
+            return {}
+        columnas_leidas = unir(partes)
+        if columnas is not None:
+            columnas_leidas = {c: v for c, v in columnas_leidas.items() if c in columnas or c == "ronda"}
+        return columnas_leidas
+
+    def resumir(self, experimento):
+        """Resumen de un experimento para la tabla de analisis.py (se guarda en el índice)."""
+        glob_ = self.leer(experimento, "global", ["metricas_globales.accuracy", "metricas_globales.f1_score",
+                                                  "t_ronda", "fin.motivo", "num_clientes_activos"])
+        clientes = self.leer(experimento, "clientes", ["client_id", "accuracy"])
+        resumen = {"rondas": 0, "fin": None, "clientes": 0}
+        if "fin.motivo" in glob_:
+            motivos = glob_["fin.motivo"][glob_["fin.motivo"] != ""]
+            resumen["fin"] = str(motivos[-1]) if len(motivos) else None
+        if "metricas_globales.accuracy" in glob_:
+            evaluadas = ~np.isnan(glob_["metricas_globales.accuracy"])
+            accuracy = glob_["metricas_globales.accuracy"][evaluadas]
+            rondas = glob_["ronda"][evaluadas]
+            if len(accuracy):
+                mejor = int(np.argmax(accuracy))
+                f1 = glob_.get("metricas_globales.f1_score", np.full(len(evaluadas), np.nan))[evaluadas]
+                resumen.update({
+                    "rondas": int(len(np.unique(rondas))),
+                    "ultima_ronda": int(rondas[-1]),
+                    "accuracy_final": float(accuracy[-1]),
+                    "f1_final": float(f1[-1]),
+                    "accuracy_mejor": float(accuracy[mejor]),
+                    "ronda_mejor": int(rondas[mejor]),
+                })
+        if "t_ronda" in glob_:
+            t_ronda = glob_["t_ronda"][~np.isnan(glob_["t_ronda"])]
+            if len(t_ronda):
+                resumen["t_ronda_mediana"] = float(np.median(t_ronda))
+                resumen["t_total"] = float(t_ronda.sum())
+        if "client_id" in clientes:
+            resumen["clientes"] = int(len(np.unique(clientes["client_id"])))
+            ultima = (clientes["ronda"] == clientes["ronda"].max()) & ~np.isnan(clientes.get("accuracy", np.nan))
+            if ultima.any():
+                #Reparto entre clientes en la última ronda: el peor cliente dice más que la media en non-IID.
+                resumen["accuracy_cliente_min"] = float(np.nanmin(clientes["accuracy"][ultima]))
+                resumen["accuracy_cliente_p10"] = float(np.nanpercentile(clientes["accuracy"][ultima], 10))
+        return resumen
+
+    def por_ronda(self, experimento, tabla, columna, rondas=None):
+        """(rondas, media, mínimo, máximo) de una columna agrupada por ronda (p. ej. la accuracy de los clientes)."""
+        datos = self.leer(experimento, tabla, [columna], rondas)
+        if columna not in datos:
+            return (np.empty(0, dtype=np.int64),) + (np.empty(0),) * 3
+        validas = ~np.isnan(datos[columna])
+        ronda, valores = datos["ronda"][validas], datos[columna][validas]
+        orden = np.argsort(ronda, kind="stable")
+        ronda, valores = ronda[orden], valores[orden]
+        unicas, inicios, cuentas = np.unique(ronda, return_index=True, return_counts=True)
+        if not len(unicas):
+            return unicas, np.empty(0), np.empty(0), np.empty(0)
+        media = np.add.reduceat(valores, inicios) / cuentas
+        return unicas, media, np.minimum.reduceat(valores, inicios), np.maximum.reduceat(valores, inicios)
@@ -0,0 +1,165 @@
+"""
+**Análisis de muchos experimentos desde el almacén columnar (almacen.py)**
+
+Cada ejecución actualiza primero el almacén de <raiz> (por defecto <raiz>/.almacen): sólo lee las líneas nuevas de
+los JSON de resultados de los experimentos que han cambiado. Después:
+
+- Sin opciones: una tabla con el resumen de cada experimento (rondas, accuracy final y mejor, F1 final, accuracy del
+  peor cliente en la última ronda, t_ronda mediana, clientes y motivo del final), ordenada por --orden.
+- --clientes <experimento>: una tabla por cliente (rondas, métrica final, media y mínima, memoria máxima), de peor a
+  mejor, hasta --limite filas.
+- --graficas <carpeta>: global_<metrica>.png (la métrica global por ronda, una línea por experimento) y
+  clientes_<metrica>.png (la media de los clientes por ronda con la banda mínimo-máximo). Necesita matplotlib.
+- --csv <fichero>: la tabla resumen en CSV.
+
+Los experimentos se nombran por su carpeta relativa a <raiz>; --filtro se queda con los que contienen ese texto.
+
+Uso:
+    python experimentos/analisis.py results
+    python experimentos/analisis.py results/barridos --filtro alpha --orden accuracy_final --graficas results/graficas
+    python experimentos/analisis.py results/simulaciones --clientes base_20260101_120000
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from experimentos.almacen import Almacen  # noqa: E402
+
+#(campo del resumen, cabecera, ancho, formato)
+COLUMNAS_RESUMEN = [
+    ("rondas", "rondas", 6, "{:d}"),
+    ("accuracy_final", "acc final", 9, "{:.4f}"),
+    ("accuracy_mejor", "acc mejor", 9, "{:.4f}"),
+    ("ronda_mejor", "ronda", 5, "{:d}"),
+    ("f1_final", "f1 final", 8, "{:.4f}"),
+    ("accuracy_cliente_min", "peor cliente", 12, "{:.4f}"),
+    ("t_ronda_mediana", "t_ronda", 8, "{:.2f}s"),
+    ("clientes", "clientes", 8, "{:d}"),
+    ("fin", "fin", 18, "{}"),
+]
+
+
+def formatear(valor, formato):
+    return "-" if valor is None else formato.format(valor)
+
+
+def tabla_resumen(almacen, experimentos, orden):
+    def clave(experimento): # Números de mayor a menor, textos en orden alfabético, los que no lo tienen al final
+        valor = None if orden == "experimento" else almacen.experimentos[experimento]["resumen"].get(orden)
+        return (valor is None, valor if isinstance(valor, str) or valor is None else -valor, experimento)
+
+    filas = sorted(experimentos, key=clave)
+    ancho = max([len("experimento")] + [len(e) for e in filas])
+    print(f"{'experimento':<{ancho}} | " + " | ".join(f"{cabecera:>{w}}" for _, cabecera, w, _ in COLUMNAS_RESUMEN))
+    for experimento in filas:
+        resumen = almacen.experimentos[experimento]["resumen"]
+        print(f"{experimento:<{ancho}} | " + " | ".join(f"{formatear(resumen.get(campo), fmt):>{w}}"
+                                                       for campo, _, w, fmt in COLUMNAS_RESUMEN))
+
+
+def tabla_clientes(almacen, experimento, metrica, limite):
+    datos = almacen.leer(experimento, "clientes", ["client_id", metrica, "rss_mb"])
+    if metrica not in datos:
+        sys.exit(f"{experimento} no tiene {metrica} de los clientes")
+    validas = ~np.isnan(datos[metrica])
+    ids, ronda, valores = datos["client_id"][validas], datos["ronda"][validas], datos[metrica][validas]
+    rss = datos["rss_mb"][validas] if "rss_mb" in datos else np.full(len(ids), np.nan)
+    clientes, inversa, rondas = np.unique(ids, return_inverse=True, return_counts=True)
+    #Las filas están ordenadas por ronda: la última de cada cliente es su valor final.
+    ultima = np.zeros(len(clientes), dtype=np.int64)
+    np.maximum.at(ultima, inversa, np.arange(len(ids)))
+    media = np.bincount(inversa, weights=valores) / rondas
+    minimo = np.full(len(clientes), np.inf)
+    np.minimum.at(minimo, inversa, valores)
+    rss_max = np.full(len(clientes), -np.inf)
+    np.fmax.at(rss_max, inversa, rss)
+    print(f"{experimento}: {len(clientes)} clientes | {metrica} en la última ronda de cada cliente")
+    print(f"{'cliente':>7} | {'rondas':>6} | {'ronda fin':>9} | {'final':>7} | {'media':>7} | {'mínima':>7} | {'rss máx':>9}")
+    for i in np.argsort(valores[ultima], kind="stable")[:limite]:
+        memoria = f"{rss_max[i]:.0f} MB" if np.isfinite(rss_max[i]) else "-"
+        print(f"{clientes[i]:>7} | {rondas[i]:>6} | {ronda[ultima[i]]:>9} | {valores[ultima[i]]:>7.4f} | "
+              f"{media[i]:>7.4f} | {minimo[i]:>7.4f} | {memoria:>9}")
+    if len(clientes) > limite:
+        print(f"... y {len(clientes) - limite} clientes más (--limite)")
+
+
+def graficas(almacen, experimentos, metrica, carpeta):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        sys.exit("--graficas necesita matplotlib (pip install matplotlib)")
+    os.makedirs(carpeta, exist_ok=True)
+    leyenda = len(experimentos) <= 20
+
+    figura, eje = plt.subplots(figsize=(10, 6))
+    for experimento in experimentos:
+        rondas, media, _, _ = almacen.por_ronda(experimento, "global", f"metricas_globales.{metrica}")
+        eje.plot(rondas, media, label=experimento)
+    eje.set(xlabel="Ronda", ylabel=metrica, title=f"{metrica} global por ronda")
+    if leyenda:
+        eje.legend(fontsize="small")
+    figura.savefig(os.path.join(carpeta, f"global_{metrica}.png"), dpi=120, bbox_inches="tight")
+    plt.close(figura)
+
+    figura, eje = plt.subplots(figsize=(10, 6))
+    for experimento in experimentos:
+        rondas, media, minimo, maximo = almacen.por_ronda(experimento, "clientes", metrica)
+        linea, = eje.plot(rondas, media, label=experimento)
+        eje.fill_between(rondas, minimo, maximo, color=linea.get_color(), alpha=0.15)
+    eje.set(xlabel="Ronda", ylabel=metrica, title=f"{metrica} de los clientes por ronda (media y mínimo-máximo)")
+    if leyenda:
+        eje.legend(fontsize="small")
+    figura.savefig(os.path.join(carpeta, f"clientes_{metrica}.png"), dpi=120, bbox_inches="tight")
+    plt.close(figura)
+    print(f"Gráficas en {carpeta}: global_{metrica}.png, clientes_{metrica}.png")
+
+
+def escribir_csv(almacen, experimentos, ruta):
+    campos = [campo for campo, _, _, _ in COLUMNAS_RESUMEN] + ["ultima_ronda", "t_total", "accuracy_cliente_p10"]
+    with open(ruta, "w", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["experimento", "ruta"] + campos)
+        for experimento in experimentos:
+            entrada = almacen.experimentos[experimento]
+            escritor.writerow([experimento, entrada["ruta"]] + [entrada["resumen"].get(c) for c in campos])
+    print(f"Resumen en {ruta}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("raiz", nargs="?", default=os.path.join(RAIZ, "results"), help="Carpeta con los experimentos.")
+    parser.add_argument("--almacen", help="Carpeta del almacén (por defecto <raiz>/.almacen).")
+    parser.add_argument("--filtro", help="Sólo los experimentos cuyo nombre contiene este texto.")
+    parser.add_argument("--orden", default="experimento", help="Campo del resumen por el que ordenar (de mayor a menor).")
+    parser.add_argument("--metrica", default="accuracy", choices=["accuracy", "f1_score", "precision", "recall", "loss"])
+    parser.add_argument("--clientes", help="Tabla por cliente de este experimento.")
+    parser.add_argument("--limite", type=int, default=50, help="Filas de la tabla por cliente.")
+    parser.add_argument("--graficas", help="Carpeta donde guardar las gráficas.")
+    parser.add_argument("--csv", help="Fichero CSV con la tabla resumen.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    almacen = Almacen(args.almacen or os.path.join(args.raiz, ".almacen"))
+    cambios = almacen.actualizar_todo(args.raiz, args.filtro)
+    experimentos = sorted(e for e in almacen.experimentos if args.filtro is None or args.filtro in e)
+    filas = sum(sum(n.values()) for n in cambios.values())
+    print(f"[ALMACEN] {len(experimentos)} experimentos | {len(cambios)} con datos nuevos | {filas} filas nuevas | "
+          f"{time.perf_counter() - inicio:.2f}s")
+
+    if args.clientes:
+        if args.clientes not in almacen.experimentos:
+            sys.exit(f"No existe el experimento {args.clientes}")
+        tabla_clientes(almacen, args.clientes, args.metrica, args.limite)
+    else:
+        tabla_resumen(almacen, experimentos, args.orden)
+    if args.graficas:
+        graficas(almacen, experimentos, args.metrica, args.graficas)
+    if args.csv:
+        escribir_csv(almacen, experimentos, args.csv)
@@ -0,0 +1,167 @@
+"""
+**Barrido de experimentos en paralelo**
+
+Expande la rejilla ("barrido") de un escenario (ver escenario.py) y ejecuta cada combinación como un experimento
+independiente en local (servidor + clientes como procesos, ver local.py), varios a la vez.
+
+- Presupuesto de CPU (--cpus, por defecto todas): cada experimento reserva clientes + bordes + 1 CPUs (un proceso
+  por cliente y por borde más el servidor) y sólo arranca cuando hay CPUs libres. Un experimento más grande que el
+  presupuesto se ejecuta solo.
+- Cada experimento tiene sus puertos y su carpeta: results/barridos/<nombre>_<fecha>/<NNN>_<combinación>/ con el
+  escenario resuelto (escenario.json: parámetros y clientes sorteados), los logs y los JSON de resultados de siempre.
+- indice.json en la carpeta del barrido lista cada experimento (parámetros, estado, carpeta, tiempos y métricas
+  finales). Se reescribe de forma atómica cada vez que termina uno, así que un barrido interrumpido queda indexado.
+
+El almacén del dataset (DATASET_DIR, memmap de sólo lectura) lo comparten todos los experimentos.
+Con --sintetico N se usa un MNIST sintético de N muestras (como bench_e2e.py) para no depender del real.
+
+Uso:
+    python experimentos/barrido.py experimentos/escenarios/barrido_alpha.json --cpus 8
+    python experimentos/barrido.py experimentos/escenarios/base.json --sintetico 14000
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+import threading
+import subprocess
+import concurrent.futures
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from experimentos import escenario as esc  # noqa: E402
+from experimentos.local import crear_mnist_sintetico, ejecutar_procesos, leer_json_lineas  # noqa: E402
+
+
+PUERTOS_POR_EXPERIMENTO = 10 # El del servidor y uno por borde (edge/edge.py)
+
+
+class PresupuestoCPU:
+    """Semáforo de CPUs: cada experimento reserva las suyas y las devuelve al terminar."""
+
+    def __init__(self, cpus):
+        self.libres = cpus
+        self.total = cpus
+        self.condicion = threading.Condition()
+
+    def reservar(self, cpus):
+        cpus = min(cpus, self.total)
+        with self.condicion:
+            self.condicion.wait_for(lambda: self.libres >= cpus)
+            self.libres -= cpus
+        return cpus
+
+    def liberar(self, cpus):
+        with self.condicion:
+            self.libres += cpus
+            self.condicion.notify_all()
+
+
+def resumir(directorio):
+    """Métricas finales de una ejecución a partir de su global_results.json."""
+    lineas = leer_json_lineas(os.path.join(directorio, "global_results.json"))
+    rondas = [r for r in lineas if "metricas_globales" in r]
+    #Motivo del final que escribe el servidor (ver server/control.py); None si no llegó a terminar.
+    fin = next((r["fin"]["motivo"] for r in lineas if "fin" in r), None)
+    if not rondas:
+        return {"rondas": 0, "fin": fin}
+    t_rondas = [r["t_ronda"] for r in rondas if "t_ronda" in r]
+    return {
+        "rondas": len(rondas),
+        "fin": fin,
+        "accuracy_final": rondas[-1]["metricas_globales"]["accuracy"],
+        "f1_final": rondas[-1]["metricas_globales"]["f1_score"],
+        "t_ronda_mediana": float(np.median(t_rondas)) if t_rondas else None,
+    }
+
+
+def ejecutar(indice, parametros, escenario, carpeta, entorno_comun, puerto, presupuesto, timeout):
+    directorio = os.path.join(carpeta, f"{indice:03d}_{escenario['nombre']}")
+    os.makedirs(directorio, exist_ok=True)
+    clientes = esc.asignar_clientes(escenario)
+    with open(os.path.join(directorio, "escenario.json"), "w") as f:
+        json.dump({"parametros": parametros, "escenario": escenario, "clientes": clientes}, f, indent=1)
+
+    entorno_servidor = dict(entorno_comun, **esc.entorno_servidor(escenario))
+    entornos_clientes = [dict(entorno_comun, **esc.entorno_cliente(escenario, c)) for c in clientes]
+    entornos_bordes = [dict(entorno_comun, **esc.entorno_borde(escenario, b)) for b in esc.asignar_bordes(clientes)]
+    entrada = {"id": indice, "nombre": escenario["nombre"], "parametros": parametros,
+               "directorio": os.path.basename(directorio)}
+    cpus = presupuesto.reservar(escenario["clientes"] + len(entornos_bordes) + 1)
+    try:
+        print(f"[BARRIDO] Inicio {indice:03d} {escenario['nombre']} ({cpus} CPUs)")
+        entrada.update(ejecutar_procesos(entorno_servidor, entornos_clientes, directorio, puerto, timeout,
+                                         caidas_cada=escenario["fallos"]["caidas_cada"], semilla=escenario["semilla"],
+                                         entornos_bordes=entornos_bordes))
+    except Exception as e:
+        entrada.update({"estado": "error", "error": str(e)})
+    finally:
+        presupuesto.liberar(cpus)
+    entrada.update(resumir(directorio))
+    return entrada
+
+
+def escribir_indice(carpeta, indice):
+    temporal = os.path.join(carpeta, "indice.json.tmp")
+    with open(temporal, "w") as f:
+        json.dump(indice, f, indent=1)
+    os.replace(temporal, os.path.join(carpeta, "indice.json"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("escenario", help="JSON del escenario (con o sin \"barrido\").")
+    parser.add_argument("--cpus", type=int, default=os.cpu_count(), help="Presupuesto de CPUs para todo el barrido.")
+    parser.add_argument("--puerto", type=int, default=19080, help="Puerto del primer experimento (el servidor y los siguientes para sus bordes).")
+    parser.add_argument("--timeout", type=float, default=3600, help="Segundos máximos por experimento.")
+    parser.add_argument("--salida", default=os.path.join(RAIZ, "results", "barridos"))
+    parser.add_argument("--sintetico", type=int, default=0, help="Usar un MNIST sintético con estas muestras.")
+    args = parser.parse_args()
+
+    base = esc.cargar(args.escenario)
+    experimentos = esc.expandir_barrido(base)
+    carpeta = os.path.join(args.salida, f"{base['nombre']}_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+    os.makedirs(carpeta, exist_ok=True)
+
+    #Dataset compartido por todos los experimentos.
+    entorno_comun = {"DATASET_DIR": os.environ.get("DATASET_DIR", os.path.join(RAIZ, "results", "dataset"))}
+    if args.sintetico:
+        npz = os.path.join(carpeta, "mnist_sintetico.npz")
+        crear_mnist_sintetico(npz, args.sintetico, semilla=base["semilla"])
+        entorno_comun = {"MNIST_NPZ": npz, "DATASET_DIR": os.path.join(carpeta, "dataset")}
+
+    commit = subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    indice = {
+        "barrido": base["nombre"],
+        "fecha": str(datetime.datetime.now()),
+        "commit": commit.stdout.strip(),
+        "escenario": os.path.abspath(args.escenario),
+        "rejilla": base["barrido"],
+        "cpus": args.cpus,
+        "ejecuciones": [],
+    }
+    escribir_indice(carpeta, indice)
+    print(f"[BARRIDO] {len(experimentos)} experimentos con {args.cpus} CPUs -> {carpeta}")
+
+    presupuesto = PresupuestoCPU(args.cpus)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(experimentos)) as executor:
+        futuros = [
+            executor.submit(ejecutar, i, parametros, escenario, carpeta, entorno_comun, args.puerto + i * PUERTOS_POR_EXPERIMENTO,
+                            presupuesto, args.timeout)
+            for i, (parametros, escenario) in enumerate(experimentos)
+        ]
+        for futuro in concurrent.futures.as_completed(futuros):
+            entrada = futuro.result()
+            indice["ejecuciones"].append(entrada)
+            indice["ejecuciones"].sort(key=lambda e: e["id"])
+            escribir_indice(carpeta, indice)
+            acc = f"{entrada['accuracy_final']:.4f}" if "accuracy_final" in entrada else "-"
+            print(f"[BARRIDO] Fin {entrada['id']:03d} {entrada['nombre']} | {entrada['estado']} | "
+                  f"{entrada['rondas']} rondas | acc {acc} | {entrada.get('t_total', 0):.0f}s")
+
+    fallidos = [e for e in indice["ejecuciones"] if e["estado"] != "ok"]
+    print(f"[BARRIDO] Terminado: {len(experimentos) - len(fallidos)}/{len(experimentos)} correctos. Índice en "
+          f"{os.path.join(carpeta, 'indice.json')}")
+    sys.exit(1 if fallidos else 0)
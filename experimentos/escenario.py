@@ -0,0 +1,203 @@
+"""
+**Escenarios de experimento declarativos**
+
+Cada experimento de RESULTADOS_EXPERIMENTOS era editar a mano generate_compose.py (NUM_CLIENTS, PERFILES, el
+START_DELAY aleatorio, el atacante fijo) y las constantes de client.py / server.py, y volver a lanzar.
+
+Un escenario es un JSON (ver experimentos/escenarios/) con todo lo que define un experimento:
+
+    nombre, semilla        Nombre y semilla: con la misma semilla, los mismos perfiles y retrasos para cada cliente.
+    clientes, rondas       Número de clientes y de rondas (NUM_ROUNDS).
+    perfiles               Peso de cada perfil de hardware/red en el sorteo (p. ej. {"IoT": 1, "WiFi": 2}).
+                           Las definiciones (cpu, latencia, pérdida, banda) están en PERFILES o en "definicion_perfiles",
+                           que también puede cambiar sólo algunos campos de un perfil existente. Con "entorno" un perfil
+                           añade variables a sus clientes (p. ej. {"IoT": {"entorno": {"EVAL_TFLITE": "dynamic"}}}).
+    datos                  metodo, alpha y semilla del reparto (DISTRIBUTION_METHOD, DIRICHLET_ALPHA, PARTITION_SEED).
+    estrategia             agregacion, min_clients_fraction y "entorno" con cualquier otra variable del servidor.
+    fallos                 atacantes (los N últimos clientes), retrasos_inicio (START_DELAY posibles) y caidas_cada
+                           (segundos entre caídas de un cliente al azar, como Pumba; 0 = sin caídas).
+    bordes                 Perfiles cuyos clientes se agrupan detrás de un agregador de borde (edge/edge.py), p. ej.
+                           ["IoT"]: un borde "borde-iot" por perfil, que el servidor ve como un cliente más.
+    entorno_servidor       Variables de entorno extra del servidor...
+    entorno_clientes       ...de todos los clientes...
+    entorno_bordes         ...y de todos los bordes (p. ej. UPDATE_CODEC de la actualización que suben).
+
+Un escenario con "barrido" es una rejilla: {"datos.alpha": [0.1, 1.0], "semilla": [1, 2]} da 4 escenarios, uno
+por combinación (las claves con puntos indican el campo anidado que se cambia).
+
+Del escenario salen las variables de entorno del servidor, de cada cliente y de cada borde, que usan generate_compose.py (Docker)
+y experimentos/barrido.py (procesos locales).
+"""
+import copy
+import json
+import random
+import itertools
+
+
+#Perfiles de hardware y red de cada cliente.
+PERFILES = {
+    "IoT":    {"cpu": "0.5", "latencia": "200ms", "loss": "5%", "banda": "1mbit"},   # Sensores / Raspberry Pi antigua
+    "Movil":  {"cpu": "1.0", "latencia": "100ms", "loss": "1%", "banda": "10mbit"},  # Red 4G media
+    "WiFi":   {"cpu": "2.0", "latencia": "20ms",  "loss": "0%", "banda": "100mbit"},  # PC en casa
+    "Servidor": {"cpu": "4.0", "latencia": "10ms",  "loss": "0%", "banda": "1gbit"}    # Servidor potente
+}
+
+#Valores por defecto: los de generate_compose.py, client.py y server.py antes de los escenarios.
+POR_DEFECTO = {
+    "nombre": "base",
+    "semilla": 42,
+    "clientes": 4,
+    "rondas": 10,
+    "perfiles": {nombre: 1 for nombre in PERFILES},
+    "definicion_perfiles": {},
+    "datos": {"metodo": "dirichlet", "alpha": 0.1, "semilla": 42},
+    "estrategia": {"agregacion": "fedavg", "min_clients_fraction": 0.6, "entorno": {}},
+    "fallos": {"atacantes": 1, "retrasos_inicio": [0, 0, 30, 60], "caidas_cada": 120},
+    "bordes": [],
+    "entorno_servidor": {},
+    "entorno_clientes": {},
+    "entorno_bordes": {},
+    "barrido": {},
+}
+
+
+def _combinar(base, cambios):
+    """Copia de `base` con los valores de `cambios` (los dicts anidados se combinan, el resto se sustituye)."""
+    resultado = copy.deepcopy(base)
+    for clave, valor in cambios.items():
+        if isinstance(valor, dict) and isinstance(resultado.get(clave), dict):
+            resultado[clave] = _combinar(resultado[clave], valor)
+        else:
+            resultado[clave] = copy.deepcopy(valor)
+    return resultado
+
+
+def _perfiles(escenario):
+    """PERFILES con los cambios de "definicion_perfiles" (perfiles nuevos o campos de uno existente)."""
+    return {nombre: dict(PERFILES.get(nombre, {}), **escenario["definicion_perfiles"].get(nombre, {}))
+            for nombre in set(PERFILES) | set(escenario["definicion_perfiles"])}
+
+
+def cargar(ruta):
+    """Lee un escenario y lo completa con los valores por defecto. Las claves desconocidas son un error (erratas)."""
+    with open(ruta, encoding="utf-8") as f:
+        escenario = json.load(f)
+    desconocidas = set(escenario) - set(POR_DEFECTO)
+    if desconocidas:
+        raise ValueError(f"Claves desconocidas en {ruta}: {sorted(desconocidas)}. Válidas: {sorted(POR_DEFECTO)}")
+    escenario = dict(_combinar(POR_DEFECTO, escenario), perfiles=escenario.get("perfiles", POR_DEFECTO["perfiles"]))
+    perfiles = _perfiles(escenario)
+    sin_definir = (set(escenario["perfiles"]) | set(escenario["bordes"])) - set(perfiles)
+    if sin_definir:
+        raise ValueError(f"Perfiles sin definir en {ruta}: {sorted(sin_definir)}")
+    return escenario
+
+
+def expandir_barrido(escenario):
+    """Lista de (parámetros, escenario) con una entrada por combinación de la rejilla (o el propio escenario)."""
+    barrido = escenario["barrido"]
+    base = dict(escenario, barrido={})
+    if not barrido:
+        return [({}, base)]
+    claves = list(barrido)
+    resultado = []
+    for valores in itertools.product(*(barrido[clave] for clave in claves)):
+        parametros = dict(zip(claves, valores))
+        concreto = copy.deepcopy(base)
+        for clave, valor in parametros.items():
+            destino = concreto
+            *ruta, ultima = clave.split(".")
+            for parte in ruta:
+                destino = destino[parte]
+            destino[ultima] = valor
+        concreto["nombre"] = f"{base['nombre']}_" + "_".join(f"{c.split('.')[-1]}={v}" for c, v in parametros.items())
+        resultado.append((parametros, concreto))
+    return resultado
+
+
+def asignar_clientes(escenario):
+    """Perfil, retraso de arranque y rol de cada cliente, sorteados con la semilla del escenario."""
+    rng = random.Random(escenario["semilla"])
+    perfiles = _perfiles(escenario)
+    nombres = list(escenario["perfiles"])
+    pesos = [escenario["perfiles"][nombre] for nombre in nombres]
+    fallos = escenario["fallos"]
+    clientes = []
+    for i in range(1, escenario["clientes"] + 1):
+        nombre = rng.choices(nombres, weights=pesos)[0]
+        clientes.append({
+            "client_id": i,
+            "perfil": nombre,
+            **perfiles[nombre],
+            "atacante": i > escenario["clientes"] - fallos["atacantes"],
+            "retraso_inicio": rng.choice(fallos["retrasos_inicio"]) if fallos["retrasos_inicio"] else 0,
+            "borde": nombre_borde(nombre) if nombre in escenario["bordes"] else None,
+        })
+    return clientes
+
+
+def nombre_borde(perfil):
+    """Nombre (y servicio de Docker) del borde de un perfil: "IoT" -> "borde-iot"."""
+    return f"borde-{perfil.lower()}"
+
+
+def asignar_bordes(clientes):
+    """Un borde por cada perfil agrupado que tenga clientes, con los IDs de sus clientes."""
+    bordes = {}
+    for cliente in clientes:
+        if cliente["borde"] is not None:
+            borde = bordes.setdefault(cliente["borde"], {"nombre": cliente["borde"], "perfil": cliente["perfil"],
+                                                         "clientes": []})
+            borde["clientes"].append(cliente["client_id"])
+    return list(bordes.values())
+
+
+def entorno_servidor(escenario):
+    estrategia = escenario["estrategia"]
+    #Con bordes el servidor ve a cada borde como un cliente, en lugar de a los clientes que agrupa.
+    clientes = asignar_clientes(escenario)
+    participantes = sum(c["borde"] is None for c in clientes) + len(asignar_bordes(clientes))
+    entorno = {
+        "TOTAL_CLIENTS": participantes,
+        "NUM_ROUNDS": escenario["rondas"],
+        "MIN_CLIENTS_FRACTION": estrategia["min_clients_fraction"],
+        "AGGREGATION": estrategia["agregacion"],
+    }
+    entorno.update(estrategia["entorno"])
+    entorno.update(escenario["entorno_servidor"])
+    return {clave: str(valor) for clave, valor in entorno.items()}
+
+
+def entorno_cliente(escenario, cliente):
+    datos = escenario["datos"]
+    entorno = {
+        "CLIENT_ID": cliente["client_id"],
+        "TOTAL_CLIENTS": escenario["clientes"],
+        "IS_ATTACKER": cliente["atacante"],
+        "NET_LATENCY": cliente["latencia"],
+        "NET_LOSS": cliente["loss"],
+        "NET_BANDWIDTH": cliente["banda"],
+        "CPU_LIMIT": cliente["cpu"],
+        "PERFIL": cliente["perfil"],
+        "START_DELAY": cliente["retraso_inicio"],
+        "DISTRIBUTION_METHOD": datos["metodo"],
+        "DIRICHLET_ALPHA": datos["alpha"],
+        "PARTITION_SEED": datos["semilla"],
+    }
+    entorno.update(escenario["entorno_clientes"])
+    entorno.update(cliente.get("entorno", {})) # Variables propias del perfil
+    if cliente.get("borde"):
+        entorno["SERVER_ADDRESS"] = f"{cliente['borde']}:8080" # Se conecta a su borde, no al servidor
+    return {clave: str(valor) for clave, valor in entorno.items()}
+
+
+def entorno_borde(escenario, borde):
+    entorno = {
+        "EDGE_ID": borde["nombre"],
+        "PERFIL": borde["perfil"],
+        "EDGE_CLIENTS": len(borde["clientes"]),
+        "MIN_CLIENTS_FRACTION": escenario["estrategia"]["min_clients_fraction"],
+        "SERVER_ADDRESS": "server:8080",
+    }
+    entorno.update(escenario["entorno_bordes"])
+    return {clave: str(valor) for clave, valor in entorno.items()}
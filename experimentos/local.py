@@ -0,0 +1,121 @@
+"""
+**Ejecución local (sin Docker) de un servidor y sus clientes**
+
+Lanza server/server.py y los clientes client/client.py (y los bordes edge/edge.py, si los hay) como procesos del
+host conectados por loopback, cada ejecución con su propio puerto y su propia carpeta de resultados. Cada borde escucha
+en el puerto siguiente al del servidor y sus clientes (SERVER_ADDRESS="<EDGE_ID>:8080") se conectan a él. Lo usan benchmarks/bench_e2e.py y
+experimentos/barrido.py.
+
+Sin Docker no hay tc ni límites de CPU: los clientes se lanzan con NET_EMULATION=False y los perfiles sólo llegan
+como variables de entorno (PERFIL, CPU_LIMIT, que usa la selección de clientes del servidor).
+Las caídas se simulan como Pumba + `restart: on-failure`: cada `caidas_cada` segundos se manda SIGTERM a un cliente
+al azar y se vuelve a lanzar con el mismo entorno.
+"""
+import os
+import sys
+import time
+import random
+import socket
+import subprocess
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from comun.registro import leer_nuevas  # noqa: E402
+
+
+def crear_mnist_sintetico(ruta, muestras, semilla=0):
+    """npz con las claves de keras (x_train, y_train, x_test, y_test). Las clases se pueden aprender: plantilla + ruido."""
+    rng = np.random.default_rng(semilla)
+    plantillas = rng.integers(0, 256, size=(10, 28, 28)).astype(np.int16)
+    y = rng.integers(0, 10, size=muestras).astype(np.uint8)
+    ruido = rng.integers(-60, 61, size=(muestras, 28, 28), dtype=np.int16)
+    x = np.clip(plantillas[y] + ruido, 0, 255).astype(np.uint8)
+    corte = muestras * 6 // 7
+    np.savez(ruta, x_train=x[:corte], y_train=y[:corte], x_test=x[corte:], y_test=y[corte:])
+
+
+def esperar_puerto(puerto, proceso, timeout):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            return False
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", puerto)) == 0:
+                return True
+        time.sleep(0.2)
+    return False
+
+
+def leer_json_lineas(ruta):
+    """Las líneas completas de un JSON por líneas, sin las rotas por una caída (ver comun/registro.py)."""
+    return leer_nuevas(ruta)[0]
+
+
+def _lanzar(script, entorno, log):
+    with open(log, "a") as f:
+        return subprocess.Popen([sys.executable, os.path.join(RAIZ, script)], env=entorno, stdout=f, stderr=subprocess.STDOUT)
+
+
+def ejecutar_procesos(entorno_servidor, entornos_clientes, directorio, puerto, timeout, caidas_cada=0, semilla=0,
+                      entornos_bordes=(), procesos=None):
+    """
+    Lanza el servidor, los bordes y los clientes y espera a que el servidor termine sus rondas.
+    Los entornos son sólo las variables propias; se añaden las del host, PYTHONPATH, RESULTS_DIR y SERVER_ADDRESS.
+    Si se pasa `procesos` (lista), se añaden los Popen del servidor y los bordes según arrancan (para medirlos).
+    Devuelve {estado ("ok" o "timeout"), t_total, caidas}. Si el servidor o un borde no arranca lanza RuntimeError.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    base = dict(os.environ, PYTHONPATH=RAIZ, TF_CPP_MIN_LOG_LEVEL="3", RESULTS_DIR=directorio)
+    servidor = _lanzar(os.path.join("server", "server.py"),
+                       {**base, **entorno_servidor, "SERVER_ADDRESS": f"127.0.0.1:{puerto}"},
+                       os.path.join(directorio, "server.log"))
+    puertos_bordes = {entorno["EDGE_ID"]: puerto + i for i, entorno in enumerate(entornos_bordes, start=1)}
+    direcciones = {f"{nombre}:8080": f"127.0.0.1:{p}" for nombre, p in puertos_bordes.items()}
+    entornos = [{**base, "NET_EMULATION": "False", **entorno,
+                 "SERVER_ADDRESS": direcciones.get(entorno.get("SERVER_ADDRESS"), f"127.0.0.1:{puerto}")}
+                for entorno in entornos_clientes]
+    logs = [os.path.join(directorio, f"client{i}.log") for i in range(1, len(entornos) + 1)]
+    bordes = []
+    clientes = []
+    rng = random.Random(semilla)
+    caidas = 0
+    estado = "ok"
+    inicio = time.perf_counter()
+    try:
+        if procesos is not None:
+            procesos.append(servidor)
+        if not esperar_puerto(puerto, servidor, timeout=60):
+            raise RuntimeError(f"El servidor no arrancó (ver {directorio}/server.log)")
+        for entorno in entornos_bordes:
+            nombre = entorno["EDGE_ID"]
+            borde = _lanzar(os.path.join("edge", "edge.py"),
+                            {**base, **entorno, "SERVER_ADDRESS": f"127.0.0.1:{puerto}",
+                             "EDGE_ADDRESS": f"127.0.0.1:{puertos_bordes[nombre]}"},
+                            os.path.join(directorio, f"{nombre}.log"))
+            bordes.append(borde)
+            if procesos is not None:
+                procesos.append(borde)
+            if not esperar_puerto(puertos_bordes[nombre], borde, timeout=60):
+                raise RuntimeError(f"El borde {nombre} no arrancó (ver {directorio}/{nombre}.log)")
+        clientes = [_lanzar(os.path.join("client", "client.py"), entorno, log) for entorno, log in zip(entornos, logs)]
+        proxima_caida = time.perf_counter() + caidas_cada if caidas_cada > 0 else None
+        while servidor.poll() is None:
+            ahora = time.perf_counter()
+            if ahora - inicio > timeout:
+                estado = "timeout"
+                break
+            if proxima_caida is not None and ahora >= proxima_caida:
+                i = rng.randrange(len(clientes))
+                clientes[i].terminate()
+                clientes[i].wait()
+                clientes[i] = _lanzar(os.path.join("client", "client.py"), entornos[i], logs[i])
+                caidas += 1
+                proxima_caida = ahora + caidas_cada
+            time.sleep(0.5)
+    finally:
+        for proceso in clientes + bordes + [servidor]:
+            if proceso.poll() is None:
+                proceso.kill()
+            proceso.wait()
+    return {"estado": estado, "t_total": time.perf_counter() - inicio, "caidas": caidas}
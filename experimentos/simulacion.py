@@ -0,0 +1,441 @@
+"""
+**Simulación de eventos discretos con reloj virtual**
+
+Un experimento con Docker tarda lo que tardan de verdad sus rondas: los IoT a 1mbit, los START_DELAY de 30-60s y
+los 2 minutos entre caídas de Pumba. Y con cientos de clientes no hay host que aguante un contenedor por cliente.
+
+Aquí todo corre en UN proceso con un reloj virtual:
+
+- El servidor es el de siempre: se importa server/server.py y se usa su `strategy` (FedAvgTFM, con su agregación,
+  selección, versiones de la bajada, checkpoints y evaluación en el holdout) y sus funciones de métricas, así que
+  global_results.json sale igual que en un experimento real.
+- Cada cliente es un FlowerClient de client/client.py envuelto en un ClientProxy (ProxySimulado). Todos comparten
+  un único modelo y un único motor de entrenamiento (una sola traza): al atender a un cliente se cambian sus datos
+  y su estado de Adam (RuntimeSimulado).
+- La red no se espera, se calcula: cada mensaje tarda latencia + bytes / tasa, con la tasa del perfil limitada por
+  la pérdida de paquetes (fórmula de Mathis para TCP: MSS / RTT * sqrt(3/2) / sqrt(p)). Los bytes son los de los
+  Parameters serializados, así que la compresión del uplink y las versiones de la bajada cuentan.
+- El cómputo sí se ejecuta (el modelo resultante es real) y su tiempo se escala con la CPU del perfil:
+  t_virtual = t_medido * --cpu-host / cpu del perfil (--cpu-host = CPUs que equivale un núcleo de este host).
+- Con TRAIN_DEADLINE el límite de entrenamiento que recibe cada cliente se escala igual (es tiempo virtual).
+- Las llegadas tardías (retraso_inicio) y las caídas (cada caidas_cada segundos un cliente conectado al azar, como
+  Pumba) son eventos en una cola ordenada por tiempo. El cliente caído vuelve tras su retraso_inicio + --t-arranque
+  con otro cid (como al reconectar) y sin la versión del modelo, pero con sus datos y su estado de Adam (como con
+  la caché local de estado.py). Si se cae en mitad de una fase, su respuesta es un fallo en el instante de la caída.
+- La parada temprana de server.py (TARGET_METRIC / PLATEAU_ROUNDS, ver server/control.py) corta igual el bucle; la
+  espera a los clientes es virtual y no tiene límite.
+- Una fase (fit o evaluate) termina cuando responde el último cliente elegido (o falla). Al tiempo de los clientes se
+  suma lo que tarda de verdad el servidor en configurar, agregar y evaluar en el holdout.
+
+Lo que no se modela: get_properties del selector (instantáneo), contención entre clientes en la misma red y el
+modo asíncrono (ASYNC_BUFFER).
+
+Resultados en results/simulaciones/<nombre>_<fecha>/: escenario.json, global_results.json y client_*_metrics.json
+como siempre (cada ronda lleva "simulacion" con sus tiempos virtuales), y simulacion_results.json con una línea por
+ronda y un resumen final (tiempo virtual, tiempo real y aceleración).
+
+Uso:
+    python experimentos/simulacion.py experimentos/escenarios/base.json --clientes 200 --sintetico 70000
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import datetime
+from flwr.server import SimpleClientManager
+from flwr.server.client_proxy import ClientProxy
+from flwr.common import GetParametersIns, FitIns
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, RAIZ)
+from experimentos import escenario as esc  # noqa: E402
+from experimentos.local import crear_mnist_sintetico  # noqa: E402
+from comun.parametros import BufferModelo, ClienteBuffer  # noqa: E402
+
+MSS = 1448 # Bytes útiles por segmento TCP
+#Variables de cada cliente: van al FlowerClient (entorno=) en lugar del entorno del proceso.
+VARIABLES_POR_CLIENTE = {"CLIENT_ID", "IS_ATTACKER", "PERFIL", "CPU_LIMIT", "START_DELAY",
+                         "NET_LATENCY", "NET_LOSS", "NET_BANDWIDTH"}
+
+
+def segundos(texto):
+    """"200ms" -> 0.2, "1s" -> 1.0 (unidades de tc)."""
+    texto = str(texto).strip()
+    for sufijo, factor in (("ms", 1e-3), ("us", 1e-6), ("s", 1.0)):
+        if texto.endswith(sufijo):
+            return float(texto[:-len(sufijo)]) * factor
+    return float(texto)
+
+
+def bits_por_segundo(texto):
+    """"1mbit" -> 1e6, "100kbit" -> 1e5 (unidades de tc)."""
+    texto = str(texto).strip().lower()
+    for sufijo, factor in (("gbit", 1e9), ("mbit", 1e6), ("kbit", 1e3), ("bit", 1.0)):
+        if texto.endswith(sufijo):
+            return float(texto[:-len(sufijo)]) * factor
+    return float(texto)
+
+
+def fraccion(texto):
+    """"5%" -> 0.05."""
+    texto = str(texto).strip()
+    return float(texto[:-1]) / 100 if texto.endswith("%") else float(texto)
+
+
+class EnlaceSimulado:
+    """Tiempo de transferencia de un mensaje con la latencia, la pérdida y la banda de un perfil."""
+
+    def __init__(self, latencia, perdida, banda):
+        self.latencia = segundos(latencia)
+        self.perdida = fraccion(perdida)
+        self.tasa = bits_por_segundo(banda)
+        if self.perdida > 0:
+            rtt = max(2 * self.latencia, 1e-3)
+            self.tasa = min(self.tasa, MSS * 8 / rtt * (1.5 ** 0.5) / self.perdida ** 0.5)
+
+    def transferencia(self, num_bytes):
+        return self.latencia + num_bytes * 8 / self.tasa
+
+
+class ModeloCompartido:
+    """Modelo y motor de entrenamiento únicos. `activo` es el cliente cuyos datos y estado de Adam tiene cargados."""
+
+    def __init__(self, x_u8, y, xla=False):
+        from comun.modelo import build_model
+        from entrenamiento import MotorEntrenamiento
+        self.model = build_model()
+        self.buffer = BufferModelo(self.model)
+        self.motor = MotorEntrenamiento(self.model, x_u8, y, xla=xla)
+        self.motor.calentar()
+        self.optimizador_inicial = self.motor.estado_optimizador() # Adam sin pasos (lo que tiene un cliente nuevo)
+        self.activo = None
+
+
+class RuntimeSimulado:
+    """Lo que FlowerClient usa de RuntimeCliente (datos, modelo y motor), sobre el modelo compartido."""
+
+    def __init__(self, datos, compartido):
+        self.x_train_c, self.x_test_c, self.y_train_c, self.y_test_c = datos
+        self.compartido = compartido
+        self.model = compartido.model
+        self.buffer = compartido.buffer
+        self.motor = compartido.motor
+        self.optimizador = None # Estado de Adam de este cliente mientras no está activo
+        self.datasets = None # Pipelines tf.data de sus datos (se construyen la primera vez)
+
+    def registrar_primera_peticion(self):
+        pass
+
+    def esperar(self):
+        """Carga los datos y el estado de Adam de este cliente en el motor compartido (si no los tiene ya)."""
+        anterior = self.compartido.activo
+        if anterior is self:
+            return self
+        if anterior is not None:
+            anterior.optimizador = self.motor.estado_optimizador()
+        self.datasets = self.motor.cambiar_datos(self.x_train_c, self.y_train_c, self.datasets)
+        self.motor.restaurar_optimizador(self.optimizador or self.compartido.optimizador_inicial)
+        self.compartido.activo = self
+        return self
+
+    def guardar_estado(self, pesos_globales, ronda):
+        pass # El estado de Adam se guarda al cambiar de cliente (equivale a la caché local)
+
+
+class ProxySimulado(ClientProxy):
+    """ClientProxy que llama directamente a un FlowerClient del mismo proceso (sin gRPC)."""
+
+    def __init__(self, cid, cliente):
+        super().__init__(cid)
+        self.cliente = ClienteBuffer(cliente) # El mismo envoltorio que usa client.py
+
+    def get_properties(self, ins, timeout):
+        return self.cliente.get_properties(ins)
+
+    def get_parameters(self, ins, timeout):
+        return self.cliente.get_parameters(ins)
+
+    def fit(self, ins, timeout):
+        return self.cliente.fit(ins)
+
+    def evaluate(self, ins, timeout):
+        return self.cliente.evaluate(ins)
+
+    def reconnect(self, ins, timeout):
+        raise NotImplementedError("El simulador no desconecta clientes desde el servidor")
+
+
+class ClienteSimulado:
+    """Un cliente del escenario: su enlace, su CPU, su runtime y el proxy de su conexión actual (None = caído)."""
+
+    def __init__(self, datos_escenario, entorno, runtime):
+        self.id = datos_escenario["client_id"]
+        self.perfil = datos_escenario["perfil"]
+        self.cpu = float(datos_escenario["cpu"])
+        self.retraso_inicio = float(datos_escenario["retraso_inicio"])
+        self.enlace = EnlaceSimulado(datos_escenario["latencia"], datos_escenario["loss"], datos_escenario["banda"])
+        self.entorno = entorno
+        self.runtime = runtime
+        self.proxy = None
+        self.conexiones = 0
+
+
+def _bytes(parameters):
+    return sum(len(tensor) for tensor in parameters.tensors)
+
+
+class Simulador:
+    """Bucle de rondas de Flower (Server.fit) sobre un reloj virtual y una cola de eventos de altas y caídas."""
+
+    def __init__(self, strategy, clientes, crear_cliente, caidas_cada=0.0, t_arranque=3.0, cpu_host=1.0, semilla=0,
+                 control=None):
+        self.strategy = strategy
+        self.control = control # ControlRondas de server.py (parada temprana) o None
+        self.clientes = {c.id: c for c in clientes}
+        self.crear_cliente = crear_cliente # ClienteSimulado -> FlowerClient nuevo (un proceso recién arrancado)
+        self.caidas_cada = caidas_cada
+        self.t_arranque = t_arranque
+        self.cpu_host = cpu_host
+        self.rng = random.Random(semilla)
+        self.manager = SimpleClientManager()
+        self.reloj = 0.0
+        self.eventos = [] # heap de (t, orden, tipo, client_id)
+        self.orden = 0
+        self.contadores = {"altas": 0, "caidas": 0, "caidas_en_fase": 0}
+        self.por_cid = {} # cid del proxy -> ClienteSimulado
+        for cliente in clientes:
+            self._programar(cliente.retraso_inicio + t_arranque, "alta", cliente.id)
+        if caidas_cada > 0:
+            self._programar(caidas_cada, "caida", None)
+
+    def _programar(self, t, tipo, client_id):
+        heapq.heappush(self.eventos, (t, self.orden, tipo, client_id))
+        self.orden += 1
+
+    def _procesar_siguiente(self, en_curso=None):
+        """Avanza el reloj hasta el siguiente evento y lo aplica. Devuelve el cliente caído (o None)."""
+        t, _, tipo, client_id = heapq.heappop(self.eventos)
+        self.reloj = max(self.reloj, t)
+        if tipo == "alta":
+            cliente = self.clientes[client_id]
+            cliente.conexiones += 1
+            cliente.proxy = ProxySimulado(f"sim-{cliente.id}-{cliente.conexiones}", self.crear_cliente(cliente))
+            self.por_cid[cliente.proxy.cid] = cliente
+            self.manager.register(cliente.proxy)
+            self.contadores["altas"] += 1
+            return None
+        #Caída: como Pumba, un cliente conectado al azar. Vuelve a arrancar y espera su START_DELAY otra vez.
+        self._programar(t + self.caidas_cada, "caida", None)
+        conectados = sorted(c.id for c in self.clientes.values() if c.proxy is not None)
+        if not conectados:
+            return None
+        cliente = self.clientes[self.rng.choice(conectados)]
+        self.manager.unregister(cliente.proxy)
+        cliente.proxy = None
+        self._programar(t + cliente.retraso_inicio + self.t_arranque, "alta", cliente.id)
+        self.contadores["caidas"] += 1
+        print(f"[SIMULACION] t={t:.1f}s | Cae el cliente {cliente.id} ({cliente.perfil})")
+        return cliente
+
+    def esperar_clientes(self, minimo):
+        """Procesa eventos hasta que haya `minimo` clientes conectados (lo que hace wait_for en el servidor real)."""
+        while self.manager.num_available() < minimo:
+            if not self.eventos:
+                raise RuntimeError(f"Nunca habrá {minimo} clientes conectados")
+            self._procesar_siguiente()
+
+    def _servidor(self, funcion, *args):
+        """Ejecuta una llamada del servidor y suma su tiempo real al reloj (el servidor es este host)."""
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        self.reloj += time.perf_counter() - inicio
+        return resultado
+
+    def fase(self, nombre, instrucciones):
+        """
+        Ejecuta una fase (fit o evaluate) con los clientes elegidos. Cada respuesta llega en
+        bajada + cómputo escalado + subida; las caídas que ocurren antes la convierten en fallo.
+        Devuelve (results, failures, estadísticas de la fase).
+        """
+        inicio = self.reloj
+        pendientes = {} # client_id -> (t_llegada, proxy, respuesta, detalle)
+        for proxy, ins in instrucciones:
+            cliente = self.por_cid[proxy.cid]
+            if "t_limite" in ins.config: # TRAIN_DEADLINE es tiempo virtual: en este host el cliente tiene menos
+                ins = FitIns(ins.parameters, dict(ins.config, t_limite=ins.config["t_limite"] * cliente.cpu / self.cpu_host))
+            t0 = time.perf_counter()
+            respuesta = proxy.fit(ins, None) if nombre == "fit" else proxy.evaluate(ins, None)
+            computo = (time.perf_counter() - t0) * self.cpu_host / cliente.cpu
+            bajada = cliente.enlace.transferencia(_bytes(ins.parameters))
+            subida = cliente.enlace.transferencia(_bytes(respuesta.parameters) if nombre == "fit" else 0)
+            #La selección de clientes aprende con la latencia que verían en el despliegue real.
+            clave = "t_fit" if nombre == "fit" else "t_evaluate"
+            if clave in respuesta.metrics:
+                respuesta.metrics[clave] = float(respuesta.metrics[clave]) * self.cpu_host / cliente.cpu
+            detalle = {"bajada": bajada, "computo": computo, "subida": subida}
+            pendientes[cliente.id] = (inicio + bajada + computo + subida, proxy, respuesta, detalle)
+
+        fallos = {} # client_id -> instante de la caída
+        while self.eventos:
+            activos = [t for cid, (t, *_) in pendientes.items() if cid not in fallos]
+            if not activos or self.eventos[0][0] > max(activos):
+                break
+            caido = self._procesar_siguiente()
+            if caido is not None and caido.id in pendientes and caido.id not in fallos \
+                    and pendientes[caido.id][0] > self.reloj:
+                fallos[caido.id] = self.reloj
+                self.contadores["caidas_en_fase"] += 1
+
+        results = [(proxy, respuesta) for cid, (_, proxy, respuesta, _) in pendientes.items() if cid not in fallos]
+        failures = [ConnectionError(f"Cliente {cid} caído durante {nombre}") for cid in fallos]
+        llegadas = [t for cid, (t, *_) in pendientes.items() if cid not in fallos] + list(fallos.values())
+        self.reloj = max([self.reloj] + llegadas)
+        exitos = {cid: valores for cid, valores in pendientes.items() if cid not in fallos}
+        mas_lento = max(exitos, key=lambda cid: exitos[cid][0]) if exitos else None
+        estadisticas = {
+            "clientes": len(pendientes),
+            "fallos": len(fallos),
+            "t_fase": self.reloj - inicio,
+            "mas_lento": mas_lento,
+        }
+        if mas_lento is not None:
+            estadisticas.update({f"t_{k}_mas_lento": v for k, v in exitos[mas_lento][3].items()})
+        return results, failures, estadisticas
+
+    def ejecutar(self, num_rondas, fichero):
+        """Server.fit de Flower: parámetros iniciales, evaluación de la ronda 0 y num_rondas de fit + evaluate."""
+        inicio_real = time.perf_counter()
+        strategy = self.strategy
+        parametros = strategy.initialize_parameters(client_manager=self.manager)
+        if parametros is None: # Como Flower: los pesos iniciales de un cliente al azar
+            self.esperar_clientes(1)
+            proxy = self.manager.sample(1)[0]
+            parametros = proxy.get_parameters(GetParametersIns(config={}), None).parameters
+            self.reloj += self.por_cid[proxy.cid].enlace.transferencia(_bytes(parametros))
+        self._servidor(strategy.evaluate, 0, parametros)
+
+        ultima = strategy.ronda_inicial
+        for ronda in range(strategy.ronda_inicial + 1, num_rondas + 1):
+            inicio_ronda, inicio_real_ronda = self.reloj, time.perf_counter()
+            simulacion = {"ronda": ronda, "reloj_inicio": inicio_ronda}
+            #La línea de global_results.json de esta ronda lleva también sus tiempos virtuales.
+            strategy.estadisticas_fit.setdefault(ronda, {})["simulacion"] = simulacion
+
+            self.esperar_clientes(strategy.min_available_clients)
+            simulacion["t_espera_clientes"] = self.reloj - inicio_ronda
+            instrucciones = self._servidor(strategy.configure_fit, ronda, parametros, self.manager)
+            if instrucciones:
+                results, failures, simulacion["fit"] = self.fase("fit", instrucciones)
+                agregados, _ = self._servidor(strategy.aggregate_fit, ronda, results, failures)
+                if agregados is not None:
+                    parametros = agregados
+
+            simulacion["t_ronda_simulada"] = self.reloj - inicio_ronda
+            self._servidor(strategy.evaluate, ronda, parametros)
+            instrucciones = self._servidor(strategy.configure_evaluate, ronda, parametros, self.manager)
+            if instrucciones:
+                results, failures, simulacion["evaluate"] = self.fase("evaluate", instrucciones)
+                simulacion["t_ronda_simulada"] = self.reloj - inicio_ronda
+                self._servidor(strategy.aggregate_evaluate, ronda, results, failures)
+
+            simulacion.update({
+                "reloj_fin": self.reloj,
+                "t_ronda_simulada": self.reloj - inicio_ronda,
+                "t_real": time.perf_counter() - inicio_real_ronda,
+                "conectados": self.manager.num_available(),
+            })
+            with open(fichero, "a") as f:
+                f.write(json.dumps(simulacion) + "\n")
+            print(f"[SIMULACION] Ronda {ronda} | {simulacion['t_ronda_simulada']:.1f}s simulados en "
+                  f"{simulacion['t_real']:.1f}s reales | Reloj: {self.reloj:.1f}s | Conectados: {simulacion['conectados']}")
+            ultima = ronda
+            if self.control is not None and self.control.parar() is not None:
+                break
+
+        t_real = time.perf_counter() - inicio_real
+        resumen = {
+            "resumen": True,
+            "rondas": ultima - strategy.ronda_inicial,
+            "fin": (self.control.parar() if self.control is not None else None) or "rondas_completadas",
+            "t_simulado": self.reloj,
+            "t_real": t_real,
+            "aceleracion": self.reloj / t_real if t_real > 0 else None,
+            **self.contadores,
+        }
+        with open(fichero, "a") as f:
+            f.write(json.dumps(resumen) + "\n")
+        return resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("escenario", help="JSON del escenario (sin \"barrido\"; ver escenario.py).")
+    parser.add_argument("--clientes", type=int, default=0, help="Cambia el número de clientes del escenario.")
+    parser.add_argument("--rondas", type=int, default=0, help="Cambia el número de rondas del escenario.")
+    parser.add_argument("--t-arranque", type=float, default=3.0,
+                        help="Segundos virtuales desde que arranca un cliente hasta que atiende al servidor.")
+    parser.add_argument("--cpu-host", type=float, default=1.0, help="CPUs del perfil que equivale un núcleo de este host.")
+    parser.add_argument("--salida", default=os.path.join(RAIZ, "results", "simulaciones"))
+    parser.add_argument("--sintetico", type=int, default=0, help="Usar un MNIST sintético con estas muestras.")
+    args = parser.parse_args()
+
+    escenario = esc.cargar(args.escenario)
+    if escenario["barrido"]:
+        sys.exit("La simulación es de un escenario concreto: quita el \"barrido\" o simula cada combinación.")
+    if escenario["bordes"]:
+        sys.exit("La simulación no modela los agregadores de borde: ejecuta el escenario con barrido.py o Docker.")
+    if args.clientes:
+        escenario["clientes"] = args.clientes
+    if args.rondas:
+        escenario["rondas"] = args.rondas
+    directorio = os.path.join(args.salida, f"{escenario['nombre']}_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+    os.makedirs(directorio, exist_ok=True)
+    clientes = esc.asignar_clientes(escenario)
+    with open(os.path.join(directorio, "escenario.json"), "w") as f:
+        json.dump({"escenario": escenario, "clientes": clientes, "simulacion": vars(args)}, f, indent=1)
+
+    #server.py y client.py leen su configuración del entorno al importarse: el del servidor y lo común a los clientes.
+    entornos = [esc.entorno_cliente(escenario, c) for c in clientes]
+    comun = {k: v for k, v in entornos[0].items() if k not in VARIABLES_POR_CLIENTE}
+    os.environ.update(esc.entorno_servidor(escenario))
+    os.environ.update(comun)
+    os.environ.update({"RESULTS_DIR": directorio, "NET_EMULATION": "False", "CLIENT_CACHE": "False",
+                       "TF_CPP_MIN_LOG_LEVEL": os.environ.get("TF_CPP_MIN_LOG_LEVEL", "3")})
+    os.environ.setdefault("DATASET_DIR", os.path.join(RAIZ, "results", "dataset"))
+    if args.sintetico:
+        npz = os.path.join(directorio, "mnist_sintetico.npz")
+        crear_mnist_sintetico(npz, args.sintetico, semilla=escenario["semilla"])
+        os.environ.update({"MNIST_NPZ": npz, "DATASET_DIR": os.path.join(directorio, "dataset")})
+    if int(os.environ.get("ASYNC_BUFFER", "0")) > 0:
+        sys.exit("El modo asíncrono (ASYNC_BUFFER) no se simula.")
+
+    sys.path[:0] = [os.path.join(RAIZ, "server"), os.path.join(RAIZ, "client")]
+    random.seed(escenario["semilla"]) # El muestreo de clientes de Flower usa el random global
+    import server as servidor  # noqa: E402
+    import client as cliente_flower  # noqa: E402
+    if servidor.strategy.checkpoints is not None:
+        servidor.strategy.checkpoints.reiniciar()
+
+    inicio = time.perf_counter()
+    compartido = None
+    simulados = []
+    for datos_escenario, entorno in zip(clientes, entornos):
+        datos = cliente_flower.preparar_datos(datos_escenario["client_id"])
+        if compartido is None:
+            compartido = ModeloCompartido(datos[0], datos[2], xla=cliente_flower.TRAIN_XLA)
+        simulados.append(ClienteSimulado(datos_escenario, entorno, RuntimeSimulado(datos, compartido)))
+    print(f"[SIMULACION] {len(simulados)} clientes preparados en {time.perf_counter() - inicio:.1f}s -> {directorio}")
+
+    simulador = Simulador(
+        servidor.strategy, simulados,
+        crear_cliente=lambda c: cliente_flower.FlowerClient(rt=c.runtime, entorno=c.entorno),
+        caidas_cada=escenario["fallos"]["caidas_cada"], t_arranque=args.t_arranque, cpu_host=args.cpu_host,
+        semilla=escenario["semilla"], control=servidor.control,
+    )
+    resumen = simulador.ejecutar(escenario["rondas"], os.path.join(directorio, "simulacion_results.json"))
+    print(f"[SIMULACION] {resumen['rondas']} rondas: {resumen['t_simulado']:.1f}s simulados en {resumen['t_real']:.1f}s "
+          f"reales (x{resumen['aceleracion']:.1f}) | Altas: {resumen['altas']} | Caídas: {resumen['caidas']} "
+          f"({resumen['caidas_en_fase']} en mitad de una fase)")
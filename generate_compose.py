@@ -15,7 +15,8 @@ No se necesita configuración adicional, ya que Docker gestiona automáticamente
 Otras opciones son: host (usa la tarjeta red de mi ordenador), none (no hay red), overlay (avanzado) permite conexiones con ordenadores físicos diferente) y Macvlan (asigna direcciones MAC a los contenedores).
 
 2. Servidor:
- 2.1 build: ./server. Indicamos la ruta donde se encuentra el Dockerfile
+ 2.1 build: context . y dockerfile server/Dockerfile. Indicamos la ruta donde se encuentra el Dockerfile.
+     El contexto es la raíz del proyecto para que la imagen pueda copiar también el código compartido de comun/
  2.2 Puerto: 8080:8080. 
 
  8080              :               8080
@@ -24,7 +25,7 @@ Entrada           Conecta         Espera escuchar
  2.3 Variables de entorno para luego poder usar el número de clientes en otro script.
 
 3. Clientes:
- 3.1 build: ./client. Indicamos la ruta donde se encuentra el Dockerfile
+ 3.1 build: context . y dockerfile client/Dockerfile. Indicamos la ruta donde se encuentra el Dockerfile
  3.2 Depencia en el servidor, no empieza hasta que no haya arrancado el servidor
  3.3 Variables de entorno para posteriormente usar el ID del cliente y el número total de clientes.
  
@@ -92,12 +93,17 @@ fl.server.strategy.Krum: Selecciona el cliente que más se parezca a la mayoría
 """
 import sys
 import os
-import random
+import json
+
+from experimentos import escenario as esc
 
 
 # Configuración
-# Puedes cambiar esto o pasarlo por argumento
-NUM_CLIENTS = 4
+# Todo el experimento (clientes, perfiles, reparto, estrategia, rondas y fallos) sale de un escenario JSON.
+# Ver experimentos/escenario.py. Uso: python generate_compose.py [experimentos/escenarios/base.json]
+RUTA_ESCENARIO = sys.argv[1] if len(sys.argv) > 1 else os.path.join("experimentos", "escenarios", "base.json")
+ESCENARIO = esc.cargar(RUTA_ESCENARIO)
+NUM_CLIENTS = ESCENARIO["clientes"]
 
 
 #Creamos la carpeta results para guardar los resultados globales del servidor
@@ -105,16 +111,15 @@ if not os.path.exists("results"):
     os.makedirs("results")
 
 
-#Creamos los distintos perfiles de hardware y red para cada cliente, y los guardamos.
-PERFILES = {
-    "IoT":    {"cpu": "0.5", "latencia": "200ms", "loss": "5%", "banda": "1mbit"},   # Sensores / Raspberry Pi antigua
-    "Movil":  {"cpu": "1.0", "latencia": "100ms", "loss": "1%", "banda": "10mbit"},  # Red 4G media
-    "WiFi":   {"cpu": "2.0", "latencia": "20ms",  "loss": "0%", "banda": "100mbit"},  # PC en casa
-    "Servidor": {"cpu": "4.0", "latencia": "10ms",  "loss": "0%", "banda": "1gbit"}    # Servidor potente
-}
-
+#Los perfiles de hardware y red de cada cliente (IoT, Movil, WiFi, Servidor) están en experimentos/escenario.py.
+#El reparto de perfiles, los retrasos de arranque y los atacantes se sortean con la semilla del escenario.
+CLIENTES = esc.asignar_clientes(ESCENARIO)
+#Los clientes de los perfiles de "bordes" se conectan a su agregador de borde (edge/edge.py) y no al servidor.
+BORDES = esc.asignar_bordes(CLIENTES)
 
 
+def lineas_entorno(entorno, sangria="      "):
+    return "".join(f"\n{sangria}- {clave}={valor}" for clave, valor in entorno.items())
 
 
 # Plantilla del encabezado y el servidor (que siempre es igual)
@@ -123,47 +128,53 @@ name: federated-learning
 
 services:
   server:
-    build: ./server
+    build:
+      context: .
+      dockerfile: server/Dockerfile
     container_name: fl-server
     ports:
       - "8080:8080"
     networks:
       - flnet
-    environment:
-      - TOTAL_CLIENTS={NUM_CLIENTS} 
+    environment:{lineas_entorno(esc.entorno_servidor(ESCENARIO))}
     volumes:
       - ./results:/app/results
     cap_add:
       - NET_ADMIN
 """
 
-# Bucle para generar los clientes
-for i in range(1, NUM_CLIENTS + 1):
-    nombre_perfil = random.choice(list(PERFILES.keys()))
-    perfil = PERFILES[nombre_perfil]
-
-    #Asignamos rol de atacante de forma aleatoria.
-    es_atacante = "True" if i == NUM_CLIENTS else "False"
-    #Como ahora no queremos ponerlo, añadimos:
-    #es_atacante = "False"
+# Un servicio por borde: cliente para el servidor y servidor (en su propio puerto 8080) para sus clientes
+for borde in BORDES:
+    yaml_content += f"""
+  {borde["nombre"]}:
+    build:
+      context: .
+      dockerfile: edge/Dockerfile
+    container_name: fl-{borde["nombre"]}
+    environment:{lineas_entorno(esc.entorno_borde(ESCENARIO, borde))}
+    depends_on:
+      - server
+    networks:
+      - flnet
+    volumes:
+      - ./results:/app/results
+"""
 
+# Bucle para generar los clientes
+for cliente in CLIENTES:
+    i = cliente["client_id"]
+    #El rol de atacante (los últimos fallos.atacantes clientes) y el START_DELAY vienen del escenario.
 
     yaml_content += f"""
   client{i}:
-    build: ./client
+    build:
+      context: .
+      dockerfile: client/Dockerfile
     container_name: fl-client{i}
-    environment:
-      - CLIENT_ID={i}
-      - TOTAL_CLIENTS={NUM_CLIENTS}
-      - IS_ATTACKER={es_atacante}
-      - NET_LATENCY={perfil['latencia']}
-      - NET_LOSS={perfil['loss']}
-      - NET_BANDWIDTH={perfil['banda']}
-      - CPU_LIMIT={perfil['cpu']}
-      - PERFIL={nombre_perfil}
-      - START_DELAY={random.choice([0, 0, 30, 60])}
+    restart: on-failure # Si Pumba lo mata, vuelve (y restaura su caché local)
+    environment:{lineas_entorno(esc.entorno_cliente(ESCENARIO, cliente))}
     depends_on:
-      - server
+      - {cliente["borde"] or "server"}
     networks:
       - flnet
     volumes:
@@ -173,18 +184,19 @@ for i in range(1, NUM_CLIENTS + 1):
     deploy:
       resources:
         limits:
-          cpus: '{perfil["cpu"]}'
+          cpus: '{cliente["cpu"]}'
 """
 
 # Añadimos Pumba (El asesino aleatorio para Dropouts)
-# Mata un contenedor aleatorio que empiece por "fl-client" cada X minutos
-yaml_content += """
+# Mata un contenedor aleatorio que empiece por "fl-client" cada fallos.caidas_cada segundos (0 = sin Pumba)
+if ESCENARIO["fallos"]["caidas_cada"] > 0:
+    yaml_content += f"""
   pumba:
     image: gaiaadm/pumba
     container_name: chaos-monkey
     volumes:
       - /var/run/docker.sock:/var/run/docker.sock
-    command: --random --interval 2m kill --signal SIGTERM "re2:^fl-client"
+    command: --random --interval {ESCENARIO["fallos"]["caidas_cada"]}s kill --signal SIGTERM "re2:^fl-client"
     depends_on:
       - server
 """
@@ -200,4 +212,8 @@ networks:
 with open("docker-compose.yml", "w", encoding="utf-8") as f:
     f.write(yaml_content)
 
-print(f"Archivo docker-compose.yml generado con {NUM_CLIENTS} clientes.")
\ No newline at end of file
+print(f"Archivo docker-compose.yml generado con {NUM_CLIENTS} clientes y {len(BORDES)} bordes "
+      f"(escenario {ESCENARIO['nombre']}).")
+#El escenario resuelto (con los clientes sorteados) se guarda junto a los resultados para poder repetir el experimento.
+with open(os.path.join("results", "escenario.json"), "w", encoding="utf-8") as f:
+    json.dump({"escenario": ESCENARIO, "clientes": CLIENTES, "bordes": BORDES}, f, indent=1)
\ No newline at end of file
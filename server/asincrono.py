@@ -0,0 +1,286 @@
+"""
+**Servidor asíncrono con buffer (estilo FedBuff)**
+
+Con FedAvg síncrono cada ronda espera a `min_fit_clients` resultados, así que un cliente IoT (200ms, 1mbit)
+o uno que llega tarde (START_DELAY) marca el ritmo de todos.
+
+Aquí no hay rondas que esperen a nadie:
+1. Cada cliente libre recibe el modelo global MÁS RECIENTE y entrena.
+2. Su actualización (delta respecto a la versión que recibió) entra en un buffer.
+3. En cuanto hay K actualizaciones en el buffer se agregan y se crea una nueva versión del modelo.
+   Las actualizaciones "viejas" (calculadas sobre una versión anterior) pesan menos:
+       peso = muestras * 1 / sqrt(1 + staleness)     (staleness = versiones que han pasado desde que la recibió)
+4. El cliente vuelve a pedir trabajo en cuanto termina, sin esperar al resto.
+
+Cada versión del modelo cuenta como una "ronda" para el resto del sistema (global_results.json, num_rounds...).
+
+La evaluación federada se hace aprovechando que un cliente queda libre: antes de su siguiente fit evalúa la
+última versión pendiente. Con `min_evaluate_clients` resultados se agrega con weighted_average como siempre.
+Así ningún cliente recibe dos peticiones a la vez.
+
+Por cada agregación se escribe una línea en /app/results/asincrono_results.json con la staleness y el tiempo
+ocioso (desde que entregó su resultado hasta que recibe nuevo trabajo) de cada cliente, más su perfilado por fases
+si lo envía (ver comun/perfilado.py) y, con UPDATE_CODEC, las estadísticas de compresión de las actualizaciones del buffer.
+
+Con un ControlRondas (control.py) la espera a los clientes está acotada como en el modo síncrono: al empezar y cuando
+no queda ningún cliente trabajando se espera a los mínimos como mucho CLIENT_WAIT_TIMEOUT (con sus pausas y mínimos
+adaptados), y si no llegan se termina con motivo "sin_clientes". La parada temprana (objetivo o meseta de la métrica
+global) también se respeta entre versiones. Al acabar se escribe la misma línea "fin" que en el modo síncrono.
+"""
+import time
+import threading
+import concurrent.futures
+import numpy as np
+import flwr as fl
+from flwr.common import FitIns, EvaluateIns
+from flwr.server.history import History
+
+from comun.perfilado import extraer_perfilado
+from comun.parametros import parameters_a_ndarrays, ndarrays_a_parameters
+from comun.registro import RegistroJSONL
+
+
+class ServidorFedBuff(fl.server.Server):
+
+    def __init__(self, *, client_manager, strategy, tamano_buffer=2, eta=1.0, exponente_staleness=0.5,
+                 fichero_log="/app/results/asincrono_results.json", control=None):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.control = control # ControlRondas o None (esperas de Flower sin límite y sin parada temprana)
+        self.tamano_buffer = tamano_buffer # K: actualizaciones necesarias para crear una versión nueva
+        self.eta = eta # Tasa de aprendizaje del servidor sobre el delta agregado
+        self.exponente_staleness = exponente_staleness
+        self.registro = RegistroJSONL(fichero_log) # Una línea por versión, entera (ver comun/registro.py)
+
+        self.version = 0
+        self.versiones = {} # version -> lista de ndarrays (sólo las que algún cliente sigue usando)
+        self.bases = {} # cid -> versión sobre la que está entrenando ese cliente
+        self.lock = threading.Lock()
+
+        # Estado de la evaluación federada "oportunista"
+        self.version_eval = None
+        self.ultima_evaluada = None
+        self.resultados_eval = []
+        self.clientes_evaluados = set()
+
+    # ---------- Trabajo de cada cliente (se ejecuta en un hilo) ----------
+
+    def _trabajo_cliente(self, proxy, timeout):
+        """Evalúa la versión pendiente (si la hay y no la ha evaluado) y después entrena con la versión más reciente."""
+        resultado_eval = None
+        with self.lock:
+            version_eval = self.version_eval
+            evaluar = version_eval is not None and proxy.cid not in self.clientes_evaluados
+            if evaluar:
+                self.clientes_evaluados.add(proxy.cid)
+                pesos_eval = self.versiones[version_eval]
+        if evaluar:
+            config = self.strategy.on_evaluate_config_fn(version_eval) if self.strategy.on_evaluate_config_fn else {}
+            ins = EvaluateIns(ndarrays_a_parameters(pesos_eval), config)
+            resultado_eval = (version_eval, proxy.evaluate(ins, timeout=timeout))
+
+        with self.lock:
+            version = self.version
+            pesos = self.versiones[version]
+            self.bases[proxy.cid] = version
+        config = self.strategy.on_fit_config_fn(version + 1) if self.strategy.on_fit_config_fn else {}
+        config["server_round"] = version + 1
+        parametros = ndarrays_a_parameters(pesos)
+        self.strategy.parametros_ronda[version] = parametros # Base para decodificar deltas comprimidos
+        fit_res = proxy.fit(FitIns(parametros, config), timeout=timeout)
+        return resultado_eval, version, fit_res
+
+    # ---------- Agregación ----------
+
+    def _agregar(self, buffer):
+        """FedBuff: nuevo = actual + eta * sum(n_i * s(tau_i) * delta_i) / sum(n_i)."""
+        actual = self.versiones[self.version]
+        acumulado = [np.zeros_like(w, dtype=np.float64) for w in actual]
+        total_muestras = 0
+        for pesos, version_base, num_examples in buffer:
+            staleness = self.version - version_base
+            factor = num_examples / (1.0 + staleness) ** self.exponente_staleness
+            for acc, w, base in zip(acumulado, pesos, self.versiones[version_base]):
+                acc += factor * (w - base)
+            total_muestras += num_examples
+        return [(w + self.eta * acc / total_muestras).astype(w.dtype) for w, acc in zip(actual, acumulado)]
+
+    def _finalizar_evaluacion(self, history):
+        """Agrega los resultados de evaluación acumulados para version_eval (escribe global_results.json)."""
+        if self.version_eval is None or not self.resultados_eval:
+            return
+        loss, metricas = self.strategy.aggregate_evaluate(self.version_eval, self.resultados_eval, [])
+        if loss is not None:
+            history.add_loss_distributed(server_round=self.version_eval, loss=loss)
+            history.add_metrics_distributed(server_round=self.version_eval, metrics=metricas)
+        self.ultima_evaluada = self.version_eval
+        self.resultados_eval = []
+        # La siguiente evaluación será sobre la próxima versión nueva.
+        self.version_eval = self.version if self.version != self.ultima_evaluada else None
+        self.clientes_evaluados = set()
+
+    def _liberar_versiones(self):
+        """Olvida las versiones que ya no son base de ningún entrenamiento en curso. Llamar con self.lock."""
+        usadas = {self.version, self.version_eval} | set(self.bases.values())
+        for v in list(self.versiones):
+            if v not in usadas:
+                del self.versiones[v]
+                self.strategy.parametros_ronda.pop(v, None)
+
+    @staticmethod
+    def _combinar_compresion(compresiones):
+        """Estadísticas de compresión de una versión a partir de las de cada actualización (_decodificar_resultados)."""
+        if not compresiones:
+            return None
+        bytes_originales = sum(c["bytes_originales"] for c in compresiones)
+        bytes_codificados = sum(c["bytes_codificados"] for c in compresiones)
+        clientes = sum(c["clientes_comprimidos"] for c in compresiones)
+        combinadas = {
+            "codec": sorted(set().union(*(c["codec"] for c in compresiones))),
+            "clientes_comprimidos": clientes,
+            "ratio_compresion": bytes_originales / max(bytes_codificados, 1),
+            "bytes_originales": bytes_originales,
+            "bytes_codificados": bytes_codificados,
+            "t_codificar_medio": sum(c["t_codificar_medio"] * c["clientes_comprimidos"] for c in compresiones) / clientes,
+            "t_decodificar_total": sum(c["t_decodificar_total"] for c in compresiones),
+            "error_relativo_medio": sum(c["error_relativo_medio"] * c["clientes_comprimidos"] for c in compresiones) / clientes,
+        }
+        medidos = [c for c in compresiones if "clientes_impacto" in c]
+        if medidos:
+            clientes_impacto = sum(c["clientes_impacto"] for c in medidos)
+            combinadas["clientes_impacto"] = clientes_impacto
+            for clave in ("accuracy_sin_comprimir_media", "accuracy_comprimido_media", "impacto_accuracy_medio"):
+                combinadas[clave] = sum(c[clave] * c["clientes_impacto"] for c in medidos) / clientes_impacto
+        return combinadas
+
+    def _esperar_clientes(self, ronda):
+        """Espera a los clientes mínimos. False si no han llegado (con ControlRondas, como mucho CLIENT_WAIT_TIMEOUT)."""
+        if self.control is None:
+            return self._client_manager.wait_for(self.strategy.min_available_clients)
+        return self.control.preparar("fit", ronda, self.strategy, self._client_manager)
+
+    # ---------- Bucle principal ----------
+
+    def fit(self, num_rounds, timeout):
+        history = History()
+        self.version = self.strategy.ronda_inicial # > 0 si se ha reanudado desde un checkpoint
+        inicio = time.perf_counter()
+        # Los pesos iniciales se piden a un cliente: primero se espera a los mínimos (acotado con ControlRondas).
+        sin_clientes = not self._esperar_clientes(self.version + 1)
+        if not sin_clientes:
+            self.parameters = self._get_initial_parameters(timeout=timeout)
+            self.versiones[self.version] = parameters_a_ndarrays(self.parameters)
+
+        en_curso = {} # future -> cid
+        proxies = {} # cid -> proxy al que se envió el trabajo (sigue valiendo aunque se haya desconectado)
+        ultimo_resultado = {} # cid -> instante en que entregó su último resultado
+        nombres = {} # cid -> client_id que el cliente envía en sus métricas
+        buffer, info_buffer, ociosos, compresiones = [], [], {}, []
+        actualizaciones = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers or 256) as executor:
+            while not sin_clientes and self.version < num_rounds and \
+                    (self.control is None or self.control.parar() is None):
+                # 1. Dar trabajo a todos los clientes conectados que estén libres (incluidos los que llegan tarde).
+                ocupados = set(en_curso.values())
+                for cid, proxy in list(self._client_manager.all().items()):
+                    if cid in ocupados:
+                        continue
+                    if cid in ultimo_resultado:
+                        nombre = str(nombres.get(cid, cid))
+                        ociosos[nombre] = ociosos.get(nombre, 0.0) + time.perf_counter() - ultimo_resultado[cid]
+                    with self.lock:
+                        self.bases[cid] = self.version
+                    futuro = executor.submit(self._trabajo_cliente, proxy, timeout)
+                    en_curso[futuro] = cid
+                    proxies[cid] = proxy
+
+                # 2. Esperar al primero que termine (con timeout para detectar clientes nuevos). Si no hay nadie
+                #    trabajando es que no queda ningún cliente conectado: se espera a que vuelvan en lugar de dar vueltas.
+                if not en_curso:
+                    sin_clientes = not self._esperar_clientes(self.version + 1)
+                    continue
+                hechos, _ = concurrent.futures.wait(list(en_curso), timeout=1.0,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for futuro in hechos:
+                    cid = en_curso.pop(futuro)
+                    ultimo_resultado[cid] = time.perf_counter()
+                    try:
+                        resultado_eval, version_base, fit_res = futuro.result()
+                    except Exception as e:
+                        print(f"[ASYNC] Cliente {cid} falló: {e}")
+                        with self.lock:
+                            self.bases.pop(cid, None)
+                        continue
+
+                    if resultado_eval is not None and resultado_eval[0] == self.version_eval:
+                        self.resultados_eval.append((proxies[cid], resultado_eval[1]))
+                        if len(self.resultados_eval) >= self.strategy.min_evaluate_clients:
+                            self._finalizar_evaluacion(history)
+
+                    # Deltas comprimidos: se reconstruyen sobre la versión que recibió el cliente.
+                    compresion = self.strategy._decodificar_resultados(version_base, [(None, fit_res)])
+                    if compresion is not None:
+                        compresiones.append(compresion)
+                    buffer.append((parameters_a_ndarrays(fit_res.parameters), version_base, fit_res.num_examples))
+                    nombres[cid] = fit_res.metrics.get("client_id", cid)
+                    info_buffer.append({
+                        "client_id": nombres[cid],
+                        "staleness": self.version - version_base,
+                        "muestras": fit_res.num_examples,
+                        **extraer_perfilado(fit_res.metrics), # Tiempos por fase si el cliente tiene PROFILE=True
+                    })
+                    actualizaciones += 1
+                    with self.lock:
+                        self.bases.pop(cid, None)
+
+                # 3. Con K actualizaciones en el buffer, nueva versión del modelo.
+                if len(buffer) >= self.tamano_buffer:
+                    with self.lock:
+                        nuevos = self._agregar(buffer)
+                        self.version += 1
+                        self.versiones[self.version] = nuevos
+                        self.parameters = ndarrays_a_parameters(nuevos)
+                        if self.version_eval is None or not self.resultados_eval:
+                            # Nadie ha entregado aún la evaluación pendiente: pasamos a la versión más reciente.
+                            self.version_eval = self.version
+                            self.clientes_evaluados = set()
+                        self._liberar_versiones()
+                    self.strategy.guardar_checkpoint(self.version, self.parameters)
+
+                    transcurrido = time.perf_counter() - inicio
+                    registro = {
+                        "version": self.version,
+                        "tiempo": transcurrido,
+                        "actualizaciones": info_buffer,
+                        "staleness_media": float(np.mean([i["staleness"] for i in info_buffer])),
+                        "tiempo_ocioso": ociosos,
+                        "actualizaciones_por_minuto": 60.0 * actualizaciones / transcurrido,
+                    }
+                    compresion = self._combinar_compresion(compresiones)
+                    if compresion is not None:
+                        registro["compresion"] = compresion
+                    self.registro.escribir(registro)
+                    print(f"[ASYNC] Versión {self.version} | Staleness media: {registro['staleness_media']:.2f} | "
+                          f"Actualizaciones/min: {registro['actualizaciones_por_minuto']:.1f}")
+                    buffer, info_buffer, ociosos, compresiones = [], [], {}, []
+
+            # Fin: esperamos a los entrenamientos en curso (se descartan) y evaluamos la última versión con todos.
+            concurrent.futures.wait(list(en_curso))
+
+        self._finalizar_evaluacion(history)
+        # Sin clientes no se evalúa: configure_evaluate volvería a esperarlos sin límite.
+        if not sin_clientes and self.ultima_evaluada != self.version and \
+                (self.control is None or self.control.preparar("evaluate", self.version, self.strategy,
+                                                               self._client_manager)):
+            res_fed = self.evaluate_round(server_round=self.version, timeout=timeout)
+            if res_fed and res_fed[0] is not None:
+                history.add_loss_distributed(server_round=self.version, loss=res_fed[0])
+                history.add_metrics_distributed(server_round=self.version, metrics=res_fed[1])
+
+        print(f"[ASYNC] {actualizaciones} actualizaciones en {time.perf_counter() - inicio:.1f}s")
+        if self.control is not None:
+            fin = self.control.resumen(self.version, num_rounds, time.perf_counter() - inicio)
+            if self.control.escribir is not None:
+                self.control.escribir({"ronda": self.version, "fin": fin})
+            print(f"[CONTROL] Fin: {fin['motivo']} | Versión {self.version} de {num_rounds} en {fin['t_total']:.1f}s")
+        return history
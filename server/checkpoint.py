@@ -0,0 +1,155 @@
+"""
+**Checkpoints del modelo global y reanudación**
+
+Si el contenedor fl-server muere, start_server vuelve a empezar en la ronda 1 y se pierde todo lo que habían
+entrenado los clientes. Aquí se guarda el modelo agregado al final de cada ronda:
+
+- Cada K rondas (cada_completo) una copia completa: el vector de parámetros en float32 (.npy).
+- Entre medias sólo el delta respecto a la ronda anterior, en float16 (la mitad de bytes).
+  El delta se calcula contra el modelo RECONSTRUIDO (no contra el real), así que el error de redondeo no se acumula
+  a lo largo de la cadena: restaurar la ronda r da exactamente lo mismo que se reconstruyó al guardarla, y el error
+  frente al modelo real es el de un solo redondeo a float16 del último delta.
+- indice.json lista los checkpoints (ronda, tipo, fichero, bytes) y las formas de las capas. Se reescribe de forma
+  atómica, así que un corte a mitad de escritura deja el índice anterior válido. Los ficheros que salen del índice
+  se borran después de escribir el nuevo: el índice en disco nunca apunta a un fichero borrado.
+
+Sólo se conservan las últimas `conservar` cadenas (completo + sus deltas).
+
+restaurar() devuelve la última ronda y sus pesos: completo más anterior + deltas en orden.
+La reanudación del bucle de rondas a partir de la ronda restaurada la hace ServidorControlado (control.py).
+"""
+import os
+import json
+import time
+import numpy as np
+
+from comun.compresion import aplanar, desaplanar
+
+
+FORMATO = 1
+
+
+class GestorCheckpoints:
+
+    def __init__(self, directorio, cada_completo=5, tipo_delta="float16", conservar=2):
+        self.directorio = directorio
+        self.cada_completo = cada_completo
+        self.tipo_delta = np.dtype(tipo_delta)
+        self.conservar = conservar
+        os.makedirs(directorio, exist_ok=True)
+        self.indice = self._leer_indice()
+        self.reconstruido = None # Vector de la última ronda guardada, tal y como se restauraría
+        self.ronda_completo = None # Ronda del último checkpoint completo
+
+    # ---------- Índice ----------
+
+    def _ruta(self, fichero):
+        return os.path.join(self.directorio, fichero)
+
+    def _leer_indice(self):
+        ruta = self._ruta("indice.json")
+        if os.path.exists(ruta):
+            with open(ruta) as f:
+                indice = json.load(f)
+            if indice.get("formato") == FORMATO:
+                return indice
+        return {"formato": FORMATO, "formas": None, "checkpoints": []}
+
+    def _escribir_indice(self):
+        temporal = self._ruta("indice.json.tmp")
+        with open(temporal, "w") as f:
+            json.dump(self.indice, f)
+        os.replace(temporal, self._ruta("indice.json"))
+
+    def ultima_ronda(self):
+        return self.indice["checkpoints"][-1]["ronda"] if self.indice["checkpoints"] else None
+
+    def reiniciar(self):
+        """Borra los checkpoints de una ejecución anterior (se empieza desde cero sin reanudar)."""
+        sobrantes = self.indice["checkpoints"]
+        self.indice = {"formato": FORMATO, "formas": None, "checkpoints": []}
+        self.reconstruido, self.ronda_completo = None, None
+        self._escribir_indice()
+        self._borrar(sobrantes)
+
+    def _borrar(self, entradas):
+        """Borra los ficheros de unas entradas que ya no están en el índice escrito."""
+        for entrada in entradas:
+            if os.path.exists(self._ruta(entrada["fichero"])):
+                os.remove(self._ruta(entrada["fichero"]))
+
+    # ---------- Guardar ----------
+
+    def guardar(self, ronda, pesos):
+        """Guarda los pesos agregados de `ronda`. Devuelve estadísticas (tipo, bytes, t_escritura)."""
+        inicio = time.perf_counter()
+        vector, formas = aplanar(pesos)
+        formas = [list(forma) for forma in formas]
+        completo = (
+            self.reconstruido is None
+            or formas != self.indice["formas"]
+            or ronda != self.ultima_ronda() + 1
+            or ronda - self.ronda_completo >= self.cada_completo
+        )
+
+        if completo:
+            fichero, datos = f"r{ronda:06d}_completo.npy", vector
+            self.reconstruido = vector.copy()
+            self.ronda_completo = ronda
+        else:
+            fichero, datos = f"r{ronda:06d}_delta.npy", (vector - self.reconstruido).astype(self.tipo_delta)
+            self.reconstruido += datos.astype(np.float32)
+        np.save(self._ruta(fichero), datos)
+
+        self.indice["formas"] = formas
+        self.indice["checkpoints"].append({
+            "ronda": ronda, "tipo": "completo" if completo else "delta", "fichero": fichero, "bytes": int(datos.nbytes)
+        })
+        sobrantes = self._podar()
+        self._escribir_indice()
+        self._borrar(sobrantes)
+        return {
+            "tipo": "completo" if completo else "delta",
+            "bytes": int(datos.nbytes),
+            "bytes_modelo": int(vector.nbytes),
+            "t_escritura": time.perf_counter() - inicio,
+        }
+
+    def _podar(self):
+        """
+        Deja en el índice sólo las `conservar` cadenas más recientes. Devuelve las entradas que salen: sus ficheros se
+        borran después de escribir el índice.
+        """
+        completos = [i for i, e in enumerate(self.indice["checkpoints"]) if e["tipo"] == "completo"]
+        if len(completos) <= self.conservar:
+            return []
+        corte = completos[-self.conservar]
+        sobrantes = self.indice["checkpoints"][:corte]
+        self.indice["checkpoints"] = self.indice["checkpoints"][corte:]
+        return sobrantes
+
+    # ---------- Restaurar ----------
+
+    def restaurar(self):
+        """(ronda, pesos, estadísticas) de la última ronda guardada, o None si no hay checkpoints."""
+        checkpoints = self.indice["checkpoints"]
+        if not checkpoints:
+            return None
+        inicio = time.perf_counter()
+        base = max(i for i, e in enumerate(checkpoints) if e["tipo"] == "completo")
+        vector = np.load(self._ruta(checkpoints[base]["fichero"])).astype(np.float32)
+        for entrada in checkpoints[base + 1:]:
+            vector += np.load(self._ruta(entrada["fichero"])).astype(np.float32)
+
+        self.reconstruido = vector.copy()
+        self.ronda_completo = checkpoints[base]["ronda"]
+        ronda = checkpoints[-1]["ronda"]
+        estadisticas = {
+            "ronda": ronda,
+            "deltas_aplicados": len(checkpoints) - base - 1,
+            "bytes_leidos": int(sum(e["bytes"] for e in checkpoints[base:])),
+            "bytes_modelo": int(vector.nbytes),
+            "t_restauracion": time.perf_counter() - inicio,
+        }
+        return ronda, desaplanar(vector, self.indice["formas"]), estadisticas
+
@@ -0,0 +1,223 @@
+"""
+**Control de rondas: parada temprana y espera acotada a los clientes**
+
+Con fl.server.Server el servidor hace siempre NUM_ROUNDS rondas, aunque la accuracy lleve varias rondas sin moverse,
+y si quedan vivos menos de `min_fit_clients` se queda esperando (SimpleClientManager.wait_for espera hasta un día)
+sin escribir nada ni terminar.
+
+ControlRondas decide entre rondas:
+
+1. Parada temprana con la serie de la métrica global (STOP_METRIC, "accuracy" o "f1_score") que escriben
+   weighted_average / evaluacion_central en global_results.json (la del holdout si el servidor evalúa):
+   - "objetivo": la métrica llega a TARGET_METRIC.
+   - "meseta":   PLATEAU_ROUNDS evaluaciones seguidas sin mejorar la mejor en más de PLATEAU_DELTA.
+   Cuenta evaluaciones, no rondas: con FED_EVAL_EVERY=k una evaluación son k rondas.
+2. Antes de cada fase (fit y evaluate) espera a los clientes mínimos como mucho CLIENT_WAIT_TIMEOUT segundos.
+   Si no llegan:
+   - con ADAPT_MIN_CLIENTS=True la flota pasa a ser la de clientes conectados y los mínimos de la estrategia
+     (min_fit_clients, min_available_clients, min_evaluate_clients) se recalculan con MIN_CLIENTS_FRACTION sobre ella,
+     nunca por debajo de MIN_CLIENTS_FLOOR ni por encima de los configurados. Si vuelven clientes la flota crece otra
+     vez y con ella los mínimos.
+   - si aun así no hay bastantes: NO_CLIENTS_ACTION="terminar" acaba el entrenamiento ("sin_clientes") y
+     "pausar" sigue esperando en tramos de CLIENT_WAIT_TIMEOUT (una línea "pausa" por tramo) hasta MAX_PAUSES
+     tramos (0 = sin límite) antes de terminar.
+
+ServidorControlado es el bucle de fl.server.Server.fit con estas comprobaciones. Empieza en strategy.ronda_inicial + 1,
+así que también sirve para reanudar desde un checkpoint. Al acabar, por el motivo que sea ("rondas_completadas",
+"objetivo", "meseta" o "sin_clientes"), escribe en global_results.json una línea {"ronda": ..., "fin": {...}} con el
+motivo, y Flower desconecta a los clientes como al final de siempre. Tras un "sin_clientes" se puede seguir con
+RESUME=True desde el último checkpoint.
+"""
+import time
+import flwr as fl
+from flwr.server.history import History
+
+ESPERA_INDEFINIDA = 86400 # La que usa SimpleClientManager por defecto (un día)
+
+
+class ControlRondas:
+
+    def __init__(self, total_clientes, metrica="accuracy", objetivo=0.0, paciencia=0, delta=0.001, espera=600.0,
+                 accion="terminar", max_pausas=0, adaptar=False, fraccion=0.6, minimo=1, escribir=None):
+        self.metrica = metrica # Clave de metricas_globales que se sigue
+        self.objetivo = objetivo # 0 = sin objetivo
+        self.paciencia = paciencia # Evaluaciones sin mejorar antes de parar. 0 = sin parada por meseta
+        self.delta = delta # Mejora mínima que cuenta como mejora
+        self.espera = espera # Segundos de espera a los clientes por fase. 0 = indefinida (como Flower)
+        self.accion = accion # "terminar" o "pausar"
+        self.max_pausas = max_pausas # Tramos de espera seguidos en pausa antes de terminar. 0 = sin límite
+        self.adaptar = adaptar
+        self.fraccion = fraccion # MIN_CLIENTS_FRACTION, aplicada a la flota viva
+        self.minimo = minimo # Por debajo de este número de clientes no se entrena
+        self.escribir = escribir # Función que añade una línea a global_results.json
+
+        self.flota = total_clientes # Clientes que se consideran vivos
+        self.total_clientes = total_clientes
+        self.configurados = None # Mínimos de la estrategia al empezar (el tope de los adaptados)
+        self.serie = [] # (ronda, valor de la métrica)
+        self.mejor = None
+        self.ronda_mejor = None
+        self.sin_mejora = 0 # Evaluaciones seguidas sin mejorar a la mejor
+        self.pausas = 0
+        self.adaptaciones = 0
+        self.motivo = None # Motivo de parada (None = seguir)
+        self.detalle = None # Qué faltaba cuando se paró por falta de clientes
+
+    # ---------- Parada temprana ----------
+
+    def registrar(self, ronda, metricas):
+        """Añade la métrica global de una ronda evaluada y decide si se ha llegado al objetivo o a una meseta."""
+        valor = metricas.get(self.metrica)
+        if valor is None:
+            return
+        self.serie.append((ronda, float(valor)))
+        if self.mejor is None or valor > self.mejor + self.delta:
+            self.mejor, self.ronda_mejor, self.sin_mejora = float(valor), ronda, 0
+        else:
+            self.sin_mejora += 1
+
+        if self.objetivo > 0 and valor >= self.objetivo:
+            self.motivo = "objetivo"
+            print(f"[CONTROL] Ronda {ronda} | {self.metrica} {valor:.4f} >= objetivo {self.objetivo:.4f}")
+        elif self.paciencia > 0 and self.sin_mejora >= self.paciencia:
+            self.motivo = "meseta"
+            print(f"[CONTROL] Ronda {ronda} | {self.sin_mejora} evaluaciones sin mejorar {self.metrica} "
+                  f"{self.mejor:.4f} (ronda {self.ronda_mejor}) en más de {self.delta}")
+
+    def parar(self):
+        """Motivo para no empezar otra ronda, o None."""
+        return self.motivo
+
+    # ---------- Clientes disponibles ----------
+
+    def _necesarios(self, fase):
+        configurado = self.configurados[fase]
+        if not self.adaptar:
+            return configurado
+        return min(configurado, max(self.minimo, int(self.flota * self.fraccion)))
+
+    def _aplicar(self, strategy, ronda):
+        """Ajusta los mínimos de la estrategia a la flota actual y lo anota en la ronda si han cambiado."""
+        minimos = {"min_fit_clients": self._necesarios("fit"), "min_available_clients": self._necesarios("fit"),
+                   "min_evaluate_clients": self._necesarios("evaluate")}
+        if all(getattr(strategy, clave) == valor for clave, valor in minimos.items()):
+            return
+        for clave, valor in minimos.items():
+            setattr(strategy, clave, valor)
+        self.adaptaciones += 1
+        strategy.estadisticas_fit.setdefault(ronda, {})["clientes_minimos"] = {"flota": self.flota, **minimos}
+        print(f"[CONTROL] Ronda {ronda} | Flota: {self.flota} clientes | Mínimos: fit {minimos['min_fit_clients']}, "
+              f"evaluate {minimos['min_evaluate_clients']}")
+
+    def preparar(self, fase, ronda, strategy, client_manager):
+        """
+        Espera a los clientes que necesita la fase ("fit" o "evaluate"). True si se puede seguir; False si no hay
+        bastantes (self.motivo = "sin_clientes").
+        """
+        if self.configurados is None:
+            self.configurados = {"fit": max(strategy.min_fit_clients, strategy.min_available_clients),
+                                 "evaluate": strategy.min_evaluate_clients}
+        if self.adaptar and client_manager.num_available() > self.flota:
+            self.flota = min(self.total_clientes, client_manager.num_available()) # Han vuelto clientes
+
+        pausas = 0
+        while True:
+            self._aplicar(strategy, ronda)
+            necesarios = self._necesarios(fase)
+            inicio = time.perf_counter()
+            if client_manager.wait_for(necesarios, timeout=self.espera if self.espera > 0 else ESPERA_INDEFINIDA):
+                return True
+
+            vivos = client_manager.num_available()
+            if self.adaptar and self.minimo <= vivos < self.flota:
+                self.flota = vivos
+                continue
+
+            falta = {"fase": fase, "necesarios": necesarios, "disponibles": vivos,
+                     "t_espera": time.perf_counter() - inicio}
+            if self.accion == "pausar" and (self.max_pausas == 0 or pausas < self.max_pausas):
+                pausas += 1
+                self.pausas += 1
+                print(f"[CONTROL] Ronda {ronda} ({fase}) en pausa | {vivos}/{necesarios} clientes tras "
+                      f"{falta['t_espera']:.0f}s | Pausa {pausas}")
+                if self.escribir is not None:
+                    self.escribir({"ronda": ronda, "pausa": dict(falta, pausa=pausas)})
+                continue
+
+            self.motivo, self.detalle = "sin_clientes", falta
+            print(f"[CONTROL] Ronda {ronda} ({fase}) | Sólo {vivos}/{necesarios} clientes tras "
+                  f"{falta['t_espera']:.0f}s: fin del entrenamiento")
+            return False
+
+    # ---------- Fin ----------
+
+    def resumen(self, ultima_ronda, num_rounds, t_total):
+        """La línea "fin" de global_results.json."""
+        fin = {
+            "motivo": self.motivo or "rondas_completadas",
+            "ultima_ronda": ultima_ronda,
+            "rondas_maximas": num_rounds,
+            "t_total": t_total,
+            "metrica": self.metrica,
+            "valor_final": self.serie[-1][1] if self.serie else None,
+            "mejor": self.mejor,
+            "ronda_mejor": self.ronda_mejor,
+            "pausas": self.pausas,
+            "flota": self.flota,
+        }
+        if self.detalle is not None:
+            fin["sin_clientes"] = self.detalle
+        return fin
+
+
+class ServidorControlado(fl.server.Server):
+    """
+    Servidor síncrono de Flower con ControlRondas entre fases. Empieza en la ronda siguiente al checkpoint
+    (strategy.ronda_inicial, 0 sin reanudar) para que global_results.json siga con la numeración correcta; los pesos
+    restaurados llegan por strategy.initialize_parameters.
+    """
+
+    def __init__(self, *, client_manager, strategy, control):
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.control = control
+
+    def fit(self, num_rounds, timeout):
+        history = History()
+        primera = self.strategy.ronda_inicial + 1
+        if primera > 1:
+            print(f"[CHECKPOINT] Reanudando en la ronda {primera} de {num_rounds}")
+
+        inicio = time.perf_counter()
+        ultima = primera - 1
+        # Los pesos iniciales se piden a un cliente: también se espera como mucho CLIENT_WAIT_TIMEOUT.
+        if self.control.preparar("fit", primera, self.strategy, self._client_manager):
+            self.parameters = self._get_initial_parameters(timeout=timeout)
+            for ronda in range(primera, num_rounds + 1):
+                if not self.control.preparar("fit", ronda, self.strategy, self._client_manager):
+                    break
+                res_fit = self.fit_round(server_round=ronda, timeout=timeout)
+                if res_fit and res_fit[0]:
+                    self.parameters = res_fit[0]
+
+                res_cen = self.strategy.evaluate(ronda, parameters=self.parameters)
+                if res_cen is not None:
+                    history.add_loss_centralized(server_round=ronda, loss=res_cen[0])
+                    history.add_metrics_centralized(server_round=ronda, metrics=res_cen[1])
+
+                if self.strategy.evalua_federada(ronda) and \
+                        not self.control.preparar("evaluate", ronda, self.strategy, self._client_manager):
+                    break
+                res_fed = self.evaluate_round(server_round=ronda, timeout=timeout)
+                if res_fed and res_fed[0]:
+                    history.add_loss_distributed(server_round=ronda, loss=res_fed[0])
+                    history.add_metrics_distributed(server_round=ronda, metrics=res_fed[1])
+
+                ultima = ronda
+                if self.control.parar() is not None:
+                    break
+
+        fin = self.control.resumen(ultima, num_rounds, time.perf_counter() - inicio)
+        if self.control.escribir is not None:
+            self.control.escribir({"ronda": ultima, "fin": fin})
+        print(f"[CONTROL] Fin: {fin['motivo']} | Rondas {primera}-{ultima} de {num_rounds} en {fin['t_total']:.1f}s")
+        return history
@@ -0,0 +1,391 @@
+"""
+**Estrategia del servidor**
+
+Extiende FedAvg de Flower con lo que necesita este proyecto, sin cambiar la agregación en sí:
+
+1. Decodificación de actualizaciones comprimidas.
+   Si un cliente envía su delta comprimido (métrica "codec" distinta de "none", ver comun/compresion.py),
+   lo reconstruimos sumándolo a los parámetros globales de esa ronda ANTES de que FedAvg agregue.
+   Así FedAvg siempre ve pesos completos y los clientes sin compresión siguen funcionando igual.
+
+2. Estadísticas por ronda (estadisticas_fit) que server.py añade a global_results.json, entre ellas la duración
+   de la ronda (t_ronda: desde que se envía el fit hasta que se agrega la evaluación) y de la agregación (t_agregacion).
+
+3. La ronda real de cada evaluación (ronda_evaluacion) y de cada fit (ronda_fit), para que las funciones de agregación
+   de métricas de server.py no dependan de contar llamadas (en modo asíncrono no se evalúan todas las versiones).
+
+4. Agregación robusta opcional (trimmed mean, mediana, Krum, Multi-Krum y pre-filtro por norma), ver robusta.py.
+   Con agregacion="fedavg" y sin filtro se usa la media ponderada de Flower (aggregate), deserializando sin copias
+   (ver comun/parametros.py), o la suma incremental si el servidor entrega cada resultado al llegar (acumular, ver
+   incremental.py). Las subidas en trozos se suman trozo a trozo (acumular_trozos, ver transferencia.py).
+
+5. Selección de clientes según sus recursos (opcional, ver seleccion.py). Sin selector se muestrea como FedAvg.
+
+6. Checkpoint del modelo agregado en cada ronda y reanudación desde el último (opcional, ver checkpoint.py).
+   Los pesos restaurados se entregan como parámetros iniciales (initialize_parameters).
+
+7. Evaluación federada cada `evaluacion_cada` rondas (en las demás configure_evaluate no elige a nadie). Pensado para
+   cuando el servidor evalúa en su propio holdout (evaluate_fn, ver evaluacion.py).
+
+8. Bajada por versiones (opcional, ver comun/descarga.py): cada cliente recibe sólo el delta desde la versión que
+   ya tiene, o nada si ya está al día. Los clientes que piden "sincronizar" se quitan de los resultados y reciben el
+   modelo completo la próxima vez. Los bytes de bajada de cada fase se guardan en estadisticas_fit ("descarga").
+"""
+import time
+import threading
+import numpy as np
+import flwr as fl
+from flwr.common import FitIns, EvaluateIns, Parameters
+from flwr.server.strategy.aggregate import aggregate
+
+from comun.compresion import aplanar, desaplanar, decodificar
+from comun.parametros import parameters_a_ndarrays, ndarrays_a_parameters
+from comun.agregacion import AcumuladorFedAvg
+from robusta import agregar_robusto
+
+ACUMULADO = "acumulado" # tensor_type de un FitRes cuyos parámetros ya se han sumado y liberado (ver acumular)
+
+
+def _bytes(parameters):
+    """Bytes de unos Parameters de Flower ya serializados (lo que viaja por la red)."""
+    return sum(len(tensor) for tensor in parameters.tensors)
+
+
+class FedAvgTFM(fl.server.strategy.FedAvg):
+
+    def __init__(self, *args, agregacion="fedavg", robusto_f=1, beta_recorte=0.2, factor_norma=0.0, selector=None,
+                 checkpoints=None, evaluacion_cada=1,
+                 versiones=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.agregacion = agregacion # "fedavg", "trimmed_mean", "median", "krum" o "multikrum"
+        self.robusto_f = robusto_f # Número de atacantes que se asume (Krum)
+        self.beta_recorte = beta_recorte # Fracción que se recorta por cada extremo (trimmed mean)
+        self.factor_norma = factor_norma # Pre-filtro: descarta normas > factor x mediana. 0 = desactivado
+        self.selector = selector # SelectorRecursos o None (todos los clientes, como FedAvg)
+        self.checkpoints = checkpoints # GestorCheckpoints o None
+        self.evaluacion_cada = evaluacion_cada # La evaluación federada se hace sólo en las rondas múltiplo de este valor
+        self.versiones = versiones # CacheVersiones o None (modelo completo a todos, como FedAvg)
+        self.agregados = None # Últimos parámetros agregados que se han publicado como versión...
+        self.publicados = None # ...y los que reconstruyen los clientes a partir de los deltas
+        self.enviados = {"fit": set(), "evaluate": set()} # cids a los que se ha enviado el modelo en cada fase
+        self.ronda_inicial = 0 # Última ronda restaurada de un checkpoint (0 = se empieza desde cero)
+        self.parametros_restaurados = None
+        self.parametros_ronda = {} # server_round -> parámetros globales enviados en esa ronda
+        self.base_ronda = None # (server_round, vector, formas) de los parámetros globales, para decodificar deltas
+        self.acumuladores = {} # server_round -> AcumuladorFedAvg con los resultados sumados al llegar
+        self.t_decodificar = {} # server_round -> segundos decodificando actualizaciones comprimidas
+        self.estadisticas_fit = {} # server_round -> dict con estadísticas para global_results.json
+        self.ronda_evaluacion = 0 # Ronda cuya evaluación se está agregando
+        self.ronda_fit = 0 # Ronda cuyo fit se está agregando
+        self.inicio_ronda = {} # server_round -> instante (perf_counter) en que se configuró el fit
+        self.inicio_evaluacion = None # Instante en que se configuró la última evaluación (selector)
+        self.cerrojo = threading.Lock() # Los trozos de las subidas se suman desde el hilo de cada cliente
+
+    def reanudar(self):
+        """Carga el último checkpoint. Devuelve la ronda restaurada (0 si no había ninguno)."""
+        restaurado = self.checkpoints.restaurar() if self.checkpoints else None
+        if restaurado is None:
+            return 0
+        self.ronda_inicial, pesos, estadisticas = restaurado
+        self.parametros_restaurados = ndarrays_a_parameters(pesos)
+        self.estadisticas_fit.setdefault(self.ronda_inicial + 1, {})["reanudacion"] = estadisticas
+        print(f"[CHECKPOINT] Restaurada la ronda {self.ronda_inicial} en {estadisticas['t_restauracion'] * 1000:.1f}ms "
+              f"({estadisticas['deltas_aplicados']} deltas, {estadisticas['bytes_leidos']} bytes leídos)")
+        return self.ronda_inicial
+
+    def initialize_parameters(self, client_manager):
+        # Con un checkpoint restaurado no se piden los pesos iniciales a un cliente.
+        if self.parametros_restaurados is not None:
+            return self.parametros_restaurados
+        return super().initialize_parameters(client_manager)
+
+    def guardar_checkpoint(self, server_round, parametros):
+        if self.checkpoints is None or parametros is None:
+            return
+        estadisticas = self.checkpoints.guardar(server_round, parameters_a_ndarrays(parametros))
+        self.estadisticas_fit.setdefault(server_round, {})["checkpoint"] = estadisticas
+
+    def configure_fit(self, server_round, parameters, client_manager):
+        parameters = self._publicar(parameters)
+        # Guardamos los pesos globales que reciben los clientes: son la base de sus deltas.
+        self.parametros_ronda = {server_round: parameters}
+        self.acumuladores = {}
+        self.inicio_ronda = {server_round: time.perf_counter()}
+        if self.selector is None:
+            return self._versionar("fit", server_round, super().configure_fit(server_round, parameters, client_manager))
+
+        config = self.on_fit_config_fn(server_round) if self.on_fit_config_fn else {}
+        clientes = self._seleccionar("fit", server_round, client_manager, *self.num_fit_clients(client_manager.num_available()))
+        fit_ins = FitIns(parameters, config)
+        return self._versionar("fit", server_round, [(cliente, fit_ins) for cliente in clientes])
+
+    def evalua_federada(self, server_round):
+        """True si en esta ronda hay evaluación federada (en los clientes)."""
+        return self.fraction_evaluate > 0.0 and server_round % self.evaluacion_cada == 0
+
+    def configure_evaluate(self, server_round, parameters, client_manager):
+        if not self.evalua_federada(server_round):
+            return []
+        parameters = self._publicar(parameters)
+        if self.selector is None:
+            return self._versionar("evaluate", server_round, super().configure_evaluate(server_round, parameters, client_manager))
+
+        self.inicio_evaluacion = time.perf_counter()
+        config = self.on_evaluate_config_fn(server_round) if self.on_evaluate_config_fn else {}
+        clientes = self._seleccionar("evaluate", server_round, client_manager,
+                                     *self.num_evaluation_clients(client_manager.num_available()))
+        evaluate_ins = EvaluateIns(parameters, config)
+        return self._versionar("evaluate", server_round, [(cliente, evaluate_ins) for cliente in clientes])
+
+    def _publicar(self, parameters):
+        """Publica los parámetros agregados como versión nueva (una sola vez) y devuelve los que tendrán los clientes."""
+        if self.versiones is None:
+            return parameters
+        if parameters is not self.agregados: # Flower conserva el mismo objeto mientras no haya agregación nueva
+            self.agregados = parameters
+            self.publicados = ndarrays_a_parameters(self.versiones.publicar(parameters_a_ndarrays(parameters)))
+        return self.publicados
+
+    def _versionar(self, fase, server_round, instrucciones):
+        """Sustituye el modelo completo de cada instrucción por lo que le falta a ese cliente (delta, nada o completo)."""
+        if self.versiones is None or not instrucciones:
+            return instrucciones
+        bytes_completo = _bytes(self.publicados)
+        memoria = {} # (tipo, base) -> Parameters: los clientes con la misma versión comparten la serialización
+        cuentas = {"completo": 0, "delta": 0, "actual": 0}
+        nuevas = []
+        for cliente, ins in instrucciones:
+            tipo, arrays, base = self.versiones.preparar(cliente.cid)
+            if (tipo, base) not in memoria:
+                memoria[(tipo, base)] = self.publicados if tipo == "completo" else ndarrays_a_parameters(arrays)
+            config = dict(ins.config, descarga=tipo, version_modelo=self.versiones.version)
+            if base is not None:
+                config["version_base"] = base
+            nuevas.append((cliente, type(ins)(memoria[(tipo, base)], config)))
+            cuentas[tipo] += 1
+        self.enviados[fase] = {cliente.cid for cliente, _ in nuevas}
+
+        descarga = dict(cuentas, version=self.versiones.version, bytes_sin_versiones=bytes_completo * len(nuevas),
+                        bytes=sum(_bytes(ins.parameters) for _, ins in nuevas))
+        self.estadisticas_fit.setdefault(server_round, {}).setdefault("descarga", {})[fase] = descarga
+        print(f"[DESCARGA] Ronda {server_round} ({fase}) | v{descarga['version']} | completo: {cuentas['completo']}, "
+              f"delta: {cuentas['delta']}, actual: {cuentas['actual']} | {descarga['bytes'] / 1024:.1f} KB "
+              f"(sin versiones {descarga['bytes_sin_versiones'] / 1024:.1f} KB)")
+        return nuevas
+
+    def _confirmar_versiones(self, fase, server_round, results):
+        """Anota la versión que tiene cada cliente y quita de los resultados a los que piden sincronizar."""
+        if self.versiones is None:
+            return results
+        validos = [(proxy, res) for proxy, res in results if not res.metrics.get("sincronizar", False)]
+        for proxy, res in validos:
+            self.versiones.confirmar(proxy.cid, res.metrics.get("version_modelo"))
+        confirmados = {proxy.cid for proxy, _ in validos}
+        for cid in self.enviados[fase] - confirmados: # Fallos y peticiones de sincronizar
+            self.versiones.olvidar(cid)
+        if len(validos) < len(results):
+            descarga = self.estadisticas_fit.setdefault(server_round, {}).setdefault("descarga", {}).setdefault(fase, {})
+            descarga["fallos_cache"] = len(results) - len(validos)
+            print(f"[DESCARGA] Ronda {server_round} ({fase}) | {descarga['fallos_cache']} clientes sin la versión base: "
+                  f"modelo completo en la próxima")
+        return validos
+
+    def _quitar_vacios(self, results, failures):
+        """Los resultados sin muestras (un borde sin clientes que respondan, edge/edge.py) cuentan como fallos."""
+        vacios = [(proxy, res) for proxy, res in results if res.num_examples <= 0]
+        if not vacios:
+            return results, failures
+        return [(proxy, res) for proxy, res in results if res.num_examples > 0], list(failures) + vacios
+
+    def _seleccionar(self, fase, server_round, client_manager, num_clientes, min_clientes):
+        """Espera al mínimo de clientes y deja que el selector elija. La decisión se guarda en estadisticas_fit."""
+        client_manager.wait_for(min_clientes)
+        clientes, decision = self.selector.seleccionar(fase, list(client_manager.all().values()), num_clientes, min_clientes)
+        self.estadisticas_fit.setdefault(server_round, {})[f"seleccion_{fase}"] = decision
+        t_previsto = "?" if decision["t_previsto"] is None else f"{decision['t_previsto']:.2f}s"
+        print(f"[SELECCION] Ronda {server_round} ({fase}) | {len(clientes)}/{decision['disponibles']} clientes | "
+              f"Previsto: {t_previsto} | Etiquetas: {decision['etiquetas_cubiertas']}")
+        return clientes
+
+    def _registrar_seleccion(self, fase, server_round, inicio, results, failures):
+        """Tiempo real de la fase frente al previsto, y actualización del historial del selector."""
+        decision = self.estadisticas_fit.get(server_round, {}).get(f"seleccion_{fase}")
+        if self.selector is None or decision is None or inicio is None:
+            return
+        decision["t_real"] = time.perf_counter() - inicio
+        self.selector.registrar(fase, results, failures)
+        t_previsto = "?" if decision["t_previsto"] is None else f"{decision['t_previsto']:.2f}s"
+        print(f"[SELECCION] Ronda {server_round} ({fase}) | Previsto: {t_previsto} | Real: {decision['t_real']:.2f}s")
+
+    def _pesos(self, server_round, res):
+        """Pesos completos de un resultado: los recibidos o, si vienen comprimidos, los globales de la ronda + el delta."""
+        if res.metrics.get("codec", "none") == "none":
+            return parameters_a_ndarrays(res.parameters)
+        if self.base_ronda is None or self.base_ronda[0] != server_round:
+            self.base_ronda = (server_round, *aplanar(parameters_a_ndarrays(self.parametros_ronda[server_round])))
+        _, base, formas = self.base_ronda
+        inicio = time.perf_counter()
+        pesos = desaplanar(base + decodificar(parameters_a_ndarrays(res.parameters)), formas)
+        self.t_decodificar[server_round] = self.t_decodificar.get(server_round, 0.0) + time.perf_counter() - inicio
+        return pesos
+
+    def acumular(self, server_round, proxy, res):
+        """
+        Suma un resultado de fit a la agregación incremental de la ronda en cuanto llega y libera sus parámetros
+        (ver incremental.py). Sólo con FedAvg sin pre-filtro; los métodos robustos necesitan todos los resultados.
+        Devuelve True si se ha sumado.
+        """
+        if self.agregacion != "fedavg" or self.factor_norma > 0 or res.metrics.get("sincronizar", False):
+            return False
+        if res.num_examples <= 0:
+            return False
+        if res.parameters.tensor_type == ACUMULADO: # Ya sumado trozo a trozo al recibirlo (acumular_trozos)
+            return True
+        pesos = self._pesos(server_round, res)
+        with self.cerrojo:
+            acumulador = self.acumuladores.setdefault(server_round, AcumuladorFedAvg())
+            acumulador.sumar(pesos, res.num_examples)
+        res.parameters = Parameters(tensors=[], tensor_type=ACUMULADO)
+        return True
+
+    def acumular_trozos(self, server_round, res, manifiesto, trozos):
+        """
+        Suma a la agregación incremental una subida en trozos (lo llama ProxyTrozos desde el hilo de cada cliente, ver
+        transferencia.py) sin reconstruir el modelo. Los trozos se guardan aparte hasta que ha llegado el último con el
+        CRC bien y sólo entonces se suman a la ronda: si la subida falla (la excepción de `trozos` sigue hacia el fit
+        y Flower lo cuenta como fallo) no queda nada de ese cliente en la suma. Devuelve False, sin consumir los
+        trozos, si este resultado no se puede sumar así: entonces se reconstruye entero.
+        """
+        if self.agregacion != "fedavg" or self.factor_norma > 0 or res.metrics.get("sincronizar", False):
+            return False
+        if res.num_examples <= 0 or res.metrics.get("codec", "none") != "none" or "formas" not in manifiesto:
+            return False
+        if any(dtype != "<f4" for dtype in manifiesto["dtypes"]) or manifiesto["tamano_trozo"] % 4:
+            return False # Con otros tipos un elemento podría quedar partido entre dos trozos
+        recibidos = list(trozos)
+        with self.cerrojo:
+            self.acumuladores.setdefault(server_round, AcumuladorFedAvg()).sumar_trozos(
+                manifiesto, recibidos, res.num_examples)
+        res.parameters = Parameters(tensors=[], tensor_type=ACUMULADO)
+        return True
+
+    def _decodificar_resultados(self, server_round, results):
+        """Sustituye los parámetros comprimidos por los pesos completos. Devuelve las estadísticas de compresión."""
+        comprimidos = [(proxy, res) for proxy, res in results if res.metrics.get("codec", "none") != "none"]
+        if not comprimidos:
+            return None
+
+        for _, res in comprimidos:
+            if res.parameters.tensor_type != ACUMULADO: # Los acumulados ya se decodificaron al llegar
+                res.parameters = ndarrays_a_parameters(self._pesos(server_round, res))
+        t_decodificar = self.t_decodificar.pop(server_round, 0.0)
+
+        bytes_originales = sum(res.metrics["bytes_originales"] for _, res in comprimidos)
+        bytes_codificados = sum(res.metrics["bytes_codificados"] for _, res in comprimidos)
+        estadisticas = {
+            "codec": sorted({res.metrics["codec"] for _, res in comprimidos}),
+            "clientes_comprimidos": len(comprimidos),
+            "ratio_compresion": bytes_originales / max(bytes_codificados, 1),
+            "bytes_originales": bytes_originales,
+            "bytes_codificados": bytes_codificados,
+            "t_codificar_medio": float(np.mean([res.metrics["t_codificar"] for _, res in comprimidos])),
+            "t_decodificar_total": t_decodificar,
+            "error_relativo_medio": float(np.mean([res.metrics["error_relativo"] for _, res in comprimidos])),
+        }
+        # Impacto en la accuracy: cada cliente evalúa su modelo sin comprimir y el reconstruido (COMPRESSION_EVAL_SAMPLES).
+        medidos = [res.metrics for _, res in comprimidos if "accuracy_comprimido" in res.metrics]
+        if medidos:
+            sin_comprimir = float(np.mean([m["accuracy_sin_comprimir"] for m in medidos]))
+            comprimido = float(np.mean([m["accuracy_comprimido"] for m in medidos]))
+            estadisticas.update({
+                "clientes_impacto": len(medidos),
+                "accuracy_sin_comprimir_media": sin_comprimir,
+                "accuracy_comprimido_media": comprimido,
+                "impacto_accuracy_medio": sin_comprimir - comprimido, # > 0: la compresión pierde accuracy
+            })
+        return estadisticas
+
+    def aggregate_evaluate(self, server_round, results, failures):
+        # weighted_average no recibe la ronda: la dejamos aquí para que numere global_results.json con la ronda real.
+        self.ronda_evaluacion = server_round
+        results = self._confirmar_versiones("evaluate", server_round, results)
+        results, failures = self._quitar_vacios(results, failures)
+        self._registrar_seleccion("evaluate", server_round, self.inicio_evaluacion, results, failures)
+        if server_round in self.inicio_ronda:
+            self.estadisticas_fit.setdefault(server_round, {})["t_ronda"] = time.perf_counter() - self.inicio_ronda[server_round]
+        return super().aggregate_evaluate(server_round, results, failures)
+
+    def _agregar_robusto(self, server_round, results):
+        """Agrega los deltas apilados en una matriz (clientes x parámetros) con el método robusto configurado."""
+        base, formas = aplanar(parameters_a_ndarrays(self.parametros_ronda[server_round]))
+        deltas = np.stack([aplanar(parameters_a_ndarrays(res.parameters))[0] - base for _, res in results])
+        muestras = [res.num_examples for _, res in results]
+        agregado, informe = agregar_robusto(
+            deltas, muestras, self.agregacion,
+            f=self.robusto_f, beta=self.beta_recorte, factor_norma=self.factor_norma
+        )
+
+        # Informe de detección con los IDs de cliente en lugar de posiciones.
+        ids = [res.metrics.get("client_id", i) for i, (_, res) in enumerate(results)]
+        deteccion = {
+            "metodo": informe["metodo"],
+            "t_agregacion": informe["t_agregacion"],
+            "descartados_norma": [ids[i] for i in informe["descartados_norma"]],
+            "seleccionados": [ids[i] for i in informe["seleccionados"]],
+            "detalle": [
+                {
+                    "client_id": ids[i],
+                    "norma": informe["normas"][i],
+                    "distancia_al_agregado": informe["distancia_al_agregado"][i],
+                    **({"puntuacion_krum": informe["puntuaciones_krum"][i]} if "puntuaciones_krum" in informe else {}),
+                } for i in range(len(ids))
+            ],
+        }
+        self.estadisticas_fit.setdefault(server_round, {})["robusta"] = deteccion
+        print(f"[ROBUSTA] Ronda {server_round} ({self.agregacion}) | Descartados por norma: {deteccion['descartados_norma']} "
+              f"| Seleccionados: {deteccion['seleccionados']}")
+        return ndarrays_a_parameters(desaplanar(base + agregado, formas))
+
+    def aggregate_fit(self, server_round, results, failures):
+        self.ronda_fit = server_round
+        results = self._confirmar_versiones("fit", server_round, results)
+        results, failures = self._quitar_vacios(results, failures)
+        self._registrar_seleccion("fit", server_round, self.inicio_ronda.get(server_round), results, failures)
+        inicio = time.perf_counter()
+        parametros, metricas = self._agregar_fit(server_round, results, failures)
+        self.estadisticas_fit.setdefault(server_round, {})["t_agregacion"] = time.perf_counter() - inicio
+        self.guardar_checkpoint(server_round, parametros)
+        return parametros, metricas
+
+    def _agregar_fit(self, server_round, results, failures):
+        """Decodifica las actualizaciones comprimidas y agrega con FedAvg o con el método robusto."""
+        compresion = self._decodificar_resultados(server_round, results)
+        if compresion is not None:
+            self.estadisticas_fit.setdefault(server_round, {})["compresion"] = compresion
+
+        if not results:
+            return None, {}
+        if not self.accept_failures and failures:
+            return None, {}
+
+        acumulador = self.acumuladores.pop(server_round, None)
+        if self.agregacion == "fedavg" and self.factor_norma <= 0 and acumulador is not None:
+            # Suma incremental: sólo quedan los resultados que no se sumaron al llegar (si hay alguno) y la división.
+            for _, res in results:
+                if res.parameters.tensor_type != ACUMULADO:
+                    acumulador.sumar(parameters_a_ndarrays(res.parameters), res.num_examples)
+            parametros = ndarrays_a_parameters(acumulador.resultado())
+            self.estadisticas_fit.setdefault(server_round, {})["agregacion_incremental"] = {
+                "actualizaciones": acumulador.actualizaciones,
+                "t_acumular": acumulador.t_acumular,
+            }
+        elif self.agregacion == "fedavg" and self.factor_norma <= 0:
+            # El FedAvg de Flower, deserializando sin copias (vistas de sólo lectura de los bytes recibidos).
+            parametros = ndarrays_a_parameters(aggregate(
+                [(parameters_a_ndarrays(res.parameters), res.num_examples) for _, res in results]))
+        else:
+            parametros = self._agregar_robusto(server_round, results)
+        metricas = {}
+        if self.fit_metrics_aggregation_fn:
+            metricas = self.fit_metrics_aggregation_fn([(res.num_examples, res.metrics) for _, res in results])
+        return parametros, metricas
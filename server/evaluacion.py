@@ -0,0 +1,62 @@
+"""
+**Evaluación centralizada en el servidor sobre un holdout fijo**
+
+Las métricas globales salían sólo de la evaluación federada con fraction_evaluate=1.0: en cada ronda el modelo
+se envía una segunda vez a TODOS los clientes, y los IoT gastan su poca CPU en evaluate + predict.
+
+EvaluadorCentral evalúa el modelo global en el propio servidor sobre un holdout fijo: las últimas `tamano` muestras
+del almacén compartido (comun/datos.py). Los clientes las excluyen del reparto (HOLDOUT_SIZE en client.py), así que
+ningún cliente entrena con ellas.
+
+- El holdout se copia en memoria ya normalizado (float32) una sola vez.
+- La inferencia es por lotes con una función compilada (tf.function) que se reutiliza en todas las rondas.
+- Las métricas salen de metricas_desde_probabilidades (comun/metricas.py), las mismas que calculan los clientes.
+
+Con esto la evaluación federada puede bajar a una fracción de los clientes o hacerse cada K rondas (ver server.py).
+"""
+import time
+import numpy as np
+
+from comun.datos import cargar_o_crear_almacen, normalizar_lote
+from comun.metricas import metricas_desde_probabilidades
+
+
+class EvaluadorCentral:
+
+    def __init__(self, directorio_dataset, tamano, batch_size=1024):
+        x_all, y_all = cargar_o_crear_almacen(directorio_dataset)
+        self.x = normalizar_lote(x_all[-tamano:]) # Copia en memoria (~31 MB para 10.000 imágenes)
+        self.y = np.array(y_all[-tamano:], dtype=np.int64)
+        self.batch_size = batch_size
+        self.model = None # Se construye en la primera evaluación (TensorFlow sólo se importa si hace falta)
+        self.buffer = None
+        self._inferir = None
+
+    @property
+    def num_muestras(self):
+        return len(self.y)
+
+    def _construir(self):
+        import tensorflow as tf
+        from comun.modelo import build_model
+        from comun.parametros import BufferModelo
+        self.model = build_model()
+        self.buffer = BufferModelo(self.model) # Admite el modelo plano (FLAT_PARAMS) o por capas
+        self._inferir = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec([None, 28, 28, 1], tf.float32)]
+        )
+
+    def evaluar(self, pesos):
+        """Métricas del modelo con estos pesos sobre el holdout: loss, accuracy, precision, recall, f1_score y t_evaluacion."""
+        inicio = time.perf_counter()
+        if self.model is None:
+            self._construir()
+        self.buffer.escribir(pesos)
+        probabilidades = np.concatenate([
+            self._inferir(self.x[i:i + self.batch_size]).numpy()
+            for i in range(0, len(self.x), self.batch_size)
+        ])
+        metricas, _ = metricas_desde_probabilidades(self.y, probabilidades)
+        metricas["t_evaluacion"] = time.perf_counter() - inicio
+        return metricas
@@ -0,0 +1,65 @@
+"""
+**Agregación FedAvg incremental (en streaming)**
+
+Con FedAvg de Flower el servidor guarda el resultado completo de cada cliente (sus parámetros serializados) hasta que
+llega el último y sólo entonces agrega capa a capa: la memoria crece con el número de clientes y la agregación entera
+se hace después del más lento.
+
+Aquí cada FitRes se suma a una suma ponderada en cuanto llega (suma += muestras * pesos, con
+AcumuladorFedAvg de comun/agregacion.py, que también usan los agregadores de borde) y se libera:
+
+- Memoria O(modelo): la suma (que al final se divide sobre sí misma), un buffer temporal del tamaño de la capa más
+  grande y el resultado que se está sumando.
+- La agregación se solapa con la espera a los rezagados. Al llegar el último sólo queda su suma y una división.
+- Mismo resultado que FedAvg (sum(n_i * w_i) / sum(n_i)) salvo el redondeo: se acumula en el dtype de los pesos
+  (float32), en el orden en que llegan los resultados.
+
+La estrategia (estrategia.py, acumular) decide qué se puede sumar así: sólo FedAvg sin pre-filtro por norma (los
+métodos robustos necesitan todas las actualizaciones a la vez). Las actualizaciones comprimidas se decodifican antes
+de sumarlas. ServidorIncremental es el fit_round de Flower con los resultados procesados según llegan
+(concurrent.futures.as_completed) en lugar de esperar a todos. Cada petición es un proxy.fit(ins, timeout) directo, sin
+el fit_client privado de flwr.server.server.
+"""
+import concurrent.futures
+import flwr as fl
+from flwr.common import Code
+
+from control import ServidorControlado
+
+
+def _fit_cliente(proxy, ins, timeout):
+    """(proxy, FitRes) de un cliente, para saber de quién es cada resultado que devuelve as_completed."""
+    return proxy, proxy.fit(ins, timeout=timeout)
+
+
+class ServidorIncremental(fl.server.Server):
+    """Servidor síncrono de Flower que entrega cada resultado de fit a strategy.acumular en cuanto llega."""
+
+    def fit_round(self, server_round, timeout):
+        client_instructions = self.strategy.configure_fit(
+            server_round=server_round, parameters=self.parameters, client_manager=self._client_manager
+        )
+        if not client_instructions:
+            return None
+
+        results, failures = [], []
+        # Como fit_clients de Flower, pero los resultados se procesan en este hilo según van llegando.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futuros = [executor.submit(_fit_cliente, proxy, ins, timeout) for proxy, ins in client_instructions]
+            for futuro in concurrent.futures.as_completed(futuros):
+                if futuro.exception() is not None:
+                    failures.append(futuro.exception())
+                    continue
+                proxy, res = futuro.result()
+                if res.status.code != Code.OK:
+                    failures.append((proxy, res))
+                    continue
+                self.strategy.acumular(server_round, proxy, res)
+                results.append((proxy, res))
+
+        parameters_aggregated, metrics_aggregated = self.strategy.aggregate_fit(server_round, results, failures)
+        return parameters_aggregated, metrics_aggregated, (results, failures)
+
+
+class ServidorControladoIncremental(ServidorIncremental, ServidorControlado):
+    """El bucle de ServidorControlado (parada temprana, espera acotada, reanudación) con la agregación incremental."""
@@ -0,0 +1,193 @@
+"""
+**Selección de clientes según sus recursos**
+
+Con fraction_fit=1.0 todos los clientes conectados entrenan y evalúan en todas las rondas, y el más lento (IoT a
+0.1 CPU) marca la duración de cada ronda. Con muchos clientes eso no escala.
+
+SelectorRecursos elige en cada ronda un subconjunto para acercarse a una duración objetivo (TARGET_ROUND_TIME):
+
+1. Predicción de la latencia de cada cliente:
+   - Con historial propio: media exponencial (EWMA) de los tiempos que él mismo informa (t_fit / t_evaluate).
+   - Sin historial: a partir de su perfil (get_properties: CPU_LIMIT y nº de muestras) y del coste medio por
+     muestra y CPU observado en el resto, t ≈ coste * muestras / cpu.
+   - Si todavía no hay nada con lo que estimar, el cliente se selecciona (exploración).
+   - Cada selección en la que un cliente se queda fuera su predicción se multiplica por `olvido` (0.9): un cliente
+     que tuvo una ronda lenta vuelve a ser elegible al cabo de unas rondas y su historial se renueva. Al elegirlo
+     se vuelve a la predicción sin descontar.
+   Si get_properties falla (timeout), se vuelve a pedir en la siguiente selección en lugar de quedarse sin perfil.
+2. Elegibles: clientes con latencia prevista <= objetivo.
+3. Entre los elegibles, primero se cubren las etiquetas (voraz: el que más etiquetas nuevas aporta) y luego se
+   rellena hasta el tamaño de muestra de la estrategia, dando prioridad a quien menos ha participado (equidad).
+4. Si alguna etiqueta sólo la tienen clientes lentos, se añade el más rápido de ellos: la cobertura pesa más
+   que la latencia.
+5. Degradación: si no llegan a min_fit_clients (se han caído clientes o todos son lentos) se completa con los
+   más rápidos del resto para que la ronda pueda hacerse.
+
+Cada decisión se devuelve como un dict (seleccionados, excluidos, tiempo previsto) que la estrategia guarda en
+global_results.json junto con el tiempo real de la ronda.
+"""
+import concurrent.futures
+import numpy as np
+from flwr.common import GetPropertiesIns
+
+
+class SelectorRecursos:
+
+    def __init__(self, objetivo, suavizado=0.5, timeout_propiedades=10.0, olvido=0.9):
+        self.objetivo = objetivo # Duración objetivo (s) de la fase de fit/evaluate de una ronda
+        self.suavizado = suavizado # Peso de la última observación en la EWMA
+        self.timeout_propiedades = timeout_propiedades
+        self.olvido = olvido # Descuento de la predicción por cada selección en la que el cliente se queda fuera
+        self.propiedades = {} # cid -> get_properties del cliente (client_id, cpu_limit, muestras, etiquetas, perfil)
+        self.sin_propiedades = set() # cids cuyo get_properties ha fallado (se reintenta en la siguiente selección)
+        self.excluido = {"fit": {}, "evaluate": {}} # client_id -> selecciones seguidas en las que se ha quedado fuera
+        self.latencia = {"fit": {}, "evaluate": {}} # client_id -> EWMA de la latencia en esa fase
+        self.participaciones = {} # client_id -> nº de rondas de fit en las que ha participado
+
+    # ---------- Historial ----------
+
+    def _pedir_propiedades(self, proxy):
+        try:
+            res = proxy.get_properties(GetPropertiesIns(config={}), timeout=self.timeout_propiedades)
+            self.propiedades[proxy.cid] = dict(res.properties)
+            self.sin_propiedades.discard(proxy.cid)
+        except Exception as e:
+            print(f"[SELECCION] Sin propiedades del cliente {proxy.cid} (se reintenta en la siguiente selección): {e}")
+            self.sin_propiedades.add(proxy.cid)
+
+    def _propiedades(self, proxy):
+        """Perfil del cliente (se pide una vez por conexión; si falla, {} hasta el reintento de seleccionar)."""
+        if proxy.cid not in self.propiedades and proxy.cid not in self.sin_propiedades:
+            self._pedir_propiedades(proxy)
+        return self.propiedades.get(proxy.cid, {})
+
+    def _id(self, proxy):
+        return self._propiedades(proxy).get("client_id", proxy.cid)
+
+    def registrar(self, fase, results, failures):
+        """Actualiza el historial con los tiempos que informan los clientes. Un fallo cuenta como el doble del objetivo."""
+        clave = "t_fit" if fase == "fit" else "t_evaluate"
+        for proxy, res in results:
+            if clave not in res.metrics:
+                continue
+            cliente = res.metrics.get("client_id", self._id(proxy))
+            previo = self.latencia[fase].get(cliente)
+            t = float(res.metrics[clave])
+            self.latencia[fase][cliente] = t if previo is None else self.suavizado * t + (1 - self.suavizado) * previo
+            if fase == "fit":
+                self.participaciones[cliente] = self.participaciones.get(cliente, 0) + 1
+        for fallo in failures:
+            if isinstance(fallo, tuple):
+                cliente = self._id(fallo[0])
+                self.latencia[fase][cliente] = max(self.latencia[fase].get(cliente, 0.0), 2.0 * self.objetivo)
+
+    def olvidar(self, cids_conectados):
+        """Descarta las propiedades de conexiones que ya no existen (los clientes reiniciados vuelven con otro cid)."""
+        for cid in list(self.propiedades):
+            if cid not in cids_conectados:
+                del self.propiedades[cid]
+        self.sin_propiedades &= set(cids_conectados)
+
+    def _coste_por_muestra(self, fase):
+        """Mediana de latencia * cpu / muestras entre los clientes con historial (o None)."""
+        costes = []
+        por_id = {p.get("client_id"): p for p in self.propiedades.values()}
+        for cliente, t in self.latencia[fase].items():
+            p = por_id.get(cliente, {})
+            if p.get("muestras"):
+                costes.append(t * float(p.get("cpu_limit", 1.0)) / p["muestras"])
+        return float(np.median(costes)) if costes else None
+
+    def predecir(self, fase, proxy, coste=None):
+        """Latencia prevista (historial o perfil), descontada por las selecciones seguidas que lleva fuera. None = sin datos."""
+        cliente = self._id(proxy)
+        p = self._propiedades(proxy)
+        if cliente in self.latencia[fase]:
+            t = self.latencia[fase][cliente]
+        elif coste is not None and p.get("muestras"):
+            t = coste * p["muestras"] / float(p.get("cpu_limit", 1.0))
+        else:
+            return None # Sin datos: exploración
+        return t * self.olvido ** self.excluido[fase].get(cliente, 0)
+
+    # ---------- Selección ----------
+
+    def seleccionar(self, fase, proxies, num_clientes, min_clientes):
+        """Devuelve (proxies elegidos, decisión para el log)."""
+        self.olvidar({p.cid for p in proxies})
+        # Las propiedades de los clientes nuevos (y las que fallaron en la selección anterior) se piden en paralelo
+        # (con miles de clientes, una a una sería lento).
+        nuevos = [p for p in proxies if p.cid not in self.propiedades]
+        if nuevos:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(nuevos))) as executor:
+                list(executor.map(self._pedir_propiedades, nuevos))
+        coste = self._coste_por_muestra(fase)
+        info = []
+        for proxy in proxies:
+            props = self._propiedades(proxy)
+            info.append({
+                "proxy": proxy,
+                "client_id": props.get("client_id", proxy.cid),
+                "t": self.predecir(fase, proxy, coste),
+                "etiquetas": int(props.get("etiquetas", 0)),
+            })
+
+        elegibles = [c for c in info if c["t"] is None or c["t"] <= self.objetivo]
+        lentos = sorted((c for c in info if c["t"] is not None and c["t"] > self.objetivo), key=lambda c: c["t"])
+        # Equidad: primero los que menos han participado; a igualdad, los más rápidos.
+        elegibles.sort(key=lambda c: (self.participaciones.get(c["client_id"], 0), c["t"] or 0.0))
+
+        elegidos, usados, cubiertas = [], set(), 0 # usados: cids elegidos (evita búsquedas O(n) en la lista)
+
+        def elegir(c):
+            elegidos.append(c)
+            usados.add(c["proxy"].cid)
+
+        # 1. Cobertura de etiquetas con los elegibles (cada pasada añade el que más etiquetas nuevas aporta).
+        while len(elegidos) < num_clientes:
+            mejor = max((c for c in elegibles if c["proxy"].cid not in usados),
+                        key=lambda c: bin(c["etiquetas"] & ~cubiertas).count("1"), default=None)
+            if mejor is None or not mejor["etiquetas"] & ~cubiertas:
+                break
+            elegir(mejor)
+            cubiertas |= mejor["etiquetas"]
+        # 2. Relleno por equidad.
+        for c in elegibles:
+            if len(elegidos) >= num_clientes:
+                break
+            if c["proxy"].cid not in usados:
+                elegir(c)
+        # 3. Etiquetas que sólo tienen clientes lentos.
+        todas = 0
+        for c in info:
+            todas |= c["etiquetas"]
+        for c in lentos:
+            if not todas & ~cubiertas:
+                break
+            if c["etiquetas"] & ~cubiertas:
+                elegir(c)
+                cubiertas |= c["etiquetas"]
+        # 4. Degradación: mínimo de clientes aunque superen el objetivo.
+        for c in lentos:
+            if len(elegidos) >= min_clientes:
+                break
+            if c["proxy"].cid not in usados:
+                elegir(c)
+
+        # Olvido: los que se quedan fuera descuentan su predicción en la siguiente selección; los elegidos la renuevan.
+        for c in info:
+            if c["proxy"].cid in usados:
+                self.excluido[fase].pop(c["client_id"], None)
+            else:
+                self.excluido[fase][c["client_id"]] = self.excluido[fase].get(c["client_id"], 0) + 1
+
+        previstos = [c["t"] for c in elegidos if c["t"] is not None]
+        decision = {
+            "objetivo": self.objetivo,
+            "disponibles": len(info),
+            "t_previsto": max(previstos) if previstos else None,
+            "etiquetas_cubiertas": bin(cubiertas).count("1"),
+            "seleccionados": [c["client_id"] for c in elegidos],
+            "excluidos": [{"client_id": c["client_id"], "t_previsto": c["t"]} for c in info if c["proxy"].cid not in usados],
+        }
+        return [c["proxy"] for c in elegidos], decision
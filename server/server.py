@@ -2,7 +2,18 @@ import flwr as fl
 import os
 from typing import List, Tuple
 from flwr.common import Metrics
-import json
+import time
+from estrategia import FedAvgTFM
+from asincrono import ServidorFedBuff
+from seleccion import SelectorRecursos
+from checkpoint import GestorCheckpoints
+from incremental import ServidorControladoIncremental
+from control import ControlRondas, ServidorControlado
+from transferencia import GestorClientesTrozos
+from evaluacion import EvaluadorCentral
+from comun.descarga import CacheVersiones
+from comun.perfilado import resumen_perfilado
+from comun.registro import RegistroJSONL
 
 """
 **Servidor Flower** 
@@ -15,13 +26,130 @@ import json
 """
 def evaluate_config(server_round: int):
     #Envía configuracion a los clientes para la evaluación
-    return {"server_round": server_round}
+    #t_envio permite a los clientes con PROFILE=True medir la bajada (red + deserialización). Ver comun/perfilado.py.
+    return {"server_round": server_round, "t_envio": time.time()}
+
+#Entrenamiento local que se pide a los clientes en cada ronda.
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "32"))
+LOCAL_EPOCHS = int(os.environ.get("LOCAL_EPOCHS", "1"))
+#Límite de tiempo del entrenamiento local (segundos, 0 = sin límite): cada cliente entrena los lotes que le caben y
+#LOCAL_EPOCHS pasa a ser un máximo. FedAvg pondera por las muestras procesadas. Ver client/entrenamiento.py.
+TRAIN_DEADLINE = float(os.environ.get("TRAIN_DEADLINE", "0"))
+
+def fit_config(server_round: int):
+    #Envía configuracion a los clientes para el entrenamiento
+    config = {"server_round": server_round, "batch_size": BATCH_SIZE, "local_epochs": LOCAL_EPOCHS, "t_envio": time.time()}
+    if TRAIN_DEADLINE > 0:
+        config["t_limite"] = TRAIN_DEADLINE
+    return config
+
+def resumen_limite(metrics: List[Tuple[int, Metrics]]):
+    #Qué ha entrenado cada cliente dentro del límite de tiempo de la ronda.
+    detalle = [
+        {"client_id": m.get("client_id", "Desconocido"), "pasos": m.get("pasos"), "muestras": num_examples,
+         "t_fit": m.get("t_fit"), "recortado": bool(m.get("recortado", False))}
+        for num_examples, m in metrics
+    ]
+    return {
+        "t_limite": TRAIN_DEADLINE,
+        "recortados": [d["client_id"] for d in detalle if d["recortado"]],
+        "muestras_procesadas": sum(d["muestras"] for d in detalle),
+        "detalle": detalle,
+    }
+
+def resumen_tflite(metrics: List[Tuple[int, Metrics]]):
+    #Evaluación con TFLite (EVAL_TFLITE en los clientes, ver client/inferencia.py): motor, tiempos y, de los clientes
+    #que han comparado con Keras en esta ronda, la pérdida de accuracy y la aceleración. Agrupado por perfil.
+    por_perfil = {}
+    for _, m in metrics:
+        if "motor_evaluacion" not in m:
+            continue
+        grupo = por_perfil.setdefault(m.get("perfil", "Desconocido"), {"motores": set(), "clientes": 0, "conversiones": 0,
+                                                                     "t_inferencia": [], "brecha": [], "aceleracion": []})
+        grupo["motores"].add(m["motor_evaluacion"])
+        grupo["clientes"] += 1
+        grupo["conversiones"] += int(m["conversion_tflite"])
+        grupo["t_inferencia"].append(m["t_inferencia"])
+        if "brecha_accuracy" in m:
+            grupo["brecha"].append(m["brecha_accuracy"])
+            grupo["aceleracion"].append(m["aceleracion"])
+    if not por_perfil:
+        return None
+    return {
+        perfil: {
+            "motores": sorted(g["motores"]),
+            "clientes": g["clientes"],
+            "conversiones": g["conversiones"],
+            "t_inferencia_medio": sum(g["t_inferencia"]) / len(g["t_inferencia"]),
+            "brecha_accuracy_media": sum(g["brecha"]) / len(g["brecha"]) if g["brecha"] else None,
+            "aceleracion_media": sum(g["aceleracion"]) / len(g["aceleracion"]) if g["aceleracion"] else None,
+        } for perfil, g in por_perfil.items()
+    }
+
+def resumen_cpu(metrics: List[Tuple[int, Metrics]]):
+    #Throttling de la cuota de CPU de cada cliente en la fase (cpu.stat de su cgroup, ver client/recursos.py).
+    #Sólo lo mandan los clientes con cuota (contenedores con limits.cpus).
+    detalle = [
+        {"client_id": m.get("client_id", "Desconocido"), "fraccion_cpu_limitada": m["fraccion_cpu_limitada"],
+         "t_cpu_limitado": m["t_cpu_limitado"]}
+        for _, m in metrics if "fraccion_cpu_limitada" in m
+    ]
+    if not detalle:
+        return None
+    return {
+        "clientes_limitados": [d["client_id"] for d in detalle if d["t_cpu_limitado"] > 0],
+        "t_cpu_limitado_max": max(d["t_cpu_limitado"] for d in detalle),
+        "fraccion_cpu_limitada_media": sum(d["fraccion_cpu_limitada"] for d in detalle) / len(detalle),
+        "detalle": detalle,
+    }
+
+def registrar_cpu(metrics, fase, ronda, destino):
+    cpu = resumen_cpu(metrics)
+    if cpu is None:
+        return
+    destino[f"limitacion_cpu_{fase}"] = cpu
+    if cpu["clientes_limitados"]:
+        print(f"[CPU] Ronda {ronda} ({fase}) | {len(cpu['clientes_limitados'])}/{len(cpu['detalle'])} clientes con la cuota "
+              f"de CPU agotada | Congelado hasta {cpu['t_cpu_limitado_max']:.2f}s | Periodos limitados: "
+              f"{cpu['fraccion_cpu_limitada_media']:.1%}")
+
+#Perfilado del fit: tiempos por fase de cada cliente y ranking de rezagados, que se añaden a global_results.json.
+def fit_metrics_average(metrics: List[Tuple[int, Metrics]]) -> Metrics:
+    registrar_cpu(metrics, "fit", strategy.ronda_fit, strategy.estadisticas_fit.setdefault(strategy.ronda_fit, {}))
+    if TRAIN_DEADLINE > 0:
+        limite = resumen_limite(metrics)
+        strategy.estadisticas_fit.setdefault(strategy.ronda_fit, {})["limite_entrenamiento"] = limite
+        pasos = [d["pasos"] for d in limite["detalle"] if d["pasos"] is not None]
+        print(f"[LIMITE] Ronda {strategy.ronda_fit} | {len(limite['recortados'])}/{len(metrics)} clientes recortados "
+              f"a {TRAIN_DEADLINE:.1f}s | Pasos: {min(pasos, default=0)}-{max(pasos, default=0)} | "
+              f"{limite['muestras_procesadas']} muestras")
+    perfilado = resumen_perfilado(metrics)
+    if perfilado is None:
+        return {}
+    strategy.estadisticas_fit.setdefault(strategy.ronda_fit, {})["perfilado_fit"] = perfilado
+    print(f"[PERFIL] Ronda {strategy.ronda_fit} | Fit más lento: {perfilado['rezagados'][0]} ({perfilado['t_respuesta_max']:.2f}s)")
+    return {"t_respuesta_max": perfilado["t_respuesta_max"]}
+
+#Carpeta de resultados (volumen compartido en Docker).
+RESULTS_DIR = os.environ.get("RESULTS_DIR", "/app/results")
+
+#Escritura de global_results.json (ver comun/registro.py): cada línea entera en una sola escritura. Con
+#RESULTS_BUFFER_LINES=N se escriben de N en N (o cuando la más antigua lleva RESULTS_BUFFER_S segundos) y al salir.
+#RESULTS_FSYNC=True fuerza cada escritura a disco.
+RESULTS_BUFFER_LINES = int(os.environ.get("RESULTS_BUFFER_LINES", "1"))
+RESULTS_BUFFER_S = float(os.environ.get("RESULTS_BUFFER_S", "0"))
+RESULTS_FSYNC = os.environ.get("RESULTS_FSYNC", "False") == "True"
+registro_global = RegistroJSONL(os.path.join(RESULTS_DIR, "global_results.json"), lineas=RESULTS_BUFFER_LINES,
+                                segundos=RESULTS_BUFFER_S, fsync=RESULTS_FSYNC)
+
+def escribir_resultado(resultado_ronda):
+    registro_global.escribir(resultado_ronda)
 
 #Calculamos como está funcionando el modelo, haciendo una media con todos los clientes y su conjunto de datos.
 CURRENT_ROUND = 0
 def weighted_average(metrics: List[Tuple[int, Metrics]]) -> Metrics:
     global CURRENT_ROUND
-    CURRENT_ROUND += 1
+    CURRENT_ROUND = strategy.ronda_evaluacion # La ronda real que se evalúa (ver estrategia.py)
     
     #Extraemos el número de ejemplos (imágenes) de cada cliente
     examples = [num_examples for num_examples, _ in metrics]
@@ -73,39 +201,237 @@ def weighted_average(metrics: List[Tuple[int, Metrics]]) -> Metrics:
         ]
     }
 
-    with open("/app/results/global_results.json", "a") as f:
-        f.write(json.dumps(resultado_ronda) + "\n")
+    # Perfilado de la evaluación (sólo si los clientes tienen PROFILE=True)
+    perfilado = resumen_perfilado(metrics)
+    if perfilado is not None:
+        resultado_ronda["perfilado_evaluacion"] = perfilado
+
+    registrar_cpu(metrics, "evaluate", CURRENT_ROUND, resultado_ronda)
+
+    tflite = resumen_tflite(metrics)
+    if tflite is not None:
+        resultado_ronda["evaluacion_tflite"] = tflite
+        for perfil, g in tflite.items():
+            if g["brecha_accuracy_media"] is not None:
+                print(f"[TFLITE] Ronda {CURRENT_ROUND} | {perfil} ({', '.join(g['motores'])}) | Brecha de accuracy: "
+                      f"{g['brecha_accuracy_media']:+.4f} | Aceleración: x{g['aceleracion_media']:.2f}")
+
+    # Con evaluación en el servidor, las métricas globales son las del holdout y las federadas quedan aparte.
+    central = RESULTADO_CENTRAL.pop(CURRENT_ROUND, None)
+    if central is not None:
+        resultado_ronda["metricas_federadas"] = resultado_ronda.pop("metricas_globales")
+        resultado_ronda.update(central)
+    control.registrar(CURRENT_ROUND, resultado_ronda["metricas_globales"])
+
+    # Estadísticas del fit de esta misma ronda (compresión del uplink, ...). Ver estrategia.py.
+    resultado_ronda.update(strategy.estadisticas_fit.get(CURRENT_ROUND, {}))
+
+    escribir_resultado(resultado_ronda)
     
     print(f"Ronda: {CURRENT_ROUND} | Clientes: {clientes_participantes} | Acc Global: {global_accuracy:.4f} | F1 Global: {global_f1_score:.4f}")
     
     return {"accuracy": global_accuracy, "f1_score": global_f1_score}
 
 
+#Evaluación centralizada: el servidor evalúa el modelo global en un holdout fijo (las últimas HOLDOUT_SIZE muestras del
+#almacén, que los clientes excluyen del reparto con la misma variable). 0 = desactivada. Ver evaluacion.py.
+#Con ella la evaluación federada se puede reducir a una fracción de los clientes (FED_EVAL_FRACTION, 0 = ninguna)
+#o a una de cada FED_EVAL_EVERY rondas: menos bajadas del modelo y menos CPU de los IoT.
+HOLDOUT_SIZE = int(os.environ.get("HOLDOUT_SIZE", "0"))
+DATASET_DIR = os.environ.get("DATASET_DIR", os.path.join(RESULTS_DIR, "dataset"))
+EVAL_BATCH_SIZE = int(os.environ.get("EVAL_BATCH_SIZE", "1024"))
+FED_EVAL_FRACTION = float(os.environ.get("FED_EVAL_FRACTION", "1.0"))
+FED_EVAL_EVERY = int(os.environ.get("FED_EVAL_EVERY", "1"))
+
+evaluador = EvaluadorCentral(DATASET_DIR, HOLDOUT_SIZE, batch_size=EVAL_BATCH_SIZE) if HOLDOUT_SIZE > 0 else None
+RESULTADO_CENTRAL = {} # ronda -> métricas del holdout que esperan a la evaluación federada de esa misma ronda
+
+def evaluacion_central(server_round, parameters, config):
+    #Flower llama también con la ronda 0 (modelo inicial): no se evalúa, global_results.json empieza en la ronda 1.
+    if server_round == 0:
+        return None
+    metricas = evaluador.evaluar(parameters)
+    loss, t_evaluacion = metricas.pop("loss"), metricas.pop("t_evaluacion")
+    central = {
+        "evaluacion": "servidor",
+        "muestras_holdout": evaluador.num_muestras,
+        "t_evaluacion_servidor": t_evaluacion,
+        "metricas_globales": metricas,
+    }
+
+    #Rondas anteriores cuya evaluación federada no llegó a agregarse (sin resultados): se escriben sólo con el holdout.
+    for ronda in [r for r in RESULTADO_CENTRAL if r < server_round]:
+        escribir_resultado({"ronda": ronda, **RESULTADO_CENTRAL.pop(ronda), **strategy.estadisticas_fit.get(ronda, {})})
+
+    if strategy.evalua_federada(server_round):
+        RESULTADO_CENTRAL[server_round] = central # La línea la escribe weighted_average
+    else:
+        #Sin evaluación federada esta ronda termina aquí.
+        resultado_ronda = {"ronda": server_round, **central}
+        if server_round in strategy.inicio_ronda:
+            resultado_ronda["t_ronda"] = time.perf_counter() - strategy.inicio_ronda[server_round]
+        resultado_ronda.update(strategy.estadisticas_fit.get(server_round, {}))
+        escribir_resultado(resultado_ronda)
+        control.registrar(server_round, metricas)
+
+    print(f"[HOLDOUT] Ronda: {server_round} | Acc: {metricas['accuracy']:.4f} | F1: {metricas['f1_score']:.4f} | "
+          f"{evaluador.num_muestras} muestras en {t_evaluacion:.2f}s")
+    return loss, metricas
+
+
 #Aqui modificamos el código, para obtener el número total de clientes.
 total_clients = int(os.environ.get("TOTAL_CLIENTS", "2"))
-min_clients = int(total_clients*0.6)
+#Porcentaje de clientes vivos necesario para empezar o continuar una ronda (tolerancia a fallos).
+MIN_CLIENTS_FRACTION = float(os.environ.get("MIN_CLIENTS_FRACTION", "0.6"))
+min_clients = int(total_clients*MIN_CLIENTS_FRACTION)
 if min_clients<1: min_clients=1
+#Con FED_EVAL_FRACTION < MIN_CLIENTS_FRACTION el mínimo de la evaluación baja también (si no, la fracción no tendría efecto).
+min_eval_clients = max(1, min(min_clients, int(total_clients*FED_EVAL_FRACTION)))
 
-strategy = fl.server.strategy.FedAvg( #Define la estrategia de agregación federada
+#Agregación robusta frente al atacante (IS_ATTACKER). Ver robusta.py.
+#"fedavg" (por defecto), "trimmed_mean", "median", "krum" o "multikrum".
+AGGREGATION = os.environ.get("AGGREGATION", "fedavg")
+ROBUST_F = int(os.environ.get("ROBUST_F", "1")) #Atacantes que se asumen (Krum/Multi-Krum).
+TRIM_BETA = float(os.environ.get("TRIM_BETA", "0.2")) #Fracción recortada por cada extremo (trimmed_mean).
+NORM_FILTER = float(os.environ.get("NORM_FILTER", "0")) #Descarta updates con norma > NORM_FILTER x mediana. 0 = desactivado.
+#Agregación incremental: con STREAMING_AGG=True cada resultado de fit se suma a la media ponderada (float32) en cuanto
+#llega y se libera. Memoria constante en el número de clientes. Sólo FedAvg síncrono sin NORM_FILTER. Ver incremental.py.
+STREAMING_AGG = os.environ.get("STREAMING_AGG", "False") == "True"
+
+#Selección de clientes según sus recursos: con TARGET_ROUND_TIME=T (segundos) sólo entrenan/evalúan los clientes que se
+#espera que terminen en T, cuidando que estén todas las etiquetas y que todos participen. 0 = todos. Ver seleccion.py.
+TARGET_ROUND_TIME = float(os.environ.get("TARGET_ROUND_TIME", "0"))
+#Descuento de la latencia prevista de un cliente por cada ronda que se queda fuera: los lentos se vuelven a probar.
+SELECTION_DECAY = float(os.environ.get("SELECTION_DECAY", "0.9"))
+
+#Checkpoints del modelo global en cada ronda: completo cada CHECKPOINT_FULL_EVERY rondas y deltas en float16 entre medias.
+#Con RESUME=True se continúa desde el último checkpoint (p. ej. si el contenedor del servidor se ha caído). Ver checkpoint.py.
+CHECKPOINTS = os.environ.get("CHECKPOINTS", "True") == "True"
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", os.path.join(RESULTS_DIR, "checkpoints"))
+CHECKPOINT_FULL_EVERY = int(os.environ.get("CHECKPOINT_FULL_EVERY", "5"))
+RESUME = os.environ.get("RESUME", "False") == "True"
+
+#Bajada por versiones: el servidor recuerda qué versión del modelo tiene cada cliente y le envía sólo el delta comprimido
+#con DOWNLINK_CODEC ("none", "int8", "uint4", ...; ver comun/compresion.py) o nada si ya la tiene. Se guardan los
+#últimos DOWNLINK_VERSIONS deltas; más atrás, modelo completo. "off" = modelo completo siempre. Ver comun/descarga.py.
+DOWNLINK_CODEC = os.environ.get("DOWNLINK_CODEC", "off")
+DOWNLINK_VERSIONS = int(os.environ.get("DOWNLINK_VERSIONS", "3"))
+
+strategy = FedAvgTFM( #Define la estrategia de agregación federada (FedAvg + decodificación de actualizaciones comprimidas)
     fraction_fit=1.0, #Porcentaje de clientes que participan en cada ronda de entrenamiento 1=100% (TODOS) Reducimos cuando tenemos muchos clientes
-    fraction_evaluate=1.0, #Porcentaje de clientes que participan en cada ronda de evaluación 1=100% (TODOS) la diferecncia con fit es que evalua el modelo despues de entrenar y fit es entrenar
+    fraction_evaluate=FED_EVAL_FRACTION, #Porcentaje de clientes que participan en cada ronda de evaluación 1=100% (TODOS) la diferecncia con fit es que evalua el modelo despues de entrenar y fit es entrenar
     min_fit_clients=min_clients, #Número mínimo de clientes que deben participar en el entrenamiento por ronda
-    min_evaluate_clients=min_clients, #Número mínimo de clientes que deben participar en la evaluación por ronda
+    min_evaluate_clients=min_eval_clients, #Número mínimo de clientes que deben participar en la evaluación por ronda
     min_available_clients=min_clients, #Número mínimo de clientes que deben estar disponibles para que el servidor inicie una ronda // Antes estaba todos, ahora solo el mínimo
     evaluate_metrics_aggregation_fn=weighted_average,
-    on_evaluate_config_fn=evaluate_config #Pasa la ronda a los clientes.
+    evaluate_fn=evaluacion_central if evaluador is not None else None, #Evaluación en el holdout del servidor.
+    fit_metrics_aggregation_fn=fit_metrics_average, #Perfilado por fases de los clientes.
+    on_evaluate_config_fn=evaluate_config, #Pasa la ronda a los clientes.
+    on_fit_config_fn=fit_config, #Pasa la ronda, el tamaño de lote y las épocas locales a los clientes.
+    agregacion=AGGREGATION,
+    robusto_f=ROBUST_F,
+    beta_recorte=TRIM_BETA,
+    factor_norma=NORM_FILTER,
+    selector=SelectorRecursos(TARGET_ROUND_TIME, olvido=SELECTION_DECAY) if TARGET_ROUND_TIME > 0 else None,
+    checkpoints=GestorCheckpoints(CHECKPOINT_DIR, cada_completo=CHECKPOINT_FULL_EVERY) if CHECKPOINTS else None,
+    evaluacion_cada=FED_EVAL_EVERY,
+    versiones=CacheVersiones(DOWNLINK_CODEC, conservar=DOWNLINK_VERSIONS) if DOWNLINK_CODEC != "off" else None
   )
 
 
+#Parámetros en trozos: con PARAM_CHUNK_KB=N (0 = desactivado) los modelos de más de N KB viajan en trozos de N KB con
+#CRC, cada uno en su propio mensaje, en la bajada y en la subida. Un trozo mal recibido se repite (PARAM_CHUNK_RETRIES
+#veces) y si la conexión se corta el cliente sólo recibe después los trozos que le faltan. Con STREAMING_AGG los trozos
+#de la subida se suman a la agregación según llegan. Ver transferencia.py.
+PARAM_CHUNK_KB = int(os.environ.get("PARAM_CHUNK_KB", "0"))
+PARAM_CHUNK_RETRIES = int(os.environ.get("PARAM_CHUNK_RETRIES", "3"))
+
+def registrar_trozos(server_round, clave, estadisticas):
+    #Lo transferido en trozos por fase y sentido ("bajada_fit", "subida_fit", ...): sumas y, de los tiempos, el máximo.
+    destino = strategy.estadisticas_fit.setdefault(server_round, {}).setdefault("trozos", {}).setdefault(clave, {})
+    for campo, valor in estadisticas.items():
+        destino[campo] = max(destino.get(campo, 0.0), valor) if campo.startswith("t_") else destino.get(campo, 0) + valor
+
+
+#Modo asíncrono (FedBuff): con ASYNC_BUFFER=K el servidor agrega en cuanto tiene K actualizaciones, sin esperar a los lentos.
+#Cada agregación cuenta como una ronda. 0 = FedAvg síncrono de siempre. Ver asincrono.py.
+ASYNC_BUFFER = int(os.environ.get("ASYNC_BUFFER", "0"))
+ASYNC_ETA = float(os.environ.get("ASYNC_ETA", "1.0")) #Tasa de aprendizaje del servidor sobre el delta agregado.
+
+NUM_ROUNDS = int(os.environ.get("NUM_ROUNDS", "10")) #Número de rondas de entrenamiento federado (el máximo si hay parada temprana)
+
+#Control de rondas (también en modo asíncrono, entre versiones). Ver control.py.
+#Parada temprana con la métrica global STOP_METRIC ("accuracy" o "f1_score"): al llegar a TARGET_METRIC o tras
+#PLATEAU_ROUNDS evaluaciones sin mejorar en más de PLATEAU_DELTA. 0 = desactivada.
+#Clientes: antes de cada fase se espera como mucho CLIENT_WAIT_TIMEOUT segundos (0 = indefinidamente) a los mínimos.
+#Con ADAPT_MIN_CLIENTS=True los mínimos pasan a ser MIN_CLIENTS_FRACTION de los clientes conectados (nunca menos de
+#MIN_CLIENTS_FLOOR). Si aun así no hay bastantes, NO_CLIENTS_ACTION="terminar" acaba y "pausar" sigue esperando
+#(hasta MAX_PAUSES tramos, 0 = sin límite). El motivo del final queda en la última línea de global_results.json ("fin").
+STOP_METRIC = os.environ.get("STOP_METRIC", "accuracy")
+TARGET_METRIC = float(os.environ.get("TARGET_METRIC", "0"))
+PLATEAU_ROUNDS = int(os.environ.get("PLATEAU_ROUNDS", "0"))
+PLATEAU_DELTA = float(os.environ.get("PLATEAU_DELTA", "0.001"))
+CLIENT_WAIT_TIMEOUT = float(os.environ.get("CLIENT_WAIT_TIMEOUT", "600"))
+NO_CLIENTS_ACTION = os.environ.get("NO_CLIENTS_ACTION", "terminar")
+MAX_PAUSES = int(os.environ.get("MAX_PAUSES", "0"))
+ADAPT_MIN_CLIENTS = os.environ.get("ADAPT_MIN_CLIENTS", "False") == "True"
+MIN_CLIENTS_FLOOR = int(os.environ.get("MIN_CLIENTS_FLOOR", "1"))
+
+control = ControlRondas(
+    total_clients,
+    metrica=STOP_METRIC,
+    objetivo=TARGET_METRIC,
+    paciencia=PLATEAU_ROUNDS,
+    delta=PLATEAU_DELTA,
+    espera=CLIENT_WAIT_TIMEOUT,
+    accion=NO_CLIENTS_ACTION,
+    max_pausas=MAX_PAUSES,
+    adaptar=ADAPT_MIN_CLIENTS,
+    fraccion=MIN_CLIENTS_FRACTION,
+    minimo=MIN_CLIENTS_FLOOR,
+    escribir=escribir_resultado
+)
+SERVER_ADDRESS = os.environ.get("SERVER_ADDRESS", "0.0.0.0:8080") #Escucha en todas las interfaces de red en el puerto 8080
+
+
 if __name__ == "__main__": # Punto de entrada del servidor. Si el archivo se ejecuta directamente, se inicia el servidor federado
     # Limpiar fichero anterior al arrancar
     #if os.path.exists("/app/results/global_results.json"):
     #    os.remove("/app/results/global_results.json")
 
-    print(f"Servidor iniciado con estrategia FedAvg. Esperando a {total_clients} clientes...")
+    if strategy.checkpoints is not None:
+        if RESUME:
+            strategy.reanudar()
+        else:
+            strategy.checkpoints.reiniciar() #Ejecución nueva: fuera los checkpoints de la anterior.
+
+    gestor = fl.server.SimpleClientManager()
+    if PARAM_CHUNK_KB > 0:
+        gestor = GestorClientesTrozos(
+            PARAM_CHUNK_KB * 1024,
+            reintentos=PARAM_CHUNK_RETRIES,
+            consumidor=strategy.acumular_trozos if STREAMING_AGG and ASYNC_BUFFER == 0 else None,
+            registrar=registrar_trozos
+        )
+
+    if ASYNC_BUFFER > 0:
+        servidor = ServidorFedBuff(
+            client_manager=gestor,
+            strategy=strategy,
+            tamano_buffer=ASYNC_BUFFER,
+            eta=ASYNC_ETA,
+            fichero_log=os.path.join(RESULTS_DIR, "asincrono_results.json"),
+            control=control
+        )
+    else:
+        clase = ServidorControladoIncremental if STREAMING_AGG else ServidorControlado
+        servidor = clase(client_manager=gestor, strategy=strategy, control=control)
+
+    print(f"Servidor iniciado con estrategia {'FedBuff (K=' + str(ASYNC_BUFFER) + ')' if ASYNC_BUFFER > 0 else 'FedAvg'}. Esperando a {total_clients} clientes...")
     fl.server.start_server( 
-        server_address="0.0.0.0:8080", #Escucha en todas las interfaces de red en el puerto 8080
-        config=fl.server.ServerConfig(num_rounds=10), #Número de rondas de entrenamiento federado
+        server_address=SERVER_ADDRESS,
+        server=servidor,
+        config=fl.server.ServerConfig(num_rounds=NUM_ROUNDS),
         strategy=strategy
     )
 
@@ -0,0 +1,196 @@
+"""
+**Transporte de los parámetros en trozos sobre Flower (lado servidor)**
+
+Flower 1.1 no tiene mensajes en streaming: cada FitIns/FitRes lleva el modelo entero. Aquí cada trozo
+(comun/trozos.py) viaja en su propio get_properties y el FitIns/FitRes/EvaluateIns sólo lleva el manifiesto:
+
+    bajada:  get_properties({"trozos": "manifiesto"})  -> el cliente responde con los trozos que ya tiene
+             get_properties({"trozos": "bajada", indice, datos, crc}) por cada trozo que falta -> {"ok"}
+             fit/evaluate con el manifiesto en lugar de los parámetros
+    subida:  fit con "trozos_subida" en el config -> FitRes con el manifiesto
+             get_properties({"trozos": "subida", indice}) por cada trozo -> {"datos", "crc"}
+
+- Un trozo con el CRC mal se repite (hasta `reintentos` veces), no toda la transferencia.
+- El id de la bajada es un hash del contenido: si la conexión se corta y el cliente vuelve (con otro cid, o tras
+  reiniciarse si guarda la bajada en disco, ver ClienteBuffer) sólo se le envían los trozos que le faltan.
+- La subida NO se reanuda: sólo se repiten los trozos con el CRC mal dentro del mismo fit. Si la conexión se corta a
+  mitad, ese fit falla (Flower lo cuenta en failures), los trozos ya recibidos se descartan y el cliente entrena
+  otra vez en la siguiente ronda con el nuevo modelo global, así que su subida anterior ya no sirve a nadie.
+- Todos los clientes comparten la misma Transferencia de los parámetros globales: cada trozo es una copia del tamaño
+  del trozo, no del modelo.
+- En la subida, con un `consumidor` (la estrategia con STREAMING_AGG, ver estrategia.acumular_trozos) los trozos se
+  suman a la agregación sin reconstruir el modelo del cliente, cuando han llegado todos bien. Sin consumidor (métodos
+  robustos) se reconstruye en un único buffer. Si un trozo no llega bien tras los reintentos, la excepción sale del
+  fit y Flower cuenta ese cliente como fallo.
+
+GestorClientesTrozos es el SimpleClientManager de Flower que envuelve cada cliente en un ProxyTrozos, así que
+sirve con cualquier bucle de servidor. Sólo se trocea con los clientes que lo admiten (ClienteBuffer responde a
+{"trozos": "capacidad"}; los agregadores de borde no) y los parámetros que no caben en un trozo.
+"""
+import json
+import time
+import hashlib
+import threading
+import collections
+import numpy as np
+import flwr as fl
+from flwr.common import GetPropertiesIns, GetParametersIns, FitIns, EvaluateIns
+from flwr.server.client_proxy import ClientProxy
+
+from comun.trozos import (MARCA, Transferencia, Recepcion, manifiesto_a_parameters, parameters_a_manifiesto,
+                          trozo_valido)
+
+
+def _id_contenido(parameters):
+    resumen = hashlib.blake2b(digest_size=8)
+    for tensor in parameters.tensors:
+        resumen.update(tensor)
+    return resumen.hexdigest()
+
+
+class GestorClientesTrozos(fl.server.SimpleClientManager):
+
+    def __init__(self, tamano_trozo, reintentos=3, consumidor=None, registrar=None, conservar=4):
+        super().__init__()
+        self.tamano_trozo = tamano_trozo
+        self.reintentos = reintentos
+        self.consumidor = consumidor # f(server_round, res, manifiesto, trozos) -> True si se ha sumado, o None
+        self.registrar = registrar # f(server_round, clave, estadisticas) con lo transferido, o None
+        self.conservar = conservar
+        self.transferencias = collections.OrderedDict() # id(parameters) -> (parameters, Transferencia)
+        self.cerrojo = threading.Lock()
+
+    def register(self, client):
+        return super().register(ProxyTrozos(client, self))
+
+    def transferencia(self, parameters):
+        """La Transferencia de unos parámetros globales, compartida por todos los clientes que los reciben."""
+        with self.cerrojo:
+            entrada = self.transferencias.get(id(parameters))
+            if entrada is None or entrada[0] is not parameters:
+                transferencia = Transferencia(_id_contenido(parameters), [[t] for t in parameters.tensors],
+                                              self.tamano_trozo, tensor_type=parameters.tensor_type)
+                entrada = self.transferencias[id(parameters)] = (parameters, transferencia)
+                while len(self.transferencias) > self.conservar:
+                    self.transferencias.popitem(last=False)
+            return entrada[1]
+
+    def anotar(self, server_round, clave, estadisticas):
+        if self.registrar is not None and server_round is not None:
+            with self.cerrojo:
+                self.registrar(server_round, clave, estadisticas)
+
+
+class ProxyTrozos(ClientProxy):
+    """Un ClientProxy de Flower que envía y recibe los parámetros grandes en trozos."""
+
+    def __init__(self, proxy, gestor):
+        super().__init__(proxy.cid)
+        self.proxy = proxy
+        self.gestor = gestor
+        self.admite = None # ¿El cliente entiende {"trozos": ...}? Se pregunta una vez
+
+    def _pedir(self, config, timeout):
+        return self.proxy.get_properties(GetPropertiesIns(config=config), timeout).properties
+
+    def _admite(self, timeout):
+        if self.admite is None:
+            self.admite = bool(self._pedir({"trozos": "capacidad"}, timeout).get("trozos", False))
+        return self.admite
+
+    def _bajar(self, parameters, server_round, fase, timeout):
+        """Envía los trozos que le faltan al cliente y devuelve el manifiesto que sustituye a los parámetros."""
+        inicio = time.perf_counter()
+        transferencia = self.gestor.transferencia(parameters)
+        manifiesto = transferencia.manifiesto
+        respuesta = self._pedir({"trozos": "manifiesto", "manifiesto": json.dumps(manifiesto)}, timeout)
+        recibidos = np.unpackbits(np.frombuffer(respuesta["recibidos"], dtype=np.uint8))[:transferencia.num_trozos]
+        faltan = np.flatnonzero(recibidos == 0).tolist()
+        reintentos, enviados = 0, 0
+        for indice in faltan:
+            datos, crc = transferencia.trozo(indice)
+            for intento in range(self.gestor.reintentos + 1):
+                if self._pedir({"trozos": "bajada", "indice": indice, "datos": datos, "crc": crc}, timeout)["ok"]:
+                    break
+                reintentos += 1
+            else:
+                raise RuntimeError(f"El trozo {indice} de {manifiesto['id']} no llega bien al cliente {self.cid}")
+            enviados += len(datos)
+        self.gestor.anotar(server_round, f"bajada_{fase}", {
+            "clientes": 1, "trozos": len(faltan), "reanudados": transferencia.num_trozos - len(faltan),
+            "reintentos": reintentos, "bytes": enviados, "t_transferencia": time.perf_counter() - inicio})
+        return manifiesto_a_parameters(manifiesto)
+
+    def _trozos_subida(self, manifiesto, estadisticas, timeout):
+        """
+        Los trozos de una subida en orden, pidiendo otra vez los que llegan con el CRC mal. Un trozo que no llega bien
+        tras los reintentos (o un corte de la conexión) termina la subida con una excepción: no hay reanudación.
+        """
+        for indice in range(manifiesto["num_trozos"]):
+            for intento in range(self.gestor.reintentos + 1):
+                respuesta = self._pedir({"trozos": "subida", "indice": indice}, timeout)
+                datos = respuesta["datos"]
+                if trozo_valido(manifiesto, indice, datos, int(respuesta["crc"])):
+                    break
+                estadisticas["reintentos"] += 1
+            else:
+                raise RuntimeError(f"El trozo {indice} de {manifiesto['id']} no llega bien desde el cliente {self.cid}")
+            estadisticas["trozos"] += 1
+            estadisticas["bytes"] += len(datos)
+            yield indice, datos
+
+    def _subir(self, res, server_round, fase, timeout, consumir):
+        """
+        Cambia el manifiesto de un resultado por los parámetros (o los suma a la agregación). Si la subida falla, la
+        excepción sale del fit y lo recibido de este cliente se descarta (no se guarda para reanudar).
+        """
+        inicio = time.perf_counter()
+        manifiesto = parameters_a_manifiesto(res.parameters)
+        estadisticas = {"clientes": 1, "trozos": 0, "reintentos": 0, "bytes": 0}
+        trozos = self._trozos_subida(manifiesto, estadisticas, timeout)
+        if not (consumir and self.gestor.consumidor is not None
+                and self.gestor.consumidor(server_round, res, manifiesto, trozos)):
+            recepcion = Recepcion(manifiesto)
+            for indice, datos in trozos:
+                recepcion.colocar(indice, datos)
+            res.parameters = recepcion.parameters()
+        estadisticas["t_transferencia"] = time.perf_counter() - inicio
+        self.gestor.anotar(server_round, f"subida_{fase}", estadisticas)
+        return res
+
+    def _config(self, config, timeout):
+        """El config con el tamaño de trozo para la subida, si el cliente lo admite."""
+        if not self._admite(timeout):
+            return config
+        return dict(config, trozos_subida=self.gestor.tamano_trozo)
+
+    def _grandes(self, parameters, timeout):
+        return parameters.tensor_type != MARCA and sum(len(t) for t in parameters.tensors) > self.gestor.tamano_trozo \
+            and self._admite(timeout)
+
+    def get_properties(self, ins, timeout):
+        return self.proxy.get_properties(ins, timeout)
+
+    def get_parameters(self, ins, timeout):
+        res = self.proxy.get_parameters(GetParametersIns(config=self._config(ins.config, timeout)), timeout)
+        if res.parameters.tensor_type == MARCA:
+            self._subir(res, None, "parametros", timeout, consumir=False)
+        return res
+
+    def fit(self, ins, timeout):
+        server_round = ins.config.get("server_round")
+        parameters = self._bajar(ins.parameters, server_round, "fit", timeout) \
+            if self._grandes(ins.parameters, timeout) else ins.parameters
+        res = self.proxy.fit(FitIns(parameters=parameters, config=self._config(ins.config, timeout)), timeout)
+        if res.parameters.tensor_type == MARCA:
+            self._subir(res, server_round, "fit", timeout, consumir=True)
+        return res
+
+    def evaluate(self, ins, timeout):
+        if not self._grandes(ins.parameters, timeout):
+            return self.proxy.evaluate(ins, timeout)
+        parameters = self._bajar(ins.parameters, ins.config.get("server_round"), "evaluate", timeout)
+        return self.proxy.evaluate(EvaluateIns(parameters=parameters, config=ins.config), timeout)
+
+    def reconnect(self, ins, timeout):
+        return self.proxy.reconnect(ins, timeout)
@@ -0,0 +1,119 @@
+"""
+Pruebas de los parámetros en trozos (comun/trozos.py, server/transferencia.py) con modelos pequeños, usando el
+cable en proceso de benchmarks/bench_trozos.py: reintento de los trozos con el CRC mal, reanudación de la bajada
+tras un corte y que una subida que falla no deje nada en la agregación incremental (estrategia.acumular_trozos).
+
+Uso:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+import flwr as fl  # noqa: E402
+from bench_trozos import ProxyCable, ronda, modelo_sintetico  # noqa: E402
+from comun.trozos import Transferencia  # noqa: E402
+from comun.parametros import ClienteBuffer, ndarrays_a_parameters, parameters_a_ndarrays  # noqa: E402
+from estrategia import FedAvgTFM  # noqa: E402
+from transferencia import GestorClientesTrozos  # noqa: E402
+
+MB = 0.25 # Modelo de 256 KB en 8 capas
+KB = 16 # 16 trozos
+
+
+class ClienteFijo(fl.client.NumPyClient):
+    """Devuelve siempre los mismos pesos con `muestras` ejemplos."""
+
+    def __init__(self, pesos, muestras):
+        self.pesos = pesos
+        self.muestras = muestras
+
+    def get_parameters(self, config):
+        return self.pesos
+
+    def fit(self, parameters, config):
+        return self.pesos, self.muestras, {}
+
+    def evaluate(self, parameters, config):
+        return 0.0, self.muestras, {}
+
+
+class ProxySubidaRota(ProxyCable):
+    """Corrompe todos los trozos de la subida desde `desde`: los anteriores llegan bien."""
+
+    def __init__(self, cid, cliente, desde):
+        super().__init__(cid, cliente)
+        self.desde = desde
+
+    def get_properties(self, ins, timeout):
+        res = super().get_properties(ins, timeout)
+        if ins.config.get("trozos") == "subida" and int(ins.config["indice"]) >= self.desde:
+            datos = bytearray(res.properties["datos"])
+            datos[0] ^= 0xFF
+            res.properties["datos"] = bytes(datos)
+        return res
+
+
+def _iguales(a, b):
+    return len(a) == len(b) and all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def test_reintenta_solo_los_trozos_con_crc_mal():
+    pesos = modelo_sintetico(MB)
+    _, _, estadisticas, recibidos = ronda("trozos", pesos, KB, perdida=0.3)
+    bajada = estadisticas["bajada_fit"]
+    assert _iguales(recibidos, pesos)
+    assert bajada["reintentos"] > 0
+    assert bajada["trozos"] == Transferencia.desde_ndarrays("x", pesos, KB * 1024).num_trozos # Cada uno una vez
+
+
+def test_crc_mal_tras_los_reintentos_falla():
+    with pytest.raises(RuntimeError):
+        ronda("trozos", modelo_sintetico(MB), KB, perdida=1.0)
+
+
+def test_la_bajada_se_reanuda_tras_un_corte(tmp_path):
+    pesos = modelo_sintetico(MB)
+    with pytest.raises(ConnectionError):
+        ronda("trozos", pesos, KB, directorio=str(tmp_path), corte=12) # "capacidad", "manifiesto" y unos trozos
+    _, _, estadisticas, recibidos = ronda("trozos", pesos, KB, directorio=str(tmp_path))
+    bajada = estadisticas["bajada_fit"]
+    assert _iguales(recibidos, pesos)
+    assert 0 < bajada["reanudados"] < bajada["trozos"] + bajada["reanudados"]
+
+
+def test_subida_fallida_no_cambia_el_agregado():
+    globales, buenos, malos = (modelo_sintetico(MB, semilla=semilla) for semilla in (0, 1, 2))
+    estrategia = FedAvgTFM(on_fit_config_fn=lambda server_round: {"server_round": server_round})
+    gestor = GestorClientesTrozos(KB * 1024, consumidor=estrategia.acumular_trozos)
+    gestor.register(ProxyCable("bueno", ClienteBuffer(ClienteFijo(buenos, 30))))
+    gestor.register(ProxySubidaRota("malo", ClienteBuffer(ClienteFijo(malos, 70)), desde=5))
+
+    results, failures = [], []
+    for proxy, ins in estrategia.configure_fit(1, ndarrays_a_parameters(globales), gestor):
+        try:
+            results.append((proxy, proxy.fit(ins, timeout=None)))
+        except RuntimeError as error:
+            failures.append(error)
+    assert [proxy.cid for proxy, _ in results] == ["bueno"] and len(failures) == 1
+
+    parametros, _ = estrategia.aggregate_fit(1, results, failures)
+    assert estrategia.estadisticas_fit[1]["agregacion_incremental"]["actualizaciones"] == 1
+    for agregado, esperado in zip(parameters_a_ndarrays(parametros), buenos):
+        np.testing.assert_allclose(agregado, esperado, rtol=1e-6)
+
+
+def test_subidas_completas_son_fedavg():
+    globales, a, b = (modelo_sintetico(MB, semilla=semilla) for semilla in (0, 1, 2))
+    estrategia = FedAvgTFM(on_fit_config_fn=lambda server_round: {"server_round": server_round})
+    gestor = GestorClientesTrozos(KB * 1024, consumidor=estrategia.acumular_trozos)
+    gestor.register(ProxyCable("a", ClienteBuffer(ClienteFijo(a, 30))))
+    gestor.register(ProxyCable("b", ClienteBuffer(ClienteFijo(b, 70))))
+
+    results = [(proxy, proxy.fit(ins, timeout=None))
+               for proxy, ins in estrategia.configure_fit(1, ndarrays_a_parameters(globales), gestor)]
+    parametros, _ = estrategia.aggregate_fit(1, results, [])
+    for agregado, x, y in zip(parameters_a_ndarrays(parametros), a, b):
+        np.testing.assert_allclose(agregado, (30 * x + 70 * y) / 100, rtol=1e-5, atol=1e-6)